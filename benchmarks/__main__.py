@@ -0,0 +1,76 @@
+"""
+Run benchmarks and write or compare JSON baselines.
+
+Usage:
+    python -m benchmarks --output baseline.json
+    python -m benchmarks --compare baseline.json --threshold 0.15
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from .environment import BACKENDS
+from .harness import build_report, compare_reports, load_report, write_report
+from . import (
+    bench_ids,
+    bench_model,
+    bench_operations,
+    bench_optimize,
+    bench_projection,
+    bench_search,
+    bench_serialization
+)
+
+SUITES = {
+    **bench_ids.SUITES,
+    **bench_model.SUITES,
+    **bench_operations.SUITES,
+    **bench_optimize.SUITES,
+    **bench_projection.SUITES,
+    **bench_search.SUITES,
+    **bench_serialization.SUITES
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Image service benchmarks (offline, moto-backed).')
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+                        help='Suite to run (repeatable, default: all)')
+    parser.add_argument('--iterations', type=int, default=50, help='Timed iterations per case')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare results against a baseline file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative regression threshold for --compare (default: 0.10)')
+    parser.add_argument('--backend', choices=BACKENDS, default='aws',
+                        help='Repositories behind the service: moto-backed AWS or local filesystem + SQLite')
+    parser.add_argument('--logs', action='store_true', help='Keep structured service logs enabled')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.logs:
+        logging.disable(logging.CRITICAL)
+    os.environ['BENCH_BACKEND'] = args.backend
+
+    results = []
+    for name in args.suite or list(SUITES):
+        results.extend(SUITES[name](args.iterations))
+
+    report = write_report(args.output, results) if args.output else build_report(results)
+    for result in report['results'].values():
+        print(json.dumps(result, sort_keys=True))
+
+    if args.compare:
+        regressions = compare_reports(load_report(args.compare), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {json.dumps(regression, sort_keys=True)}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Benchmarks for image ID generation throughput: random ``uuid4`` versus
+time-ordered ``uuid7``, from one thread and from several threads sharing
+the generator's lock.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from src.common.utils import ID_SCHEMES, generate_image_id
+
+from .harness import BenchmarkResult, run_benchmark
+
+
+def bench_ids(iterations, batch=10000, threads=(1, 8)):
+    """Generate ``batch`` IDs per iteration and report per-ID latency and IDs per second."""
+    results = []
+    for scheme in ID_SCHEMES:
+        for thread_count in threads:
+            per_thread = batch // thread_count
+
+            def generate(_, scheme=scheme):
+                for _ in range(per_thread):
+                    generate_image_id(scheme)
+
+            if thread_count == 1:
+                operation = generate
+            else:
+                executor = ThreadPoolExecutor(max_workers=thread_count)
+
+                def operation(i, generate=generate, executor=executor, thread_count=thread_count):
+                    list(executor.map(generate, range(thread_count)))
+
+            try:
+                result = run_benchmark(
+                    f'id_generate[{scheme},threads={thread_count}]', operation,
+                    iterations=max(3, iterations // 10), warmup=1, memory_iterations=0,
+                    params={'batch': per_thread * thread_count, 'threads': thread_count}
+                )
+            finally:
+                if thread_count > 1:
+                    executor.shutdown()
+            ids = per_thread * thread_count
+            results.append(BenchmarkResult(
+                result.name, [latency / ids for latency in result.latencies],
+                result.total_seconds / ids, 0, result.params
+            ))
+    return results
+
+
+SUITES = {'ids': bench_ids}
@@ -0,0 +1,114 @@
+"""
+Benchmarks for ImageMetadata decode rate and memory per object, compared with
+the original ``__dict__``-based class.
+"""
+import gc
+import tracemalloc
+from decimal import Decimal
+
+from src.common.serialization import to_json_number
+from src.models.image_model import NUMERIC_FIELDS, ImageMetadata
+
+from .harness import BenchmarkResult, run_benchmark
+
+
+class LegacyImageMetadata:
+    """The pre-``__slots__`` model, kept as a reference point."""
+
+    def __init__(self, image_id, user_id, filename, s3_key, content_type, size, upload_date,
+                 tags=None, description=None, width=None, height=None, original_size=None,
+                 checksum=None, dominant_color=None, captured_at=None, enriched_at=None, expires_at=None,
+                 version=None):
+        self.image_id = image_id
+        self.user_id = user_id
+        self.filename = filename
+        self.s3_key = s3_key
+        self.content_type = content_type
+        self.size = size
+        self.upload_date = upload_date
+        self.tags = tags
+        self.description = description
+        self.width = width
+        self.height = height
+        self.original_size = original_size
+        self.checksum = checksum
+        self.dominant_color = dominant_color
+        self.captured_at = captured_at
+        self.enriched_at = enriched_at
+        self.expires_at = expires_at
+        self.version = version
+
+    @classmethod
+    def from_dynamodb_item(cls, item):
+        return cls(**item)
+
+
+def _legacy_decode_and_convert(item):
+    """Legacy decode plus the Decimal conversion previously paid at encode time."""
+    obj = LegacyImageMetadata.from_dynamodb_item(item)
+    for field in NUMERIC_FIELDS:
+        setattr(obj, field, to_json_number(getattr(obj, field)))
+    return obj
+
+
+def _items(count):
+    return [{
+        'image_id': f'{i:08d}-0000-4000-8000-000000000000',
+        'user_id': f'user{i % 100}',
+        'filename': f'photo_{i}.jpg',
+        's3_key': f'images/user{i % 100}/{i:08d}.jpg',
+        'content_type': 'image/jpeg',
+        'size': Decimal(1000 + i),
+        'upload_date': '2024-05-01T12:00:00.000000',
+        'tags': 'nature',
+        'width': Decimal(1920),
+        'height': Decimal(1080),
+        'original_size': Decimal(4000 + i),
+        'checksum': f'{i:064x}',
+        'dominant_color': '#4a7f3c',
+        'captured_at': '2024-04-30T18:30:00',
+        'enriched_at': '2024-05-01T12:00:05.000000',
+        'version': Decimal(1)
+    } for i in range(count)]
+
+
+def _memory_per_object(decode, items):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [decode(item) for item in items]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del objects
+    return (after - before) / len(items)
+
+
+def bench_model(iterations, batch=10000):
+    """Decode ``batch`` items per iteration with each model implementation."""
+    items = _items(batch)
+    decoders = {
+        'legacy': LegacyImageMetadata.from_dynamodb_item,
+        'legacy+convert': _legacy_decode_and_convert,
+        'slots': ImageMetadata.from_dynamodb_item,
+        'item_to_dict': ImageMetadata.item_to_dict
+    }
+    results = []
+    for label, decode in decoders.items():
+        per_object = _memory_per_object(decode, items)
+        result = run_benchmark(
+            f'model_decode[{label}]',
+            lambda _, decode=decode: [decode(item) for item in items],
+            iterations=max(3, iterations // 10), warmup=1, memory_iterations=0,
+            params={'batch': batch, 'bytes_per_object': round(per_object, 1)}
+        )
+        # Report per-object latency and objects decoded per second
+        results.append(BenchmarkResult(
+            result.name, [latency / batch for latency in result.latencies],
+            result.total_seconds / batch, int(per_object), result.params
+        ))
+    return results
+
+
+SUITES = {'model': bench_model}
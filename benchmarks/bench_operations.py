@@ -0,0 +1,222 @@
+"""
+Benchmarks for the four API operations, driven through ``lambda_handler``
+and ``ImageService``.
+"""
+from src.repositories.storage_repository import StorageRepository
+from src.repositories.url_signers import S3UrlSigner, WindowedUrlSigner
+
+from .environment import api_event, bench_environment, make_image_data
+from .faults import FaultInjector
+from .harness import run_benchmark
+
+KB = 1024
+MB = 1024 * KB
+
+PAYLOAD_SIZES = (1 * KB, 100 * KB, 1 * MB, 10 * MB)
+TABLE_SIZES = (100, 1000)
+
+
+def _iterations_for(payload_size, iterations):
+    """Scale down iterations for large payloads to bound moto memory use."""
+    if payload_size >= 10 * MB:
+        return max(3, iterations // 10)
+    if payload_size >= 1 * MB:
+        return max(5, iterations // 4)
+    return iterations
+
+
+def _assert_status(response, expected):
+    if response['statusCode'] != expected:
+        raise RuntimeError(f"Unexpected status {response['statusCode']}: {response['body']}")
+
+
+def bench_upload(iterations, payload_sizes=PAYLOAD_SIZES):
+    """Upload through the handler for each payload size."""
+    results = []
+    for size in payload_sizes:
+        count = _iterations_for(size, iterations)
+        with bench_environment() as env:
+            event = api_event('POST', body={
+                'user_id': 'bench-user',
+                'filename': 'bench.png',
+                'image_data': make_image_data(size),
+                'tags': 'bench',
+                'description': 'benchmark upload'
+            })
+
+            def operation(_, event=event, env=env):
+                _assert_status(env.invoke(event), 201)
+
+            results.append(run_benchmark(
+                f'upload[{size}]', operation, iterations=count, warmup=1,
+                params={'payload_bytes': size}
+            ))
+    return results
+
+
+def bench_list(iterations, table_sizes=TABLE_SIZES):
+    """List through the handler with and without filters across table sizes."""
+    results = []
+    for table_size in table_sizes:
+        with bench_environment() as env:
+            env.seed_images(table_size)
+            cases = {
+                'all': {'limit': '50'},
+                'user': {'user_id': 'user1', 'limit': '50'},
+                'tags': {'tags': 'nature', 'limit': '50'},
+                'user+tags': {'user_id': 'user1', 'tags': 'nature', 'limit': '50'}
+            }
+            for label, query in cases.items():
+                event = api_event('GET', query_params=query)
+
+                def operation(_, event=event, env=env):
+                    _assert_status(env.invoke(event), 200)
+
+                results.append(run_benchmark(
+                    f'list[{label},{table_size}]', operation, iterations=iterations,
+                    params={'table_size': table_size, 'filter': label}
+                ))
+    return results
+
+
+def bench_get(iterations):
+    """Get through the handler with and without the download disposition."""
+    results = []
+    with bench_environment() as env:
+        image_id = env.seed_images(1)[0]
+        for download in (False, True):
+            event = api_event(
+                'GET',
+                path_params={'image_id': image_id},
+                query_params={'download': 'true' if download else 'false'}
+            )
+
+            def operation(_, event=event, env=env):
+                _assert_status(env.invoke(event), 200)
+
+            label = 'download' if download else 'view'
+            results.append(run_benchmark(
+                f'get[{label}]', operation, iterations=iterations,
+                params={'download': download}
+            ))
+    return results
+
+
+def bench_delete(iterations, round_trips_ms=(0, 5)):
+    """
+    Delete through the handler; every iteration removes a pre-seeded image.
+
+    moto answers in-process, so the ``rtt`` cases add a fixed latency to every
+    AWS call to show how the number of sequential round trips dominates.
+    """
+    warmup, memory_iterations = 5, 3
+    results = []
+    for rtt in round_trips_ms:
+        count = iterations if not rtt else max(10, iterations // 5)
+        with bench_environment() as env:
+            image_ids = env.seed_images(warmup + count + memory_iterations)
+            injector = FaultInjector(latency_ms=rtt)
+            if rtt:
+                injector.attach(env.s3_client)
+                injector.attach(env.dynamodb.meta.client)
+
+            def operation(i, env=env, image_ids=image_ids):
+                event = api_event('DELETE', path_params={'image_id': image_ids[i]})
+                _assert_status(env.invoke(event), 200)
+
+            results.append(run_benchmark(
+                f'delete[rtt={rtt}ms]' if rtt else 'delete', operation, iterations=count, warmup=warmup,
+                memory_iterations=memory_iterations, params={'rtt_ms': rtt}
+            ))
+            injector.detach()
+    return results
+
+
+def bench_purge(iterations, batch_size=100):
+    """Purge one batch of expired tombstones per iteration (DeleteObjects + BatchWriteItem)."""
+    warmup, memory_iterations = 1, 1
+    count = max(3, iterations // 20)
+    with bench_environment() as env:
+        repo = env.service.metadata_repo
+        image_ids = env.seed_images((warmup + count + memory_iterations) * batch_size)
+        # Batch i expires at its own instant, so purging "as of" it removes only that batch
+        for i, image_id in enumerate(image_ids):
+            repo.mark_deleted(image_id, '2000-01-01T00:00:00', _purge_instant(i // batch_size))
+
+        def operation(i):
+            result = env.service.purge_deleted(now=_purge_instant(i))
+            if result['purged'] != batch_size:
+                raise RuntimeError(f"Unexpected purge result: {result}")
+
+        return [run_benchmark(
+            f'purge[{batch_size}]', operation, iterations=count, warmup=warmup,
+            memory_iterations=memory_iterations, params={'batch_size': batch_size}
+        )]
+
+
+def bench_signing(iterations, window_seconds=(0, 900)):
+    """
+    List one user's 50 images repeatedly, signing every URL vs window-aligned memoized URLs.
+
+    ``distinct_pages`` counts different response bodies over the run; each new
+    set of URLs makes browsers and CDNs download every image again.
+    """
+    results = []
+    for window in window_seconds:
+        with bench_environment() as env:
+            env.seed_images(50, users=1)
+            signer = S3UrlSigner(env.s3_client, env.service.storage_repo.bucket_name)
+            if window:
+                signer = WindowedUrlSigner(signer, window)
+            env.service.storage_repo = StorageRepository(env.s3_client, signer)
+            event = api_event('GET', query_params={'user_id': 'user0', 'limit': '50'})
+            seen = set()
+
+            def operation(_, env=env, event=event, seen=seen):
+                response = env.invoke(event)
+                _assert_status(response, 200)
+                seen.add(response['body'])
+
+            result = run_benchmark(
+                f'list_signing[window={window}s]', operation, iterations=iterations,
+                params={'window_seconds': window}
+            )
+            result.params['distinct_pages'] = len(seen)
+            if window:
+                cache = signer.cache
+                result.params['cache_hit_rate'] = round(cache.hits / max(1, cache.hits + cache.misses), 3)
+            results.append(result)
+    return results
+
+
+def _purge_instant(batch):
+    return f'2000-01-01T00:00:00.{batch:06d}'
+
+
+def bench_service_upload(iterations, payload_sizes=PAYLOAD_SIZES):
+    """Upload through ``ImageService`` directly, without handler overhead."""
+    results = []
+    for size in payload_sizes:
+        count = _iterations_for(size, iterations)
+        with bench_environment() as env:
+            image_data = make_image_data(size)
+
+            def operation(_, env=env, image_data=image_data):
+                env.service.upload_image('bench-user', 'bench.png', image_data)
+
+            results.append(run_benchmark(
+                f'service_upload[{size}]', operation, iterations=count, warmup=1,
+                params={'payload_bytes': size}
+            ))
+    return results
+
+
+SUITES = {
+    'upload': bench_upload,
+    'service_upload': bench_service_upload,
+    'list': bench_list,
+    'get': bench_get,
+    'delete': bench_delete,
+    'purge': bench_purge,
+    'signing': bench_signing
+}
@@ -0,0 +1,72 @@
+"""
+Benchmarks for the upload optimization stage: bytes saved and added latency
+per source format and mode, inline and through the worker pool.
+"""
+import io
+
+from src.services.image_optimizer import Image, ImageOptimizer, optimize_image
+
+from .harness import run_benchmark
+
+
+def _photo(size):
+    """Photo-like content: smooth gradients plus sensor-style noise."""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 24)
+    return Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def _camera_jpeg(size=(1600, 1200)):
+    """A camera JPEG: quality 92 with a large EXIF block and a comment."""
+    exif = Image.Exif()
+    exif[0x010E] = 'Camera maker notes ' * 3000  # ImageDescription, ~56 KB
+    exif[0x0112] = 1
+    buffer = io.BytesIO()
+    _photo(size).save(buffer, 'JPEG', quality=92, exif=exif.tobytes(), comment=b'x' * 4096)
+    return buffer.getvalue()
+
+
+def _uncompressed_png(size=(800, 600)):
+    """A screenshot-style PNG written with the fastest (weakest) compression."""
+    buffer = io.BytesIO()
+    _photo(size).save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def bench_optimize(iterations):
+    """Optimize sample uploads and record latency and bytes saved."""
+    if Image is None:
+        print('optimize suite skipped: Pillow is not installed')
+        return []
+
+    samples = {'jpeg': _camera_jpeg(), 'png': _uncompressed_png()}
+    count = max(3, iterations // 5)
+    results = []
+    for label, data in samples.items():
+        for mode in ('lossless', 'webp'):
+            optimized, _ = optimize_image(data, mode, 80) or (data, None)
+            params = {
+                'format': label,
+                'mode': mode,
+                'original_bytes': len(data),
+                'optimized_bytes': len(optimized),
+                'saved_pct': round(100 * (1 - len(optimized) / len(data)), 1)
+            }
+            results.append(run_benchmark(
+                f'optimize[{label},{mode}]', lambda _, data=data, mode=mode: optimize_image(data, mode, 80),
+                iterations=count, warmup=1, memory_iterations=1, params=params
+            ))
+
+            optimizer = ImageOptimizer({'mode': mode, 'webp_quality': 80, 'timeout_ms': 60000, 'workers': 1})
+            try:
+                results.append(run_benchmark(
+                    f'optimize[{label},{mode},pool]',
+                    lambda _, data=data, optimizer=optimizer: optimizer.optimize(data, 'image/' + label),
+                    iterations=count, warmup=1, memory_iterations=1, params=params
+                ))
+            finally:
+                optimizer.shutdown()
+    return results
+
+
+SUITES = {'optimize': bench_optimize}
@@ -0,0 +1,55 @@
+"""
+Benchmarks for list/get field projection and optional URL signing.
+"""
+from .environment import api_event, bench_environment
+from .harness import run_benchmark
+
+LIST_CASES = {
+    'full': {},
+    'fields': {'fields': 'image_id,upload_date'},
+    'fields+no_urls': {'fields': 'image_id,upload_date', 'include_urls': 'false'},
+    'no_urls': {'include_urls': 'false'}
+}
+
+
+def bench_projection(iterations, table_size=100, description_bytes=2048):
+    """Compare response bytes and latency for projected and full listings."""
+    results = []
+    with bench_environment() as env:
+        image_ids = env.seed_images(table_size)
+        # Large descriptions make the cost of unprojected reads visible
+        for image_id in image_ids:
+            env.dynamodb.Table(env.service.metadata_repo.table_name).update_item(
+                Key={'image_id': image_id},
+                UpdateExpression='SET description = :d',
+                ExpressionAttributeValues={':d': 'd' * description_bytes}
+            )
+
+        for label, extra in LIST_CASES.items():
+            event = api_event('GET', query_params={'limit': '100', **extra})
+            wire_bytes = len(env.invoke(event)['body'])
+
+            def operation(_, event=event):
+                env.invoke(event)
+
+            results.append(run_benchmark(
+                f'projection_list[{label}]', operation, iterations=iterations,
+                params={'table_size': table_size, 'wire_bytes': wire_bytes}
+            ))
+
+        get_cases = {'full': {}, 'fields+no_urls': {'fields': 'upload_date', 'include_urls': 'false'}}
+        for label, extra in get_cases.items():
+            event = api_event('GET', path_params={'image_id': image_ids[0]}, query_params=extra or None)
+            wire_bytes = len(env.invoke(event)['body'])
+
+            def operation(_, event=event):
+                env.invoke(event)
+
+            results.append(run_benchmark(
+                f'projection_get[{label}]', operation, iterations=iterations,
+                params={'wire_bytes': wire_bytes}
+            ))
+    return results
+
+
+SUITES = {'projection': bench_projection}
@@ -0,0 +1,74 @@
+"""
+Benchmarks for search query latency over one user's index at up to 1M
+images, plus segment size and load time.
+"""
+import random
+import time
+
+from src.services.search_index import SearchIndex
+
+from .harness import run_benchmark
+
+INDEX_SIZES = (10000, 100000, 1000000)
+
+# Queries by shape: a very common term, two common terms, a prefix, a rare term
+QUERIES = {
+    'common': 'beach',
+    'two_terms': 'beach 2024',
+    'prefix': 'sun',
+    'rare': 'w19999'
+}
+
+_SUBJECTS = ('beach', 'sunset', 'city', 'portrait', 'family', 'dog', 'cat', 'mountain', 'snow', 'party')
+_YEARS = ('2021', '2022', '2023', '2024')
+
+
+def build_index(count, seed=7):
+    """Synthetic library: camera-style filenames, Zipf-distributed description words and tags."""
+    rng = random.Random(seed)
+    vocabulary = [f'w{i}' for i in range(20000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    words = rng.choices(vocabulary, weights, k=count * 4)
+    index = SearchIndex()
+    for i in range(count):
+        subject = rng.choice(_SUBJECTS)
+        index.add(
+            f'{i:08d}-0000-4000-8000-000000000000',
+            f'{rng.choice(_YEARS)}-05-01T12:00:00.{i % 1000000:06d}',
+            f'IMG_{subject}_{rng.choice(_YEARS)}_{i}.jpg',
+            ' '.join(words[i * 4:i * 4 + 4]),
+            f'{rng.choice(_SUBJECTS)},{subject}'
+        )
+    return index
+
+
+def bench_search(iterations, sizes=INDEX_SIZES):
+    """Query one user's index at each size; segment bytes and decode time are reported as params."""
+    results = []
+    for size in sizes:
+        started = time.perf_counter()
+        index = build_index(size)
+        build_seconds = time.perf_counter() - started
+        segment = index.encode()
+        started = time.perf_counter()
+        index, _ = SearchIndex.decode(segment)
+        decode_ms = (time.perf_counter() - started) * 1000
+        base = {
+            'documents': size,
+            'terms': len(index.postings),
+            'segment_bytes': len(segment),
+            'build_s': round(build_seconds, 2),
+            'decode_ms': round(decode_ms, 1)
+        }
+        count = iterations if size < 1000000 else max(10, iterations // 5)
+        for label, query in QUERIES.items():
+            results.append(run_benchmark(
+                f'search[{label},{size}]', lambda _, index=index, query=query: index.search(query, 20),
+                iterations=count, warmup=2, memory_iterations=1,
+                params=dict(base, query=query, hits=len(index.search(query, 100)))
+            ))
+        del index, segment
+    return results
+
+
+SUITES = {'search': bench_search}
@@ -0,0 +1,102 @@
+"""
+Benchmarks for response encoding: legacy ``json.dumps`` with a Decimal
+callback versus the serialization layer, plus compressed bytes on the wire.
+"""
+import json
+import os
+from decimal import Decimal
+
+from src.common import serialization
+from src.models.image_model import ImageMetadata
+
+from .harness import run_benchmark
+
+
+def _legacy_decimal_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def _dynamodb_items(count):
+    url = 'https://image-service-bucket.s3.amazonaws.com/images/user1/' + 'a' * 36 + '.png' \
+          '?AWSAccessKeyId=AKIAEXAMPLE&Signature=' + 'S' * 28 + '&Expires=1700000000'
+    items = []
+    for i in range(count):
+        items.append({
+            'image_id': f'{i:08d}-0000-4000-8000-000000000000',
+            'user_id': 'user1',
+            'filename': f'holiday_{i}.png',
+            's3_key': f'images/user1/{i:08d}.png',
+            'content_type': 'image/png',
+            'size': Decimal(1024 * (i + 1)),
+            'upload_date': '2024-05-01T12:00:00.000000',
+            'tags': 'nature,landscape',
+            'description': 'A long description of the photo ' * 4,
+            'width': Decimal(1920),
+            'height': Decimal(1080),
+            '_url': url
+        })
+    return items
+
+
+def _list_body(items, convert):
+    images = []
+    for item in items:
+        url = item['_url']
+        record = {k: v for k, v in item.items() if k != '_url'}
+        image = ImageMetadata.from_dynamodb_item(record).to_dict() if convert else record
+        image['image_url'] = url
+        images.append(image)
+    return {'images': images, 'count': len(images)}
+
+
+def bench_serialization(iterations, item_counts=(10, 100)):
+    """Encode list responses and record encode latency and wire bytes."""
+    results = []
+    previous_backend = os.environ.get('JSON_BACKEND')
+    try:
+        for count in item_counts:
+            items = _dynamodb_items(count)
+            legacy_body = _list_body(items, convert=False)
+            body = _list_body(items, convert=True)
+
+            legacy_bytes = len(json.dumps(legacy_body, default=_legacy_decimal_default))
+            results.append(run_benchmark(
+                f'encode[legacy,{count}]',
+                lambda _: json.dumps(legacy_body, default=_legacy_decimal_default),
+                iterations=iterations,
+                params={'items': count, 'wire_bytes': legacy_bytes}
+            ))
+
+            for backend in ('json', 'auto'):
+                os.environ['JSON_BACKEND'] = backend
+                label = 'stdlib' if backend == 'json' or serialization.orjson is None else 'orjson'
+                wire_bytes = len(serialization.dumps(body))
+                results.append(run_benchmark(
+                    f'encode[{label},{count}]',
+                    lambda _: serialization.dumps(body),
+                    iterations=iterations,
+                    params={'items': count, 'wire_bytes': wire_bytes}
+                ))
+
+            text = serialization.dumps(body)
+            for encoding in serialization.supported_encodings():
+                encoded, _, _ = serialization.encode_body(text, encoding, min_bytes=0)
+                results.append(run_benchmark(
+                    f'encode[{label}+{encoding},{count}]',
+                    lambda _, encoding=encoding: serialization.encode_body(
+                        serialization.dumps(body), encoding, min_bytes=0
+                    ),
+                    iterations=iterations,
+                    params={'items': count, 'wire_bytes': len(encoded), 'encoding': encoding}
+                ))
+    finally:
+        if previous_backend is None:
+            os.environ.pop('JSON_BACKEND', None)
+        else:
+            os.environ['JSON_BACKEND'] = previous_backend
+    return results
+
+
+SUITES = {'serialization': bench_serialization}
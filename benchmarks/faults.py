@@ -0,0 +1,82 @@
+"""
+Fault injection for boto3 clients (works with moto and real endpoints).
+
+Faults are injected through botocore's ``before-call`` event: returning a
+response from that hook short-circuits the HTTP request, exactly like
+``botocore.stub.Stubber`` does.
+"""
+import random
+import threading
+import time
+
+# Error code -> HTTP status used for injected failures
+FAULT_STATUS = {
+    'ProvisionedThroughputExceededException': 400,
+    'ThrottlingException': 400,
+    'RequestLimitExceeded': 400,
+    'InternalServerError': 500,
+    'SlowDown': 503,
+    'ServiceUnavailable': 503,
+    'InternalError': 500
+}
+
+
+class _FakeHTTPResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.raw = None
+
+
+class FaultInjector:
+    """
+    Inject errors and latency into boto3 client calls.
+
+    ``operations`` limits injection to specific operation names (e.g.
+    ``{'PutItem', 'PutObject'}``); by default every call is eligible.
+    """
+
+    def __init__(self, error_rate=0.0, error_code='InternalServerError', latency_ms=0,
+                 operations=None, seed=None):
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.latency_ms = latency_ms
+        self.operations = set(operations) if operations else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.injected = 0
+        self.calls = 0
+        self._registrations = []
+
+    def attach(self, client):
+        """Start injecting faults into ``client`` (a boto3 client)."""
+        service = client.meta.service_model.service_name
+        event_name = f'before-call.{service}'
+        client.meta.events.register(event_name, self._before_call)
+        self._registrations.append((client, event_name))
+        return self
+
+    def detach(self):
+        for client, event_name in self._registrations:
+            client.meta.events.unregister(event_name, self._before_call)
+        self._registrations = []
+
+    def _before_call(self, model, **kwargs):
+        if self.operations and model.name not in self.operations:
+            return None
+        with self.lock:
+            self.calls += 1
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.injected += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if not fail:
+            return None
+
+        status = FAULT_STATUS.get(self.error_code, 500)
+        return _FakeHTTPResponse(status), {
+            'Error': {'Code': self.error_code, 'Message': 'Injected fault'},
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        }
@@ -0,0 +1,152 @@
+"""
+Benchmark timing, reporting and baseline comparison.
+"""
+import gc
+import json
+import math
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+
+class BenchmarkResult:
+    """Timing and memory statistics for a single benchmark case."""
+
+    def __init__(self, name, latencies, total_seconds, peak_memory_bytes, params=None):
+        self.name = name
+        self.latencies = latencies
+        self.total_seconds = total_seconds
+        self.peak_memory_bytes = peak_memory_bytes
+        self.params = params or {}
+
+    @property
+    def iterations(self):
+        return len(self.latencies)
+
+    @property
+    def ops_per_sec(self):
+        if self.total_seconds <= 0:
+            return 0.0
+        return self.iterations / self.total_seconds
+
+    def to_dict(self):
+        """Convert to dictionary (latencies in milliseconds)."""
+        return {
+            'name': self.name,
+            'params': self.params,
+            'iterations': self.iterations,
+            'ops_per_sec': round(self.ops_per_sec, 2),
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 4),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 4),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 4),
+            'peak_memory_bytes': self.peak_memory_bytes
+        }
+
+
+def percentile(values, pct):
+    """Return the nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_benchmark(name, operation, iterations=50, warmup=5, memory_iterations=3, params=None):
+    """
+    Time an operation and measure its peak memory.
+
+    ``operation`` is called with the iteration index. Timing and memory are
+    measured in separate passes so tracemalloc overhead does not skew latency.
+    """
+    for i in range(warmup):
+        operation(i)
+
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        op_start = time.perf_counter()
+        operation(warmup + i)
+        latencies.append(time.perf_counter() - op_start)
+    total_seconds = time.perf_counter() - started
+
+    peak = 0
+    if memory_iterations:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for i in range(memory_iterations):
+                tracemalloc.reset_peak()
+                operation(warmup + iterations + i)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return BenchmarkResult(name, latencies, total_seconds, peak, params)
+
+
+def build_report(results):
+    """Build a JSON-serializable report for a list of results."""
+    return {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {result.name: result.to_dict() for result in results}
+    }
+
+
+def write_report(path, results):
+    """Write results to a JSON baseline file."""
+    report = build_report(results)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    return report
+
+
+def load_report(path):
+    """Load a JSON baseline file."""
+    with open(path, 'r', encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+# Metric name -> True when a higher value is better
+COMPARED_METRICS = {
+    'ops_per_sec': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'peak_memory_bytes': False
+}
+
+
+def compare_reports(baseline, current, threshold=0.10):
+    """
+    Compare two reports and return the regressions beyond ``threshold``.
+
+    ``threshold`` is a relative change (0.10 = 10%). Cases that exist in only
+    one of the reports are ignored.
+    """
+    regressions = []
+    baseline_results = baseline.get('results', {})
+    for name, current_result in current.get('results', {}).items():
+        baseline_result = baseline_results.get(name)
+        if not baseline_result:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old = baseline_result.get(metric)
+            new = current_result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            if regressed:
+                regressions.append({
+                    'name': name,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change_pct': round(change * 100, 2)
+                })
+    return regressions
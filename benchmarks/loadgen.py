@@ -0,0 +1,502 @@
+"""
+Concurrent load generator and traffic replay for ``lambda_handler``.
+
+Builds synthetic API Gateway events with a configurable operation mix,
+payload sizes and Zipfian image popularity (or replays recorded events) and
+drives them in-process across threads or processes for a fixed duration or
+at a fixed rate. Everything runs offline against moto.
+
+Usage:
+    python -m benchmarks.loadgen --threads 8 --duration 10
+    python -m benchmarks.loadgen --processes 4 --rate 200 --duration 30
+    python -m benchmarks.loadgen --record-to events.jsonl --requests 1000
+    python -m benchmarks.loadgen --replay events.jsonl --threads 4
+    python -m benchmarks.loadgen --duration 10 --fault-target dynamodb --fault-rate 0.3
+"""
+import argparse
+import bisect
+import json
+import logging
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from .environment import api_event, bench_environment, make_image_data
+from .faults import FaultInjector
+from .harness import percentile
+
+KB = 1024
+
+DEFAULT_MIX = {'list': 0.40, 'get': 0.40, 'upload': 0.10, 'delete': 0.10}
+DEFAULT_PAYLOADS = {1 * KB: 0.5, 64 * KB: 0.3, 512 * KB: 0.15, 2048 * KB: 0.05}
+
+# Placeholder resolved at replay time to the N-th most popular seeded image
+SEED_PLACEHOLDER = '$seed:'
+
+# Histogram bucket upper bounds in milliseconds
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class ZipfSampler:
+    """Sample ranks ``0..n-1`` with probability proportional to ``1 / (rank + 1) ** s``."""
+
+    def __init__(self, n, s=1.1, rng=None):
+        if n < 1:
+            raise ValueError('n must be at least 1')
+        self.rng = rng or random.Random()
+        weights = [1.0 / (rank + 1) ** s for rank in range(n)]
+        total = sum(weights)
+        cumulative = 0.0
+        self.cdf = []
+        for weight in weights:
+            cumulative += weight / total
+            self.cdf.append(cumulative)
+
+    def sample(self):
+        index = bisect.bisect_left(self.cdf, self.rng.random())
+        return min(index, len(self.cdf) - 1)
+
+
+class WeightedChoice:
+    """Pick keys from a ``{key: weight}`` mapping."""
+
+    def __init__(self, weights, rng=None):
+        if not weights or sum(weights.values()) <= 0:
+            raise ValueError('weights must contain a positive total')
+        self.rng = rng or random.Random()
+        self.keys = list(weights)
+        self.weights = [weights[key] for key in self.keys]
+
+    def sample(self):
+        return self.rng.choices(self.keys, self.weights)[0]
+
+
+class WorkloadSpec:
+    """Description of a synthetic workload, optionally with injected downstream faults."""
+
+    def __init__(self, mix=None, payloads=None, hot_images=200, zipf_s=1.1,
+                 users=20, list_limit=50, seed=None, faults=None):
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.payloads = payloads or dict(DEFAULT_PAYLOADS)
+        self.hot_images = hot_images
+        self.zipf_s = zipf_s
+        self.users = users
+        self.list_limit = list_limit
+        self.seed = seed
+        # e.g. {'target': 'dynamodb', 'error_rate': 0.2, 'error_code': 'InternalServerError', 'latency_ms': 0}
+        self.faults = faults
+
+
+class EventGenerator:
+    """Produce ``(operation, event)`` pairs for a ``WorkloadSpec``."""
+
+    def __init__(self, spec, seed_offset=0):
+        seed = None if spec.seed is None else spec.seed + seed_offset
+        self.spec = spec
+        self.rng = random.Random(seed)
+        self.operations = WeightedChoice(spec.mix, self.rng)
+        self.payload_sizes = WeightedChoice(spec.payloads, self.rng)
+        self.popularity = ZipfSampler(spec.hot_images, spec.zipf_s, self.rng)
+        self._payload_cache = {}
+
+    def _payload(self, size):
+        if size not in self._payload_cache:
+            self._payload_cache[size] = make_image_data(size)
+        return self._payload_cache[size]
+
+    def next_event(self):
+        operation = self.operations.sample()
+        user_id = f'user{self.rng.randrange(self.spec.users)}'
+
+        if operation == 'upload':
+            return operation, api_event('POST', body={
+                'user_id': user_id,
+                'filename': 'load.png',
+                'image_data': self._payload(self.payload_sizes.sample()),
+                'tags': self.rng.choice(('nature', 'city', 'portrait'))
+            })
+        if operation == 'get':
+            image_ref = f'{SEED_PLACEHOLDER}{self.popularity.sample()}'
+            return operation, api_event('GET', path_params={'image_id': image_ref})
+        if operation == 'delete':
+            # Resolved at dispatch time to an image uploaded during the run
+            return operation, api_event('DELETE', path_params={'image_id': None})
+
+        query = {'limit': str(self.spec.list_limit)}
+        if self.rng.random() < 0.5:
+            query['user_id'] = user_id
+        return operation, api_event('GET', query_params=query)
+
+    def take(self, count):
+        return [self.next_event() for _ in range(count)]
+
+
+def classify_event(event):
+    """Infer the operation name of a recorded API Gateway event."""
+    method = (event.get('httpMethod') or '').upper()
+    has_id = bool((event.get('pathParameters') or {}).get('image_id'))
+    if method == 'POST':
+        return 'upload'
+    if method == 'DELETE':
+        return 'delete'
+    return 'get' if has_id else 'list'
+
+
+def load_recorded_events(path):
+    """Load ``(operation, event)`` pairs from a JSON-lines file of events."""
+    events = []
+    with open(path, 'r', encoding='utf-8') as handle:
+        for line in handle:
+            line = line.strip()
+            if line:
+                event = json.loads(line)
+                events.append((classify_event(event), event))
+    return events
+
+
+def write_recorded_events(path, events):
+    """Write events as JSON lines so a run can be replayed exactly."""
+    with open(path, 'w', encoding='utf-8') as handle:
+        for _, event in events:
+            handle.write(json.dumps(event) + '\n')
+
+
+class LoadStats:
+    """Thread-safe latency and error accumulator."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, operation, latency, status, error=None):
+        with self._lock:
+            self.latencies[operation].append(latency)
+            self.statuses[operation][status] += 1
+            if error:
+                self.errors[f'{operation} {status}: {error}'] += 1
+
+    def merge(self, other):
+        for operation, values in other['latencies'].items():
+            self.latencies[operation].extend(values)
+        for operation, counts in other['statuses'].items():
+            self.statuses[operation].update({int(k): v for k, v in counts.items()})
+        self.errors.update(other['errors'])
+
+    def raw(self):
+        return {
+            'latencies': dict(self.latencies),
+            'statuses': {op: dict(counts) for op, counts in self.statuses.items()},
+            'errors': dict(self.errors)
+        }
+
+    def summary(self, elapsed):
+        operations = {}
+        all_latencies = []
+        for operation, values in sorted(self.latencies.items()):
+            all_latencies.extend(values)
+            operations[operation] = _summarize(values, self.statuses[operation], elapsed)
+        total_statuses = Counter()
+        for counts in self.statuses.values():
+            total_statuses.update(counts)
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'total': _summarize(all_latencies, total_statuses, elapsed),
+            'operations': operations,
+            'errors': dict(self.errors.most_common())
+        }
+
+
+def _summarize(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'histogram_ms': latency_histogram(latencies)
+    }
+
+
+def latency_histogram(latencies):
+    """Bucket latencies (seconds) into ``HISTOGRAM_BOUNDS_MS`` buckets."""
+    counts = Counter()
+    for latency in latencies:
+        latency_ms = latency * 1000
+        index = bisect.bisect_left(HISTOGRAM_BOUNDS_MS, latency_ms)
+        label = f'<={HISTOGRAM_BOUNDS_MS[index]}' if index < len(HISTOGRAM_BOUNDS_MS) else f'>{HISTOGRAM_BOUNDS_MS[-1]}'
+        counts[label] += 1
+    ordered = [f'<={bound}' for bound in HISTOGRAM_BOUNDS_MS] + [f'>{HISTOGRAM_BOUNDS_MS[-1]}']
+    return {label: counts[label] for label in ordered if counts[label]}
+
+
+class LoadRunner:
+    """Replay ``(operation, event)`` pairs against an in-process handler."""
+
+    def __init__(self, env, seeded_ids, stats=None):
+        self.env = env
+        self.seeded_ids = seeded_ids
+        self.stats = stats or LoadStats()
+        self._uploaded = []
+        self._uploaded_lock = threading.Lock()
+
+    def _resolve(self, operation, event):
+        """Bind placeholders and delete targets to concrete image IDs."""
+        params = event.get('pathParameters')
+        if not params or 'image_id' not in params:
+            return event
+        image_id = params['image_id']
+        if operation == 'delete' and not image_id:
+            with self._uploaded_lock:
+                if not self._uploaded:
+                    return None
+                image_id = self._uploaded.pop(0)
+        elif isinstance(image_id, str) and image_id.startswith(SEED_PLACEHOLDER):
+            rank = int(image_id[len(SEED_PLACEHOLDER):])
+            image_id = self.seeded_ids[rank % len(self.seeded_ids)]
+        return {**event, 'pathParameters': {**params, 'image_id': image_id}}
+
+    def execute(self, operation, event):
+        resolved = self._resolve(operation, event)
+        if resolved is None:
+            # Nothing to delete yet; issue an upload so the mix keeps moving
+            operation, resolved = 'upload', api_event('POST', body={
+                'user_id': 'user0', 'filename': 'load.png', 'image_data': make_image_data(KB)
+            })
+
+        started = time.perf_counter()
+        try:
+            response = self.env.invoke(resolved)
+        except Exception as e:
+            self.stats.record(operation, time.perf_counter() - started, 'exception', type(e).__name__)
+            return
+        latency = time.perf_counter() - started
+
+        status = response['statusCode']
+        error = None
+        if status >= 400:
+            error = _error_message(response)
+        elif operation == 'upload':
+            image_id = json.loads(response['body']).get('image_id')
+            if image_id:
+                with self._uploaded_lock:
+                    self._uploaded.append(image_id)
+        self.stats.record(operation, latency, status, error)
+
+    def run(self, next_event, threads=4, duration=None, requests=None, rate=None):
+        """
+        Run until ``duration`` seconds pass or ``requests`` events are issued.
+
+        With ``rate`` set, events are issued open-loop on a fixed schedule
+        shared by all threads; otherwise each thread issues back-to-back.
+        """
+        if duration is None and requests is None:
+            raise ValueError('duration or requests is required')
+
+        lock = threading.Lock()
+        issued = [0]
+        started = time.perf_counter()
+        deadline = started + duration if duration else None
+
+        def claim():
+            with lock:
+                if requests is not None and issued[0] >= requests:
+                    return None
+                index = issued[0]
+                issued[0] += 1
+                return index, next_event()
+
+        def worker():
+            while True:
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                claimed = claim()
+                if claimed is None:
+                    return
+                index, (operation, event) = claimed
+                if rate:
+                    delay = started + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    if deadline and time.perf_counter() >= deadline:
+                        return
+                self.execute(operation, event)
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def _error_message(response):
+    try:
+        return json.loads(response['body']).get('error', 'unknown')
+    except (TypeError, ValueError, AttributeError):
+        return 'unparseable body'
+
+
+def _event_source(spec, recorded, seed_offset):
+    if recorded is not None:
+        cycle = {'index': 0}
+
+        def next_recorded():
+            event = recorded[cycle['index'] % len(recorded)]
+            cycle['index'] += 1
+            return event
+        return next_recorded
+    return EventGenerator(spec, seed_offset).next_event
+
+
+def run_load(spec, threads=4, duration=None, requests=None, rate=None, recorded=None, seed_offset=0):
+    """Seed a fresh moto environment and run one load session; return raw stats and elapsed time."""
+    with bench_environment() as env:
+        seeded_ids = env.seed_images(spec.hot_images, users=spec.users)
+        injector = _attach_faults(env, spec.faults)
+        runner = LoadRunner(env, seeded_ids)
+        try:
+            elapsed = runner.run(
+                _event_source(spec, recorded, seed_offset),
+                threads=threads, duration=duration, requests=requests, rate=rate
+            )
+        finally:
+            if injector:
+                injector.detach()
+        return runner.stats.raw(), elapsed
+
+
+def _attach_faults(env, faults):
+    """Attach a ``FaultInjector`` to the environment's S3 and/or DynamoDB clients."""
+    if not faults:
+        return None
+    options = dict(faults)
+    target = options.pop('target', 'dynamodb')
+    injector = FaultInjector(**options)
+    if target in ('s3', 'both'):
+        injector.attach(env.s3_client)
+    if target in ('dynamodb', 'both'):
+        injector.attach(env.dynamodb.meta.client)
+    return injector
+
+
+def _process_worker(args):
+    logging.disable(logging.CRITICAL)
+    spec, threads, duration, requests, rate, recorded, index = args
+    return run_load(spec, threads, duration, requests, rate, recorded, seed_offset=index)
+
+
+def run_distributed(spec, processes, threads=4, duration=None, requests=None, rate=None, recorded=None):
+    """
+    Run one load session per process and merge the results.
+
+    Each process gets its own moto state, so rate and request counts are
+    split evenly between processes.
+    """
+    per_process_rate = rate / processes if rate else None
+    per_process_requests = -(-requests // processes) if requests else None
+    jobs = [
+        (spec, threads, duration, per_process_requests, per_process_rate, recorded, index)
+        for index in range(processes)
+    ]
+    stats = LoadStats()
+    elapsed = 0.0
+    with multiprocessing.Pool(processes) as pool:
+        for raw, process_elapsed in pool.map(_process_worker, jobs):
+            stats.merge(raw)
+            elapsed = max(elapsed, process_elapsed)
+    return stats, elapsed
+
+
+def parse_weights(value, cast=str):
+    """Parse ``key=weight,key=weight`` into a dict."""
+    weights = {}
+    for part in value.split(','):
+        key, _, weight = part.partition('=')
+        weights[cast(key.strip())] = float(weight)
+    return weights
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='In-process load generator for lambda_handler.')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, help='Run for this many seconds')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--rate', type=float, help='Target requests per second (open loop)')
+    parser.add_argument('--mix', default=None, help='Operation mix, e.g. list=0.4,get=0.4,upload=0.1,delete=0.1')
+    parser.add_argument('--payloads', default=None, help='Payload bytes mix, e.g. 1024=0.5,65536=0.5')
+    parser.add_argument('--hot-images', type=int, default=200, help='Seeded images addressed by get')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for image popularity')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible event streams')
+    parser.add_argument('--fault-target', choices=('s3', 'dynamodb', 'both'), default='dynamodb',
+                        help='Client to inject faults into')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='Fraction of AWS calls that fail')
+    parser.add_argument('--fault-code', default='InternalServerError', help='Error code of injected failures')
+    parser.add_argument('--fault-latency-ms', type=float, default=0.0, help='Latency added to every AWS call')
+    parser.add_argument('--replay', help='Replay events from a JSON-lines file')
+    parser.add_argument('--record-to', help='Write the synthetic event stream to a JSON-lines file and exit')
+    parser.add_argument('--output', help='Write the summary JSON to this file')
+    args = parser.parse_args(argv)
+    if not (args.duration or args.requests or args.record_to):
+        parser.error('one of --duration or --requests is required')
+    return args
+
+
+def _fault_options(args):
+    if not (args.fault_rate or args.fault_latency_ms):
+        return None
+    return {
+        'target': args.fault_target,
+        'error_rate': args.fault_rate,
+        'error_code': args.fault_code,
+        'latency_ms': args.fault_latency_ms,
+        'seed': args.seed
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.disable(logging.CRITICAL)
+    spec = WorkloadSpec(
+        mix=parse_weights(args.mix) if args.mix else None,
+        payloads=parse_weights(args.payloads, int) if args.payloads else None,
+        hot_images=args.hot_images,
+        zipf_s=args.zipf,
+        users=args.users,
+        seed=args.seed,
+        faults=_fault_options(args)
+    )
+
+    if args.record_to:
+        write_recorded_events(args.record_to, EventGenerator(spec).take(args.requests or 1000))
+        return 0
+
+    recorded = load_recorded_events(args.replay) if args.replay else None
+    if args.processes > 1:
+        stats, elapsed = run_distributed(
+            spec, args.processes, args.threads, args.duration, args.requests, args.rate, recorded
+        )
+    else:
+        raw, elapsed = run_load(spec, args.threads, args.duration, args.requests, args.rate, recorded)
+        stats = LoadStats()
+        stats.merge(raw)
+
+    summary = stats.summary(elapsed)
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,7 +15,18 @@ TABLE_NAME="${TABLE_NAME:-image-metadata}"
 FUNCTION_NAME="${FUNCTION_NAME:-imageService}"
 API_NAME="${API_NAME:-image-api}"
 STAGE_NAME="${STAGE_NAME:-dev}"
+FEED_INDEX_NAME="${FEED_INDEX_NAME:-recent-feed-index}"
+PURGE_INDEX_NAME="${PURGE_INDEX_NAME:-purge-index}"
+USAGE_TABLE_NAME="${USAGE_TABLE_NAME:-image-usage}"
+IDEMPOTENCY_TABLE_NAME="${IDEMPOTENCY_TABLE_NAME:-image-idempotency}"
 HANDLER_NAME="${HANDLER_NAME:-src.handlers.image_handler.lambda_handler}"
+ENRICHMENT_FUNCTION_NAME="${ENRICHMENT_FUNCTION_NAME:-imageEnrichment}"
+ENRICHMENT_HANDLER_NAME="${ENRICHMENT_HANDLER_NAME:-src.handlers.enrichment_handler.lambda_handler}"
+ENRICHMENT_QUEUE_NAME="${ENRICHMENT_QUEUE_NAME:-image-enrichment}"
+EXPIRY_FUNCTION_NAME="${EXPIRY_FUNCTION_NAME:-imageExpiry}"
+EXPIRY_HANDLER_NAME="${EXPIRY_HANDLER_NAME:-src.handlers.expiry_handler.lambda_handler}"
+EXPIRY_CLASS_DAYS="${EXPIRY_CLASS_DAYS:-1,7,30,90,365}"
+EXPIRY_TAG_KEY="${EXPIRY_TAG_KEY:-expiry-class}"
 LAMBDA_RUNTIME="${LAMBDA_RUNTIME:-python3.12}"
 FUNCTION_ZIP="${FUNCTION_ZIP:-${ROOT_DIR}/function.zip}"
 
@@ -33,17 +44,77 @@ ensure_bucket() {
   fi
 }
 
+ensure_index() {
+  local index_name="$1" hash_key="$2" range_key="$3" projection="$4"
+  if [[ "$(awslocal dynamodb describe-table --table-name "${TABLE_NAME}" --query "Table.GlobalSecondaryIndexes[?IndexName=='${index_name}'].IndexName | [0]" --output text)" == "None" ]]; then
+    echo "Adding index: ${index_name}"
+    awslocal dynamodb update-table \
+      --table-name "${TABLE_NAME}" \
+      --attribute-definitions AttributeName=${hash_key},AttributeType=S AttributeName=${range_key},AttributeType=S \
+      --global-secondary-index-updates "[{\"Create\":{\"IndexName\":\"${index_name}\",\"KeySchema\":[{\"AttributeName\":\"${hash_key}\",\"KeyType\":\"HASH\"},{\"AttributeName\":\"${range_key}\",\"KeyType\":\"RANGE\"}],\"Projection\":${projection}}}]" >/dev/null
+  fi
+}
+
 ensure_table() {
   echo "Ensuring DynamoDB table exists: ${TABLE_NAME}"
+  local feed_projection='{"ProjectionType":"ALL"}'
+  local purge_projection='{"ProjectionType":"INCLUDE","NonKeyAttributes":["s3_key"]}'
   if ! awslocal dynamodb describe-table --table-name "${TABLE_NAME}" >/dev/null 2>&1; then
     awslocal dynamodb create-table \
       --table-name "${TABLE_NAME}" \
-      --attribute-definitions AttributeName=image_id,AttributeType=S \
+      --attribute-definitions AttributeName=image_id,AttributeType=S AttributeName=feed_pk,AttributeType=S AttributeName=feed_sk,AttributeType=S AttributeName=purge_pk,AttributeType=S AttributeName=purge_after,AttributeType=S \
       --key-schema AttributeName=image_id,KeyType=HASH \
+      --global-secondary-indexes "[{\"IndexName\":\"${FEED_INDEX_NAME}\",\"KeySchema\":[{\"AttributeName\":\"feed_pk\",\"KeyType\":\"HASH\"},{\"AttributeName\":\"feed_sk\",\"KeyType\":\"RANGE\"}],\"Projection\":${feed_projection}},{\"IndexName\":\"${PURGE_INDEX_NAME}\",\"KeySchema\":[{\"AttributeName\":\"purge_pk\",\"KeyType\":\"HASH\"},{\"AttributeName\":\"purge_after\",\"KeyType\":\"RANGE\"}],\"Projection\":${purge_projection}}]" \
       --billing-mode PAY_PER_REQUEST >/dev/null
+  else
+    ensure_index "${FEED_INDEX_NAME}" feed_pk feed_sk "${feed_projection}"
+    ensure_index "${PURGE_INDEX_NAME}" purge_pk purge_after "${purge_projection}"
   fi
 }
 
+ensure_usage_table() {
+  echo "Ensuring DynamoDB usage table exists: ${USAGE_TABLE_NAME}"
+  if ! awslocal dynamodb describe-table --table-name "${USAGE_TABLE_NAME}" >/dev/null 2>&1; then
+    awslocal dynamodb create-table \
+      --table-name "${USAGE_TABLE_NAME}" \
+      --attribute-definitions AttributeName=user_id,AttributeType=S \
+      --key-schema AttributeName=user_id,KeyType=HASH \
+      --billing-mode PAY_PER_REQUEST >/dev/null
+  fi
+}
+
+ensure_idempotency_table() {
+  echo "Ensuring DynamoDB idempotency table exists: ${IDEMPOTENCY_TABLE_NAME}"
+  if ! awslocal dynamodb describe-table --table-name "${IDEMPOTENCY_TABLE_NAME}" >/dev/null 2>&1; then
+    awslocal dynamodb create-table \
+      --table-name "${IDEMPOTENCY_TABLE_NAME}" \
+      --attribute-definitions AttributeName=idempotency_key,AttributeType=S \
+      --key-schema AttributeName=idempotency_key,KeyType=HASH \
+      --billing-mode PAY_PER_REQUEST >/dev/null
+  fi
+  awslocal dynamodb update-time-to-live \
+    --table-name "${IDEMPOTENCY_TABLE_NAME}" \
+    --time-to-live-specification "Enabled=true,AttributeName=expires_at" >/dev/null 2>&1 || true
+}
+
+ensure_expiry() {
+  echo "Ensuring TTL on ${TABLE_NAME} and lifecycle rules on ${BUCKET_NAME}"
+  awslocal dynamodb update-time-to-live \
+    --table-name "${TABLE_NAME}" \
+    --time-to-live-specification "Enabled=true,AttributeName=expires_at" >/dev/null 2>&1 || true
+
+  # One rule per expiry class: objects tagged "<days>d" expire <days> days after upload.
+  # Replaces the bucket's lifecycle configuration; keep EXPIRY_* in sync with the Lambda environment.
+  local rules="" days expiry_days
+  IFS=',' read -ra expiry_days <<< "${EXPIRY_CLASS_DAYS}"
+  for days in "${expiry_days[@]}"; do
+    rules+="${rules:+,}{\"ID\":\"expire-${days}d\",\"Status\":\"Enabled\",\"Filter\":{\"Tag\":{\"Key\":\"${EXPIRY_TAG_KEY}\",\"Value\":\"${days}d\"}},\"Expiration\":{\"Days\":${days}}}"
+  done
+  awslocal s3api put-bucket-lifecycle-configuration \
+    --bucket "${BUCKET_NAME}" \
+    --lifecycle-configuration "{\"Rules\":[${rules}]}" >/dev/null
+}
+
 package_lambda() {
   echo "Packaging Lambda artifact"
   rm -f "${FUNCTION_ZIP}"
@@ -70,7 +141,7 @@ ensure_lambda() {
       --function-name "${FUNCTION_NAME}" \
       --runtime "${LAMBDA_RUNTIME}" \
       --handler "${HANDLER_NAME}" \
-      --environment "Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}" >/dev/null
+      --environment "Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},USAGE_TABLE_NAME=${USAGE_TABLE_NAME},IDEMPOTENCY_TABLE_NAME=${IDEMPOTENCY_TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}" >/dev/null
   else
     awslocal lambda create-function \
       --function-name "${FUNCTION_NAME}" \
@@ -78,7 +149,88 @@ ensure_lambda() {
       --handler "${HANDLER_NAME}" \
       --role arn:aws:iam::000000000000:role/lambda-role \
       --zip-file "fileb://${FUNCTION_ZIP}" \
-      --environment "Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}" >/dev/null
+      --environment "Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},USAGE_TABLE_NAME=${USAGE_TABLE_NAME},IDEMPOTENCY_TABLE_NAME=${IDEMPOTENCY_TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}" >/dev/null
+  fi
+}
+
+ensure_enrichment() {
+  echo "Ensuring enrichment queue and Lambda exist: ${ENRICHMENT_FUNCTION_NAME}"
+  local dlq_url dlq_arn queue_url queue_arn function_env
+  function_env="Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}"
+
+  dlq_url="$(awslocal sqs create-queue --queue-name "${ENRICHMENT_QUEUE_NAME}-dlq" --query 'QueueUrl' --output text)"
+  dlq_arn="$(awslocal sqs get-queue-attributes --queue-url "${dlq_url}" --attribute-names QueueArn --query 'Attributes.QueueArn' --output text)"
+  queue_url="$(awslocal sqs create-queue --queue-name "${ENRICHMENT_QUEUE_NAME}" --query 'QueueUrl' --output text)"
+  queue_arn="$(awslocal sqs get-queue-attributes --queue-url "${queue_url}" --attribute-names QueueArn --query 'Attributes.QueueArn' --output text)"
+  awslocal sqs set-queue-attributes \
+    --queue-url "${queue_url}" \
+    --attributes "{\"VisibilityTimeout\":\"180\",\"RedrivePolicy\":\"{\\\"deadLetterTargetArn\\\":\\\"${dlq_arn}\\\",\\\"maxReceiveCount\\\":\\\"5\\\"}\"}" >/dev/null
+
+  if awslocal lambda get-function --function-name "${ENRICHMENT_FUNCTION_NAME}" >/dev/null 2>&1; then
+    awslocal lambda update-function-code \
+      --function-name "${ENRICHMENT_FUNCTION_NAME}" \
+      --zip-file "fileb://${FUNCTION_ZIP}" >/dev/null
+  else
+    awslocal lambda create-function \
+      --function-name "${ENRICHMENT_FUNCTION_NAME}" \
+      --runtime "${LAMBDA_RUNTIME}" \
+      --handler "${ENRICHMENT_HANDLER_NAME}" \
+      --timeout 30 \
+      --role arn:aws:iam::000000000000:role/lambda-role \
+      --zip-file "fileb://${FUNCTION_ZIP}" \
+      --environment "${function_env}" >/dev/null
+  fi
+
+  if [[ "$(awslocal lambda list-event-source-mappings --function-name "${ENRICHMENT_FUNCTION_NAME}" --event-source-arn "${queue_arn}" --query 'EventSourceMappings[0].UUID' --output text)" == "None" ]]; then
+    awslocal lambda create-event-source-mapping \
+      --function-name "${ENRICHMENT_FUNCTION_NAME}" \
+      --event-source-arn "${queue_arn}" \
+      --batch-size 10 \
+      --function-response-types ReportBatchItemFailures >/dev/null
+  fi
+
+  awslocal s3api put-bucket-notification-configuration \
+    --bucket "${BUCKET_NAME}" \
+    --notification-configuration "{\"QueueConfigurations\":[{\"QueueArn\":\"${queue_arn}\",\"Events\":[\"s3:ObjectCreated:*\"]}]}" >/dev/null
+}
+
+ensure_expiry_stream() {
+  echo "Ensuring metadata stream and expiry Lambda exist: ${EXPIRY_FUNCTION_NAME}"
+  local stream_arn function_env
+  function_env="Variables={BUCKET_NAME=${BUCKET_NAME},TABLE_NAME=${TABLE_NAME},USAGE_TABLE_NAME=${USAGE_TABLE_NAME},AWS_DEFAULT_REGION=${AWS_DEFAULT_REGION},USE_LOCALSTACK=1}"
+
+  stream_arn="$(awslocal dynamodb describe-table --table-name "${TABLE_NAME}" --query 'Table.LatestStreamArn' --output text)"
+  if [[ -z "${stream_arn}" || "${stream_arn}" == "None" ]]; then
+    stream_arn="$(awslocal dynamodb update-table \
+      --table-name "${TABLE_NAME}" \
+      --stream-specification StreamEnabled=true,StreamViewType=OLD_IMAGE \
+      --query 'TableDescription.LatestStreamArn' --output text)"
+  fi
+
+  if awslocal lambda get-function --function-name "${EXPIRY_FUNCTION_NAME}" >/dev/null 2>&1; then
+    awslocal lambda update-function-code \
+      --function-name "${EXPIRY_FUNCTION_NAME}" \
+      --zip-file "fileb://${FUNCTION_ZIP}" >/dev/null
+  else
+    awslocal lambda create-function \
+      --function-name "${EXPIRY_FUNCTION_NAME}" \
+      --runtime "${LAMBDA_RUNTIME}" \
+      --handler "${EXPIRY_HANDLER_NAME}" \
+      --timeout 30 \
+      --role arn:aws:iam::000000000000:role/lambda-role \
+      --zip-file "fileb://${FUNCTION_ZIP}" \
+      --environment "${function_env}" >/dev/null
+  fi
+
+  # Only TTL deletions reach the function; the API releases usage for its own deletes
+  if [[ "$(awslocal lambda list-event-source-mappings --function-name "${EXPIRY_FUNCTION_NAME}" --event-source-arn "${stream_arn}" --query 'EventSourceMappings[0].UUID' --output text)" == "None" ]]; then
+    awslocal lambda create-event-source-mapping \
+      --function-name "${EXPIRY_FUNCTION_NAME}" \
+      --event-source-arn "${stream_arn}" \
+      --starting-position LATEST \
+      --batch-size 100 \
+      --function-response-types ReportBatchItemFailures \
+      --filter-criteria '{"Filters":[{"Pattern":"{\"eventName\":[\"REMOVE\"],\"userIdentity\":{\"type\":[\"Service\"],\"principalId\":[\"dynamodb.amazonaws.com\"]}}"}]}' >/dev/null
   fi
 }
 
@@ -140,8 +292,13 @@ main() {
 
   ensure_bucket
   ensure_table
+  ensure_usage_table
+  ensure_idempotency_table
+  ensure_expiry
   package_lambda
   ensure_lambda
+  ensure_enrichment
+  ensure_expiry_stream
   ensure_api
 }
 
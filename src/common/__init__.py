@@ -7,7 +7,11 @@ from .errors import (
     ValidationError,
     NotFoundError,
     StorageError,
-    DatabaseError
+    DatabaseError,
+    ConflictError,
+    QuotaExceededError,
+    TooManyRequestsError,
+    ServiceUnavailableError
 )
 
 __all__ = [
@@ -17,5 +21,9 @@ __all__ = [
     'ValidationError',
     'NotFoundError',
     'StorageError',
-    'DatabaseError'
+    'DatabaseError',
+    'ConflictError',
+    'QuotaExceededError',
+    'TooManyRequestsError',
+    'ServiceUnavailableError'
 ]
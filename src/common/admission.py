@@ -0,0 +1,128 @@
+"""
+Admission control and load shedding.
+
+Tracks the outcome of recent requests, and the latency of recent reads, in a
+sliding window and sheds new work with 503 + ``Retry-After`` when downstream error rates or
+latencies cross thresholds. Writes are shed before reads, so reads stay
+available during upload storms. An optional in-flight byte budget rejects
+uploads with 429 when a long-lived (server-mode) process holds too many
+decoded image buffers at once.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+from .config import Config
+from .errors import ServiceUnavailableError, TooManyRequestsError
+
+READ = 'read'
+WRITE = 'write'
+
+
+class HealthWindow:
+    """Sliding window of ``(timestamp, failed, latency)`` samples; ``latency`` may be None."""
+    
+    def __init__(self, window_seconds, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.samples = deque()
+        self.lock = threading.Lock()
+    
+    def record(self, failed, latency=None):
+        with self.lock:
+            self.samples.append((self.clock(), failed, latency))
+            self._expire()
+    
+    def snapshot(self):
+        """Return ``(count, error_rate, p90_latency_seconds, oldest_timestamp)``."""
+        with self.lock:
+            self._expire()
+            count = len(self.samples)
+            if not count:
+                return 0, 0.0, 0.0, None
+            failures = sum(1 for _, failed, _ in self.samples if failed)
+            latencies = sorted(latency for _, _, latency in self.samples if latency is not None)
+            p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))] if latencies else 0.0
+            return count, failures / count, p90, self.samples[0][0]
+    
+    def _expire(self):
+        cutoff = self.clock() - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+
+class Ticket:
+    """An admitted request; pass back to ``AdmissionController.release``."""
+    
+    __slots__ = ('priority', 'reserved_bytes', 'started')
+    
+    def __init__(self, priority, reserved_bytes, started):
+        self.priority = priority
+        self.reserved_bytes = reserved_bytes
+        self.started = started
+
+
+class AdmissionController:
+    """Decide whether to admit a request based on recent health and in-flight bytes."""
+    
+    def __init__(self, settings=None, clock=time.monotonic):
+        settings = settings or Config.get_admission_settings()
+        self.settings = settings
+        self.clock = clock
+        self.health = HealthWindow(settings['window_seconds'], clock)
+        self.inflight_bytes = 0
+        self.lock = threading.Lock()
+    
+    def admit(self, priority, request_bytes=0):
+        """Admit a request or raise ``ServiceUnavailableError``/``TooManyRequestsError``."""
+        self._check_health(priority)
+        
+        reserved = 0
+        limit = self.settings['max_inflight_bytes']
+        if limit and request_bytes:
+            with self.lock:
+                # A single request larger than the budget is admitted only when idle
+                if self.inflight_bytes and self.inflight_bytes + request_bytes > limit:
+                    raise TooManyRequestsError(
+                        'Too many uploads in progress', retry_after=self.settings['retry_after']
+                    )
+                self.inflight_bytes += request_bytes
+                reserved = request_bytes
+        
+        return Ticket(priority, reserved, self.clock())
+    
+    def release(self, ticket, failed=False):
+        """Release a ticket and record whether the request failed downstream."""
+        if ticket.reserved_bytes:
+            with self.lock:
+                self.inflight_bytes -= ticket.reserved_bytes
+        # Upload latency grows with the body and the optimizer, not with downstream health
+        latency = self.clock() - ticket.started if ticket.priority == READ else None
+        self.health.record(failed, latency)
+    
+    def _check_health(self, priority):
+        count, error_rate, p90_latency, oldest = self.health.snapshot()
+        if count < self.settings['min_samples']:
+            return
+        
+        prefix = 'read' if priority == READ else 'write'
+        max_error_rate = self.settings[f'{prefix}_error_rate']
+        max_latency_ms = self.settings[f'{prefix}_latency_ms']
+        
+        reason = None
+        if error_rate >= max_error_rate:
+            reason = f'error rate {error_rate:.0%}'
+        elif max_latency_ms and p90_latency * 1000 >= max_latency_ms:
+            reason = f'p90 latency {p90_latency * 1000:.0f} ms'
+        
+        if reason:
+            raise ServiceUnavailableError(
+                f'Service is shedding {prefix} load ({reason})',
+                retry_after=self._retry_after(oldest)
+            )
+    
+    def _retry_after(self, oldest):
+        """Suggest waiting until the oldest bad sample may have left the window."""
+        remaining = self.settings['window_seconds'] - (self.clock() - oldest) if oldest else 0
+        return max(self.settings['retry_after'], min(math.ceil(remaining), int(self.settings['window_seconds'])))
@@ -1,6 +1,7 @@
 """
 Configuration management.
 """
+import math
 import os
 
 
@@ -12,13 +13,128 @@ class Config:
     TABLE_NAME = 'image-metadata'
     REGION = 'us-east-1'
     PRESIGNED_URL_EXPIRATION = 3600  # seconds
+    URL_SIGNER = 's3'
+    CLOUDFRONT_POLICY = 'canned'
+    URL_SIGNING_WINDOW_SECONDS = 0  # 0 = sign every URL with the current time
+    URL_CACHE_SIZE = 10000
     MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MB
+    S3_KEY_LAYOUT = 'legacy'
+    ID_SCHEME = 'uuid4'
+    STORAGE_BACKEND = 's3'
+    METADATA_BACKEND = 'dynamodb'
+    LOCAL_STORAGE_ROOT = 'data/objects'
+    SQLITE_PATH = 'data/metadata.db'
+    IMAGE_OPTIMIZATION = 'off'
+    WEBP_QUALITY = 80
+    OPTIMIZE_TIMEOUT_MS = 2000
+    OPTIMIZE_WORKERS = 2  # 0 = optimize inline
+    ENRICHMENTS = 'dimensions,captured_at,checksum,dominant_color'
+    ENRICHMENT_HEADER_BYTES = 128 * 1024
+    ENRICHMENT_WORKERS = 8
+    COMPRESSION_MIN_BYTES = 1024
+    FEED_INDEX_NAME = 'recent-feed-index'
+    FEED_SHARD_COUNT = 8
+    FEED_LOOKBACK_DAYS = 30
+    PURGE_INDEX_NAME = 'purge-index'
+    SEARCH_INDEX = 'off'
+    SEARCH_CACHE_USERS = 64
+    SEARCH_REFRESH_SECONDS = 5
+    UNDELETE_WINDOW_SECONDS = 7 * 24 * 3600
+    EXPIRY_CLASS_DAYS = '1,7,30,90,365'
+    BULK_TAG_MAX_IMAGES = 1000
+    BULK_TAG_WORKERS = 8
+    EXPIRY_TAG_KEY = 'expiry-class'
+    USAGE_TABLE_NAME = 'image-usage'
+    MAX_IMAGES_PER_USER = 0  # 0 = unlimited
+    MAX_BYTES_PER_USER = 0  # 0 = unlimited
+    IDEMPOTENCY_TABLE_NAME = 'image-idempotency'
+    IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+    IDEMPOTENCY_WAIT_SECONDS = 5
+    IDEMPOTENCY_LEASE_SECONDS = 30  # Lambda timeout
+    ADMISSION_MAX_INFLIGHT_BYTES = 0  # 0 = unlimited
+    ADMISSION_WINDOW_SECONDS = 10
+    ADMISSION_MIN_SAMPLES = 20
+    ADMISSION_WRITE_ERROR_RATE = 0.25
+    ADMISSION_READ_ERROR_RATE = 0.75
+    ADMISSION_WRITE_LATENCY_MS = 3000  # 0 = disabled
+    ADMISSION_READ_LATENCY_MS = 6000  # 0 = disabled
+    ADMISSION_RETRY_AFTER = 2  # seconds
+    RETRY_MAX_ATTEMPTS = 3
+    RETRY_BASE_DELAY_MS = 25
+    RETRY_MAX_DELAY_MS = 1000
+    RETRY_BUDGET = 10  # retries per invocation
+    BREAKER_FAILURE_THRESHOLD = 5
+    BREAKER_RESET_SECONDS = 30
+    PROFILE_MODE = 'all'
+    PROFILE_SAMPLE_RATE = 0.0  # 0 = only requests with a signed X-Debug-Profile header
+    PROFILE_OUTPUT = '/tmp/profiles'
+    PROFILE_TOP = 30
+    PROFILE_TRACE_FRAMES = 16
     
     @staticmethod
     def get_bucket_name():
         """Get S3 bucket name."""
         return os.environ.get('BUCKET_NAME', Config.BUCKET_NAME)
     
+    @staticmethod
+    def get_storage_backend():
+        """Get the object storage backend (``s3`` or ``local``)."""
+        return os.environ.get('STORAGE_BACKEND', Config.STORAGE_BACKEND).lower()
+    
+    @staticmethod
+    def get_metadata_backend():
+        """Get the metadata, usage and idempotency backend (``dynamodb`` or ``sqlite``)."""
+        return os.environ.get('METADATA_BACKEND', Config.METADATA_BACKEND).lower()
+    
+    @staticmethod
+    def get_local_storage_root():
+        """Get the directory holding objects for the ``local`` storage backend."""
+        return os.environ.get('LOCAL_STORAGE_ROOT', Config.LOCAL_STORAGE_ROOT)
+    
+    @staticmethod
+    def get_local_storage_url():
+        """Get the base URL local objects are served from (None = ``file://`` URLs)."""
+        return os.environ.get('LOCAL_STORAGE_URL') or None
+    
+    @staticmethod
+    def get_sqlite_path():
+        """Get the database file of the ``sqlite`` metadata backend."""
+        return os.environ.get('SQLITE_PATH', Config.SQLITE_PATH)
+    
+    @staticmethod
+    def get_search_bucket_name():
+        """Get the bucket holding search segments (defaults to the image bucket)."""
+        return os.environ.get('SEARCH_BUCKET_NAME') or Config.get_bucket_name()
+    
+    @staticmethod
+    def get_search_settings():
+        """Get whether search indexing is on, the per-process index cache size and refresh interval."""
+        env = os.environ.get
+        return {
+            'enabled': env('SEARCH_INDEX', Config.SEARCH_INDEX).lower() == 'on',
+            'cache_users': int(env('SEARCH_CACHE_USERS', str(Config.SEARCH_CACHE_USERS))),
+            'refresh_seconds': float(env('SEARCH_REFRESH_SECONDS', str(Config.SEARCH_REFRESH_SECONDS)))
+        }
+    
+    @staticmethod
+    def get_expiry_settings():
+        """Get the lifecycle expiry classes (days, ascending) and the S3 tag key that selects them."""
+        env = os.environ.get
+        days = env('EXPIRY_CLASS_DAYS', Config.EXPIRY_CLASS_DAYS)
+        return {
+            'class_days': tuple(sorted(int(value) for value in days.split(',') if value.strip())),
+            'tag_key': env('EXPIRY_TAG_KEY', Config.EXPIRY_TAG_KEY)
+        }
+    
+    @staticmethod
+    def get_bulk_tag_settings():
+        """Get the most images one bulk tag edit may touch and how many are updated in parallel."""
+        env = os.environ.get
+        return {
+            'max_images': int(env('BULK_TAG_MAX_IMAGES', str(Config.BULK_TAG_MAX_IMAGES))),
+            'workers': max(1, int(env('BULK_TAG_WORKERS', str(Config.BULK_TAG_WORKERS))))
+        }
+    
     @staticmethod
     def get_table_name():
         """Get DynamoDB table name."""
@@ -35,11 +151,192 @@ class Config:
         value = os.environ.get('PRESIGNED_URL_EXPIRATION', str(Config.PRESIGNED_URL_EXPIRATION))
         return int(value)
     
+    @staticmethod
+    def get_url_signer_settings():
+        """Get the URL signer (``s3`` or ``cloudfront``), its CloudFront key and the signing window."""
+        env = os.environ.get
+        private_key = env('CLOUDFRONT_PRIVATE_KEY')
+        key_file = env('CLOUDFRONT_PRIVATE_KEY_FILE')
+        if not private_key and key_file:
+            with open(key_file) as f:
+                private_key = f.read()
+        return {
+            'signer': env('URL_SIGNER', Config.URL_SIGNER),
+            'domain': env('CLOUDFRONT_DOMAIN'),
+            'key_pair_id': env('CLOUDFRONT_KEY_PAIR_ID'),
+            'private_key': private_key,
+            'policy': env('CLOUDFRONT_POLICY', Config.CLOUDFRONT_POLICY),
+            'signed_cookies': env('CLOUDFRONT_SIGNED_COOKIES', 'false').lower() == 'true',
+            'window_seconds': int(env('URL_SIGNING_WINDOW_SECONDS', str(Config.URL_SIGNING_WINDOW_SECONDS))),
+            'cache_size': int(env('URL_CACHE_SIZE', str(Config.URL_CACHE_SIZE)))
+        }
+    
+    @staticmethod
+    def get_cookie_domain():
+        """Get the ``Domain`` attribute for signed cookies (unset = the API's own host)."""
+        return os.environ.get('CLOUDFRONT_COOKIE_DOMAIN')
+    
     @staticmethod
     def get_max_image_size():
         """Get maximum image size in bytes."""
         value = os.environ.get('MAX_IMAGE_SIZE', str(Config.MAX_IMAGE_SIZE))
         return int(value)
+    
+    @staticmethod
+    def get_id_scheme():
+        """Get the image ID scheme for new uploads (``uuid4`` or ``uuid7``)."""
+        return os.environ.get('ID_SCHEME', Config.ID_SCHEME)
+    
+    @staticmethod
+    def get_s3_key_layout():
+        """Get the S3 key layout for new uploads (``legacy`` or ``hashed``)."""
+        return os.environ.get('S3_KEY_LAYOUT', Config.S3_KEY_LAYOUT)
+    
+    @staticmethod
+    def get_optimization_settings():
+        """Get image optimization mode, WebP quality, time budget and pool size."""
+        env = os.environ.get
+        return {
+            'mode': env('IMAGE_OPTIMIZATION', Config.IMAGE_OPTIMIZATION),
+            'webp_quality': int(env('WEBP_QUALITY', str(Config.WEBP_QUALITY))),
+            'timeout_ms': float(env('OPTIMIZE_TIMEOUT_MS', str(Config.OPTIMIZE_TIMEOUT_MS))),
+            'workers': int(env('OPTIMIZE_WORKERS', str(Config.OPTIMIZE_WORKERS)))
+        }
+    
+    @staticmethod
+    def get_enrichment_settings():
+        """Get the enrichments to compute, bytes fetched for header-only enrichments and parallel workers."""
+        env = os.environ.get
+        enrichments = env('ENRICHMENTS', Config.ENRICHMENTS)
+        return {
+            'enrichments': tuple(name.strip() for name in enrichments.split(',') if name.strip()),
+            'header_bytes': int(env('ENRICHMENT_HEADER_BYTES', str(Config.ENRICHMENT_HEADER_BYTES))),
+            'workers': int(env('ENRICHMENT_WORKERS', str(Config.ENRICHMENT_WORKERS)))
+        }
+    
+    @staticmethod
+    def get_compression_min_bytes():
+        """Get the minimum response body size (bytes) eligible for compression."""
+        value = os.environ.get('COMPRESSION_MIN_BYTES', str(Config.COMPRESSION_MIN_BYTES))
+        return int(value)
+    
+    @staticmethod
+    def get_feed_index_name():
+        """Get the name of the recent-uploads feed GSI."""
+        return os.environ.get('FEED_INDEX_NAME', Config.FEED_INDEX_NAME)
+    
+    @staticmethod
+    def get_feed_shard_count():
+        """Get the number of write shards per feed date bucket."""
+        value = os.environ.get('FEED_SHARD_COUNT', str(Config.FEED_SHARD_COUNT))
+        return int(value)
+    
+    @staticmethod
+    def get_feed_lookback_days():
+        """Get how many consecutive empty daily buckets end the feed."""
+        value = os.environ.get('FEED_LOOKBACK_DAYS', str(Config.FEED_LOOKBACK_DAYS))
+        return int(value)
+    
+    @staticmethod
+    def get_purge_index_name():
+        """Get the name of the sparse GSI over tombstoned images."""
+        return os.environ.get('PURGE_INDEX_NAME', Config.PURGE_INDEX_NAME)
+    
+    @staticmethod
+    def get_undelete_window_seconds():
+        """Get how long a deleted image can be restored before it is purged."""
+        return int(os.environ.get('UNDELETE_WINDOW_SECONDS', str(Config.UNDELETE_WINDOW_SECONDS)))
+    
+    @staticmethod
+    def get_usage_table_name():
+        """Get DynamoDB per-user usage table name."""
+        return os.environ.get('USAGE_TABLE_NAME', Config.USAGE_TABLE_NAME)
+    
+    @staticmethod
+    def get_max_images_per_user():
+        """Get the per-user image count quota (0 = unlimited)."""
+        value = os.environ.get('MAX_IMAGES_PER_USER', str(Config.MAX_IMAGES_PER_USER))
+        return int(value)
+    
+    @staticmethod
+    def get_max_bytes_per_user():
+        """Get the per-user storage quota in bytes (0 = unlimited)."""
+        value = os.environ.get('MAX_BYTES_PER_USER', str(Config.MAX_BYTES_PER_USER))
+        return int(value)
+    
+    @staticmethod
+    def get_idempotency_table_name():
+        """Get DynamoDB idempotency table name."""
+        return os.environ.get('IDEMPOTENCY_TABLE_NAME', Config.IDEMPOTENCY_TABLE_NAME)
+    
+    @staticmethod
+    def get_idempotency_ttl_seconds():
+        """Get how long idempotency records are kept."""
+        value = os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(Config.IDEMPOTENCY_TTL_SECONDS))
+        return int(value)
+    
+    @staticmethod
+    def get_idempotency_lease_seconds():
+        """
+        Get how long an in-progress claim blocks retries of the same key.
+        
+        The function timeout plus the duplicate wait time: a claim left behind
+        by a crashed or timed-out upload can be taken over after that.
+        """
+        value = os.environ.get('IDEMPOTENCY_LEASE_SECONDS', str(Config.IDEMPOTENCY_LEASE_SECONDS))
+        return int(value) + math.ceil(Config.get_idempotency_wait_seconds())
+    
+    @staticmethod
+    def get_idempotency_wait_seconds():
+        """Get how long a duplicate waits for an in-flight original before a 409."""
+        value = os.environ.get('IDEMPOTENCY_WAIT_SECONDS', str(Config.IDEMPOTENCY_WAIT_SECONDS))
+        return float(value)
+    
+    @staticmethod
+    def use_content_hash_idempotency():
+        """Whether uploads without an Idempotency-Key are deduplicated by content hash."""
+        return os.environ.get('IDEMPOTENCY_CONTENT_HASH') == '1'
+    
+    @staticmethod
+    def get_admission_settings():
+        """Get admission control thresholds."""
+        env = os.environ.get
+        return {
+            'max_inflight_bytes': int(env('ADMISSION_MAX_INFLIGHT_BYTES', str(Config.ADMISSION_MAX_INFLIGHT_BYTES))),
+            'window_seconds': float(env('ADMISSION_WINDOW_SECONDS', str(Config.ADMISSION_WINDOW_SECONDS))),
+            'min_samples': int(env('ADMISSION_MIN_SAMPLES', str(Config.ADMISSION_MIN_SAMPLES))),
+            'write_error_rate': float(env('ADMISSION_WRITE_ERROR_RATE', str(Config.ADMISSION_WRITE_ERROR_RATE))),
+            'read_error_rate': float(env('ADMISSION_READ_ERROR_RATE', str(Config.ADMISSION_READ_ERROR_RATE))),
+            'write_latency_ms': float(env('ADMISSION_WRITE_LATENCY_MS', str(Config.ADMISSION_WRITE_LATENCY_MS))),
+            'read_latency_ms': float(env('ADMISSION_READ_LATENCY_MS', str(Config.ADMISSION_READ_LATENCY_MS))),
+            'retry_after': int(env('ADMISSION_RETRY_AFTER', str(Config.ADMISSION_RETRY_AFTER)))
+        }
+    
+    @staticmethod
+    def get_retry_settings():
+        """Get retry, retry budget and circuit breaker settings for AWS calls."""
+        env = os.environ.get
+        return {
+            'max_attempts': max(1, int(env('RETRY_MAX_ATTEMPTS', str(Config.RETRY_MAX_ATTEMPTS)))),
+            'base_delay_ms': float(env('RETRY_BASE_DELAY_MS', str(Config.RETRY_BASE_DELAY_MS))),
+            'max_delay_ms': float(env('RETRY_MAX_DELAY_MS', str(Config.RETRY_MAX_DELAY_MS))),
+            'budget': int(env('RETRY_BUDGET', str(Config.RETRY_BUDGET))),
+            'breaker_threshold': int(env('BREAKER_FAILURE_THRESHOLD', str(Config.BREAKER_FAILURE_THRESHOLD))),
+            'breaker_reset_seconds': float(env('BREAKER_RESET_SECONDS', str(Config.BREAKER_RESET_SECONDS)))
+        }
+    
+    @staticmethod
+    def get_profiling_settings():
+        """Get request profiling triggers, profilers and where reports are written."""
+        env = os.environ.get
+        return {
+            'mode': env('PROFILE_MODE', Config.PROFILE_MODE).lower(),
+            'sample_rate': float(env('PROFILE_SAMPLE_RATE', str(Config.PROFILE_SAMPLE_RATE))),
+            'secret': env('PROFILE_SECRET') or None,
+            'output': env('PROFILE_OUTPUT', Config.PROFILE_OUTPUT),
+            'top': int(env('PROFILE_TOP', str(Config.PROFILE_TOP))),
+            'trace_frames': int(env('PROFILE_TRACE_FRAMES', str(Config.PROFILE_TRACE_FRAMES)))
+        }
 
 def get_aws_endpoint(service):
     if os.environ.get("USE_LOCALSTACK") == "1":
@@ -6,6 +6,9 @@ Custom exception classes for the image service.
 class ImageServiceError(Exception):
     """Base exception for all image service errors."""
     
+    # Whether the client may succeed by repeating the request later
+    retryable = False
+    
     def __init__(self, message, status_code=500):
         self.message = message
         self.status_code = status_code
@@ -21,19 +24,28 @@ class NotFoundError(ImageServiceError):
 
 
 class StorageError(ImageServiceError):
-    """Raised when S3 operations fail."""
+    """
+    Raised when S3 operations fail.
+
+    Retryable failures (throttling, 5xx, open circuit) map to 503 with
+    ``Retry-After``; everything else is a 500.
+    """
     
-    def __init__(self, message, operation=None):
+    def __init__(self, message, operation=None, retryable=False, retry_after=None):
         self.operation = operation
-        super().__init__(f"Storage error: {message}", status_code=500)
+        self.retryable = retryable
+        self.retry_after = retry_after if retryable else None
+        super().__init__(f"Storage error: {message}", status_code=503 if retryable else 500)
 
 
 class DatabaseError(ImageServiceError):
-    """Raised when DynamoDB operations fail."""
+    """Raised when DynamoDB operations fail (503 when retryable, like ``StorageError``)."""
     
-    def __init__(self, message, operation=None):
+    def __init__(self, message, operation=None, retryable=False, retry_after=None):
         self.operation = operation
-        super().__init__(f"Database error: {message}", status_code=500)
+        self.retryable = retryable
+        self.retry_after = retry_after if retryable else None
+        super().__init__(f"Database error: {message}", status_code=503 if retryable else 500)
 
 
 class ValidationError(ImageServiceError):
@@ -41,3 +53,37 @@ class ValidationError(ImageServiceError):
     
     def __init__(self, message):
         super().__init__(message, status_code=400)
+
+
+class ConflictError(ImageServiceError):
+    """Raised when a request conflicts with one already in progress."""
+    
+    def __init__(self, message):
+        super().__init__(message, status_code=409)
+
+
+class QuotaExceededError(ImageServiceError):
+    """Raised when an upload would exceed a user's quota."""
+    
+    def __init__(self, message):
+        super().__init__(message, status_code=403)
+
+
+class TooManyRequestsError(ImageServiceError):
+    """Raised when a request is rejected to protect capacity (HTTP 429)."""
+    
+    retryable = True
+    
+    def __init__(self, message, retry_after=1):
+        self.retry_after = retry_after
+        super().__init__(message, status_code=429)
+
+
+class ServiceUnavailableError(ImageServiceError):
+    """Raised when requests are shed because a dependency is unhealthy (HTTP 503)."""
+    
+    retryable = True
+    
+    def __init__(self, message, retry_after=1):
+        self.retry_after = retry_after
+        super().__init__(message, status_code=503)
@@ -0,0 +1,301 @@
+"""
+On-demand CPU and memory profiling of single requests.
+
+``profiled`` wraps a Lambda handler. A request is profiled when it is
+sampled (``PROFILE_SAMPLE_RATE``) or carries a valid ``X-Debug-Profile``
+header signed with ``PROFILE_SECRET``::
+
+    X-Debug-Profile: <mode>.<expires_at>.<hex HMAC-SHA256 of "<mode>.<expires_at>">
+
+``mode`` is ``cpu`` (cProfile), ``memory`` (tracemalloc) or ``all``. The
+JSON report - top functions, peak traced memory, top allocation sites and
+the allocations of ``allocation_site`` functions such as ``parse_json_body``
+and ``parse_base64_image`` - and the raw ``.pstats`` file go to
+``PROFILE_OUTPUT``, a directory or an ``s3://bucket/prefix`` URL. The
+response names them in ``X-Profile-Id``.
+
+With no sample rate and no secret configured, ``profiled`` and
+``allocation_site`` return the function itself, so disabled profiling costs
+nothing per request.
+"""
+import cProfile
+import functools
+import hashlib
+import hmac
+import inspect
+import json
+import marshal
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+import boto3
+
+from . import utils
+from .config import Config, get_aws_endpoint
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_HEADER = 'X-Debug-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+MODES = ('cpu', 'memory', 'all')
+
+# Allocations of ``allocation_site`` functions while a memory profile runs
+_sites = None
+
+
+def enabled(settings):
+    """Whether any request can be profiled with these settings."""
+    return settings['sample_rate'] > 0 or bool(settings['secret'])
+
+
+def sign_profile_header(secret, mode='all', expires_in=300, now=None):
+    """Build an ``X-Debug-Profile`` value valid for ``expires_in`` seconds."""
+    expires_at = int((now or time.time()) + expires_in)
+    payload = f"{mode}.{expires_at}"
+    return f"{payload}.{_signature(secret, payload)}"
+
+
+def _signature(secret, payload):
+    return hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_profile_header(value, secret, now=None):
+    """Return the mode of a valid, unexpired header value, otherwise None."""
+    if not value or not secret:
+        return None
+    try:
+        mode, expires_at, signature = value.split('.')
+        expired = int(expires_at) < (now or time.time())
+    except ValueError:
+        return None
+    if mode not in MODES or expired:
+        return None
+    if not hmac.compare_digest(signature, _signature(secret, f"{mode}.{expires_at}")):
+        return None
+    return mode
+
+
+def profiled(handler, settings=None):
+    """Wrap ``handler`` with request profiling, or return it unchanged when profiling is off."""
+    settings = settings or Config.get_profiling_settings()
+    if not enabled(settings):
+        return handler
+    if settings['mode'] not in MODES:
+        raise ValueError(f"Unknown PROFILE_MODE: {settings['mode']}")
+    profiler = RequestProfiler(settings)
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        mode = profiler.requested_mode(event)
+        if mode is None:
+            return handler(event, context)
+        return profiler.run(mode, handler, event, context)
+
+    wrapper.profiler = profiler
+    return wrapper
+
+
+def allocation_site(function, settings=None):
+    """
+    Report what ``function`` allocates in memory profiles.
+
+    Each call records the bytes still referenced when it returns (usually
+    its result) and the lines of ``function`` that allocated them.
+    """
+    if not enabled(settings or Config.get_profiling_settings()):
+        return function
+    lines, first = inspect.getsourcelines(function)
+    filename, last = function.__code__.co_filename, first + len(lines) - 1
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        sites = _sites
+        if sites is None:
+            return function(*args, **kwargs)
+        traces = [tracemalloc.Filter(True, filename, all_frames=True)]
+        earlier = tracemalloc.take_snapshot().filter_traces(traces)
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        retained = tracemalloc.get_traced_memory()[0] - before
+        entry = sites.setdefault(function.__name__, {'calls': 0, 'retained_bytes': 0, 'sites': {}})
+        entry['calls'] += 1
+        entry['retained_bytes'] += retained
+        # Only what this call added; traces kept from earlier calls are already counted
+        snapshot = tracemalloc.take_snapshot().filter_traces(traces)
+        for stat in snapshot.compare_to(earlier, 'traceback'):
+            if stat.size_diff <= 0:
+                continue
+            for frame in stat.traceback:
+                if frame.filename == filename and first <= frame.lineno <= last:
+                    key = f"{_short_path(filename)}:{frame.lineno}"
+                    entry['sites'][key] = entry['sites'].get(key, 0) + stat.size_diff
+                    break
+        return result
+
+    return wrapper
+
+
+class RequestProfiler:
+    """Run one invocation under cProfile and/or tracemalloc and write its report."""
+
+    def __init__(self, settings, s3_client=None):
+        self.settings = settings
+        self.s3_client = s3_client
+
+    def requested_mode(self, event):
+        """Profiler mode for this request, or None to run it unprofiled."""
+        mode = verify_profile_header(utils.get_header(event, PROFILE_HEADER), self.settings['secret'])
+        if mode:
+            return mode
+        rate = self.settings['sample_rate']
+        if rate > 0 and random.random() < rate:
+            return self.settings['mode']
+        return None
+
+    def run(self, mode, handler, event, context):
+        global _sites
+        cpu = cProfile.Profile() if mode in ('cpu', 'all') else None
+        trace = mode in ('memory', 'all')
+        started_tracing = trace and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.settings['trace_frames'])
+        elif trace:
+            tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0] if trace else 0
+        sites = _sites = {} if trace else None
+
+        started = time.perf_counter()
+        result = None
+        if cpu:
+            cpu.enable()
+        try:
+            result = handler(event, context)
+            return result
+        finally:
+            if cpu:
+                cpu.disable()
+            elapsed = time.perf_counter() - started
+            snapshot = peak = None
+            if trace:
+                _sites = None
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+            profile_id = self._report(mode, event, context, result, elapsed, cpu, snapshot, peak, sites)
+            if profile_id and isinstance(result, dict):
+                result.setdefault('headers', {})[PROFILE_ID_HEADER] = profile_id
+
+    def _report(self, mode, event, context, result, elapsed, cpu, snapshot, peak, sites):
+        request_id = getattr(context, 'aws_request_id', None) or 'local'
+        profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{request_id}"
+        report = {
+            'profile_id': profile_id,
+            'mode': mode,
+            'method': event.get('httpMethod'),
+            'route': event.get('resource') or event.get('path'),
+            'request_bytes': len(event.get('body') or ''),
+            'status': result.get('statusCode') if isinstance(result, dict) else None,
+            'duration_ms': round(elapsed * 1000, 3)
+        }
+        files = {}
+        if cpu:
+            report['cpu'] = cpu_summary(cpu, self.settings['top'])
+            files['pstats'] = pstats_bytes(cpu)
+        if snapshot:
+            report['memory'] = memory_summary(snapshot, peak, sites, self.settings['top'])
+        files['json'] = json.dumps(report, indent=2).encode('utf-8')
+
+        try:
+            location = self._write(profile_id, files)
+            logger.info("Request profiled", profile_id=profile_id, location=location,
+                        duration_ms=report['duration_ms'], peak_bytes=peak)
+            return profile_id
+        except Exception as e:
+            logger.error("Failed to write request profile", profile_id=profile_id, error=str(e))
+            return None
+
+    def _write(self, profile_id, files):
+        output = self.settings['output']
+        if output.startswith('s3://'):
+            bucket, _, prefix = output[len('s3://'):].partition('/')
+            prefix = prefix.strip('/')
+            client = self._client()
+            for extension, data in files.items():
+                key = f"{prefix}/{profile_id}.{extension}" if prefix else f"{profile_id}.{extension}"
+                client.put_object(Bucket=bucket, Key=key, Body=data)
+            return output.rstrip('/') + '/' + profile_id
+        os.makedirs(output, exist_ok=True)
+        for extension, data in files.items():
+            with open(os.path.join(output, f"{profile_id}.{extension}"), 'wb') as f:
+                f.write(data)
+        return os.path.join(output, profile_id)
+
+    def _client(self):
+        if self.s3_client is None:
+            self.s3_client = boto3.client(
+                's3',
+                endpoint_url=get_aws_endpoint('s3'),
+                region_name=Config.get_region(),
+                aws_access_key_id='test' if get_aws_endpoint('s3') else None,
+                aws_secret_access_key='test' if get_aws_endpoint('s3') else None
+            )
+        return self.s3_client
+
+
+def cpu_summary(profile, top):
+    """Top functions by cumulative time."""
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        'total_calls': sum(calls for _, calls, _, _, _ in stats.values()),
+        'functions': [
+            {
+                'function': _function_name(key),
+                'calls': calls,
+                'self_ms': round(self_time * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3)
+            }
+            for key, (_, calls, self_time, cumulative, _) in rows
+        ]
+    }
+
+
+def pstats_bytes(profile):
+    """Raw stats in the ``pstats``/snakeviz file format."""
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+
+def _function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        return name
+    return f"{_short_path(filename)}:{line}({name})"
+
+
+def _short_path(filename):
+    return os.sep.join(filename.split(os.sep)[-2:])
+
+
+def memory_summary(snapshot, peak, sites, top):
+    """Peak traced bytes, allocations still alive at the end and what ``allocation_site`` functions allocated."""
+    statistics = snapshot.statistics('lineno')
+    return {
+        'peak_bytes': peak,
+        'retained_bytes': sum(stat.size for stat in statistics),
+        'retained_sites': [
+            {'site': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+             'size_bytes': stat.size, 'count': stat.count}
+            for stat in statistics[:top]
+        ],
+        'functions': {
+            name: {**entry, 'sites': dict(sorted(entry['sites'].items(), key=lambda item: -item[1]))}
+            for name, entry in sites.items()
+        }
+    }
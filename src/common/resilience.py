@@ -0,0 +1,303 @@
+"""
+Retries, retry budgets and circuit breaking for S3 and DynamoDB calls.
+
+Repositories wrap their boto3 client or table in ``ResilientClient``. Every
+call is then:
+
+* rejected immediately with ``CircuitOpenError`` while the dependency's
+  circuit breaker is open,
+* retried with capped exponential backoff and full jitter when it fails with
+  a throttling, 5xx or connection error, as long as the per-invocation retry
+  budget allows it, and
+* recorded on the breaker, which opens after consecutive retryable failures
+  and lets a single probe through once ``reset_seconds`` have passed.
+
+Non-retryable errors (validation, conditional check failures, missing keys)
+are raised on the first attempt and leave the breaker's state as it was.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+from .config import Config
+
+# Error codes S3 and DynamoDB return for throttling and transient faults
+RETRYABLE_ERROR_CODES = frozenset({
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'Throttling',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'TooManyRequestsException',
+    'SlowDown',
+    'InternalServerError',
+    'InternalError',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'RequestTimeoutException',
+    'TransactionInProgressException'
+})
+
+# Client methods that never touch the network
+LOCAL_METHODS = frozenset({
+    'generate_presigned_url', 'generate_presigned_post', 'get_paginator', 'get_waiter',
+    'can_paginate', 'batch_writer'
+})
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, dependency, retry_after):
+        self.dependency = dependency
+        self.retry_after = retry_after
+        super().__init__(f"{dependency} circuit is open")
+
+
+def boto_config():
+    """botocore config that disables the SDK's own retries so this layer owns them."""
+    return BotoConfig(retries={'mode': 'standard', 'total_max_attempts': 1})
+
+
+def error_code(error):
+    """Return the AWS error code of a ``ClientError``, if any."""
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def is_retryable(error):
+    """Whether a failed call may succeed if repeated."""
+    if isinstance(error, (CircuitOpenError, BotoConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        if error_code(error) in RETRYABLE_ERROR_CODES:
+            return True
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500
+    return False
+
+
+def failure_details(error):
+    """Keyword arguments describing ``error`` for ``StorageError``/``DatabaseError``."""
+    if not is_retryable(error):
+        return {'retryable': False}
+    return {'retryable': True, 'retry_after': getattr(error, 'retry_after', None) or 1}
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts=3, base_delay=0.025, max_delay=1.0, rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            max_attempts=settings['max_attempts'],
+            base_delay=settings['base_delay_ms'] / 1000,
+            max_delay=settings['max_delay_ms'] / 1000
+        )
+
+    def delay(self, attempt):
+        """Sleep time before retry number ``attempt`` (1-based)."""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """
+    Cap on retries per Lambda invocation.
+
+    Without a budget every layer of a failing request retries independently,
+    multiplying load on a dependency that is already struggling. Each
+    invocation gets its own budget from ``start_invocation``, so concurrent
+    invocations in one process do not refill or drain each other's.
+    """
+
+    def __init__(self, max_retries=10):
+        self.max_retries = max_retries
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.used = 0
+
+    def try_acquire(self):
+        """Take one retry from the budget; False when it is exhausted."""
+        with self.lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one dependency."""
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` unless a call may proceed."""
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.reset_seconds - (self.clock() - self.opened_at)
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            raise CircuitOpenError(self.name, max(1, int(remaining + 0.999)))
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def release_probe(self):
+        """End a call that says nothing about the dependency's health."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+
+def _build_defaults():
+    settings = Config.get_retry_settings()
+    return (
+        RetryPolicy.from_settings(settings),
+        RetryBudget(settings['budget']),
+        settings
+    )
+
+
+_lock = threading.Lock()
+_breakers = {}
+default_policy, retry_budget, _settings = _build_defaults()
+# The running invocation's budget; ``retry_budget`` is only used outside one
+_invocation_budget = contextvars.ContextVar('retry_budget', default=None)
+
+
+def get_circuit_breaker(dependency):
+    """Return the process-wide breaker for ``dependency`` (e.g. ``'s3'``)."""
+    with _lock:
+        breaker = _breakers.get(dependency)
+        if breaker is None:
+            breaker = _breakers[dependency] = CircuitBreaker(
+                dependency,
+                failure_threshold=_settings['breaker_threshold'],
+                reset_seconds=_settings['breaker_reset_seconds']
+            )
+        return breaker
+
+
+def start_invocation():
+    """Reset per-invocation state; called by handlers at the start of each request."""
+    _invocation_budget.set(RetryBudget(_settings['budget']))
+
+
+def current_budget():
+    """The retry budget of the invocation running in this context."""
+    return _invocation_budget.get() or retry_budget
+
+
+def bind_invocation(function):
+    """Wrap ``function`` so that worker threads spend the calling invocation's budget."""
+    budget = _invocation_budget.get()
+
+    def bound(*args, **kwargs):
+        token = _invocation_budget.set(budget)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _invocation_budget.reset(token)
+
+    return bound
+
+
+def reset():
+    """Reload settings and forget breaker state (tests and benchmarks)."""
+    global default_policy, retry_budget, _settings
+    with _lock:
+        _breakers.clear()
+        default_policy, retry_budget, _settings = _build_defaults()
+    _invocation_budget.set(None)
+
+
+def call(dependency, operation, *args, policy=None, budget=None, breaker=None, sleep=None, **kwargs):
+    """
+    Call ``operation`` with retries and circuit breaking for ``dependency``.
+
+    The breaker counts logical calls: one failure once retries are exhausted,
+    not one per attempt. A half-open probe is not retried.
+    """
+    policy = policy or default_policy
+    budget = budget or current_budget()
+    breaker = breaker or get_circuit_breaker(dependency)
+    sleep = sleep or time.sleep
+
+    attempt = 1
+    while True:
+        breaker.before_call()
+        try:
+            result = operation(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.release_probe()
+                raise
+            if attempt >= policy.max_attempts or breaker.state != CLOSED or not budget.try_acquire():
+                breaker.record_failure()
+                raise
+            sleep(policy.delay(attempt))
+            attempt += 1
+        else:
+            breaker.record_success()
+            return result
+
+
+class ResilientClient:
+    """Proxy that routes a boto3 client or table's API calls through ``call``."""
+
+    def __init__(self, target, dependency):
+        self._target = target
+        self._dependency = dependency
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in LOCAL_METHODS or name.startswith('_') or not callable(attribute):
+            return attribute
+
+        dependency = self._dependency
+
+        def resilient_operation(*args, **kwargs):
+            return call(dependency, attribute, *args, **kwargs)
+
+        return resilient_operation
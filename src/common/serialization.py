@@ -0,0 +1,112 @@
+"""
+Response body serialization and content-encoding negotiation.
+
+Uses ``orjson`` when installed and falls back to the standard library.
+``brotli`` is optional; gzip is always available.
+"""
+import base64
+import gzip
+import json
+import os
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+
+def to_json_number(value):
+    """Convert a DynamoDB Decimal to int (integral) or float; pass other values through."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _default(obj):
+    """Fallback for values that were not pre-converted."""
+    if isinstance(obj, Decimal):
+        return to_json_number(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _use_orjson():
+    return orjson is not None and os.environ.get('JSON_BACKEND', 'auto') != 'json'
+
+
+def dumps(body):
+    """Serialize a response body to a JSON string."""
+    if _use_orjson():
+        return orjson.dumps(body, default=_default).decode('utf-8')
+    return json.dumps(body, default=_default, separators=(',', ':'))
+
+
+def supported_encodings():
+    """Content encodings this process can produce, in preference order."""
+    encodings = ['br'] if brotli is not None else []
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick a content encoding from an ``Accept-Encoding`` header value.
+
+    Returns None when the client accepts none of the supported encodings.
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+
+    best = None
+    for encoding in supported_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def compress(data, encoding):
+    """Compress bytes with the given content encoding."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def encode_body(body_text, accept_encoding=None, min_bytes=1024):
+    """
+    Encode a serialized body for API Gateway.
+
+    Returns ``(body, content_encoding, is_base64)``. Bodies smaller than
+    ``min_bytes`` or clients without a supported encoding get plain text.
+    """
+    raw = body_text.encode('utf-8')
+    if len(raw) < min_bytes:
+        return body_text, None, False
+
+    encoding = negotiate_encoding(accept_encoding)
+    if not encoding:
+        return body_text, None, False
+
+    compressed = compress(raw, encoding)
+    return base64.b64encode(compressed).decode('ascii'), encoding, True
@@ -1,13 +1,32 @@
 """
 Utility functions for common operations.
 """
+import os
 import uuid
 import json
+import math
+import time
 import base64
-from datetime import datetime
+import hashlib
+import threading
+from datetime import datetime, timezone
 from .errors import ValidationError
+from .profiling import allocation_site
 
 
+# S3 key layouts: "legacy" groups objects by user, "hashed" spreads them over hash prefixes
+KEY_LAYOUTS = ('legacy', 'hashed')
+
+# Hex characters of the hash prefix (16^4 = 65536 prefixes)
+KEY_HASH_PREFIX_LENGTH = 4
+
+# Image ID schemes: "uuid4" is random, "uuid7" is prefixed with the creation time in milliseconds
+ID_SCHEMES = ('uuid4', 'uuid7')
+
+# Last UUIDv7 issued by this process, as (unix_ms << 74) | 74 random/counter bits
+_uuid7_lock = threading.Lock()
+_uuid7_last = 0
+
 # Supported image formats
 CONTENT_TYPES = {
     'jpg': 'image/jpeg',
@@ -18,16 +37,42 @@ CONTENT_TYPES = {
 }
 
 
-def generate_image_id():
-    """Generate a unique image ID."""
+def generate_image_id(scheme='uuid4'):
+    """Generate a unique image ID with the given ``ID_SCHEME``."""
+    if scheme == 'uuid7':
+        return str(uuid7())
+    if scheme != 'uuid4':
+        raise ValueError(f"Unknown image ID scheme: {scheme}")
     return str(uuid.uuid4())
 
 
+def uuid7(now_ms=None):
+    """
+    Generate a UUIDv7 (RFC 9562): 48 bits of Unix milliseconds, then 74 random bits.
+
+    IDs from one process are strictly increasing, also within a millisecond
+    and if the clock steps back: the 122 payload bits are then the last ID's
+    plus a random 32-bit increment. Their string forms sort the same way.
+    """
+    global _uuid7_last
+    ms = int(time.time() * 1000) if now_ms is None else now_ms
+    random_bits = int.from_bytes(os.urandom(14), 'big')
+    with _uuid7_lock:
+        payload = (ms << 74) | (random_bits >> 38)
+        if payload <= _uuid7_last:
+            payload = _uuid7_last + 1 + (random_bits & 0xFFFFFFFF)
+        _uuid7_last = payload
+    value = ((payload >> 74) << 80) | (0x7 << 76) | (((payload >> 62) & 0xFFF) << 64) \
+        | (0b10 << 62) | (payload & ((1 << 62) - 1))
+    return uuid.UUID(int=value)
+
+
 def get_current_timestamp():
     """Get current timestamp in ISO format."""
     return datetime.utcnow().isoformat()
 
 
+@allocation_site
 def parse_json_body(event):
     """Parse JSON body from API Gateway event."""
     try:
@@ -51,6 +96,16 @@ def get_query_parameter(event, param_name, default=None):
     return query_params.get(param_name, default)
 
 
+def get_header(event, header_name, default=None):
+    """Get a request header from API Gateway event (case-insensitive)."""
+    headers = event.get('headers') or {}
+    wanted = header_name.lower()
+    for name, value in headers.items():
+        if name.lower() == wanted:
+            return value
+    return default
+
+
 def validate_required_fields(data, required_fields):
     """Check that all required fields are present."""
     missing_fields = [field for field in required_fields if field not in data or not data[field]]
@@ -58,12 +113,69 @@ def validate_required_fields(data, required_fields):
         raise ValidationError(f"Missing required fields: {', '.join(missing_fields)}")
 
 
-def get_s3_key(user_id, image_id, filename):
-    """Generate S3 storage path for an image."""
+def get_s3_key(user_id, image_id, filename, layout='legacy'):
+    """
+    Generate S3 storage path for an image.
+    
+    ``legacy`` keys are ``images/{user_id}/{image_id}.{ext}``. ``hashed`` keys
+    put a short hash of the image ID first, so one user's uploads spread over
+    many S3 partitions instead of sharing a single prefix's request rate.
+    """
     extension = filename.split('.')[-1] if '.' in filename else 'jpg'
-    return f"images/{user_id}/{image_id}.{extension}"
+    return _apply_key_layout(f"images/{user_id}/{image_id}.{extension}", image_id, layout)
+
+
+def relayout_s3_key(s3_key, layout='legacy'):
+    """
+    The key of a stored image in ``layout``, or None if ``s3_key`` is not an image key.
+    
+    Only the hash prefix is added or dropped; the basename and extension are
+    kept, since they follow the stored bytes rather than the filename.
+    """
+    parsed = parse_s3_key(s3_key)
+    if parsed is None:
+        return None
+    return _apply_key_layout('/'.join(s3_key.split('/')[-3:]), parsed[1], layout)
+
+
+def _apply_key_layout(key, image_id, layout):
+    if layout == 'hashed':
+        prefix = hashlib.sha256(image_id.encode('utf-8')).hexdigest()[:KEY_HASH_PREFIX_LENGTH]
+        return f"{prefix}/{key}"
+    if layout != 'legacy':
+        raise ValueError(f"Unknown S3 key layout: {layout}")
+    return key
+
 
+def parse_s3_key(s3_key):
+    """
+    Return ``(user_id, image_id)`` for an image key in either layout.
+    
+    Returns None for other objects, such as derivatives or search segments.
+    """
+    parts = s3_key.split('/')
+    if len(parts) == 4 and len(parts[0]) == KEY_HASH_PREFIX_LENGTH:
+        parts = parts[1:]
+    if len(parts) != 3 or parts[0] != 'images' or not parts[1] or not parts[2]:
+        return None
+    return parts[1], parts[2].rsplit('.', 1)[0]
 
+
+def get_user_key_pattern(user_id):
+    """
+    CloudFront wildcard matching every object of a user in either key layout.
+    
+    The leading ``*`` also matches the empty string, so legacy
+    ``images/{user_id}/...`` and hashed ``{hash}/images/{user_id}/...`` keys both match.
+    CloudFront has no escaping, so user IDs containing ``*``, ``?`` or ``/``
+    are rejected rather than widening the pattern to other users' objects.
+    """
+    if not user_id or any(char in user_id for char in '*?/'):
+        raise ValidationError("user_id must not be empty or contain '*', '?' or '/'")
+    return f"*images/{user_id}/*"
+
+
+@allocation_site
 def parse_base64_image(base64_string):
     """Convert base64 string to bytes."""
     try:
@@ -83,6 +195,14 @@ def get_content_type_from_filename(filename):
     return CONTENT_TYPES.get(extension, 'image/jpeg')
 
 
+def get_extension_for_content_type(content_type):
+    """Get the canonical file extension for a supported content type."""
+    for extension, known_type in CONTENT_TYPES.items():
+        if known_type == content_type:
+            return extension
+    return 'jpg'
+
+
 def validate_image_size(image_bytes, max_size):
     """Check if image size is within limits."""
     actual_size = len(image_bytes)
@@ -90,3 +210,56 @@ def validate_image_size(image_bytes, max_size):
         raise ValidationError(
             f"Image size ({actual_size:,} bytes) exceeds maximum ({max_size:,} bytes)"
         )
+
+
+def parse_expiry(ttl_seconds=None, expires_at=None, max_seconds=None, now=None):
+    """
+    Resolve an upload's ``ttl_seconds`` or ``expires_at`` to epoch seconds (None = never expires).
+
+    ``expires_at`` is epoch seconds or an ISO 8601 timestamp (UTC unless it
+    carries an offset). The expiry must be in the future and, when
+    ``max_seconds`` is given, at most that far away.
+    """
+    if ttl_seconds is None and expires_at is None:
+        return None
+    if ttl_seconds is not None and expires_at is not None:
+        raise ValidationError("Give either ttl_seconds or expires_at, not both")
+    now = int(time.time() if now is None else now)
+
+    if ttl_seconds is not None:
+        if isinstance(ttl_seconds, bool) or not isinstance(ttl_seconds, int):
+            raise ValidationError("ttl_seconds must be an integer")
+        expiry = now + ttl_seconds
+    elif isinstance(expires_at, int) and not isinstance(expires_at, bool):
+        expiry = expires_at
+    elif isinstance(expires_at, str):
+        try:
+            parsed = datetime.fromisoformat(expires_at)
+        except ValueError:
+            raise ValidationError("expires_at must be epoch seconds or an ISO 8601 timestamp")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        expiry = math.ceil(parsed.timestamp())
+    else:
+        raise ValidationError("expires_at must be epoch seconds or an ISO 8601 timestamp")
+
+    if expiry <= now:
+        raise ValidationError("Expiry must be in the future")
+    if max_seconds and expiry - now > max_seconds:
+        raise ValidationError(f"Expiry must be at most {max_seconds} seconds away")
+    return expiry
+
+
+def get_expiry_tags(expires_at, class_days, tag_key, now=None):
+    """
+    S3 object tags selecting the shortest lifecycle rule that keeps an object until ``expires_at``.
+
+    Returns None for images that never expire or when no classes are configured.
+    """
+    if expires_at is None or not class_days:
+        return None
+    remaining = expires_at - (time.time() if now is None else now)
+    for days in class_days:
+        if days * 86400 >= remaining:
+            return {tag_key: f'{days}d'}
+    raise ValidationError(f"Expiry must be at most {class_days[-1]} days away")
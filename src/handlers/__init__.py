@@ -1,5 +1,7 @@
 """Lambda function handlers."""
 
 from .image_handler import lambda_handler as image_handler
+from .maintenance_handler import lambda_handler as maintenance_handler
+from .enrichment_handler import lambda_handler as enrichment_handler
 
-__all__ = ['image_handler']
+__all__ = ['image_handler', 'maintenance_handler', 'enrichment_handler']
@@ -0,0 +1,66 @@
+"""Lambda handler that enriches image metadata from S3 ObjectCreated notifications."""
+import json
+from urllib.parse import unquote_plus
+
+from ..services.enrichment_service import EnrichmentService
+from ..common import resilience
+from ..common.config import Config
+from ..common.logger import get_logger
+
+service = EnrichmentService()
+logger = get_logger(__name__)
+
+
+def lambda_handler(event, context):
+    """
+    Enrich the images named in a batch of S3 notifications.
+
+    The intended wiring is bucket -> SQS -> this function with
+    ``ReportBatchItemFailures``: messages whose objects failed (or whose
+    metadata is not written yet) are returned in ``batchItemFailures`` and
+    redelivered, the rest are deleted. Unreadable messages can never succeed,
+    so they are logged and deleted rather than retried. S3 records delivered directly are also
+    accepted; a failure then raises so Lambda retries the whole event.
+    """
+    resilience.start_invocation()
+    messages = []
+    for record in (event or {}).get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            messages.append((record['messageId'], _parse_body(record)))
+        else:
+            messages.append((None, _object_keys({'Records': [record]})))
+
+    failed = service.enrich_many([key for _, keys in messages for key in keys])
+    failures = [message_id for message_id, keys in messages if any(key in failed for key in keys)]
+    logger.info(
+        "Enrichment batch completed",
+        messages=len(messages),
+        objects=sum(len(keys) for _, keys in messages),
+        failed=len(failures)
+    )
+    if None in failures:
+        raise next(iter(failed.values()))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
+
+def _parse_body(record):
+    """Object keys of an SQS message carrying an S3 notification; none if unreadable."""
+    try:
+        return _object_keys(json.loads(record.get('body') or '{}'))
+    except (TypeError, ValueError, KeyError) as e:
+        logger.error("Unreadable enrichment message", message_id=record.get('messageId'), error=str(e))
+        return []
+
+
+def _object_keys(notification):
+    """Decoded keys of the image bucket's ObjectCreated records (``s3:TestEvent`` has none)."""
+    bucket_name = Config.get_bucket_name()
+    keys = []
+    for record in notification.get('Records', []):
+        if not record.get('eventName', '').startswith('ObjectCreated'):
+            continue
+        if record['s3']['bucket']['name'] != bucket_name:
+            logger.info("Enrichment skipped, other bucket", bucket=record['s3']['bucket']['name'])
+            continue
+        keys.append(unquote_plus(record['s3']['object']['key']))
+    return keys
@@ -0,0 +1,57 @@
+"""Lambda handler that releases the usage of images removed by DynamoDB TTL."""
+from boto3.dynamodb.types import TypeDeserializer
+
+from ..services.image_service import ImageService
+from ..common import resilience
+from ..common.logger import get_logger
+from ..common.serialization import to_json_number
+
+service = ImageService()
+logger = get_logger(__name__)
+
+_deserializer = TypeDeserializer()
+
+
+def lambda_handler(event, context):
+    """
+    Release usage for the TTL deletions in a batch of metadata table stream records.
+
+    The intended wiring is the table's stream (``OLD_IMAGE``) -> this function
+    with ``ReportBatchItemFailures``. Only removals made by the TTL service
+    count; deletes and purges by the API already released their usage, and so
+    did soft-deleted images. On a failure the failing record is reported and
+    the rest of the batch is left for the retry, so no record is released twice.
+    """
+    resilience.start_invocation()
+    released = 0
+    for record in (event or {}).get('Records', []):
+        image = _expired_image(record)
+        if image is None:
+            continue
+        try:
+            service.release_expired(image['user_id'], to_json_number(image.get('size')))
+        except Exception as e:
+            logger.error(
+                "Expired image release failed",
+                image_id=image.get('image_id'),
+                sequence_number=record['dynamodb']['SequenceNumber'],
+                error=str(e)
+            )
+            return {'batchItemFailures': [{'itemIdentifier': record['dynamodb']['SequenceNumber']}]}
+        released += 1
+
+    logger.info("Expiry batch completed", records=len((event or {}).get('Records', [])), released=released)
+    return {'batchItemFailures': []}
+
+
+def _expired_image(record):
+    """The old image of a TTL removal of a live image, or None for any other record."""
+    identity = record.get('userIdentity') or {}
+    if record.get('eventName') != 'REMOVE' or identity.get('type') != 'Service' \
+            or identity.get('principalId') != 'dynamodb.amazonaws.com':
+        return None
+    old_image = record.get('dynamodb', {}).get('OldImage') or {}
+    image = {name: _deserializer.deserialize(value) for name, value in old_image.items()}
+    if not image.get('user_id') or image.get('deleted_at'):
+        return None
+    return image
@@ -1,52 +1,110 @@
 """Unified Lambda handler for image API routes."""
-import json
-from decimal import Decimal
-
 from ..services.image_service import ImageService
+from ..common import resilience
+from ..common.admission import READ, WRITE, AdmissionController
+from ..common.config import Config
 from ..common.errors import ImageServiceError, ValidationError
 from ..common.logger import get_logger
+from ..common.profiling import profiled
+from ..common.serialization import dumps, encode_body
 from ..common.utils import (
+    get_header,
     get_path_parameter,
     get_query_parameter,
     parse_json_body
 )
 
 service = ImageService()
+admission = AdmissionController()
 logger = get_logger(__name__)
 
+@profiled
 def lambda_handler(event, context):
     """Route API Gateway requests to image service operations."""
+    ticket = None
+    failed = False
+    resilience.start_invocation()
     try:
         method = _get_http_method(event)
+        ticket = admission.admit(_get_priority(method), _estimate_request_bytes(method, event))
         result = _dispatch_request(method, event)
-        status_code = 201 if method == "POST" else 200
-        return response(status_code, result)
+        status_code = 201 if method == "POST" and not _is_restore_request(event) else 200
+        cookies = _pop_signed_cookies(result)
+        return response(status_code, result, event, cookies=cookies)
 
     except ImageServiceError as e:
-        logger.error("image_handler request failed", error=e.message)
-        return response(e.status_code, {"error": e.message})
+        # 501 (search or transforms not configured) says nothing about dependency health
+        failed = e.status_code >= 500 and e.status_code != 501
+        logger.error(
+            "image_handler request failed",
+            error=e.message,
+            retryable=e.retryable
+        )
+        return response(e.status_code, {"error": e.message}, event, _error_headers(e))
 
     except Exception as e:
+        failed = True
         logger.error("image_handler unexpected failure", error=str(e))
-        return response(500, {"error": "Internal server error"})
+        return response(500, {"error": "Internal server error"}, event)
+
+    finally:
+        if ticket is not None:
+            admission.release(ticket, failed)
 
 
 def _get_http_method(event):
     method = (event.get("httpMethod") or "").upper()
-    if method not in {"POST", "GET", "DELETE"}:
+    if method not in {"POST", "GET", "PATCH", "DELETE"}:
         raise ValidationError("Unsupported method")
     return method
 
 
+def _get_priority(method):
+    """Reads are protected from write storms by being shed last."""
+    return READ if method == "GET" else WRITE
+
+
+def _estimate_request_bytes(method, event):
+    """Approximate peak buffer use: the base64 body plus its decoded bytes."""
+    if method != "POST":
+        return 0
+    body_length = len(event.get("body") or "")
+    return body_length + body_length * 3 // 4
+
+
+def _error_headers(error):
+    retry_after = getattr(error, "retry_after", None)
+    return {"Retry-After": str(retry_after)} if retry_after else None
+
+
+def _pop_signed_cookies(result):
+    """Move signed CDN cookies from the result into ``Set-Cookie`` values."""
+    cookies = result.pop("signed_cookies", None) if isinstance(result, dict) else None
+    if not cookies:
+        return None
+
+    expires_in = result.get("expires_in") or Config.get_presigned_url_expiration()
+    attributes = f"; Path=/; Max-Age={expires_in}; Secure; HttpOnly; SameSite=None"
+    domain = Config.get_cookie_domain()
+    if domain:
+        attributes += f"; Domain={domain}"
+    return [f"{name}={value}{attributes}" for name, value in cookies.items()]
+
+
 def _dispatch_request(method, event):
     if method == "POST":
         return _handle_post(event)
     if method == "GET":
         return _handle_get(event)
+    if method == "PATCH":
+        return _handle_patch(event)
     return _handle_delete(event)
 
 
 def _handle_post(event):
+    if _is_restore_request(event):
+        return service.restore_image(get_path_parameter(event, "image_id"))
+
     body = parse_json_body(event)
     return service.upload_image(
         user_id=body.get("user_id"),
@@ -55,27 +113,82 @@ def _handle_post(event):
         tags=body.get("tags"),
         description=body.get("description"),
         width=body.get("width"),
-        height=body.get("height")
+        height=body.get("height"),
+        idempotency_key=get_header(event, "Idempotency-Key"),
+        ttl_seconds=body.get("ttl_seconds"),
+        expires_at=body.get("expires_at")
     )
 
 
 def _handle_get(event):
+    if _is_stats_request(event):
+        return service.get_user_stats(get_path_parameter(event, "user_id"))
+
+    if _is_search_request(event):
+        return service.search_images(
+            user_id=get_query_parameter(event, "user_id"),
+            query=get_query_parameter(event, "q"),
+            limit=_parse_limit(event, "20"),
+            fields=get_query_parameter(event, "fields"),
+            include_urls=_parse_include_urls(event)
+        )
+
     image_id = _extract_image_id(event)
     if image_id:
         return service.get_image(
             image_id,
             _parse_download_flag(event),
-            _parse_expires_in(event)
+            _parse_expires_in(event),
+            fields=get_query_parameter(event, "fields"),
+            include_urls=_parse_include_urls(event),
+            transform=_parse_transform(event)
         )
 
     return service.list_images(
         user_id=get_query_parameter(event, "user_id"),
         tags=get_query_parameter(event, "tags"),
         limit=_parse_limit(event),
-        last_key=get_query_parameter(event, "last_key")
+        last_key=get_query_parameter(event, "last_key"),
+        fields=get_query_parameter(event, "fields"),
+        include_urls=_parse_include_urls(event),
+        sort=get_query_parameter(event, "sort")
     )
 
 
+def _handle_patch(event):
+    body = parse_json_body(event)
+    if not isinstance(body, dict):
+        raise ValidationError("Request body must be a JSON object")
+    image_id = _extract_image_id(event)
+    if not image_id:
+        # PATCH /images edits tags across many images
+        return service.update_tags(
+            body.get("image_ids"),
+            add=body.get("add_tags"),
+            remove=body.get("remove_tags"),
+            user_id=body.get("user_id")
+        )
+
+    version = body.pop("version", None)
+    if version is None:
+        version = _parse_if_match(event)
+    return service.update_image(image_id, body, version)
+
+
+def _parse_if_match(event):
+    """The image version named by an ``If-Match`` header (``"3"``, ``W/"3"`` or ``3``), if any."""
+    value = get_header(event, "If-Match")
+    if not value:
+        return None
+    tag = value.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise ValidationError("If-Match must be an image version")
+
+
 def _handle_delete(event):
     image_id = _extract_image_id(event)
     if not image_id:
@@ -83,6 +196,24 @@ def _handle_delete(event):
     return service.delete_image(image_id)
 
 
+def _is_stats_request(event):
+    """Match ``GET /users/{user_id}/stats``."""
+    route = event.get("resource") or event.get("path") or ""
+    return route.endswith("/stats") and bool(get_path_parameter(event, "user_id"))
+
+
+def _is_search_request(event):
+    """Match ``GET /images/search``."""
+    route = event.get("resource") or event.get("path") or ""
+    return route.rstrip("/").endswith("/images/search") and not get_path_parameter(event, "image_id")
+
+
+def _is_restore_request(event):
+    """Match ``POST /images/{image_id}/restore``."""
+    route = event.get("resource") or event.get("path") or ""
+    return route.endswith("/restore") and bool(get_path_parameter(event, "image_id"))
+
+
 def _extract_image_id(event):
     return get_path_parameter(event, "image_id") or get_query_parameter(event, "image_id")
 
@@ -91,6 +222,23 @@ def _parse_download_flag(event):
     return get_query_parameter(event, "download", "false").lower() == "true"
 
 
+def _parse_include_urls(event):
+    value = get_query_parameter(event, "include_urls", "true").lower()
+    if value not in {"true", "false"}:
+        raise ValidationError("include_urls must be true or false")
+    return value == "true"
+
+
+def _parse_transform(event):
+    """Collect ``w``/``h``/``fit``/``format``; the service validates and normalizes them."""
+    transform = {}
+    for name in TRANSFORM_PARAMETERS:
+        value = get_query_parameter(event, name)
+        if value:
+            transform[name] = value
+    return transform or None
+
+
 def _parse_expires_in(event):
     expires_in_str = get_query_parameter(event, "expires_in")
     if not expires_in_str:
@@ -106,8 +254,8 @@ def _parse_expires_in(event):
     return expires_in
 
 
-def _parse_limit(event):
-    limit_str = get_query_parameter(event, "limit", "50")
+def _parse_limit(event, default="50"):
+    limit_str = get_query_parameter(event, "limit", default)
     try:
         limit = int(limit_str)
     except (TypeError, ValueError):
@@ -118,21 +266,40 @@ def _parse_limit(event):
     return limit
 
 
-def decimal_default(obj):
-    """Serialize Decimal values as float for JSON responses."""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+TRANSFORM_PARAMETERS = ("w", "h", "fit", "format")
+
+RESPONSE_HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key,If-Match",
+    "Access-Control-Allow-Methods": "GET,POST,PUT,PATCH,DELETE,OPTIONS",
+    "Vary": "Accept-Encoding"
+}
+
+
+def response(status, body, event=None, extra_headers=None, cookies=None):
+    """
+    Build API Gateway response, compressing when the client allows it.
+    
+    ``cookies`` go in ``multiValueHeaders`` since one response sets several.
+    """
+    accept_encoding = get_header(event, "Accept-Encoding") if event else None
+    encoded, content_encoding, is_base64 = encode_body(
+        dumps(body), accept_encoding, Config.get_compression_min_bytes()
+    )
+
+    headers = dict(RESPONSE_HEADERS)
+    if extra_headers:
+        headers.update(extra_headers)
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
 
-def response(status, body):
-    """Build API Gateway response."""
-    return {
+    result = {
         "statusCode": status,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type",
-            "Access-Control-Allow-Methods": "GET,POST,PUT,DELETE,OPTIONS"
-        },
-        "body": json.dumps(body, default=decimal_default)
+        "headers": headers,
+        "body": encoded,
+        "isBase64Encoded": is_base64
     }
+    if cookies:
+        result["multiValueHeaders"] = {"Set-Cookie": cookies}
+    return result
@@ -0,0 +1,64 @@
+"""Lambda handler for scheduled maintenance jobs."""
+from ..services.image_service import ImageService
+from ..common import resilience
+from ..common.errors import ImageServiceError, ValidationError
+from ..common.logger import get_logger
+
+service = ImageService()
+logger = get_logger(__name__)
+
+
+def lambda_handler(event, context):
+    """
+    Run a maintenance job.
+
+    The event selects the job, e.g. ``{"job": "recount_usage", "user_id": "optional"}``
+    (typically from an EventBridge schedule).
+    """
+    job = (event or {}).get("job")
+    resilience.start_invocation()
+    try:
+        runner = JOBS.get(job)
+        if runner is None:
+            raise ValidationError(f"Unknown job: {job}")
+        result = runner(event)
+        logger.info("maintenance job completed", job=job, result=result)
+        return {"job": job, "status": "completed", "result": result}
+
+    except ImageServiceError as e:
+        logger.error("maintenance job failed", job=job, error=e.message)
+        return {"job": job, "status": "failed", "error": e.message}
+
+
+def _recount_usage(event):
+    return service.recount_usage(event.get("user_id"))
+
+
+def _purge_deleted(event):
+    return service.purge_deleted(event.get("now"))
+
+
+def _migrate_key_layout(event):
+    return service.migrate_key_layout(
+        layout=event.get("layout"),
+        limit=event.get("limit"),
+        workers=event.get("workers", 8),
+        delete_source=event.get("delete_source", True)
+    )
+
+
+def _compact_search_index(event):
+    return service.compact_search_index(event.get("user_id"))
+
+
+def _rebuild_search_index(event):
+    return service.rebuild_search_index(event.get("user_id"))
+
+
+JOBS = {
+    "recount_usage": _recount_usage,
+    "purge_deleted": _purge_deleted,
+    "migrate_key_layout": _migrate_key_layout,
+    "compact_search_index": _compact_search_index,
+    "rebuild_search_index": _rebuild_search_index
+}
@@ -2,12 +2,43 @@
 Image metadata model.
 """
 
+from ..common.serialization import dumps, to_json_number
+
+# Version of the attribute layout written by this code
+SCHEMA_VERSION = 1
+
+# All metadata attributes, in output order
+FIELDS = (
+    'image_id', 'user_id', 'filename', 's3_key', 'content_type', 'size',
+    'upload_date', 'tags', 'description', 'width', 'height', 'original_size',
+    'checksum', 'dominant_color', 'captured_at', 'enriched_at', 'expires_at', 'version'
+)
+
+# Numeric attributes DynamoDB returns as Decimal
+NUMERIC_FIELDS = ('size', 'width', 'height', 'original_size', 'expires_at', 'version')
+
+# Bookkeeping attributes that are stored but never decoded into the model
+RESERVED_ATTRIBUTES = ('schema_version', 'feed_pk', 'feed_sk', 'deleted_at', 'purge_pk', 'purge_after')
+
+# Attributes not carried over in ``extra``; schema_version is, to remember a newer writer
+_DECODED_ATTRIBUTES = frozenset(FIELDS + RESERVED_ATTRIBUTES) - {'schema_version'}
+
 
 class ImageMetadata:
-    """Image metadata model."""
+    """
+    Image metadata model.
+
+    Uses ``__slots__`` to keep per-instance memory small. Attributes written by
+    a newer schema version are preserved in ``extra`` so that a read-modify-write
+    does not drop them; unknown attributes from older versions are ignored.
+    """
+    
+    __slots__ = FIELDS + ('extra',)
     
     def __init__(self, image_id, user_id, filename, s3_key, content_type, size, upload_date,
-                 tags=None, description=None, width=None, height=None):
+                 tags=None, description=None, width=None, height=None, original_size=None,
+                 checksum=None, dominant_color=None, captured_at=None, enriched_at=None, expires_at=None,
+                 version=None, extra=None):
         self.image_id = image_id
         self.user_id = user_id
         self.filename = filename
@@ -19,9 +50,19 @@ class ImageMetadata:
         self.description = description
         self.width = width
         self.height = height
+        self.original_size = original_size
+        self.checksum = checksum
+        self.dominant_color = dominant_color
+        self.captured_at = captured_at
+        self.enriched_at = enriched_at
+        self.expires_at = expires_at
+        self.version = version
+        self.extra = extra
     
-    def to_dict(self):
-        """Convert to dictionary."""
+    def to_dict(self, fields=None):
+        """Convert to a JSON-ready dictionary, optionally restricted to ``fields``."""
+        if fields:
+            return {field: getattr(self, field) for field in fields}
         return {
             'image_id': self.image_id,
             'user_id': self.user_id,
@@ -33,14 +74,62 @@ class ImageMetadata:
             'tags': self.tags,
             'description': self.description,
             'width': self.width,
-            'height': self.height
+            'height': self.height,
+            'original_size': self.original_size,
+            'checksum': self.checksum,
+            'dominant_color': self.dominant_color,
+            'captured_at': self.captured_at,
+            'enriched_at': self.enriched_at,
+            'expires_at': self.expires_at,
+            'version': self.version
         }
     
+    def to_json(self, fields=None):
+        """Serialize directly to a JSON string."""
+        return dumps(self.to_dict(fields))
+    
     def to_dynamodb_item(self):
         """Convert to DynamoDB item (removes None values)."""
-        return {k: v for k, v in self.to_dict().items() if v is not None}
+        item = {k: v for k, v in self.to_dict().items() if v is not None}
+        if self.extra:
+            for key, value in self.extra.items():
+                item.setdefault(key, value)
+        # Keep a newer writer's version, so its attributes stay in ``extra`` on the next read
+        item['schema_version'] = max(SCHEMA_VERSION, item.get('schema_version', SCHEMA_VERSION))
+        return item
     
     @classmethod
     def from_dynamodb_item(cls, item):
-        """Create from DynamoDB item."""
-        return cls(**item)
+        """
+        Create from DynamoDB item (numbers converted to JSON-ready ints/floats).
+
+        Partial items, such as the result of a projection, leave the missing
+        attributes as None.
+        """
+        get = item.get
+        metadata = cls(
+            get('image_id'), get('user_id'), get('filename'), get('s3_key'), get('content_type'),
+            to_json_number(get('size')), get('upload_date'), get('tags'), get('description'),
+            to_json_number(get('width')), to_json_number(get('height')), to_json_number(get('original_size')),
+            get('checksum'), get('dominant_color'), get('captured_at'), get('enriched_at'),
+            to_json_number(get('expires_at')), to_json_number(get('version'))
+        )
+        version = get('schema_version')
+        if version is not None and version > SCHEMA_VERSION:
+            # Includes schema_version, so writing the item back does not downgrade it
+            metadata.extra = {k: v for k, v in item.items() if k not in _DECODED_ATTRIBUTES} or None
+        return metadata
+    
+    @staticmethod
+    def item_to_dict(item, fields=None):
+        """Decode a DynamoDB item straight to a JSON-ready dict without building a model."""
+        return _decode_dict(item, fields or FIELDS)
+
+
+def _decode_dict(item, fields):
+    get = item.get
+    return {
+        field: to_json_number(get(field)) if field in NUMERIC_FIELDS else get(field)
+        for field in fields
+    }
+
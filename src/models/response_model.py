@@ -1,7 +1,7 @@
 """
 API response models.
 """
-import json
+from ..common.serialization import dumps
 
 
 class APIResponse:
@@ -16,7 +16,7 @@ class APIResponse:
         """Convert to Lambda response format."""
         return {
             'statusCode': self.status_code,
-            'body': json.dumps(self.body),
+            'body': dumps(self.body),
             'headers': self.headers or {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*',
@@ -2,5 +2,7 @@
 
 from .storage_repository import StorageRepository
 from .metadata_repository import MetadataRepository
+from .usage_repository import UsageRepository
+from .idempotency_repository import IdempotencyRepository
 
-__all__ = ['StorageRepository', 'MetadataRepository']
+__all__ = ['StorageRepository', 'MetadataRepository', 'UsageRepository', 'IdempotencyRepository']
@@ -0,0 +1,54 @@
+"""
+Repository selection by configuration.
+
+``STORAGE_BACKEND`` picks where image bytes live (``s3`` or ``local``);
+``METADATA_BACKEND`` picks the store for metadata, usage counters and
+idempotency records (``dynamodb`` or ``sqlite``).
+"""
+from ..common.config import Config
+from .storage_repository import StorageRepository
+from .local_storage_repository import LocalStorageRepository
+from .metadata_repository import MetadataRepository
+from .usage_repository import UsageRepository
+from .idempotency_repository import IdempotencyRepository
+from .sqlite_repository import SqliteIdempotencyRepository, SqliteMetadataRepository, SqliteUsageRepository
+
+STORAGE_BACKENDS = {
+    's3': StorageRepository,
+    'local': LocalStorageRepository
+}
+
+METADATA_BACKENDS = {
+    'dynamodb': (MetadataRepository, UsageRepository, IdempotencyRepository),
+    'sqlite': (SqliteMetadataRepository, SqliteUsageRepository, SqliteIdempotencyRepository)
+}
+
+
+def create_storage_repository(backend=None):
+    """Build the configured object storage repository."""
+    backend = backend or Config.get_storage_backend()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return STORAGE_BACKENDS[backend]()
+
+
+def _metadata_backend(backend):
+    backend = backend or Config.get_metadata_backend()
+    if backend not in METADATA_BACKENDS:
+        raise ValueError(f"Unknown metadata backend: {backend}")
+    return METADATA_BACKENDS[backend]
+
+
+def create_metadata_repository(backend=None):
+    """Build the configured metadata repository."""
+    return _metadata_backend(backend)[0]()
+
+
+def create_usage_repository(backend=None):
+    """Build the configured usage counter repository."""
+    return _metadata_backend(backend)[1]()
+
+
+def create_idempotency_repository(backend=None):
+    """Build the configured idempotency repository."""
+    return _metadata_backend(backend)[2]()
@@ -0,0 +1,205 @@
+"""
+Repository interfaces.
+
+``ImageService`` and the other services only depend on these. The AWS
+implementations (S3, DynamoDB) are the default; ``backends`` selects local
+filesystem and SQLite implementations instead. Every implementation raises
+``StorageError`` / ``DatabaseError`` for backend failures and ``NotFoundError``
+where documented, so callers handle all backends alike.
+"""
+from abc import ABC, abstractmethod
+
+
+class BaseStorageRepository(ABC):
+    """Object storage for image bytes, addressed by key."""
+
+    @abstractmethod
+    def upload_image(self, s3_key, image_bytes, content_type, metadata, tags=None):
+        """Store an object, replacing any existing one; ``tags`` are object tags where supported."""
+
+    @abstractmethod
+    def delete_image(self, s3_key):
+        """Delete an object; a missing object is not an error."""
+
+    @abstractmethod
+    def get_image_bytes(self, s3_key):
+        """Return an object's bytes."""
+
+    @abstractmethod
+    def read_image(self, s3_key, length=None):
+        """Return an object's bytes, or only the first ``length``; None if it does not exist."""
+
+    @abstractmethod
+    def list_keys(self, prefix):
+        """List every object key under ``prefix``."""
+
+    @abstractmethod
+    def copy_image(self, source_key, dest_key):
+        """Copy an object to another key."""
+
+    @abstractmethod
+    def delete_images(self, s3_keys):
+        """Delete many objects; returns the set of keys that failed."""
+
+    @abstractmethod
+    def check_image_exists(self, s3_key):
+        """Whether an object exists."""
+
+    @abstractmethod
+    def generate_presigned_url(self, s3_key, expires_in=3600, download=False, filename=None):
+        """URL a client can fetch the object from for ``expires_in`` seconds."""
+
+    @abstractmethod
+    def get_object_url(self, s3_key):
+        """Unsigned URL of an object (used together with signed cookies)."""
+
+    @property
+    def signed_cookies_enabled(self):
+        """Whether list pages are authorized with cookies instead of per-URL signatures."""
+        return False
+
+    def generate_user_cookies(self, user_id, expires_in=3600):
+        """Cookies granting access to all of a user's objects."""
+        raise NotImplementedError('Signed cookies are not supported by this storage backend')
+
+
+class BaseMetadataRepository(ABC):
+    """
+    Image metadata, including soft-delete tombstones and the recent-uploads feed.
+
+    Live images are neither deleted nor past their ``expires_at``; reads only
+    return live images.
+    """
+
+    @abstractmethod
+    def save_metadata(self, metadata):
+        """Create or replace an image's metadata."""
+
+    @abstractmethod
+    def get_metadata(self, image_id, fields=None):
+        """Return a live image's ``ImageMetadata``; raises ``NotFoundError``."""
+
+    @abstractmethod
+    def delete_metadata(self, image_id):
+        """Delete an image's metadata outright."""
+
+    @abstractmethod
+    def list_metadata(self, user_id=None, tags=None, limit=50, last_evaluated_key=None, fields=None):
+        """Return ``(images, next_key)`` of live images in storage order; ``next_key`` is a dict or None."""
+
+    @abstractmethod
+    def iter_metadata(self, fields=None):
+        """Yield every live image."""
+
+    @abstractmethod
+    def update_s3_key(self, image_id, old_key, new_key):
+        """Point a live image still stored at ``old_key`` at ``new_key``; False if it changed."""
+
+    @abstractmethod
+    def update_enrichment(self, image_id, s3_key, attributes):
+        """Set computed attributes if the image is live and at ``s3_key``; raises ``NotFoundError`` if missing."""
+
+    @abstractmethod
+    def update_metadata(self, image_id, changes, expected_version=None):
+        """
+        Apply ``changes`` (None removes a field) to a live image and bump its version.
+
+        Raises ``ConflictError`` if ``expected_version`` is given and does not
+        match, ``NotFoundError`` if the image is not live. Returns the updated metadata.
+        """
+
+    @abstractmethod
+    def mark_deleted(self, image_id, deleted_at, purge_after):
+        """Tombstone a live image and return it as it was; raises ``NotFoundError``."""
+
+    @abstractmethod
+    def get_deleted(self, image_id, now):
+        """Return ``(metadata, purge_after)`` of a restorable tombstone; raises ``NotFoundError``."""
+
+    @abstractmethod
+    def restore(self, metadata, purge_after, now):
+        """Clear an unchanged tombstone whose window is open; raises ``NotFoundError``."""
+
+    @abstractmethod
+    def iter_purgeable(self, now, page_size=1000):
+        """Yield pages of tombstones whose undelete window closed by ``now``."""
+
+    @abstractmethod
+    def iter_expired(self, now, page_size=1000):
+        """Yield pages of live images whose ``expires_at`` passed by ``now`` and that the store does not reap."""
+
+    @abstractmethod
+    def delete_many(self, image_ids, max_attempts=5):
+        """Delete many items; returns the IDs that could not be deleted."""
+
+    @abstractmethod
+    def get_many(self, image_ids, fields=None, max_attempts=5):
+        """Return ``{image_id: ImageMetadata}`` of the live images among ``image_ids``."""
+
+    @abstractmethod
+    def list_recent(self, user_id=None, tags=None, limit=50, cursor=None, fields=None, now=None):
+        """Return ``(images, next_cursor)`` newest first; the cursor is ``{'feed_sk': ...}``."""
+
+
+class BaseUsageRepository(ABC):
+    """Per-user aggregate counters and quota enforcement."""
+
+    @abstractmethod
+    def reserve(self, user_id, size, upload_date, max_images=0, max_bytes=0):
+        """
+        Atomically count a new image; raises ``QuotaExceededError`` past a quota (0 = unlimited).
+
+        An ``upload_date`` of None keeps ``last_upload`` unchanged.
+        """
+
+    @abstractmethod
+    def release(self, user_id, size):
+        """Atomically remove an image from the counters."""
+
+    @abstractmethod
+    def get_usage(self, user_id):
+        """Return ``{'user_id', 'image_count', 'total_bytes', 'last_upload'}``."""
+
+    @abstractmethod
+    def set_usage(self, user_id, image_count, total_bytes, last_upload=None, expected=None):
+        """
+        Overwrite a user's counters.
+
+        With ``expected`` (``(image_count, total_bytes)``, zeros for a user
+        without counters) the write only happens if the counters still hold
+        those values; returns False when they changed.
+        """
+
+    @abstractmethod
+    def list_usage(self):
+        """Yield the counters of every user."""
+
+
+class BaseIdempotencyRepository(ABC):
+    """Idempotency records for uploads."""
+
+    @abstractmethod
+    def claim(self, key, fingerprint, lease_seconds, token):
+        """
+        Claim ``key`` for ``lease_seconds``; returns None on success, otherwise the existing live record.
+
+        An in-progress claim whose lease has run out can be claimed again.
+        ``token`` identifies this claim to ``complete`` and ``release``.
+        """
+
+    @abstractmethod
+    def get(self, key):
+        """Return a live record (None when missing or expired)."""
+
+    @abstractmethod
+    def complete(self, key, token, result, ttl_seconds):
+        """
+        Store the response of a finished request; returns False if the claim ``token`` was lost.
+
+        A request that outran its lease may have been claimed again by a
+        retry, whose record is then left alone.
+        """
+
+    @abstractmethod
+    def release(self, key, token):
+        """Delete an in-progress record, if still held with ``token``, so the request can be retried."""
@@ -0,0 +1,144 @@
+"""
+DynamoDB idempotency record repository.
+"""
+import json
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+from ..common.logger import get_logger
+from ..common.errors import DatabaseError
+from ..common.config import Config, get_aws_endpoint
+from ..common.resilience import ResilientClient, boto_config, failure_details
+from .base import BaseIdempotencyRepository
+
+logger = get_logger(__name__)
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+
+def idempotency_table_definition(table_name=None):
+    """Return ``create_table`` arguments for the idempotency table."""
+    return {
+        'TableName': table_name or Config.get_idempotency_table_name(),
+        'KeySchema': [{'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'idempotency_key', 'AttributeType': 'S'}],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+
+
+class IdempotencyRepository(BaseIdempotencyRepository):
+    """
+    Repository for idempotency records.
+    
+    A record is claimed with a conditional put (``IN_PROGRESS``) holding a short
+    lease, then either completed with the stored response, which is kept for the
+    full TTL, or deleted so the request can be retried. Both are conditional on
+    the record still carrying the claim's ``claim_token``. ``expires_at`` is the
+    lease or TTL end and the table's TTL attribute; expired records, including
+    claims abandoned by a crashed upload, can be reclaimed before DynamoDB reaps them.
+    """
+    
+    def __init__(self, dynamodb_resource=None):
+        """Initialize with DynamoDB connection."""
+        if dynamodb_resource:
+            self.dynamodb = dynamodb_resource
+        else:
+            self.dynamodb = boto3.resource(
+                'dynamodb',
+                endpoint_url=get_aws_endpoint('dynamodb'),
+                region_name=Config.get_region(),
+                aws_access_key_id='test' if get_aws_endpoint('dynamodb') else None,
+                aws_secret_access_key='test' if get_aws_endpoint('dynamodb') else None,
+                config=boto_config()
+            )
+        self.table_name = Config.get_idempotency_table_name()
+        self.table = ResilientClient(self.dynamodb.Table(self.table_name), 'dynamodb')
+    
+    def claim(self, key, fingerprint, lease_seconds, token):
+        """
+        Claim ``key`` for a new request until ``lease_seconds`` from now.
+        
+        Returns None when the claim succeeded, otherwise the existing live record.
+        """
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={
+                    'idempotency_key': key,
+                    'status': IN_PROGRESS,
+                    'fingerprint': fingerprint,
+                    'claim_token': token,
+                    'expires_at': now + lease_seconds
+                },
+                ConditionExpression='attribute_not_exists(idempotency_key) OR expires_at < :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            logger.info("Idempotency key claimed", idempotency_key=key)
+            return None
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                logger.error("Failed to claim idempotency key", idempotency_key=key, error=str(e))
+                raise DatabaseError(f"Failed to claim idempotency key: {str(e)}", operation='claim', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to claim idempotency key", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to claim idempotency key: {str(e)}", operation='claim', **failure_details(e))
+        
+        return self.get(key) or self.claim(key, fingerprint, lease_seconds, token)
+    
+    def get(self, key):
+        """Get a live record (None when missing or expired)."""
+        try:
+            response = self.table.get_item(Key={'idempotency_key': key}, ConsistentRead=True)
+        except Exception as e:
+            logger.error("Failed to get idempotency record", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to get idempotency record: {str(e)}", operation='get', **failure_details(e))
+        
+        item = response.get('Item')
+        if not item or item['expires_at'] < int(time.time()):
+            return None
+        if 'response' in item:
+            item['response'] = json.loads(item['response'])
+        return item
+    
+    def complete(self, key, token, result, ttl_seconds):
+        """Store the response of a finished request; returns False if the claim was lost."""
+        try:
+            self.table.update_item(
+                Key={'idempotency_key': key},
+                UpdateExpression='SET #status = :completed, #response = :response, expires_at = :expires_at',
+                ConditionExpression='#status = :in_progress AND claim_token = :token',
+                ExpressionAttributeNames={'#status': 'status', '#response': 'response'},
+                ExpressionAttributeValues={
+                    ':completed': COMPLETED,
+                    ':in_progress': IN_PROGRESS,
+                    ':token': token,
+                    ':response': json.dumps(result),
+                    ':expires_at': int(time.time()) + ttl_seconds
+                }
+            )
+            logger.info("Idempotency key completed", idempotency_key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.error("Idempotency claim lost before completion", idempotency_key=key)
+                return False
+            logger.error("Failed to complete idempotency key", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to complete idempotency key: {str(e)}", operation='complete', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to complete idempotency key", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to complete idempotency key: {str(e)}", operation='complete', **failure_details(e))
+    
+    def release(self, key, token):
+        """Delete an in-progress record, if still held with ``token``, so the request can be retried."""
+        try:
+            self.table.delete_item(
+                Key={'idempotency_key': key},
+                ConditionExpression='#status = :in_progress AND claim_token = :token',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': IN_PROGRESS, ':token': token}
+            )
+            logger.info("Idempotency key released", idempotency_key=key)
+        except Exception as e:
+            logger.error("Failed to release idempotency key", idempotency_key=key, error=str(e))
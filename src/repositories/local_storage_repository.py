@@ -0,0 +1,150 @@
+"""
+Local filesystem object store (``STORAGE_BACKEND=local``).
+
+Objects live at ``{LOCAL_STORAGE_ROOT}/{key}``. Writes go to a temporary
+file in the target directory and are renamed into place, so readers only
+ever see complete objects. Ranged reads fetch only the bytes they need.
+
+URLs are ``LOCAL_STORAGE_URL`` (default: a ``file://`` URL of the root)
+plus the key. They are not signed, so serve the root behind your own
+access control.
+"""
+import os
+import tempfile
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+from ..common.logger import get_logger
+from ..common.errors import StorageError
+from ..common.config import Config
+from .base import BaseStorageRepository
+
+logger = get_logger(__name__)
+
+# Temporary files of in-flight writes; never listed as objects
+TEMP_PREFIX = '.tmp-'
+
+
+class LocalStorageRepository(BaseStorageRepository):
+    """Repository for objects stored as files under a root directory."""
+
+    def __init__(self, root=None, base_url=None):
+        """Initialize with the storage root (created if missing)."""
+        self.root = Path(root or Config.get_local_storage_root()).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = (base_url or Config.get_local_storage_url() or self.root.as_uri()).rstrip('/')
+
+    def _path(self, s3_key):
+        path = (self.root / s3_key).resolve()
+        if self.root not in path.parents:
+            raise StorageError(f"Invalid object key: {s3_key}", operation='path')
+        return path
+
+    def upload_image(self, s3_key, image_bytes, content_type, metadata, tags=None):
+        """Write an object atomically (temporary file + rename); files carry no tags."""
+        path = self._path(s3_key)
+        try:
+            self._write(path, image_bytes)
+            logger.info("Image stored", s3_key=s3_key, size=len(image_bytes))
+        except OSError as e:
+            logger.error("Failed to store image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to upload image: {str(e)}", operation='upload')
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def delete_image(self, s3_key):
+        """Delete an object (missing objects are ignored)."""
+        try:
+            self._path(s3_key).unlink(missing_ok=True)
+            logger.info("Image deleted", s3_key=s3_key)
+        except OSError as e:
+            logger.error("Failed to delete image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to delete image: {str(e)}", operation='delete')
+
+    def get_image_bytes(self, s3_key):
+        """Read an object's bytes."""
+        data = self.read_image(s3_key)
+        if data is None:
+            raise StorageError(f"Failed to download image: no such key {s3_key}", operation='download')
+        return data
+
+    def read_image(self, s3_key, length=None):
+        """Read an object, or only its first ``length`` bytes; None if it does not exist."""
+        path = self._path(s3_key)
+        try:
+            with open(path, 'rb') as f:
+                return f.read(length or -1)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error("Failed to read image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to download image: {str(e)}", operation='download')
+
+    def list_keys(self, prefix):
+        """List every object key under ``prefix``."""
+        directory = self.root / prefix.rsplit('/', 1)[0] if '/' in prefix else self.root
+        keys = []
+        try:
+            for dirpath, _, filenames in os.walk(directory):
+                for filename in filenames:
+                    if filename.startswith(TEMP_PREFIX):
+                        continue
+                    key = Path(dirpath, filename).relative_to(self.root).as_posix()
+                    if key.startswith(prefix):
+                        keys.append(key)
+        except OSError as e:
+            logger.error("Failed to list images", prefix=prefix, error=str(e))
+            raise StorageError(f"Failed to list images: {str(e)}", operation='list')
+        return sorted(keys)
+
+    def copy_image(self, source_key, dest_key):
+        """Copy an object; the copy is written atomically like an upload."""
+        data = self.read_image(source_key)
+        if data is None:
+            raise StorageError(f"Failed to copy image: no such key {source_key}", operation='copy')
+        try:
+            self._write(self._path(dest_key), data)
+            logger.info("Image copied", source_key=source_key, dest_key=dest_key)
+        except OSError as e:
+            logger.error("Failed to copy image", source_key=source_key, dest_key=dest_key, error=str(e))
+            raise StorageError(f"Failed to copy image: {str(e)}", operation='copy')
+
+    def delete_images(self, s3_keys):
+        """Delete objects; returns the set of keys that could not be deleted."""
+        failed = set()
+        for s3_key in s3_keys:
+            try:
+                self._path(s3_key).unlink(missing_ok=True)
+            except (OSError, StorageError):
+                failed.add(s3_key)
+        logger.info("Images batch deleted", count=len(s3_keys) - len(failed), failed=len(failed))
+        return failed
+
+    def check_image_exists(self, s3_key):
+        """Check if an object exists."""
+        return self._path(s3_key).is_file()
+
+    def generate_presigned_url(self, s3_key, expires_in=3600, download=False, filename=None):
+        """URL of the object under ``base_url`` (unsigned; ``expires_in`` does not apply)."""
+        url = self.get_object_url(s3_key)
+        if download:
+            disposition = f'attachment; filename="{filename}"' if filename else 'attachment'
+            url += '?' + urlencode({'response-content-disposition': disposition})
+        return url
+
+    def get_object_url(self, s3_key):
+        return f"{self.base_url}/{quote(s3_key)}"
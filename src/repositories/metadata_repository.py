@@ -1,17 +1,147 @@
 """
 DynamoDB metadata repository.
 """
+import heapq
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
 import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 from ..models.image_model import ImageMetadata
 from ..common.logger import get_logger
-from ..common.errors import DatabaseError, NotFoundError
+from ..common.errors import ConflictError, DatabaseError, NotFoundError
 from ..common.config import Config, get_aws_endpoint
+from ..common import resilience
+from ..common.resilience import ResilientClient, boto_config, failure_details
+from .base import BaseMetadataRepository
 
 logger = get_logger(__name__)
 
+# Partition key value shared by every tombstone in the purge index
+TOMBSTONE_PARTITION = 'tombstone'
+
+# BatchWriteItem accepts at most this many requests per call
+BATCH_WRITE_SIZE = 25
+
+# BatchGetItem accepts at most this many keys per call
+BATCH_GET_SIZE = 100
+
+# Daily feed buckets one sort=recent page may query; the cursor resumes past them
+MAX_FEED_DAYS_PER_PAGE = 366
+
+
+def build_projection(fields):
+    """Build ProjectionExpression kwargs for a list of attribute names."""
+    if not fields:
+        return {}
+    names = {f'#pf{i}': field for i, field in enumerate(fields)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+
+def with_attributes(fields, *attributes):
+    """``fields`` plus bookkeeping ``attributes`` a read needs, or None to read whole items."""
+    if not fields:
+        return None
+    return list(fields) + [name for name in attributes if name not in fields]
+
+
+def table_definition(table_name=None, feed_index_name=None, purge_index_name=None):
+    """Return ``create_table`` arguments for the metadata table and its GSIs."""
+    return {
+        'TableName': table_name or Config.get_table_name(),
+        'KeySchema': [{'AttributeName': 'image_id', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'image_id', 'AttributeType': 'S'},
+            {'AttributeName': 'feed_pk', 'AttributeType': 'S'},
+            {'AttributeName': 'feed_sk', 'AttributeType': 'S'},
+            {'AttributeName': 'purge_pk', 'AttributeType': 'S'},
+            {'AttributeName': 'purge_after', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [{
+            'IndexName': feed_index_name or Config.get_feed_index_name(),
+            'KeySchema': [
+                {'AttributeName': 'feed_pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'feed_sk', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }, {
+            # Sparse: only tombstoned images carry purge_pk
+            'IndexName': purge_index_name or Config.get_purge_index_name(),
+            'KeySchema': [
+                {'AttributeName': 'purge_pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'purge_after', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['s3_key']}
+        }],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+
+
+def feed_attributes(image_id, upload_date, shard_count=None):
+    """
+    Build the write-sharded feed index keys for an image.
 
-class MetadataRepository:
+    The partition key is the upload day plus a shard derived from the image ID,
+    so a burst of uploads on one day spreads over ``shard_count`` partitions.
+    The sort key orders by upload time, with the image ID as a tie-breaker.
+    """
+    shard_count = shard_count or Config.get_feed_shard_count()
+    shard = zlib.crc32(image_id.encode('utf-8')) % shard_count
+    return {
+        'feed_pk': f'{upload_date[:10]}#{shard}',
+        'feed_sk': f'{upload_date}#{image_id}'
+    }
+
+
+def live_filter(now=None):
+    """Filter hiding deleted images and expired images TTL has not removed yet."""
+    now = int(time.time() if now is None else now)
+    return Attr('deleted_at').not_exists() & (Attr('expires_at').not_exists() | Attr('expires_at').gt(now))
+
+
+def is_expired(item, now=None):
+    """Whether an item's ``expires_at`` (epoch seconds) has passed."""
+    expires_at = item.get('expires_at')
+    return expires_at is not None and expires_at <= (time.time() if now is None else now)
+
+
+def is_live(item, now=None):
+    """Whether an item is neither deleted nor expired."""
+    return 'deleted_at' not in item and not is_expired(item, now)
+
+
+def build_filter(user_id=None, tags=None):
+    """Build a filter expression for user and tag filters (tags are OR-ed), hiding deleted and expired images."""
+    filter_expressions = [live_filter()]
+    
+    if user_id:
+        filter_expressions.append(Attr('user_id').eq(user_id))
+    
+    if tags:
+        tag_filters = [Attr('tags').contains(tag) for tag in tags]
+        if len(tag_filters) == 1:
+            filter_expressions.append(tag_filters[0])
+        else:
+            # Combine with OR logic
+            combined_tag_filter = tag_filters[0]
+            for tag_filter in tag_filters[1:]:
+                combined_tag_filter = combined_tag_filter | tag_filter
+            filter_expressions.append(combined_tag_filter)
+    
+    # Combine all filters with AND logic
+    combined_filter = filter_expressions[0]
+    for filter_expr in filter_expressions[1:]:
+        combined_filter = combined_filter & filter_expr
+    return combined_filter
+
+
+class MetadataRepository(BaseMetadataRepository):
     """Repository for DynamoDB operations."""
     
     def __init__(self, dynamodb_resource=None):
@@ -24,26 +154,34 @@ class MetadataRepository:
                 endpoint_url=get_aws_endpoint('dynamodb'),
                 region_name=Config.get_region(),
                 aws_access_key_id='test' if get_aws_endpoint('dynamodb') else None,
-                aws_secret_access_key='test' if get_aws_endpoint('dynamodb') else None
+                aws_secret_access_key='test' if get_aws_endpoint('dynamodb') else None,
+                config=boto_config()
             )
         self.table_name = Config.get_table_name()
-        self.table = self.dynamodb.Table(self.table_name)
+        self.table = ResilientClient(self.dynamodb.Table(self.table_name), 'dynamodb')
+        self.feed_index_name = Config.get_feed_index_name()
+        self.feed_shard_count = Config.get_feed_shard_count()
+        self.purge_index_name = Config.get_purge_index_name()
     
     def save_metadata(self, metadata):
         """Save image metadata to DynamoDB."""
         try:
-            self.table.put_item(Item=metadata.to_dynamodb_item())
+            item = metadata.to_dynamodb_item()
+            if metadata.upload_date:
+                item.update(feed_attributes(metadata.image_id, metadata.upload_date, self.feed_shard_count))
+            self.table.put_item(Item=item)
             logger.info("Metadata saved", image_id=metadata.image_id)
         except Exception as e:
             logger.error("Failed to save metadata", image_id=metadata.image_id, error=str(e))
-            raise DatabaseError(f"Failed to save metadata: {str(e)}", operation='save')
+            raise DatabaseError(f"Failed to save metadata: {str(e)}", operation='save', **failure_details(e))
     
-    def get_metadata(self, image_id):
-        """Get image metadata from DynamoDB."""
+    def get_metadata(self, image_id, fields=None):
+        """Get image metadata from DynamoDB, optionally projected to ``fields``."""
         try:
-            response = self.table.get_item(Key={'image_id': image_id})
+            projection = with_attributes(fields, 'deleted_at', 'expires_at')
+            response = self.table.get_item(Key={'image_id': image_id}, **build_projection(projection))
             
-            if 'Item' not in response:
+            if 'Item' not in response or not is_live(response['Item']):
                 raise NotFoundError('Image', image_id)
             
             logger.info("Retrieved metadata", image_id=image_id)
@@ -52,7 +190,7 @@ class MetadataRepository:
             raise
         except Exception as e:
             logger.error("Failed to get metadata", image_id=image_id, error=str(e))
-            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get')
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get', **failure_details(e))
     
     def delete_metadata(self, image_id):
         """Delete image metadata from DynamoDB."""
@@ -61,38 +199,18 @@ class MetadataRepository:
             logger.info("Metadata deleted", image_id=image_id)
         except Exception as e:
             logger.error("Failed to delete metadata", image_id=image_id, error=str(e))
-            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='delete')
+            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='delete', **failure_details(e))
     
-    def list_metadata(self, user_id=None, tags=None, limit=50, last_evaluated_key=None):
-        """List image metadata with optional filters."""
+    def list_metadata(self, user_id=None, tags=None, limit=50, last_evaluated_key=None, fields=None):
+        """List image metadata with optional filters and attribute projection."""
         try:
-            scan_kwargs = {'Limit': limit}
+            scan_kwargs = {'Limit': limit, **build_projection(fields)}
             
             if last_evaluated_key:
                 scan_kwargs['ExclusiveStartKey'] = last_evaluated_key
             
-            # Build filter expressions
-            filter_expressions = []
-            
-            if user_id:
-                filter_expressions.append(Attr('user_id').eq(user_id))
-            
-            if tags:
-                tag_filters = [Attr('tags').contains(tag) for tag in tags]
-                if len(tag_filters) == 1:
-                    filter_expressions.append(tag_filters[0])
-                else:
-                    # Combine with OR logic
-                    combined_tag_filter = tag_filters[0]
-                    for tag_filter in tag_filters[1:]:
-                        combined_tag_filter = combined_tag_filter | tag_filter
-                    filter_expressions.append(combined_tag_filter)
-            
-            # Combine all filters with AND logic
-            if filter_expressions:
-                combined_filter = filter_expressions[0]
-                for filter_expr in filter_expressions[1:]:
-                    combined_filter = combined_filter & filter_expr
+            combined_filter = build_filter(user_id, tags)
+            if combined_filter is not None:
                 scan_kwargs['FilterExpression'] = combined_filter
             
             # Execute scan
@@ -114,4 +232,406 @@ class MetadataRepository:
             
         except Exception as e:
             logger.error("Failed to list metadata", error=str(e))
-            raise DatabaseError(f"Failed to list metadata: {str(e)}", operation='list')
+            raise DatabaseError(f"Failed to list metadata: {str(e)}", operation='list', **failure_details(e))
+    
+    def iter_metadata(self, fields=None):
+        """Yield every live metadata item in the table (used by maintenance jobs)."""
+        try:
+            scan_kwargs = {**build_projection(fields), 'FilterExpression': live_filter()}
+            while True:
+                response = self.table.scan(**scan_kwargs)
+                for item in response.get('Items', []):
+                    yield ImageMetadata.from_dynamodb_item(item)
+                if 'LastEvaluatedKey' not in response:
+                    return
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            logger.error("Failed to scan metadata", error=str(e))
+            raise DatabaseError(f"Failed to scan metadata: {str(e)}", operation='scan', **failure_details(e))
+    
+    def update_s3_key(self, image_id, old_key, new_key):
+        """
+        Point an image at a new object key.
+        
+        Conditional on the item still referencing ``old_key`` and not being
+        deleted; returns False when that no longer holds.
+        """
+        try:
+            self.table.update_item(
+                Key={'image_id': image_id},
+                UpdateExpression='SET s3_key = :new_key',
+                ConditionExpression='s3_key = :old_key AND attribute_not_exists(deleted_at)',
+                ExpressionAttributeValues={':old_key': old_key, ':new_key': new_key}
+            )
+            logger.info("Metadata key updated", image_id=image_id, s3_key=new_key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            logger.error("Failed to update key", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update key: {str(e)}", operation='update_key', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to update key", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update key: {str(e)}", operation='update_key', **failure_details(e))
+    
+    def update_enrichment(self, image_id, s3_key, attributes):
+        """
+        Store computed attributes (dimensions, checksum, ...) on an image.
+        
+        Conditional on the item still referencing ``s3_key`` and not being
+        deleted; returns False when that no longer holds. Raises
+        ``NotFoundError`` if the item does not exist (yet): uploads store the
+        object before its metadata.
+        """
+        names = {f"#a{i}": name for i, name in enumerate(attributes)}
+        values = {f":a{i}": value for i, value in enumerate(attributes.values())}
+        try:
+            self.table.update_item(
+                Key={'image_id': image_id},
+                UpdateExpression='SET ' + ', '.join(f"#a{i} = :a{i}" for i in range(len(attributes))),
+                ConditionExpression='s3_key = :s3_key AND attribute_not_exists(deleted_at)',
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={**values, ':s3_key': s3_key}
+            )
+            logger.info("Metadata enriched", image_id=image_id, attributes=sorted(attributes))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                logger.error("Failed to enrich metadata", image_id=image_id, error=str(e))
+                raise DatabaseError(f"Failed to update metadata: {str(e)}", operation='enrich', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to enrich metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update metadata: {str(e)}", operation='enrich', **failure_details(e))
+        
+        try:
+            response = self.table.get_item(Key={'image_id': image_id}, ProjectionExpression='image_id', ConsistentRead=True)
+        except Exception as e:
+            logger.error("Failed to get metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get', **failure_details(e))
+        if 'Item' not in response:
+            raise NotFoundError('Image', image_id)
+        return False
+    
+    def update_metadata(self, image_id, changes, expected_version=None):
+        """
+        Apply field-level ``changes`` to a live image with one ``UpdateItem``.
+        
+        A value of None removes the attribute. Every update bumps ``version``
+        (items written before versioning count as version 0); with
+        ``expected_version`` the write only succeeds if nobody else updated
+        the image first, otherwise ``ConflictError`` is raised. Returns the
+        updated metadata; raises ``NotFoundError`` for missing, deleted or
+        expired images.
+        """
+        names = {f"#f{i}": name for i, name in enumerate(changes)}
+        names['#version'] = 'version'
+        values = {f":f{i}": value for i, value in enumerate(changes.values()) if value is not None}
+        values.update({':zero': 0, ':one': 1, ':now': int(time.time())})
+        sets = [f"#f{i} = :f{i}" for i, value in enumerate(changes.values()) if value is not None]
+        sets.append('#version = if_not_exists(#version, :zero) + :one')
+        removes = [f"#f{i}" for i, value in enumerate(changes.values()) if value is None]
+        expression = 'SET ' + ', '.join(sets) + (' REMOVE ' + ', '.join(removes) if removes else '')
+        condition = ('attribute_exists(image_id) AND attribute_not_exists(deleted_at) '
+                     'AND (attribute_not_exists(expires_at) OR expires_at > :now)')
+        if expected_version == 0:
+            condition += ' AND attribute_not_exists(#version)'
+        elif expected_version is not None:
+            condition += ' AND #version = :expected'
+            values[':expected'] = expected_version
+        try:
+            response = self.table.update_item(
+                Key={'image_id': image_id},
+                UpdateExpression=expression,
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_NEW'
+            )
+            metadata = ImageMetadata.from_dynamodb_item(response['Attributes'])
+            logger.info("Metadata updated", image_id=image_id, fields=sorted(changes), version=metadata.version)
+            return metadata
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                logger.error("Failed to update metadata", image_id=image_id, error=str(e))
+                raise DatabaseError(f"Failed to update metadata: {str(e)}", operation='update', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to update metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update metadata: {str(e)}", operation='update', **failure_details(e))
+        
+        try:
+            response = self.table.get_item(
+                Key={'image_id': image_id},
+                ProjectionExpression='image_id, deleted_at, expires_at, #version',
+                ExpressionAttributeNames={'#version': 'version'},
+                ConsistentRead=True
+            )
+        except Exception as e:
+            logger.error("Failed to get metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get', **failure_details(e))
+        item = response.get('Item')
+        if not item or not is_live(item):
+            raise NotFoundError('Image', image_id)
+        raise ConflictError(
+            f"Image {image_id} was modified concurrently: expected version {expected_version}, "
+            f"current version is {int(item.get('version', 0))}"
+        )
+    
+    def mark_deleted(self, image_id, deleted_at, purge_after):
+        """
+        Tombstone an image with a single conditional update.
+        
+        The item leaves the feed index and joins the sparse purge index, and is
+        hidden from reads straight away. Returns the image as it was; expired
+        images count as missing.
+        """
+        try:
+            response = self.table.update_item(
+                Key={'image_id': image_id},
+                UpdateExpression=(
+                    'SET deleted_at = :deleted_at, purge_pk = :purge_pk, purge_after = :purge_after '
+                    'REMOVE feed_pk, feed_sk'
+                ),
+                ConditionExpression=(
+                    'attribute_exists(image_id) AND attribute_not_exists(deleted_at) '
+                    'AND (attribute_not_exists(expires_at) OR expires_at > :now)'
+                ),
+                ExpressionAttributeValues={
+                    ':now': int(time.time()),
+                    ':deleted_at': deleted_at,
+                    ':purge_pk': TOMBSTONE_PARTITION,
+                    ':purge_after': purge_after
+                },
+                ReturnValues='ALL_OLD'
+            )
+            logger.info("Metadata marked deleted", image_id=image_id, purge_after=purge_after)
+            return ImageMetadata.from_dynamodb_item(response['Attributes'])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                raise NotFoundError('Image', image_id)
+            logger.error("Failed to mark metadata deleted", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='mark_deleted', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to mark metadata deleted", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='mark_deleted', **failure_details(e))
+    
+    def get_deleted(self, image_id, now):
+        """Return ``(metadata, purge_after)`` for a tombstone still inside its undelete window."""
+        try:
+            response = self.table.get_item(Key={'image_id': image_id}, ConsistentRead=True)
+        except Exception as e:
+            logger.error("Failed to get deleted metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get_deleted', **failure_details(e))
+        
+        item = response.get('Item')
+        if not item or 'deleted_at' not in item or item['purge_after'] <= now or is_expired(item):
+            raise NotFoundError('Deleted image', image_id)
+        return ImageMetadata.from_dynamodb_item(item), item['purge_after']
+    
+    def restore(self, metadata, purge_after, now):
+        """
+        Clear a tombstone and put the image back in the feed index.
+        
+        Conditional on the tombstone being unchanged and its undelete window
+        still open, so a restore can never race the purge job.
+        """
+        image_id = metadata.image_id
+        try:
+            feed = feed_attributes(image_id, metadata.upload_date, self.feed_shard_count)
+            self.table.update_item(
+                Key={'image_id': image_id},
+                UpdateExpression=(
+                    'SET feed_pk = :feed_pk, feed_sk = :feed_sk REMOVE deleted_at, purge_pk, purge_after'
+                ),
+                ConditionExpression='purge_after = :purge_after AND purge_after > :now',
+                ExpressionAttributeValues={
+                    ':feed_pk': feed['feed_pk'],
+                    ':feed_sk': feed['feed_sk'],
+                    ':purge_after': purge_after,
+                    ':now': now
+                }
+            )
+            logger.info("Metadata restored", image_id=image_id)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                raise NotFoundError('Deleted image', image_id)
+            logger.error("Failed to restore metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to restore metadata: {str(e)}", operation='restore', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to restore metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to restore metadata: {str(e)}", operation='restore', **failure_details(e))
+    
+    def iter_purgeable(self, now, page_size=1000):
+        """Yield pages of tombstones whose undelete window closed by ``now``."""
+        try:
+            query_kwargs = {
+                'IndexName': self.purge_index_name,
+                'KeyConditionExpression': (
+                    Key('purge_pk').eq(TOMBSTONE_PARTITION) & Key('purge_after').lte(now)
+                ),
+                'Limit': page_size
+            }
+            while True:
+                response = self.table.query(**query_kwargs)
+                items = response.get('Items', [])
+                if items:
+                    yield [ImageMetadata.from_dynamodb_item(item) for item in items]
+                if 'LastEvaluatedKey' not in response:
+                    return
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            logger.error("Failed to query purgeable metadata", error=str(e))
+            raise DatabaseError(f"Failed to query tombstones: {str(e)}", operation='purge_query', **failure_details(e))
+    
+    def iter_expired(self, now, page_size=1000):
+        """
+        Yield nothing: DynamoDB TTL removes expired items.
+        
+        Their usage is released from the table's stream (``expiry_handler``).
+        """
+        return iter(())
+    
+    def delete_many(self, image_ids, max_attempts=5):
+        """
+        Delete items in ``BatchWriteItem`` chunks, retrying unprocessed keys.
+        
+        Returns the IDs that were still unprocessed after ``max_attempts``.
+        """
+        unprocessed = []
+        try:
+            for start in range(0, len(image_ids), BATCH_WRITE_SIZE):
+                requests = [
+                    {'DeleteRequest': {'Key': {'image_id': image_id}}}
+                    for image_id in image_ids[start:start + BATCH_WRITE_SIZE]
+                ]
+                for attempt in range(1, max_attempts + 1):
+                    response = resilience.call(
+                        'dynamodb', self.dynamodb.batch_write_item,
+                        RequestItems={self.table_name: requests}
+                    )
+                    requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+                    if not requests:
+                        break
+                    if attempt < max_attempts:
+                        time.sleep(resilience.default_policy.delay(attempt))
+                unprocessed.extend(request['DeleteRequest']['Key']['image_id'] for request in requests)
+        except Exception as e:
+            logger.error("Failed to batch delete metadata", error=str(e))
+            raise DatabaseError(f"Failed to batch delete metadata: {str(e)}", operation='delete_many', **failure_details(e))
+        
+        logger.info("Metadata batch deleted", count=len(image_ids) - len(unprocessed), unprocessed=len(unprocessed))
+        return unprocessed
+    
+    def get_many(self, image_ids, fields=None, max_attempts=5):
+        """
+        Fetch live items with ``BatchGetItem``, retrying unprocessed keys.
+        
+        Returns ``{image_id: ImageMetadata}``; missing and deleted images are left out.
+        """
+        found = {}
+        projection = build_projection(with_attributes(fields, 'deleted_at', 'expires_at'))
+        try:
+            for start in range(0, len(image_ids), BATCH_GET_SIZE):
+                request = {
+                    'Keys': [{'image_id': image_id} for image_id in image_ids[start:start + BATCH_GET_SIZE]],
+                    **projection
+                }
+                for attempt in range(1, max_attempts + 1):
+                    response = resilience.call(
+                        'dynamodb', self.dynamodb.batch_get_item, RequestItems={self.table_name: request}
+                    )
+                    for item in response.get('Responses', {}).get(self.table_name, []):
+                        if is_live(item):
+                            found[item['image_id']] = ImageMetadata.from_dynamodb_item(item)
+                    request = response.get('UnprocessedKeys', {}).get(self.table_name)
+                    if not request:
+                        break
+                    if attempt < max_attempts:
+                        time.sleep(resilience.default_policy.delay(attempt))
+        except Exception as e:
+            logger.error("Failed to batch get metadata", error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get_many', **failure_details(e))
+        
+        return found
+    
+    def list_recent(self, user_id=None, tags=None, limit=50, cursor=None, fields=None, now=None):
+        """
+        List images newest-first from the sharded feed index.
+        
+        Queries every shard of a daily bucket, merges the results by upload
+        time and walks back one day at a time until ``limit`` images are found.
+        The feed ends after ``FEED_LOOKBACK_DAYS`` consecutive empty days, the
+        only way to tell that no older bucket holds images. ``cursor`` is the
+        ``feed_sk`` of the last image on the previous page, or a bare day when
+        a page spent ``MAX_FEED_DAYS_PER_PAGE`` days without filling up.
+        """
+        try:
+            projection = list(fields) + ['feed_sk'] if fields else None
+            query_filter = build_filter(user_id, tags)
+            before = cursor.get('feed_sk') if cursor else None
+            gap_days = Config.get_feed_lookback_days()
+            
+            start = datetime.strptime(before[:10], '%Y-%m-%d') if before else (now or datetime.utcnow())
+            items = []
+            next_key = None
+            empty_days = 0
+            with ThreadPoolExecutor(max_workers=self.feed_shard_count) as executor:
+                for offset in range(max(MAX_FEED_DAYS_PER_PAGE, gap_days)):
+                    day = (start - timedelta(days=offset)).strftime('%Y-%m-%d')
+                    needed = limit - len(items)
+                    shard_pages = executor.map(
+                        resilience.bind_invocation(lambda shard: self._query_feed_shard(
+                            f'{day}#{shard}', needed, before, query_filter, projection
+                        )),
+                        range(self.feed_shard_count)
+                    )
+                    merged = heapq.merge(*shard_pages, key=lambda item: item['feed_sk'], reverse=True)
+                    found = [item for _, item in zip(range(needed), merged)]
+                    items.extend(found)
+                    empty_days = 0 if found else empty_days + 1
+                    if len(items) >= limit:
+                        next_key = {'feed_sk': items[-1]['feed_sk']}
+                        break
+                    if empty_days >= gap_days:
+                        break
+                else:
+                    # Every feed_sk of ``day`` sorts after the bare day, so the next page starts before it
+                    next_key = {'feed_sk': day}
+            metadata_list = [ImageMetadata.from_dynamodb_item(item) for item in items]
+            
+            logger.info(
+                "Listed recent metadata",
+                count=len(metadata_list),
+                user_id=user_id,
+                has_more=next_key is not None
+            )
+            
+            return metadata_list, next_key
+            
+        except Exception as e:
+            logger.error("Failed to list recent metadata", error=str(e))
+            raise DatabaseError(f"Failed to list recent metadata: {str(e)}", operation='list_recent', **failure_details(e))
+    
+    def _query_feed_shard(self, feed_pk, needed, before, query_filter, projection):
+        """Return up to ``needed`` matching items from one feed partition, newest first."""
+        key_condition = Key('feed_pk').eq(feed_pk)
+        if before:
+            key_condition = key_condition & Key('feed_sk').lt(before)
+        
+        query_kwargs = {
+            'IndexName': self.feed_index_name,
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': False,
+            'Limit': needed,
+            **build_projection(projection)
+        }
+        if query_filter is not None:
+            query_kwargs['FilterExpression'] = query_filter
+        
+        items = []
+        while len(items) < needed:
+            response = self.table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return items[:needed]
@@ -0,0 +1,159 @@
+"""
+S3 storage for search index segments and deltas.
+
+Per user (``search/{user_id}/``, user ID URL-quoted):
+
+* ``segment`` - the compacted index (see ``SearchIndex.encode``).
+* ``deltas/{epoch_ms}-{uuid}`` - one small JSON object per indexed change,
+  written by the API and folded into the segment by the compaction job.
+"""
+import json
+import time
+import uuid
+from urllib.parse import quote, unquote
+
+import boto3
+from botocore.exceptions import ClientError
+from ..common.logger import get_logger
+from ..common.errors import StorageError
+from ..common.config import Config, get_aws_endpoint
+from ..common.resilience import ResilientClient, boto_config, failure_details
+from .storage_repository import DELETE_OBJECTS_BATCH_SIZE
+
+logger = get_logger(__name__)
+
+SEARCH_PREFIX = 'search/'
+SEGMENT_NAME = 'segment'
+DELTA_PREFIX = 'deltas/'
+
+
+def user_prefix(user_id):
+    return f"{SEARCH_PREFIX}{quote(user_id, safe='')}/"
+
+
+class SearchRepository:
+    """Repository for search segments and deltas in S3."""
+    
+    def __init__(self, s3_client=None):
+        """Initialize with S3 connection."""
+        if not s3_client:
+            s3_client = boto3.client(
+                's3',
+                endpoint_url=get_aws_endpoint('s3'),
+                region_name=Config.get_region(),
+                aws_access_key_id='test' if get_aws_endpoint('s3') else None,
+                aws_secret_access_key='test' if get_aws_endpoint('s3') else None,
+                config=boto_config()
+            )
+        self.s3_client = ResilientClient(s3_client, 's3')
+        self.bucket_name = Config.get_search_bucket_name()
+    
+    def list_user(self, user_id):
+        """
+        List a user's search objects in one pass.
+    
+        Returns ``(segment_etag, delta_keys)``; the ETag is None without a segment
+        and delta keys are sorted oldest first.
+        """
+        prefix = user_prefix(user_id)
+        try:
+            segment_etag = None
+            deltas = []
+            kwargs = {'Bucket': self.bucket_name, 'Prefix': prefix}
+            while True:
+                response = self.s3_client.list_objects_v2(**kwargs)
+                for obj in response.get('Contents', []):
+                    name = obj['Key'][len(prefix):]
+                    if name == SEGMENT_NAME:
+                        segment_etag = obj['ETag']
+                    elif name.startswith(DELTA_PREFIX):
+                        deltas.append(obj['Key'])
+                if not response.get('IsTruncated'):
+                    return segment_etag, sorted(deltas)
+                kwargs['ContinuationToken'] = response['NextContinuationToken']
+        except Exception as e:
+            logger.error("Failed to list search objects", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to list search index: {str(e)}", operation='search_list', **failure_details(e))
+    
+    def list_users(self):
+        """Yield every user ID with search objects."""
+        try:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=SEARCH_PREFIX, Delimiter='/'):
+                for common_prefix in page.get('CommonPrefixes', []):
+                    yield unquote(common_prefix['Prefix'][len(SEARCH_PREFIX):-1])
+        except Exception as e:
+            logger.error("Failed to list search users", error=str(e))
+            raise StorageError(f"Failed to list search index: {str(e)}", operation='search_list', **failure_details(e))
+    
+    def get_segment(self, user_id):
+        """Return ``(data, etag)`` of a user's segment, or ``(None, None)``."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=user_prefix(user_id) + SEGMENT_NAME)
+            return response['Body'].read(), response['ETag']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None, None
+            logger.error("Failed to load search segment", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to load search index: {str(e)}", operation='search_get', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to load search segment", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to load search index: {str(e)}", operation='search_get', **failure_details(e))
+    
+    def put_segment(self, user_id, data):
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=user_prefix(user_id) + SEGMENT_NAME,
+                Body=data,
+                ContentType='application/octet-stream'
+            )
+            logger.info("Search segment saved", user_id=user_id, size=len(data))
+        except Exception as e:
+            logger.error("Failed to save search segment", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to save search index: {str(e)}", operation='search_put', **failure_details(e))
+    
+    def put_delta(self, user_id, change):
+        """Store one change; keys sort by creation time. Returns the key."""
+        key = f"{user_prefix(user_id)}{DELTA_PREFIX}{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:12]}"
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=json.dumps(change, separators=(',', ':')).encode('utf-8'),
+                ContentType='application/json'
+            )
+            return key
+        except Exception as e:
+            logger.error("Failed to save search delta", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to update search index: {str(e)}", operation='search_delta', **failure_details(e))
+    
+    def get_delta(self, key):
+        """Return a stored change, or None if it was already compacted away."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            return json.loads(response['Body'].read())
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None
+            logger.error("Failed to load search delta", key=key, error=str(e))
+            raise StorageError(f"Failed to load search index: {str(e)}", operation='search_get', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to load search delta", key=key, error=str(e))
+            raise StorageError(f"Failed to load search index: {str(e)}", operation='search_get', **failure_details(e))
+    
+    def delete_deltas(self, keys):
+        """Delete compacted deltas in ``DeleteObjects`` batches; returns the keys that failed."""
+        failed = set()
+        try:
+            for start in range(0, len(keys), DELETE_OBJECTS_BATCH_SIZE):
+                batch = keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+                failed.update(error['Key'] for error in response.get('Errors', []))
+            return failed
+        except Exception as e:
+            logger.error("Failed to delete search deltas", count=len(keys), error=str(e))
+            raise StorageError(f"Failed to delete search deltas: {str(e)}", operation='search_delete', **failure_details(e))
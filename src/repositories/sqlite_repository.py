@@ -0,0 +1,648 @@
+"""
+SQLite metadata, usage and idempotency repositories (``METADATA_BACKEND=sqlite``).
+
+All three share one database file (``SQLITE_PATH``). Images are stored as
+the same JSON item DynamoDB would hold, next to indexed columns: ``user_id``
+and ``upload_date`` for lists and the recent feed, a tag table for tag
+filters and partial indexes over tombstones and expiring images for the
+purge job, which also removes expired images (SQLite has no TTL reaper). Conditional
+writes run in ``BEGIN IMMEDIATE`` transactions; WAL mode lets readers run
+alongside the writer.
+"""
+import calendar
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from ..models.image_model import ImageMetadata
+from ..common.logger import get_logger
+from ..common.errors import ConflictError, DatabaseError, NotFoundError, QuotaExceededError
+from ..common.config import Config
+from .base import BaseIdempotencyRepository, BaseMetadataRepository, BaseUsageRepository
+from .idempotency_repository import COMPLETED, IN_PROGRESS
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    image_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    upload_date TEXT,
+    s3_key TEXT,
+    deleted_at TEXT,
+    purge_after TEXT,
+    expires_at INTEGER,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_user ON images (user_id, image_id);
+CREATE INDEX IF NOT EXISTS images_recent ON images (upload_date, image_id);
+CREATE INDEX IF NOT EXISTS images_user_recent ON images (user_id, upload_date, image_id);
+CREATE INDEX IF NOT EXISTS images_purge ON images (purge_after, image_id) WHERE deleted_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS images_expiry ON images (expires_at, image_id) WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS image_tags (
+    tag TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    PRIMARY KEY (tag, image_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS image_tags_image ON image_tags (image_id);
+CREATE TABLE IF NOT EXISTS usage (
+    user_id TEXT PRIMARY KEY,
+    image_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL,
+    last_upload TEXT
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    idempotency_key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    fingerprint TEXT,
+    response TEXT,
+    expires_at INTEGER NOT NULL,
+    claim_token TEXT
+);
+"""
+
+# Columns added after a table was first released: (table, column, type)
+ADDED_COLUMNS = (('idempotency', 'claim_token', 'TEXT'),)
+
+# Bound parameters per IN (...) list, below SQLite's variable limit
+MAX_VARIABLES = 500
+
+# Hides images whose expires_at has passed; bind the current epoch seconds
+NOT_EXPIRED = '(expires_at IS NULL OR expires_at > ?)'
+
+
+def connect(path):
+    """Open a database, creating the schema if needed."""
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    for table, column, column_type in ADDED_COLUMNS:
+        columns = {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}
+        if column not in columns:
+            connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+    return connection
+
+
+def failure_details(error):
+    """Keyword arguments for ``DatabaseError``; a locked database is worth retrying."""
+    if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+        return {'retryable': True, 'retry_after': 1}
+    return {'retryable': False}
+
+
+def normalize_tags(tags):
+    """Tags as a sorted list of distinct names (comma-separated strings are split)."""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return sorted({str(tag).strip() for tag in tags if str(tag).strip()})
+
+
+def decode_item(item_json, fields=None):
+    item = json.loads(item_json)
+    if fields:
+        item = {field: item[field] for field in fields if field in item}
+    return ImageMetadata.from_dynamodb_item(item)
+
+
+class SqliteRepository:
+    """A connection shared by a repository's threads, serialized by a lock."""
+
+    def __init__(self, path=None):
+        """Initialize with the database path (``SQLITE_PATH``)."""
+        self.path = path or Config.get_sqlite_path()
+        if self.path != ':memory:' and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = connect(self.path)
+        self._lock = threading.RLock()
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def close(self):
+        self.connection.close()
+
+
+class SqliteMetadataRepository(SqliteRepository, BaseMetadataRepository):
+    """Repository for image metadata in SQLite."""
+
+    def save_metadata(self, metadata):
+        """Save image metadata, replacing any earlier version and its tags."""
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO images (image_id, user_id, upload_date, s3_key, expires_at, item) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (metadata.image_id, metadata.user_id, metadata.upload_date, metadata.s3_key,
+                     metadata.expires_at, json.dumps(metadata.to_dynamodb_item()))
+                )
+                db.execute('DELETE FROM image_tags WHERE image_id = ?', (metadata.image_id,))
+                db.executemany(
+                    'INSERT INTO image_tags (tag, image_id) VALUES (?, ?)',
+                    [(tag, metadata.image_id) for tag in normalize_tags(metadata.tags)]
+                )
+            logger.info("Metadata saved", image_id=metadata.image_id)
+        except sqlite3.Error as e:
+            logger.error("Failed to save metadata", image_id=metadata.image_id, error=str(e))
+            raise DatabaseError(f"Failed to save metadata: {str(e)}", operation='save', **failure_details(e))
+
+    def get_metadata(self, image_id, fields=None):
+        """Get a live image's metadata, optionally projected to ``fields``."""
+        try:
+            rows = self._rows(
+                f'SELECT item FROM images WHERE image_id = ? AND deleted_at IS NULL AND {NOT_EXPIRED}',
+                (image_id, int(time.time()))
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to get metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get', **failure_details(e))
+        if not rows:
+            raise NotFoundError('Image', image_id)
+        return decode_item(rows[0][0], fields)
+
+    def delete_metadata(self, image_id):
+        """Delete image metadata."""
+        try:
+            with self._transaction() as db:
+                db.execute('DELETE FROM images WHERE image_id = ?', (image_id,))
+                db.execute('DELETE FROM image_tags WHERE image_id = ?', (image_id,))
+            logger.info("Metadata deleted", image_id=image_id)
+        except sqlite3.Error as e:
+            logger.error("Failed to delete metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='delete', **failure_details(e))
+
+    def _filter(self, user_id, tags):
+        """WHERE clauses and parameters for live images of a user with any of ``tags``."""
+        clauses = ['deleted_at IS NULL', NOT_EXPIRED]
+        params = [int(time.time())]
+        if user_id:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        tags = normalize_tags(tags)
+        if tags:
+            placeholders = ', '.join('?' * len(tags))
+            clauses.append(f'image_id IN (SELECT image_id FROM image_tags WHERE tag IN ({placeholders}))')
+            params.extend(tags)
+        return clauses, params
+
+    def list_metadata(self, user_id=None, tags=None, limit=50, last_evaluated_key=None, fields=None):
+        """List live images in image ID order; ``last_evaluated_key`` is ``{'image_id': ...}``."""
+        clauses, params = self._filter(user_id, tags)
+        if last_evaluated_key:
+            clauses.append('image_id > ?')
+            params.append(last_evaluated_key.get('image_id', ''))
+        try:
+            rows = self._rows(
+                f"SELECT image_id, item FROM images WHERE {' AND '.join(clauses)} ORDER BY image_id LIMIT ?",
+                (*params, limit)
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to list metadata", error=str(e))
+            raise DatabaseError(f"Failed to list metadata: {str(e)}", operation='list', **failure_details(e))
+
+        next_key = {'image_id': rows[-1][0]} if len(rows) >= limit else None
+        metadata_list = [decode_item(item, fields) for _, item in rows]
+        logger.info("Listed metadata", count=len(metadata_list), user_id=user_id, has_more=next_key is not None)
+        return metadata_list, next_key
+
+    def iter_metadata(self, fields=None, page_size=1000):
+        """Yield every live image, one page of rows at a time."""
+        after = ''
+        while True:
+            try:
+                rows = self._rows(
+                    f'SELECT image_id, item FROM images WHERE deleted_at IS NULL AND {NOT_EXPIRED} '
+                    'AND image_id > ? ORDER BY image_id LIMIT ?',
+                    (int(time.time()), after, page_size)
+                )
+            except sqlite3.Error as e:
+                logger.error("Failed to scan metadata", error=str(e))
+                raise DatabaseError(f"Failed to scan metadata: {str(e)}", operation='scan', **failure_details(e))
+            for _, item in rows:
+                yield decode_item(item, fields)
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
+
+    def _update_item(self, image_id, operation, check, changes):
+        """
+        Apply ``changes`` to an image's item if ``check(row)`` holds.
+
+        Returns None when the image does not exist, else whether it was updated.
+        """
+        try:
+            with self._transaction() as db:
+                row = db.execute(
+                    'SELECT s3_key, deleted_at, item FROM images WHERE image_id = ?', (image_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if not check(*row):
+                    return False
+                item = json.loads(row[2])
+                item.update(changes)
+                db.execute(
+                    'UPDATE images SET s3_key = ?, item = ? WHERE image_id = ?',
+                    (item.get('s3_key'), json.dumps(item), image_id)
+                )
+                return True
+        except sqlite3.Error as e:
+            logger.error("Failed to update metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update metadata: {str(e)}", operation=operation, **failure_details(e))
+
+    def update_s3_key(self, image_id, old_key, new_key):
+        """Point a live image at a new object key if it still references ``old_key``."""
+        updated = self._update_item(
+            image_id, 'update_key',
+            lambda s3_key, deleted_at, _: s3_key == old_key and deleted_at is None,
+            {'s3_key': new_key}
+        )
+        if updated:
+            logger.info("Metadata key updated", image_id=image_id, s3_key=new_key)
+        return bool(updated)
+
+    def update_enrichment(self, image_id, s3_key, attributes):
+        """Store computed attributes if the image is live and still at ``s3_key``."""
+        updated = self._update_item(
+            image_id, 'enrich',
+            lambda current_key, deleted_at, _: current_key == s3_key and deleted_at is None,
+            attributes
+        )
+        if updated is None:
+            raise NotFoundError('Image', image_id)
+        if updated:
+            logger.info("Metadata enriched", image_id=image_id, attributes=sorted(attributes))
+        return updated
+
+    def update_metadata(self, image_id, changes, expected_version=None):
+        """Apply ``changes`` to a live image, bumping its version; see ``BaseMetadataRepository``."""
+        try:
+            with self._transaction() as db:
+                row = db.execute(
+                    f'SELECT item FROM images WHERE image_id = ? AND deleted_at IS NULL AND {NOT_EXPIRED}',
+                    (image_id, int(time.time()))
+                ).fetchone()
+                if row is None:
+                    raise NotFoundError('Image', image_id)
+                item = json.loads(row[0])
+                current = item.get('version', 0)
+                if expected_version is not None and current != expected_version:
+                    raise ConflictError(
+                        f"Image {image_id} was modified concurrently: expected version {expected_version}, "
+                        f"current version is {current}"
+                    )
+                for field, value in changes.items():
+                    if value is None:
+                        item.pop(field, None)
+                    else:
+                        item[field] = value
+                item['version'] = current + 1
+                db.execute('UPDATE images SET item = ? WHERE image_id = ?', (json.dumps(item), image_id))
+                if 'tags' in changes:
+                    db.execute('DELETE FROM image_tags WHERE image_id = ?', (image_id,))
+                    db.executemany(
+                        'INSERT INTO image_tags (tag, image_id) VALUES (?, ?)',
+                        [(tag, image_id) for tag in normalize_tags(changes['tags'])]
+                    )
+        except sqlite3.Error as e:
+            logger.error("Failed to update metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to update metadata: {str(e)}", operation='update', **failure_details(e))
+        logger.info("Metadata updated", image_id=image_id, fields=sorted(changes), version=item['version'])
+        return ImageMetadata.from_dynamodb_item(item)
+
+    def mark_deleted(self, image_id, deleted_at, purge_after):
+        """Tombstone a live image; returns the image as it was."""
+        try:
+            with self._transaction() as db:
+                row = db.execute(
+                    f'SELECT item FROM images WHERE image_id = ? AND deleted_at IS NULL AND {NOT_EXPIRED}',
+                    (image_id, int(time.time()))
+                ).fetchone()
+                if row is None:
+                    raise NotFoundError('Image', image_id)
+                db.execute(
+                    'UPDATE images SET deleted_at = ?, purge_after = ? WHERE image_id = ?',
+                    (deleted_at, purge_after, image_id)
+                )
+        except sqlite3.Error as e:
+            logger.error("Failed to mark metadata deleted", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to delete metadata: {str(e)}", operation='mark_deleted', **failure_details(e))
+        logger.info("Metadata marked deleted", image_id=image_id, purge_after=purge_after)
+        return decode_item(row[0])
+
+    def get_deleted(self, image_id, now):
+        """Return ``(metadata, purge_after)`` for a tombstone still inside its undelete window."""
+        try:
+            rows = self._rows(
+                'SELECT item, purge_after FROM images '
+                f'WHERE image_id = ? AND deleted_at IS NOT NULL AND purge_after > ? AND {NOT_EXPIRED}',
+                (image_id, now, int(time.time()))
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to get deleted metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get_deleted', **failure_details(e))
+        if not rows:
+            raise NotFoundError('Deleted image', image_id)
+        return decode_item(rows[0][0]), rows[0][1]
+
+    def restore(self, metadata, purge_after, now):
+        """Clear a tombstone if it is unchanged and its undelete window is still open."""
+        image_id = metadata.image_id
+        try:
+            with self._transaction() as db:
+                cursor = db.execute(
+                    'UPDATE images SET deleted_at = NULL, purge_after = NULL '
+                    'WHERE image_id = ? AND purge_after = ? AND purge_after > ?',
+                    (image_id, purge_after, now)
+                )
+        except sqlite3.Error as e:
+            logger.error("Failed to restore metadata", image_id=image_id, error=str(e))
+            raise DatabaseError(f"Failed to restore metadata: {str(e)}", operation='restore', **failure_details(e))
+        if not cursor.rowcount:
+            raise NotFoundError('Deleted image', image_id)
+        logger.info("Metadata restored", image_id=image_id)
+
+    def iter_purgeable(self, now, page_size=1000):
+        """Yield pages of tombstones whose undelete window closed by ``now``."""
+        yield from self._purge_pages(
+            'deleted_at IS NOT NULL AND purge_after <= ?', 'purge_after', now, '', page_size
+        )
+
+    def iter_expired(self, now, page_size=1000):
+        """
+        Yield pages of live images whose ``expires_at`` passed by ``now``.
+
+        SQLite has no TTL reaper. Expired tombstones wait for their undelete
+        window, since their usage was already released.
+        """
+        expired_before = calendar.timegm(datetime.fromisoformat(now).timetuple())
+        yield from self._purge_pages(
+            'deleted_at IS NULL AND expires_at <= ?', 'expires_at', expired_before, 0, page_size
+        )
+
+    def _purge_pages(self, condition, column, bound, start, page_size):
+        after = (start, '')
+        while True:
+            try:
+                rows = self._rows(
+                    f'SELECT {column}, image_id, item FROM images '
+                    f'WHERE {condition} AND ({column}, image_id) > (?, ?) '
+                    f'ORDER BY {column}, image_id LIMIT ?',
+                    (bound, *after, page_size)
+                )
+            except sqlite3.Error as e:
+                logger.error("Failed to query purgeable metadata", error=str(e))
+                raise DatabaseError(f"Failed to query tombstones: {str(e)}", operation='purge_query', **failure_details(e))
+            if rows:
+                yield [decode_item(item) for _, _, item in rows]
+            if len(rows) < page_size:
+                return
+            after = rows[-1][:2]
+
+    def delete_many(self, image_ids, max_attempts=5):
+        """Delete items in one transaction per chunk; nothing is left unprocessed."""
+        try:
+            for start in range(0, len(image_ids), MAX_VARIABLES):
+                chunk = image_ids[start:start + MAX_VARIABLES]
+                placeholders = ', '.join('?' * len(chunk))
+                with self._transaction() as db:
+                    db.execute(f'DELETE FROM images WHERE image_id IN ({placeholders})', chunk)
+                    db.execute(f'DELETE FROM image_tags WHERE image_id IN ({placeholders})', chunk)
+        except sqlite3.Error as e:
+            logger.error("Failed to batch delete metadata", error=str(e))
+            raise DatabaseError(f"Failed to batch delete metadata: {str(e)}", operation='delete_many', **failure_details(e))
+        logger.info("Metadata batch deleted", count=len(image_ids), unprocessed=0)
+        return []
+
+    def get_many(self, image_ids, fields=None, max_attempts=5):
+        """Return ``{image_id: ImageMetadata}``; missing and deleted images are left out."""
+        found = {}
+        try:
+            for start in range(0, len(image_ids), MAX_VARIABLES):
+                chunk = list(image_ids[start:start + MAX_VARIABLES])
+                rows = self._rows(
+                    f"SELECT image_id, item FROM images "
+                    f"WHERE image_id IN ({', '.join('?' * len(chunk))}) AND deleted_at IS NULL AND {NOT_EXPIRED}",
+                    (*chunk, int(time.time()))
+                )
+                found.update((image_id, decode_item(item, fields)) for image_id, item in rows)
+        except sqlite3.Error as e:
+            logger.error("Failed to batch get metadata", error=str(e))
+            raise DatabaseError(f"Failed to retrieve metadata: {str(e)}", operation='get_many', **failure_details(e))
+        return found
+
+    def list_recent(self, user_id=None, tags=None, limit=50, cursor=None, fields=None, now=None):
+        """
+        List images newest-first.
+
+        ``cursor`` is ``{'feed_sk': '{upload_date}#{image_id}'}`` of the last
+        image on the previous page, the same format DynamoDB returns. The
+        upload date index reaches every image, so there is no lookback limit.
+        """
+        clauses, params = self._filter(user_id, tags)
+        before = cursor.get('feed_sk') if cursor else None
+        if before:
+            upload_date, _, image_id = before.partition('#')
+            clauses.append('(upload_date, image_id) < (?, ?)')
+            params.extend((upload_date, image_id))
+        try:
+            rows = self._rows(
+                f"SELECT upload_date, image_id, item FROM images WHERE {' AND '.join(clauses)} "
+                f"ORDER BY upload_date DESC, image_id DESC LIMIT ?",
+                (*params, limit)
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to list recent metadata", error=str(e))
+            raise DatabaseError(f"Failed to list recent metadata: {str(e)}", operation='list_recent', **failure_details(e))
+
+        next_key = {'feed_sk': f'{rows[-1][0]}#{rows[-1][1]}'} if len(rows) >= limit else None
+        metadata_list = [decode_item(item, fields) for _, _, item in rows]
+        logger.info("Listed recent metadata", count=len(metadata_list), user_id=user_id, has_more=next_key is not None)
+        return metadata_list, next_key
+
+
+class SqliteUsageRepository(SqliteRepository, BaseUsageRepository):
+    """Repository for per-user aggregate counters in SQLite."""
+
+    def reserve(self, user_id, size, upload_date, max_images=0, max_bytes=0):
+        """
+        Atomically count a new image against a user's usage, within the quotas (0 = unlimited).
+
+        ``last_upload`` is left as is when ``upload_date`` is None (restores).
+        """
+        if max_bytes and size > max_bytes:
+            raise QuotaExceededError(f"Image size exceeds the storage quota of {max_bytes:,} bytes")
+        try:
+            with self._transaction() as db:
+                row = db.execute(
+                    'SELECT image_count, total_bytes FROM usage WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                if row is not None and (
+                    (max_images and row[0] >= max_images) or (max_bytes and row[1] > max_bytes - size)
+                ):
+                    logger.info("Quota exceeded", user_id=user_id, size=size)
+                    raise QuotaExceededError("Upload would exceed the user's storage quota")
+                db.execute(
+                    'INSERT INTO usage (user_id, image_count, total_bytes, last_upload) VALUES (?, 1, ?, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET image_count = image_count + 1, '
+                    'total_bytes = total_bytes + excluded.total_bytes, '
+                    'last_upload = COALESCE(excluded.last_upload, last_upload)',
+                    (user_id, size, upload_date)
+                )
+            logger.info("Usage reserved", user_id=user_id, size=size)
+        except sqlite3.Error as e:
+            logger.error("Failed to reserve usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to update usage: {str(e)}", operation='reserve', **failure_details(e))
+
+    def release(self, user_id, size):
+        """Atomically remove an image from a user's usage."""
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    'INSERT INTO usage (user_id, image_count, total_bytes) VALUES (?, -1, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET image_count = image_count - 1, '
+                    'total_bytes = total_bytes + excluded.total_bytes',
+                    (user_id, -(size or 0))
+                )
+            logger.info("Usage released", user_id=user_id, size=size)
+        except sqlite3.Error as e:
+            logger.error("Failed to release usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to update usage: {str(e)}", operation='release', **failure_details(e))
+
+    def get_usage(self, user_id):
+        """Get a user's counters (zeros when the user has never uploaded)."""
+        try:
+            rows = self._rows('SELECT image_count, total_bytes, last_upload FROM usage WHERE user_id = ?', (user_id,))
+        except sqlite3.Error as e:
+            logger.error("Failed to get usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve usage: {str(e)}", operation='get_usage', **failure_details(e))
+        image_count, total_bytes, last_upload = rows[0] if rows else (0, 0, None)
+        return {'user_id': user_id, 'image_count': image_count, 'total_bytes': total_bytes, 'last_upload': last_upload}
+
+    def set_usage(self, user_id, image_count, total_bytes, last_upload=None, expected=None):
+        """Overwrite a user's counters (used by the recount job), if still at ``expected`` when given."""
+        try:
+            with self._transaction() as db:
+                if expected is not None:
+                    row = db.execute(
+                        'SELECT image_count, total_bytes FROM usage WHERE user_id = ?', (user_id,)
+                    ).fetchone()
+                    if tuple(row or (0, 0)) != tuple(expected):
+                        logger.info("Usage changed during recount, left as is", user_id=user_id)
+                        return False
+                db.execute(
+                    'INSERT INTO usage (user_id, image_count, total_bytes, last_upload) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET image_count = excluded.image_count, '
+                    'total_bytes = excluded.total_bytes, last_upload = COALESCE(excluded.last_upload, last_upload)',
+                    (user_id, image_count, total_bytes, last_upload)
+                )
+        except sqlite3.Error as e:
+            logger.error("Failed to set usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to set usage: {str(e)}", operation='set_usage', **failure_details(e))
+        return True
+
+    def list_usage(self):
+        """Yield the counters of every user."""
+        try:
+            rows = self._rows('SELECT user_id, image_count, total_bytes, last_upload FROM usage ORDER BY user_id')
+        except sqlite3.Error as e:
+            logger.error("Failed to list usage", error=str(e))
+            raise DatabaseError(f"Failed to list usage: {str(e)}", operation='list_usage', **failure_details(e))
+        for user_id, image_count, total_bytes, last_upload in rows:
+            yield {'user_id': user_id, 'image_count': image_count, 'total_bytes': total_bytes, 'last_upload': last_upload}
+
+
+class SqliteIdempotencyRepository(SqliteRepository, BaseIdempotencyRepository):
+    """Repository for idempotency records in SQLite; expired records are reclaimed on claim."""
+
+    def claim(self, key, fingerprint, lease_seconds, token):
+        """Claim ``key`` until ``lease_seconds`` from now; returns None on success, otherwise the live record."""
+        now = int(time.time())
+        try:
+            with self._transaction() as db:
+                row = db.execute(
+                    'SELECT idempotency_key, status, fingerprint, response, expires_at FROM idempotency '
+                    'WHERE idempotency_key = ?', (key,)
+                ).fetchone()
+                if row is not None and row[4] >= now:
+                    return self._record(row)
+                db.execute(
+                    'INSERT OR REPLACE INTO idempotency (idempotency_key, status, fingerprint, expires_at, claim_token) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, IN_PROGRESS, fingerprint, now + lease_seconds, token)
+                )
+        except sqlite3.Error as e:
+            logger.error("Failed to claim idempotency key", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to claim idempotency key: {str(e)}", operation='claim', **failure_details(e))
+        logger.info("Idempotency key claimed", idempotency_key=key)
+        return None
+
+    def get(self, key):
+        """Get a live record (None when missing or expired)."""
+        try:
+            rows = self._rows(
+                'SELECT idempotency_key, status, fingerprint, response, expires_at FROM idempotency '
+                'WHERE idempotency_key = ?', (key,)
+            )
+        except sqlite3.Error as e:
+            logger.error("Failed to get idempotency record", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to get idempotency record: {str(e)}", operation='get', **failure_details(e))
+        if not rows or rows[0][4] < int(time.time()):
+            return None
+        return self._record(rows[0])
+
+    @staticmethod
+    def _record(row):
+        key, status, fingerprint, response, expires_at = row
+        record = {'idempotency_key': key, 'status': status, 'fingerprint': fingerprint, 'expires_at': expires_at}
+        if response is not None:
+            record['response'] = json.loads(response)
+        return record
+
+    def complete(self, key, token, result, ttl_seconds):
+        """Store the response of a finished request; returns False if the claim was lost."""
+        try:
+            with self._transaction() as db:
+                updated = db.execute(
+                    'UPDATE idempotency SET status = ?, response = ?, expires_at = ? '
+                    'WHERE idempotency_key = ? AND status = ? AND claim_token = ?',
+                    (COMPLETED, json.dumps(result), int(time.time()) + ttl_seconds, key, IN_PROGRESS, token)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.error("Failed to complete idempotency key", idempotency_key=key, error=str(e))
+            raise DatabaseError(f"Failed to complete idempotency key: {str(e)}", operation='complete', **failure_details(e))
+        if not updated:
+            logger.error("Idempotency claim lost before completion", idempotency_key=key)
+            return False
+        logger.info("Idempotency key completed", idempotency_key=key)
+        return True
+
+    def release(self, key, token):
+        """Delete an in-progress record, if still held with ``token``, so the request can be retried."""
+        try:
+            with self._transaction() as db:
+                db.execute(
+                    'DELETE FROM idempotency WHERE idempotency_key = ? AND status = ? AND claim_token = ?',
+                    (key, IN_PROGRESS, token)
+                )
+            logger.info("Idempotency key released", idempotency_key=key)
+        except sqlite3.Error as e:
+            logger.error("Failed to release idempotency key", idempotency_key=key, error=str(e))
@@ -1,46 +1,58 @@
 """
 S3 storage repository.
 """
+from urllib.parse import urlencode
+
 import boto3
 from botocore.exceptions import ClientError
 from ..common.logger import get_logger
 from ..common.errors import StorageError
 from ..common.config import Config, get_aws_endpoint
+from ..common.resilience import ResilientClient, boto_config, failure_details
+from ..common.utils import get_user_key_pattern
+from .base import BaseStorageRepository
+from .url_signers import build_url_signer
 
 logger = get_logger(__name__)
 
+# DeleteObjects accepts at most this many keys per request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
 
-class StorageRepository:
+class StorageRepository(BaseStorageRepository):
     """Repository for S3 operations."""
     
-    def __init__(self, s3_client=None):
-        """Initialize with S3 connection."""
-        if s3_client:
-            self.s3_client = s3_client
-        else:
-            self.s3_client = boto3.client(
+    def __init__(self, s3_client=None, url_signer=None):
+        """Initialize with S3 connection and the configured URL signer."""
+        if not s3_client:
+            s3_client = boto3.client(
                 's3',
                 endpoint_url=get_aws_endpoint('s3'),
                 region_name=Config.get_region(),
                 aws_access_key_id='test' if get_aws_endpoint('s3') else None,
-                aws_secret_access_key='test' if get_aws_endpoint('s3') else None
+                aws_secret_access_key='test' if get_aws_endpoint('s3') else None,
+                config=boto_config()
             )
+        self.s3_client = ResilientClient(s3_client, 's3')
         self.bucket_name = Config.get_bucket_name()
+        self.url_signer = url_signer or build_url_signer(self.s3_client, self.bucket_name)
     
-    def upload_image(self, s3_key, image_bytes, content_type, metadata):
-        """Upload image to S3."""
+    def upload_image(self, s3_key, image_bytes, content_type, metadata, tags=None):
+        """Upload image to S3, with object ``tags`` (e.g. the lifecycle expiry class)."""
         try:
+            put_kwargs = {'Tagging': urlencode(tags)} if tags else {}
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=s3_key,
                 Body=image_bytes,
                 ContentType=content_type,
-                Metadata=metadata
+                Metadata=metadata,
+                **put_kwargs
             )
             logger.info("Image uploaded to S3", s3_key=s3_key, size=len(image_bytes))
         except Exception as e:
             logger.error("Failed to upload image", s3_key=s3_key, error=str(e))
-            raise StorageError(f"Failed to upload image: {str(e)}", operation='upload')
+            raise StorageError(f"Failed to upload image: {str(e)}", operation='upload', **failure_details(e))
     
     def delete_image(self, s3_key):
         """Delete image from S3."""
@@ -49,7 +61,91 @@ class StorageRepository:
             logger.info("Image deleted from S3", s3_key=s3_key)
         except Exception as e:
             logger.error("Failed to delete image", s3_key=s3_key, error=str(e))
-            raise StorageError(f"Failed to delete image: {str(e)}", operation='delete')
+            raise StorageError(f"Failed to delete image: {str(e)}", operation='delete', **failure_details(e))
+    
+    def get_image_bytes(self, s3_key):
+        """Download an object's bytes."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+            return response['Body'].read()
+        except Exception as e:
+            logger.error("Failed to download image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to download image: {str(e)}", operation='download', **failure_details(e))
+    
+    def read_image(self, s3_key, length=None):
+        """
+        Download an object, or only its first ``length`` bytes with a ranged GET.
+        
+        Returns None if the object no longer exists.
+        """
+        kwargs = {'Bucket': self.bucket_name, 'Key': s3_key}
+        if length:
+            kwargs['Range'] = f"bytes=0-{length - 1}"
+        try:
+            response = self.s3_client.get_object(**kwargs)
+            return response['Body'].read()
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code')
+            if error_code in ('404', 'NoSuchKey'):
+                return None
+            if error_code == 'InvalidRange':
+                # Only an empty object has no first byte
+                return b''
+            logger.error("Failed to download image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to download image: {str(e)}", operation='download', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to download image", s3_key=s3_key, error=str(e))
+            raise StorageError(f"Failed to download image: {str(e)}", operation='download', **failure_details(e))
+    
+    def list_keys(self, prefix):
+        """List every object key under ``prefix``."""
+        try:
+            keys = []
+            kwargs = {'Bucket': self.bucket_name, 'Prefix': prefix}
+            while True:
+                response = self.s3_client.list_objects_v2(**kwargs)
+                keys.extend(obj['Key'] for obj in response.get('Contents', []))
+                if not response.get('IsTruncated'):
+                    return keys
+                kwargs['ContinuationToken'] = response['NextContinuationToken']
+        except Exception as e:
+            logger.error("Failed to list images", prefix=prefix, error=str(e))
+            raise StorageError(f"Failed to list images: {str(e)}", operation='list', **failure_details(e))
+    
+    def copy_image(self, source_key, dest_key):
+        """Server-side copy of an object (content type and user metadata are kept)."""
+        try:
+            self.s3_client.copy_object(
+                Bucket=self.bucket_name,
+                Key=dest_key,
+                CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+                MetadataDirective='COPY'
+            )
+            logger.info("Image copied in S3", source_key=source_key, dest_key=dest_key)
+        except Exception as e:
+            logger.error("Failed to copy image", source_key=source_key, dest_key=dest_key, error=str(e))
+            raise StorageError(f"Failed to copy image: {str(e)}", operation='copy', **failure_details(e))
+    
+    def delete_images(self, s3_keys):
+        """
+        Delete objects with ``DeleteObjects`` (up to 1000 keys per request).
+        
+        Returns the set of keys S3 reported as failed; missing keys count as deleted.
+        """
+        failed = set()
+        try:
+            for start in range(0, len(s3_keys), DELETE_OBJECTS_BATCH_SIZE):
+                batch = s3_keys[start:start + DELETE_OBJECTS_BATCH_SIZE]
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+                failed.update(error['Key'] for error in response.get('Errors', []))
+            logger.info("Images batch deleted from S3", count=len(s3_keys) - len(failed), failed=len(failed))
+            return failed
+        except Exception as e:
+            logger.error("Failed to batch delete images", count=len(s3_keys), error=str(e))
+            raise StorageError(f"Failed to delete images: {str(e)}", operation='delete_many', **failure_details(e))
     
     def check_image_exists(self, s3_key):
         """Check if image exists in S3."""
@@ -61,26 +157,36 @@ class StorageRepository:
             if error_code in ('404', 'NoSuchKey', 'NotFound'):
                 return False
             logger.error("Error checking image existence", s3_key=s3_key, error=str(e))
-            raise StorageError(f"Failed to check image existence: {str(e)}", operation='check')
+            raise StorageError(f"Failed to check image existence: {str(e)}", operation='check', **failure_details(e))
         except Exception as e:
             logger.error("Error checking image existence", s3_key=s3_key, error=str(e))
-            raise StorageError(f"Failed to check image existence: {str(e)}", operation='check')
+            raise StorageError(f"Failed to check image existence: {str(e)}", operation='check', **failure_details(e))
     
     def generate_presigned_url(self, s3_key, expires_in=3600, download=False, filename=None):
-        """Generate presigned URL for image access."""
+        """Generate a signed URL for image access (S3 presigned or CloudFront signed)."""
         try:
-            params = {'Bucket': self.bucket_name, 'Key': s3_key}
-            
-            if download and filename:
-                params['ResponseContentDisposition'] = f'attachment; filename="{filename}"'
-            
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params=params,
-                ExpiresIn=expires_in
-            )
+            url = self.url_signer.sign(s3_key, expires_in, download, filename)
             logger.info("Generated presigned URL", s3_key=s3_key, expires_in=expires_in)
             return url
         except Exception as e:
             logger.error("Failed to generate presigned URL", s3_key=s3_key, error=str(e))
-            raise StorageError(f"Failed to generate presigned URL: {str(e)}", operation='presign')
+            raise StorageError(f"Failed to generate presigned URL: {str(e)}", operation='presign', **failure_details(e))
+    
+    @property
+    def signed_cookies_enabled(self):
+        return self.url_signer.cookies_enabled
+    
+    def get_object_url(self, s3_key):
+        """Unsigned CDN URL of an object, for clients holding signed cookies."""
+        return self.url_signer.object_url(s3_key)
+    
+    def generate_user_cookies(self, user_id, expires_in=3600):
+        """Signed cookies granting access to every object of ``user_id``."""
+        pattern = get_user_key_pattern(user_id)
+        try:
+            cookies = self.url_signer.signed_cookies(pattern, expires_in)
+            logger.info("Generated signed cookies", user_id=user_id, expires_in=expires_in)
+            return cookies
+        except Exception as e:
+            logger.error("Failed to generate signed cookies", user_id=user_id, error=str(e))
+            raise StorageError(f"Failed to generate signed cookies: {str(e)}", operation='presign', **failure_details(e))
@@ -0,0 +1,231 @@
+"""
+URL signers used by ``StorageRepository`` to hand out object URLs.
+
+* ``S3UrlSigner`` presigns each ``GetObject`` against the bucket (default).
+* ``CloudFrontUrlSigner`` signs CloudFront URLs with an RSA key registered
+  as a CloudFront public key, using a canned policy (``Expires`` in the URL)
+  or a custom policy (``Policy`` in the URL). It can also issue signed
+  cookies whose policy covers a whole key prefix, so many objects can be
+  served with plain, CDN-cacheable URLs.
+
+Either signer can be wrapped in ``WindowedUrlSigner``, which aligns expiry
+to fixed time windows and memoizes URLs, so an object gets the same URL for
+a whole window and browsers and caches can reuse what they downloaded.
+
+The RSA key needs the optional ``cryptography`` package.
+"""
+import base64
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+
+from botocore.signers import CloudFrontSigner
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:  # pragma: no cover - depends on the environment
+    hashes = serialization = padding = None
+
+from ..common.config import Config
+
+URL_SIGNERS = ('s3', 'cloudfront')
+CLOUDFRONT_POLICIES = ('canned', 'custom')
+
+# S3 rejects presigned URLs valid for longer than 7 days
+MAX_PRESIGN_SECONDS = 7 * 24 * 3600
+
+
+def content_disposition(filename):
+    return f'attachment; filename="{filename}"'
+
+
+class S3UrlSigner:
+    """Presigned S3 ``GetObject`` URLs; every URL carries its own signature."""
+
+    cookies_enabled = False
+    max_expires_in = MAX_PRESIGN_SECONDS
+
+    def __init__(self, s3_client, bucket_name):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+
+    def sign(self, s3_key, expires_in, download=False, filename=None):
+        params = {'Bucket': self.bucket_name, 'Key': s3_key}
+        if download and filename:
+            params['ResponseContentDisposition'] = content_disposition(filename)
+        return self.s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+    def sign_until(self, s3_key, expires_at, download=False, filename=None):
+        """
+        Sign a URL expiring at epoch second ``expires_at``.
+
+        SigV2 URLs then depend only on the key and ``expires_at``. SigV4 URLs
+        also embed the signing time, so they only repeat through the memo.
+        Validity is capped at the 7 days S3 accepts.
+        """
+        expires_in = min(max(1, expires_at - int(time.time())), MAX_PRESIGN_SECONDS)
+        return self.sign(s3_key, expires_in, download, filename)
+
+
+class CloudFrontUrlSigner:
+    """CloudFront signed URLs (canned or custom policy) and prefix-wide signed cookies."""
+
+    max_expires_in = None
+
+    def __init__(self, domain, key_pair_id, private_key, policy='canned', signed_cookies=False,
+                 clock=time.time):
+        if policy not in CLOUDFRONT_POLICIES:
+            raise ValueError(f"CloudFront policy must be one of: {', '.join(CLOUDFRONT_POLICIES)}")
+        if not (domain and key_pair_id and private_key):
+            raise ValueError('CloudFront signing needs a domain, key pair id and private key')
+        self.base_url = domain if '://' in domain else f'https://{domain}'
+        self.base_url = self.base_url.rstrip('/')
+        self.key_pair_id = key_pair_id
+        self.policy = policy
+        self.cookies_enabled = signed_cookies
+        self.clock = clock
+        self._signer = CloudFrontSigner(key_pair_id, rsa_signer(private_key))
+
+    def object_url(self, s3_key):
+        """The unsigned URL of an object; valid for holders of a matching signed cookie."""
+        return f'{self.base_url}/{quote(s3_key)}'
+
+    def sign(self, s3_key, expires_in, download=False, filename=None):
+        return self.sign_until(s3_key, int(self.clock()) + expires_in, download, filename)
+
+    def sign_until(self, s3_key, expires_at, download=False, filename=None):
+        """Sign a URL expiring at epoch second ``expires_at``; deterministic for equal inputs."""
+        url = self.object_url(s3_key)
+        if download and filename:
+            # Needs a cache policy that forwards this query string to the S3 origin
+            url += '?' + urlencode({'response-content-disposition': content_disposition(filename)})
+        expires_at = datetime.fromtimestamp(expires_at, timezone.utc)
+        if self.policy == 'custom':
+            return self._signer.generate_presigned_url(url, policy=self._signer.build_policy(url, expires_at))
+        return self._signer.generate_presigned_url(url, date_less_than=expires_at)
+
+    def signed_cookies(self, key_pattern, expires_in):
+        """
+        Return the three ``CloudFront-*`` cookies for a custom policy over ``key_pattern``.
+
+        ``key_pattern`` may use CloudFront wildcards, e.g. ``images/user123/*``.
+        """
+        policy = self._signer.build_policy(
+            f'{self.base_url}/{key_pattern}', self._expires_at(expires_in)
+        ).encode('utf-8')
+        return {
+            'CloudFront-Policy': cloudfront_b64encode(policy),
+            'CloudFront-Signature': cloudfront_b64encode(self._signer.rsa_signer(policy)),
+            'CloudFront-Key-Pair-Id': self.key_pair_id
+        }
+
+    def _expires_at(self, expires_in):
+        return datetime.fromtimestamp(int(self.clock()) + expires_in, timezone.utc)
+
+
+class UrlCache:
+    """Thread-safe LRU of signed URLs with hit/miss counters."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            url = self._entries.get(key)
+            if url is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return url
+
+    def put(self, key, url):
+        with self._lock:
+            self._entries[key] = url
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class WindowedUrlSigner:
+    """
+    Sign with expiry aligned to ``window_seconds`` and memoize per window.
+
+    Every request in window ``n`` gets a URL expiring at
+    ``(n + 1) * window_seconds + expires_in``, so it stays valid for at least
+    ``expires_in`` and at most ``expires_in + window_seconds``. URLs rotate
+    when the window changes. If that could exceed the signer's
+    ``max_expires_in`` (7 days for S3), the window shrinks to the room left,
+    and URLs are signed unaligned when there is none. Other signer methods
+    are passed through.
+    """
+
+    def __init__(self, signer, window_seconds, max_entries=10000, clock=time.time):
+        self.signer = signer
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.cache = UrlCache(max_entries)
+
+    def __getattr__(self, name):
+        return getattr(self.signer, name)
+
+    def sign(self, s3_key, expires_in, download=False, filename=None):
+        window_seconds = self.window_seconds
+        limit = self.signer.max_expires_in
+        if limit is not None:
+            window_seconds = min(window_seconds, limit - expires_in)
+            if window_seconds <= 0:
+                return self.signer.sign(s3_key, min(expires_in, limit), download, filename)
+        window = int(self.clock()) // window_seconds
+        disposition = filename if download else None
+        cache_key = (s3_key, window_seconds, window, expires_in, disposition)
+        url = self.cache.get(cache_key)
+        if url is None:
+            expires_at = (window + 1) * window_seconds + expires_in
+            url = self.signer.sign_until(s3_key, expires_at, download, filename)
+            self.cache.put(cache_key, url)
+        return url
+
+
+def cloudfront_b64encode(data):
+    """Base64 with CloudFront's URL-safe substitutions (``+=/`` -> ``-_~``)."""
+    encoded = base64.b64encode(data).decode('utf-8')
+    return encoded.replace('+', '-').replace('=', '_').replace('/', '~')
+
+
+def rsa_signer(private_key_pem):
+    """Build the SHA-1 RSA signing callable CloudFront requires."""
+    if serialization is None:
+        raise ValueError('CloudFront signing requires the cryptography package')
+    if isinstance(private_key_pem, str):
+        private_key_pem = private_key_pem.encode('utf-8')
+    key = serialization.load_pem_private_key(private_key_pem, password=None)
+    return lambda message: key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+
+def build_url_signer(s3_client, bucket_name, settings=None):
+    """Create the signer selected by ``URL_SIGNER``."""
+    settings = settings or Config.get_url_signer_settings()
+    if settings['signer'] == 'cloudfront':
+        signer = CloudFrontUrlSigner(
+            settings['domain'], settings['key_pair_id'], settings['private_key'],
+            settings['policy'], settings['signed_cookies']
+        )
+    elif settings['signer'] == 's3':
+        signer = S3UrlSigner(s3_client, bucket_name)
+    else:
+        raise ValueError(f"URL signer must be one of: {', '.join(URL_SIGNERS)}")
+
+    if settings.get('window_seconds'):
+        return WindowedUrlSigner(signer, settings['window_seconds'], settings['cache_size'])
+    return signer
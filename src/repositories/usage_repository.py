@@ -0,0 +1,174 @@
+"""
+DynamoDB per-user usage counter repository.
+"""
+import boto3
+from botocore.exceptions import ClientError
+from ..common.logger import get_logger
+from ..common.errors import DatabaseError, QuotaExceededError
+from ..common.config import Config, get_aws_endpoint
+from ..common.resilience import ResilientClient, boto_config, failure_details
+from ..common.serialization import to_json_number
+from .base import BaseUsageRepository
+
+logger = get_logger(__name__)
+
+
+def usage_table_definition(table_name=None):
+    """Return ``create_table`` arguments for the usage counter table."""
+    return {
+        'TableName': table_name or Config.get_usage_table_name(),
+        'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'user_id', 'AttributeType': 'S'}],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
+
+
+class UsageRepository(BaseUsageRepository):
+    """Repository for per-user aggregate counters (image count, total bytes, last upload)."""
+    
+    def __init__(self, dynamodb_resource=None):
+        """Initialize with DynamoDB connection."""
+        if dynamodb_resource:
+            self.dynamodb = dynamodb_resource
+        else:
+            self.dynamodb = boto3.resource(
+                'dynamodb',
+                endpoint_url=get_aws_endpoint('dynamodb'),
+                region_name=Config.get_region(),
+                aws_access_key_id='test' if get_aws_endpoint('dynamodb') else None,
+                aws_secret_access_key='test' if get_aws_endpoint('dynamodb') else None,
+                config=boto_config()
+            )
+        self.table_name = Config.get_usage_table_name()
+        self.table = ResilientClient(self.dynamodb.Table(self.table_name), 'dynamodb')
+    
+    def reserve(self, user_id, size, upload_date, max_images=0, max_bytes=0):
+        """
+        Atomically count a new image against a user's usage.
+        
+        The increment is conditional on the quotas (0 = unlimited), so a user
+        at their limit is rejected without any other write taking place.
+        ``last_upload`` is left as is when ``upload_date`` is None (restores).
+        """
+        if max_bytes and size > max_bytes:
+            raise QuotaExceededError(f"Image size exceeds the storage quota of {max_bytes:,} bytes")
+        
+        update_kwargs = {
+            'Key': {'user_id': user_id},
+            'UpdateExpression': 'ADD image_count :one, total_bytes :size',
+            'ExpressionAttributeValues': {':one': 1, ':size': size}
+        }
+        if upload_date is not None:
+            update_kwargs['UpdateExpression'] += ' SET last_upload = :date'
+            update_kwargs['ExpressionAttributeValues'][':date'] = upload_date
+        
+        conditions = []
+        if max_images:
+            conditions.append('image_count < :max_images')
+            update_kwargs['ExpressionAttributeValues'][':max_images'] = max_images
+        if max_bytes:
+            conditions.append('total_bytes <= :bytes_headroom')
+            update_kwargs['ExpressionAttributeValues'][':bytes_headroom'] = max_bytes - size
+        if conditions:
+            update_kwargs['ConditionExpression'] = (
+                f"attribute_not_exists(user_id) OR ({' AND '.join(conditions)})"
+            )
+        
+        try:
+            self.table.update_item(**update_kwargs)
+            logger.info("Usage reserved", user_id=user_id, size=size)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.info("Quota exceeded", user_id=user_id, size=size)
+                raise QuotaExceededError("Upload would exceed the user's storage quota")
+            logger.error("Failed to reserve usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to update usage: {str(e)}", operation='reserve', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to reserve usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to update usage: {str(e)}", operation='reserve', **failure_details(e))
+    
+    def release(self, user_id, size):
+        """Atomically remove an image from a user's usage."""
+        try:
+            self.table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='ADD image_count :minus_one, total_bytes :minus_size',
+                ExpressionAttributeValues={':minus_one': -1, ':minus_size': -(size or 0)}
+            )
+            logger.info("Usage released", user_id=user_id, size=size)
+        except Exception as e:
+            logger.error("Failed to release usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to update usage: {str(e)}", operation='release', **failure_details(e))
+    
+    def get_usage(self, user_id):
+        """Get a user's counters (zeros when the user has never uploaded)."""
+        try:
+            response = self.table.get_item(Key={'user_id': user_id})
+        except Exception as e:
+            logger.error("Failed to get usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to retrieve usage: {str(e)}", operation='get_usage', **failure_details(e))
+        
+        item = response.get('Item', {})
+        return {
+            'user_id': user_id,
+            'image_count': to_json_number(item.get('image_count', 0)),
+            'total_bytes': to_json_number(item.get('total_bytes', 0)),
+            'last_upload': item.get('last_upload')
+        }
+    
+    def set_usage(self, user_id, image_count, total_bytes, last_upload=None, expected=None):
+        """
+        Overwrite a user's counters (used by the recount job).
+        
+        With ``expected`` this is a conditional ``UpdateItem``, so a reservation
+        or release made since the counters were read is never overwritten.
+        """
+        updates = ['image_count = :image_count', 'total_bytes = :total_bytes']
+        values = {':image_count': image_count, ':total_bytes': total_bytes}
+        if last_upload:
+            updates.append('last_upload = :last_upload')
+            values[':last_upload'] = last_upload
+        update_kwargs = {}
+        if expected is not None:
+            update_kwargs['ConditionExpression'] = (
+                '(attribute_not_exists(user_id) AND :expected_count = :zero AND :expected_bytes = :zero) '
+                'OR (image_count = :expected_count AND total_bytes = :expected_bytes)'
+            )
+            values.update({':expected_count': expected[0], ':expected_bytes': expected[1], ':zero': 0})
+        try:
+            self.table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET ' + ', '.join(updates),
+                ExpressionAttributeValues=values,
+                **update_kwargs
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                logger.info("Usage changed during recount, left as is", user_id=user_id)
+                return False
+            logger.error("Failed to set usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to set usage: {str(e)}", operation='set_usage', **failure_details(e))
+        except Exception as e:
+            logger.error("Failed to set usage", user_id=user_id, error=str(e))
+            raise DatabaseError(f"Failed to set usage: {str(e)}", operation='set_usage', **failure_details(e))
+    
+    def list_usage(self):
+        """Yield the counters of every user."""
+        try:
+            scan_kwargs = {}
+            while True:
+                response = self.table.scan(**scan_kwargs)
+                for item in response.get('Items', []):
+                    yield {
+                        'user_id': item['user_id'],
+                        'image_count': to_json_number(item.get('image_count', 0)),
+                        'total_bytes': to_json_number(item.get('total_bytes', 0)),
+                        'last_upload': item.get('last_upload')
+                    }
+                if 'LastEvaluatedKey' not in response:
+                    return
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            logger.error("Failed to list usage", error=str(e))
+            raise DatabaseError(f"Failed to list usage: {str(e)}", operation='list_usage', **failure_details(e))
@@ -0,0 +1,79 @@
+"""
+Asynchronous metadata enrichment of stored images.
+
+Driven by S3 ``ObjectCreated`` notifications (see ``enrichment_handler``), so
+uploads never wait for it. Each object is fetched once - with a ranged GET
+when only header enrichments are configured - and the results are written to
+its metadata item with a conditional ``UpdateItem``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from ..common import resilience
+from ..common.config import Config
+from ..common.logger import get_logger
+from ..common.utils import get_current_timestamp, parse_s3_key
+from ..repositories.backends import create_metadata_repository, create_storage_repository
+from .image_enricher import ENRICHMENTS, enrich_image, needs_body
+
+logger = get_logger(__name__)
+
+
+class EnrichmentService:
+    """Compute enrichments for stored images and save them to their metadata."""
+
+    def __init__(self, storage_repo=None, metadata_repo=None, settings=None):
+        settings = settings or Config.get_enrichment_settings()
+        unknown = [name for name in settings['enrichments'] if name not in ENRICHMENTS]
+        if unknown:
+            raise ValueError(f"Unknown enrichments: {', '.join(unknown)}")
+        self.enrichments = settings['enrichments']
+        self.header_bytes = settings['header_bytes']
+        self.workers = settings['workers']
+        self.storage_repo = storage_repo or create_storage_repository()
+        self.metadata_repo = metadata_repo or create_metadata_repository()
+
+    def enrich(self, s3_key):
+        """
+        Enrich the image stored at ``s3_key``.
+
+        Returns the attributes written, or None when there was nothing to do:
+        not an image key, the object is gone, or the image was deleted or
+        moved meanwhile. Raises if the metadata does not exist yet, so the
+        event is retried.
+        """
+        parsed = parse_s3_key(s3_key)
+        if parsed is None:
+            logger.info("Enrichment skipped, not an image", s3_key=s3_key)
+            return None
+        _, image_id = parsed
+
+        complete = needs_body(self.enrichments)
+        data = self.storage_repo.read_image(s3_key, None if complete else self.header_bytes)
+        if data is None:
+            logger.info("Enrichment skipped, object gone", s3_key=s3_key)
+            return None
+
+        attributes = enrich_image(data, self.enrichments, complete)
+        attributes['enriched_at'] = get_current_timestamp()
+        if not self.metadata_repo.update_enrichment(image_id, s3_key, attributes):
+            logger.info("Enrichment skipped, image changed", image_id=image_id, s3_key=s3_key)
+            return None
+        return attributes
+
+    def enrich_many(self, s3_keys):
+        """Enrich objects in parallel; returns ``{s3_key: error}`` for the ones that failed."""
+        keys = list(dict.fromkeys(s3_keys))
+        if len(keys) <= 1 or self.workers <= 1:
+            errors = [self._try_enrich(key) for key in keys]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(keys))) as executor:
+                errors = list(executor.map(resilience.bind_invocation(self._try_enrich), keys))
+        return {key: error for key, error in zip(keys, errors) if error is not None}
+
+    def _try_enrich(self, s3_key):
+        try:
+            self.enrich(s3_key)
+            return None
+        except Exception as e:
+            logger.error("Image enrichment failed", s3_key=s3_key, error=str(e))
+            return e
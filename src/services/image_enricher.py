@@ -0,0 +1,153 @@
+"""
+Attributes computed from stored image bytes, off the upload path.
+
+Enrichments (``ENRICHMENTS``):
+
+* ``dimensions`` - pixel ``width`` and ``height`` read from the PNG, GIF,
+  JPEG or WebP header.
+* ``captured_at`` - EXIF capture date as ISO 8601 (needs Pillow).
+* ``checksum`` - SHA-256 of the object, hex.
+* ``dominant_color`` - most common color of a small thumbnail as
+  ``#rrggbb`` (needs Pillow).
+
+Header enrichments only need the first bytes of an object, so they can be
+served by a ranged GET; the others need the whole object. Unreadable images
+simply yield fewer attributes.
+"""
+import hashlib
+import io
+from datetime import datetime
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+HEADER_ENRICHMENTS = ('dimensions', 'captured_at')
+BODY_ENRICHMENTS = ('checksum', 'dominant_color')
+ENRICHMENTS = HEADER_ENRICHMENTS + BODY_ENRICHMENTS
+
+DOMINANT_COLOR_SAMPLE = 64
+DOMINANT_COLOR_PALETTE = 8
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+_SOS = 0xDA
+_EXIF_IFD = 0x8769
+_EXIF_DATETIME_ORIGINAL = 0x9003
+_EXIF_DATETIME = 0x0132
+
+
+def needs_body(enrichments):
+    """Whether any of ``enrichments`` needs the whole object rather than its header."""
+    return any(name in BODY_ENRICHMENTS for name in enrichments)
+
+
+def image_dimensions(data):
+    """Return ``(width, height)`` from an image header, or None if it cannot be read."""
+    if data[:8] == _PNG_SIGNATURE and data[12:16] == b'IHDR' and len(data) >= 24:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return int.from_bytes(data[6:8], 'little'), int.from_bytes(data[8:10], 'little')
+    if data[:2] == b'\xff\xd8':
+        return _jpeg_dimensions(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        return _webp_dimensions(data)
+    return None
+
+
+def _jpeg_dimensions(data):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker == _SOS:
+            return None
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None
+            height = int.from_bytes(data[pos + 5:pos + 7], 'big')
+            width = int.from_bytes(data[pos + 7:pos + 9], 'big')
+            return width, height
+        pos += 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and data[23:26] == b'\x9d\x01\x2a':
+        return (int.from_bytes(data[26:28], 'little') & 0x3FFF,
+                int.from_bytes(data[28:30], 'little') & 0x3FFF)
+    if chunk == b'VP8L' and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def capture_date(data):
+    """Return the EXIF capture date as ISO 8601, or None (also without Pillow)."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            exif = image.getexif()
+            value = exif.get_ifd(_EXIF_IFD).get(_EXIF_DATETIME_ORIGINAL) or exif.get(_EXIF_DATETIME)
+    except Exception:
+        return None
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except ValueError:
+        return None
+
+
+def dominant_color(data):
+    """Return the most common color of the image as ``#rrggbb``, or None (also without Pillow)."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs decode straight at a reduced scale
+            image.draft('RGB', (DOMINANT_COLOR_SAMPLE, DOMINANT_COLOR_SAMPLE))
+            sample = image.convert('RGB')
+        sample.thumbnail((DOMINANT_COLOR_SAMPLE, DOMINANT_COLOR_SAMPLE))
+        palette_image = sample.quantize(colors=DOMINANT_COLOR_PALETTE)
+        _, index = max(palette_image.getcolors())
+        red, green, blue = palette_image.getpalette()[index * 3:index * 3 + 3]
+    except Exception:
+        return None
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+def enrich_image(data, enrichments=ENRICHMENTS, complete=True):
+    """
+    Compute the requested attributes of an image.
+
+    ``data`` is the whole object, or only its first bytes when ``complete``
+    is false, in which case body enrichments are skipped.
+    """
+    attributes = {}
+    if 'dimensions' in enrichments:
+        size = image_dimensions(data)
+        if size:
+            attributes['width'], attributes['height'] = size
+    if 'captured_at' in enrichments:
+        captured_at = capture_date(data)
+        if captured_at:
+            attributes['captured_at'] = captured_at
+    if complete and 'checksum' in enrichments:
+        attributes['checksum'] = hashlib.sha256(data).hexdigest()
+    if complete and 'dominant_color' in enrichments:
+        color = dominant_color(data)
+        if color:
+            attributes['dominant_color'] = color
+    return attributes
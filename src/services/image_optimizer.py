@@ -0,0 +1,232 @@
+"""
+Optional image optimization stage run before objects are stored.
+
+Modes (``IMAGE_OPTIMIZATION``):
+
+* ``off`` - store uploads exactly as sent (default).
+* ``lossless`` - strip metadata without touching pixels: JPEG APPn/COM
+  segments are dropped at the byte level (orientation, ICC profile and Adobe
+  color information are kept) and PNGs are re-encoded with maximum
+  compression and no text chunks.
+* ``webp`` - additionally transcode JPEG and PNG to WebP at
+  ``WEBP_QUALITY`` (100 = lossless WebP).
+
+Work runs in a process pool so a large decode does not hold the GIL, with a
+per-image time budget; on timeout, decode errors or no size gain the original
+bytes are stored. 16-bit PNGs are always stored as sent, since Pillow decodes
+them to 8 bits per channel. Requires Pillow; without it the stage is a no-op.
+"""
+import io
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = ImageOps = None
+
+from ..common.config import Config
+from ..common.logger import get_logger
+
+logger = get_logger(__name__)
+
+OPTIMIZATION_MODES = ('off', 'lossless', 'webp')
+
+# JPEG markers without a length field
+_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+_SOS, _APP1, _APP2, _APP14, _COM = 0xDA, 0xE1, 0xE2, 0xEE, 0xFE
+_EXIF_ORIENTATION = 0x0112
+
+# Offset of the bit depth in the IHDR chunk, which PNG requires to come first
+_PNG_BIT_DEPTH_OFFSET = 24
+
+
+def strip_jpeg_metadata(data):
+    """
+    Drop EXIF, XMP, comments and other APPn segments from a JPEG losslessly.
+
+    Scan data is copied untouched. A non-default EXIF orientation is kept as a
+    minimal EXIF segment so the image still displays the right way up.
+    Returns ``data`` unchanged if it is not a well-formed JPEG.
+    """
+    if data[:2] != b'\xff\xd8':
+        return data
+
+    out = [b'\xff\xd8']
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return data
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == _SOS:
+            out.append(data[pos:])
+            return b''.join(out)
+        if marker in _STANDALONE_MARKERS:
+            out.append(data[pos:pos + 2])
+            pos += 2
+            continue
+
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        segment = data[pos:end]
+        payload = segment[4:]
+        if marker == _APP1 and payload.startswith(b'Exif\x00\x00'):
+            out.append(_orientation_segment(payload))
+        elif not (0xE1 <= marker <= 0xEF or marker == _COM) \
+                or (marker == _APP2 and payload.startswith(b'ICC_PROFILE\x00')) \
+                or (marker == _APP14 and payload.startswith(b'Adobe')):
+            out.append(segment)
+        pos = end
+    return data
+
+
+def _orientation_segment(exif_payload):
+    """Build a minimal APP1 segment holding only a non-default orientation (or nothing)."""
+    exif = Image.Exif()
+    try:
+        exif.load(exif_payload)
+    except Exception:
+        return b''
+    orientation = exif.get(_EXIF_ORIENTATION)
+    if not orientation or orientation == 1:
+        return b''
+    minimal = Image.Exif()
+    minimal[_EXIF_ORIENTATION] = orientation
+    body = minimal.tobytes()
+    return b'\xff\xe1' + (len(body) + 2).to_bytes(2, 'big') + body
+
+
+def optimize_image(image_bytes, mode='lossless', quality=80):
+    """
+    Optimize one image; returns ``(data, content_type)`` or None to keep the original.
+
+    A module-level function so it can run in a worker process.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image_format = image.format
+        if getattr(image, 'is_animated', False) or image_format not in ('JPEG', 'PNG'):
+            return None
+        if image_format == 'PNG' and image_bytes[_PNG_BIT_DEPTH_OFFSET] == 16:
+            # Pillow cannot re-encode 16-bit color, so the result would lose precision
+            return None
+
+        if mode == 'webp':
+            icc_profile = image.info.get('icc_profile')
+            upright = ImageOps.exif_transpose(image)
+            if upright.mode not in ('RGB', 'RGBA'):
+                upright = upright.convert('RGBA' if 'transparency' in image.info or 'A' in upright.mode else 'RGB')
+            buffer = io.BytesIO()
+            options = {'quality': quality, 'lossless': quality >= 100, 'method': 4}
+            if icc_profile:
+                options['icc_profile'] = icc_profile
+            upright.save(buffer, 'WEBP', **options)
+            return buffer.getvalue(), 'image/webp'
+
+        if image_format == 'JPEG':
+            return strip_jpeg_metadata(image_bytes), 'image/jpeg'
+
+        buffer = io.BytesIO()
+        options = {'optimize': True}
+        for key in ('icc_profile', 'transparency', 'dpi'):
+            if key in image.info:
+                options[key] = image.info[key]
+        image.save(buffer, 'PNG', **options)
+        return buffer.getvalue(), 'image/png'
+
+
+class ImageOptimizer:
+    """
+    Run ``optimize_image`` in a process pool with a per-image time budget.
+
+    A job over budget has its worker processes terminated, so stuck jobs
+    cannot pile up in the pool. With ``workers=0`` jobs run on one thread of
+    this process, which cannot be stopped: while an abandoned job is still
+    running, later images are stored as sent.
+    """
+
+    def __init__(self, settings=None):
+        settings = settings or Config.get_optimization_settings()
+        self.mode = settings['mode']
+        self.quality = settings['webp_quality']
+        self.timeout = settings['timeout_ms'] / 1000
+        self.workers = settings['workers']
+        self._pool = None
+        self._inline = None
+        self._inline_job = None
+
+    @property
+    def enabled(self):
+        return self.mode != 'off' and Image is not None
+
+    def optimize(self, image_bytes, content_type):
+        """Return ``(data, content_type)``: the optimized image if it is smaller, else the input."""
+        if not self.enabled:
+            return image_bytes, content_type
+
+        try:
+            result = self._run(image_bytes)
+        except FutureTimeoutError:
+            logger.error("Image optimization timed out", size=len(image_bytes), timeout=self.timeout)
+            return image_bytes, content_type
+        except Exception as e:
+            logger.info("Image optimization skipped", size=len(image_bytes), error=str(e))
+            return image_bytes, content_type
+
+        if result is None or len(result[0]) >= len(image_bytes):
+            return image_bytes, content_type
+        logger.info(
+            "Image optimized",
+            original_size=len(image_bytes),
+            optimized_size=len(result[0]),
+            content_type=result[1]
+        )
+        return result
+
+    def _run(self, image_bytes):
+        """Run one job within the time budget; raises ``FutureTimeoutError`` when over it."""
+        pool = self._get_pool()
+        if pool is None:
+            if self._inline_job is not None and not self._inline_job.done():
+                raise FutureTimeoutError("previous inline job is still running")
+            if self._inline is None:
+                self._inline = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-optimizer')
+            self._inline_job = self._inline.submit(optimize_image, image_bytes, self.mode, self.quality)
+            return self._inline_job.result(self.timeout)
+
+        future = pool.submit(optimize_image, image_bytes, self.mode, self.quality)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                self._terminate_pool()
+            raise
+
+    def _terminate_pool(self):
+        """Kill the pool's workers so a job over budget stops using a CPU; the next job starts a new pool."""
+        pool, self._pool = self._pool, None
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _get_pool(self):
+        """Create the worker pool on first use; None runs inline (``workers=0`` or no multiprocessing)."""
+        if self._pool is None and self.workers > 0:
+            try:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, NotImplementedError) as e:
+                # AWS Lambda has no /dev/shm, so multiprocessing primitives are unavailable
+                logger.info("Process pool unavailable, optimizing inline", error=str(e))
+                self.workers = 0
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if self._inline is not None:
+            self._inline.shutdown(wait=False, cancel_futures=True)
+            self._inline = None
@@ -1,36 +1,174 @@
 """
 Image service - business logic layer.
 """
+import hashlib
 import json
-from ..models.image_model import ImageMetadata
-from ..repositories.storage_repository import StorageRepository
-from ..repositories.metadata_repository import MetadataRepository
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from ..models.image_model import ImageMetadata, FIELDS
+from ..repositories.backends import (
+    create_idempotency_repository,
+    create_metadata_repository,
+    create_storage_repository,
+    create_usage_repository
+)
+from ..repositories.idempotency_repository import COMPLETED
+from .image_optimizer import ImageOptimizer
+from .search_service import SearchService
+from .image_transformer import (
+    SingleFlight,
+    derivative_key,
+    derivative_prefix,
+    normalize_transform,
+    transform_image
+)
+from ..common import resilience
 from ..common.logger import get_logger
 from ..common.utils import (
+    KEY_LAYOUTS,
     generate_image_id,
     get_current_timestamp,
+    get_expiry_tags,
     get_s3_key,
     parse_base64_image,
+    parse_expiry,
+    relayout_s3_key,
     get_content_type_from_filename,
+    get_extension_for_content_type,
     validate_image_size,
     validate_required_fields
 )
 from ..common.config import Config
-from ..common.errors import StorageError, DatabaseError, NotFoundError, ValidationError
+from ..common.errors import (
+    ConflictError,
+    DatabaseError,
+    ImageServiceError,
+    NotFoundError,
+    StorageError,
+    ValidationError
+)
 
 logger = get_logger(__name__)
 
+# Supported list orderings (None = table scan order)
+SORT_MODES = (None, 'recent')
+
+# Attributes read when rebuilding the search index
+SEARCH_FIELDS = ('image_id', 'user_id', 'filename', 'description', 'tags', 'upload_date')
+
+# Fields PATCH /images/{image_id} may change
+PATCHABLE_FIELDS = ('filename', 'description', 'tags')
+
+# Attributes read for a bulk tag edit
+TAG_EDIT_FIELDS = ('image_id', 'user_id', 'tags', 'version')
+
+# Attempts per image when a bulk tag edit races another update
+TAG_EDIT_ATTEMPTS = 3
+
+
+def request_fingerprint(user_id, filename, image_data, tags, description, width, height, expiry=None):
+    """Hash the parts of an upload request that define its result (``expiry`` = raw TTL inputs, if any)."""
+    digest = hashlib.sha256()
+    for part in (user_id, filename, tags, description, width, height):
+        digest.update(json.dumps(part).encode('utf-8'))
+        digest.update(b'\x00')
+    if expiry is not None:
+        digest.update(json.dumps(expiry).encode('utf-8'))
+        digest.update(b'\x00')
+    digest.update(image_data.encode('utf-8') if isinstance(image_data, str) else image_data)
+    return digest.hexdigest()
+
+
+def parse_fields(fields):
+    """
+    Parse a comma-separated ``fields`` selection into an ordered list.
+
+    ``image_id`` is always included. Returns None when no selection is given.
+    """
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    selected = ['image_id']
+    for field in (f.strip() for f in fields):
+        if not field:
+            continue
+        if field not in FIELDS:
+            raise ValidationError(f"Unknown field: {field}")
+        if field not in selected:
+            selected.append(field)
+    return selected
+
+
+def projection_fields(output_fields, include_urls):
+    """Attributes to read from DynamoDB for a field selection (None reads everything)."""
+    if not output_fields:
+        return None
+    projection = list(output_fields)
+    if include_urls and 's3_key' not in projection:
+        projection.append('s3_key')
+    return projection
+
+
+def parse_tags(tags):
+    """
+    Parse tags given as a list or a comma-separated string into a list.
+
+    Order is kept and duplicates are dropped; None stays None.
+    """
+    if tags is None:
+        return None
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValidationError("tags must be a list of strings or a comma-separated string")
+    parsed = []
+    for tag in (t.strip() for t in tags):
+        if tag and tag not in parsed:
+            parsed.append(tag)
+    return parsed
+
+
+def edit_tags(tags, add=(), remove=()):
+    """Tags with ``remove`` taken out and ``add`` appended; stored tags may be a string or a list."""
+    current = parse_tags(tags) if tags else []
+    edited = [tag for tag in current if tag not in remove]
+    for tag in add:
+        if tag not in edited:
+            edited.append(tag)
+    return edited
+
 
 class ImageService:
     """Service layer for image operations."""
     
-    def __init__(self, storage_repo=None, metadata_repo=None):
+    def __init__(self, storage_repo=None, metadata_repo=None, usage_repo=None, idempotency_repo=None,
+                 optimizer=None, search=None):
         """Initialize image service with repositories."""
-        self.storage_repo = storage_repo or StorageRepository()
-        self.metadata_repo = metadata_repo or MetadataRepository()
+        self.storage_repo = storage_repo or create_storage_repository()
+        self.metadata_repo = metadata_repo or create_metadata_repository()
+        self.usage_repo = usage_repo or create_usage_repository()
+        self.idempotency_repo = idempotency_repo or create_idempotency_repository()
+        self.optimizer = optimizer or ImageOptimizer()
+        self.search = search or SearchService()
+        self._derivative_flights = SingleFlight()
     
-    def upload_image(self, user_id, filename, image_data, tags=None, description=None, width=None, height=None):
-        """Upload an image with metadata."""
+    def upload_image(self, user_id, filename, image_data, tags=None, description=None, width=None, height=None,
+                     idempotency_key=None, ttl_seconds=None, expires_at=None):
+        """
+        Upload an image with metadata.
+        
+        With ``ttl_seconds`` or ``expires_at`` the image is ephemeral: reads
+        hide it once it expires, DynamoDB TTL removes the item and an S3
+        lifecycle rule, selected by an object tag, removes the object.
+        
+        With an ``idempotency_key`` (or content-hash deduplication enabled), a
+        retry within the TTL returns the original response without touching S3;
+        a duplicate arriving while the original is still running waits for it
+        and gets a 409 if it does not finish in time.
+        """
         logger.info("Starting image upload", user_id=user_id, filename=filename)
         
         # Validate required fields
@@ -39,19 +177,109 @@ class ImageService:
             ['user_id', 'filename', 'image_data']
         )
         
+        expiry = parse_expiry(ttl_seconds, expires_at, self._max_expiry_seconds())
+        upload_args = (user_id, filename, image_data, tags, description, width, height, expiry)
+        fingerprint = None
+        if idempotency_key or Config.use_content_hash_idempotency():
+            raw_expiry = (ttl_seconds, expires_at) if expiry is not None else None
+            fingerprint = request_fingerprint(*upload_args[:-1], expiry=raw_expiry)
+            idempotency_key = f"{user_id}#{idempotency_key or 'sha256:' + fingerprint}"
+        if not idempotency_key:
+            return self._upload_image(*upload_args)
+        
+        # A short lease, so a claim left by a crashed upload does not block retries for the whole TTL
+        token = uuid.uuid4().hex
+        existing = self.idempotency_repo.claim(
+            idempotency_key, fingerprint, Config.get_idempotency_lease_seconds(), token
+        )
+        if existing:
+            return self._replay_upload(idempotency_key, fingerprint, existing)
+        
+        try:
+            result = self._upload_image(*upload_args)
+        except Exception:
+            self.idempotency_repo.release(idempotency_key, token)
+            raise
+        
+        try:
+            self.idempotency_repo.complete(idempotency_key, token, result, Config.get_idempotency_ttl_seconds())
+        except DatabaseError as e:
+            # The image is stored; retries wait out the lease instead of failing this request
+            logger.error(
+                "Upload stored but idempotency record not completed",
+                idempotency_key=idempotency_key,
+                image_id=result['image_id'],
+                error=str(e)
+            )
+        return result
+    
+    def _replay_upload(self, idempotency_key, fingerprint, record):
+        """Return the stored response of an earlier upload with the same key."""
+        if record.get('fingerprint') != fingerprint:
+            raise ConflictError('Idempotency-Key was already used with a different request')
+        
+        deadline = time.monotonic() + Config.get_idempotency_wait_seconds()
+        while record and record.get('status') != COMPLETED and time.monotonic() < deadline:
+            time.sleep(0.05)
+            record = self.idempotency_repo.get(idempotency_key)
+        
+        if not record or record.get('status') != COMPLETED:
+            raise ConflictError('An upload with this Idempotency-Key is still in progress')
+        
+        result = record['response']
+        # Stored URLs may have expired; sign a fresh one for the same object
+        result['image_url'] = self.storage_repo.generate_presigned_url(
+            result['metadata']['s3_key'], Config.get_presigned_url_expiration()
+        )
+        logger.info("Replayed idempotent upload", image_id=result['image_id'])
+        return result
+    
+    @staticmethod
+    def _max_expiry_seconds():
+        """Longest TTL the lifecycle rules can honor (None when no expiry classes are configured)."""
+        class_days = Config.get_expiry_settings()['class_days']
+        return class_days[-1] * 86400 if class_days else None
+    
+    @staticmethod
+    def _expiry_tags(expires_at):
+        settings = Config.get_expiry_settings()
+        return get_expiry_tags(expires_at, settings['class_days'], settings['tag_key'])
+    
+    def _upload_image(self, user_id, filename, image_data, tags, description, width, height, expires_at=None):
+        """Store the object and its metadata."""
         # Prepare image data
-        image_id = generate_image_id()
+        image_id = generate_image_id(Config.get_id_scheme())
         image_bytes = parse_base64_image(image_data)
         validate_image_size(image_bytes, Config.get_max_image_size())
+        original_size = len(image_bytes)
         content_type = get_content_type_from_filename(filename)
-        s3_key = get_s3_key(user_id, image_id, filename)
         
-        # Upload to S3
-        self.storage_repo.upload_image(
-            s3_key, image_bytes, content_type,
-            {'user_id': user_id, 'image_id': image_id, 'original_filename': filename}
+        # Strip metadata / recompress; the stored object may change format
+        image_bytes, stored_type = self.optimizer.optimize(image_bytes, content_type)
+        key_filename = filename
+        if stored_type != content_type:
+            key_filename = f"{filename.rsplit('.', 1)[0]}.{get_extension_for_content_type(stored_type)}"
+            content_type = stored_type
+        s3_key = get_s3_key(user_id, image_id, key_filename, Config.get_s3_key_layout())
+        upload_date = get_current_timestamp()
+        
+        # Count the image against the user's quotas before writing any bytes
+        self.usage_repo.reserve(
+            user_id, len(image_bytes), upload_date,
+            Config.get_max_images_per_user(), Config.get_max_bytes_per_user()
         )
         
+        # Upload to S3
+        try:
+            self.storage_repo.upload_image(
+                s3_key, image_bytes, content_type,
+                {'user_id': user_id, 'image_id': image_id, 'original_filename': filename},
+                tags=self._expiry_tags(expires_at)
+            )
+        except StorageError:
+            self._release_usage(user_id, len(image_bytes))
+            raise
+        
         # Create metadata
         metadata = ImageMetadata(
             image_id=image_id,
@@ -60,11 +288,14 @@ class ImageService:
             s3_key=s3_key,
             content_type=content_type,
             size=len(image_bytes),
-            upload_date=get_current_timestamp(),
+            upload_date=upload_date,
             tags=tags if tags else None,
             description=description if description else None,
             width=width,
-            height=height
+            height=height,
+            original_size=original_size,
+            expires_at=expires_at,
+            version=1
         )
         
         # Save metadata (with automatic rollback on failure)
@@ -76,8 +307,11 @@ class ImageService:
                 self.storage_repo.delete_image(s3_key)
             except StorageError:
                 logger.error("Rollback failed", image_id=image_id)
+            self._release_usage(user_id, len(image_bytes))
             raise
         
+        self.search.index_image(metadata)
+        
         # Generate presigned URL
         image_url = self.storage_repo.generate_presigned_url(
             s3_key, Config.get_presigned_url_expiration()
@@ -92,12 +326,21 @@ class ImageService:
             'metadata': metadata.to_dict()
         }
     
-    def list_images(self, user_id=None, tags=None, limit=50, last_key=None):
-        """List images with optional filters."""
-        logger.info("Listing images", user_id=user_id, tags=tags, limit=limit)
+    def list_images(self, user_id=None, tags=None, limit=50, last_key=None, fields=None, include_urls=True,
+                    sort=None):
+        """
+        List images with optional filters, field projection and URL signing.
+        
+        ``sort='recent'`` returns images newest-first from the feed index;
+        otherwise the table is scanned in storage order.
+        """
+        logger.info("Listing images", user_id=user_id, tags=tags, limit=limit, fields=fields, sort=sort)
 
         if limit < 1 or limit > 100:
             raise ValidationError('limit must be between 1 and 100')
+
+        if sort not in SORT_MODES:
+            raise ValidationError('sort must be one of: recent')
         
         # Parse tags
         tags_list = None
@@ -113,33 +356,110 @@ class ImageService:
         if last_evaluated_key is not None and not isinstance(last_evaluated_key, dict):
             raise ValidationError('last_key must be a JSON object')
         
+        output_fields = parse_fields(fields)
+        
         # Get metadata from DynamoDB
-        metadata_list, next_key = self.metadata_repo.list_metadata(
-            user_id, tags_list, limit, last_evaluated_key
-        )
+        if sort == 'recent':
+            metadata_list, next_key = self.metadata_repo.list_recent(
+                user_id, tags_list, limit, last_evaluated_key,
+                fields=projection_fields(output_fields, include_urls)
+            )
+        else:
+            metadata_list, next_key = self.metadata_repo.list_metadata(
+                user_id, tags_list, limit, last_evaluated_key,
+                fields=projection_fields(output_fields, include_urls)
+            )
+        
+        result = self._image_page(metadata_list, output_fields, include_urls, user_id)
+        if next_key:
+            result['last_evaluated_key'] = json.dumps(next_key)
+        
+        logger.info("Images listed", count=result['count'])
+        return result
+    
+    def search_images(self, user_id, query, limit=20, fields=None, include_urls=True):
+        """
+        Rank a user's images by how well ``query`` matches filename, description and tags.
+        
+        Hits are read back from the metadata table, so images deleted since
+        they were indexed never show up.
+        """
+        logger.info("Searching images", user_id=user_id, query=query, limit=limit)
+        
+        if not self.search.enabled:
+            raise ImageServiceError('Search is not enabled', status_code=501)
+        if not user_id:
+            raise ValidationError('user_id is required')
+        if not query or not query.strip():
+            raise ValidationError('q is required')
+        if limit < 1 or limit > 100:
+            raise ValidationError('limit must be between 1 and 100')
+        
+        output_fields = parse_fields(fields)
+        projection = projection_fields(output_fields, include_urls)
+        if projection and 'user_id' not in projection:
+            projection.append('user_id')
+        
+        hits = self.search.search(user_id, query, limit)
+        found = self.metadata_repo.get_many([image_id for image_id, _ in hits], projection)
+        ranked = [found[image_id] for image_id, _ in hits
+                  if image_id in found and found[image_id].user_id == user_id]
+        
+        result = self._image_page(ranked, output_fields, include_urls, user_id)
+        scores = dict(hits)
+        for image in result['images']:
+            image['score'] = scores[image['image_id']]
+        
+        logger.info("Images searched", count=result['count'], hits=len(hits))
+        return result
+    
+    def _image_page(self, metadata_list, output_fields, include_urls, user_id):
+        """Build ``{'images', 'count'}`` with an image URL per item, or signed cookies for one user's images."""
+        expiration = Config.get_presigned_url_expiration()
+        use_cookies = include_urls and bool(user_id) and self.storage_repo.signed_cookies_enabled
         
-        # Add presigned URLs to each image
         images = []
         for metadata in metadata_list:
-            image_dict = metadata.to_dict()
-            image_dict['image_url'] = self.storage_repo.generate_presigned_url(
-                metadata.s3_key, Config.get_presigned_url_expiration()
-            )
+            image_dict = metadata.to_dict(output_fields)
+            if use_cookies:
+                image_dict['image_url'] = self.storage_repo.get_object_url(metadata.s3_key)
+            elif include_urls:
+                image_dict['image_url'] = self.storage_repo.generate_presigned_url(metadata.s3_key, expiration)
             images.append(image_dict)
         
         result = {'images': images, 'count': len(images)}
-        if next_key:
-            result['last_evaluated_key'] = json.dumps(next_key)
-        
-        logger.info("Images listed", count=len(images))
+        if use_cookies:
+            # One set of cookies covers every image of the user
+            result['signed_cookies'] = self.storage_repo.generate_user_cookies(user_id, expiration)
+            result['expires_in'] = expiration
         return result
     
-    def get_image(self, image_id, download=False, expires_in=None):
-        """Get image metadata and download URL."""
+    def get_image(self, image_id, download=False, expires_in=None, fields=None, include_urls=True,
+                  transform=None):
+        """
+        Get image metadata and, unless ``include_urls`` is False, a download URL.
+        
+        With ``transform`` (raw ``w``/``h``/``fit``/``format`` values) the URL
+        points at a derivative, generated and stored on first request.
+        """
         logger.info("Getting image", image_id=image_id)
         
+        output_fields = parse_fields(fields)
+        projection = projection_fields(output_fields, include_urls)
+        if projection and transform:
+            projection += [field for field in ('s3_key', 'content_type', 'expires_at') if field not in projection]
+        if projection and include_urls and download:
+            projection.append('filename')
+        
         # Get metadata from DynamoDB
-        metadata = self.metadata_repo.get_metadata(image_id)
+        metadata = self.metadata_repo.get_metadata(image_id, fields=projection)
+        
+        if transform:
+            return self._get_derivative(metadata, transform, download, expires_in, output_fields)
+        
+        if not include_urls:
+            logger.info("Image retrieved", image_id=image_id)
+            return {'image_id': image_id, 'metadata': metadata.to_dict(output_fields)}
         
         # Verify image exists in S3
         if not self.storage_repo.check_image_exists(metadata.s3_key):
@@ -157,22 +477,381 @@ class ImageService:
         
         return {
             'image_id': image_id,
-            'metadata': metadata.to_dict(),
+            'metadata': metadata.to_dict(output_fields),
             'download_url': download_url,
             'expires_in': expiration
         }
     
+    def _get_derivative(self, metadata, transform, download, expires_in, output_fields):
+        """Return a URL to a derivative, generating it if it is not stored yet."""
+        spec = normalize_transform(transform, metadata.content_type)
+        key = derivative_key(metadata.image_id, spec)
+        
+        if not self.storage_repo.check_image_exists(key):
+            # Identical concurrent requests in this process share one generation
+            self._derivative_flights.do(key, lambda: self._create_derivative(metadata, spec, key))
+        
+        expiration = expires_in or Config.get_presigned_url_expiration()
+        filename = None
+        if download and metadata.filename:
+            filename = f"{metadata.filename.rsplit('.', 1)[0]}.{spec.format}"
+        download_url = self.storage_repo.generate_presigned_url(key, expiration, download, filename)
+        
+        logger.info("Derivative retrieved", image_id=metadata.image_id, derivative=spec.name)
+        return {
+            'image_id': metadata.image_id,
+            'metadata': metadata.to_dict(output_fields),
+            'transform': spec.to_dict(),
+            'download_url': download_url,
+            'expires_in': expiration
+        }
+    
+    def _create_derivative(self, metadata, spec, key):
+        # Another request may have stored it while this one waited to lead
+        if self.storage_repo.check_image_exists(key):
+            return
+        source = self.storage_repo.get_image_bytes(metadata.s3_key)
+        data = transform_image(source, spec)
+        # Derivatives of ephemeral images expire with them
+        self.storage_repo.upload_image(
+            key, data, spec.content_type, {'image_id': metadata.image_id, 'derivative': spec.name},
+            tags=self._expiry_tags(metadata.expires_at)
+        )
+        logger.info("Derivative created", image_id=metadata.image_id, derivative=spec.name, size=len(data))
+    
+    def update_image(self, image_id, changes, version=None):
+        """
+        Change an image's filename, description or tags.
+        
+        One conditional update writes only the given fields and bumps the
+        image's ``version``; with ``version`` it fails with a 409 if the image
+        was updated since that version was read. A null or empty value
+        removes the field.
+        """
+        logger.info("Updating image", image_id=image_id, fields=sorted(changes or {}))
+        
+        if not isinstance(changes, dict) or not changes:
+            raise ValidationError(f"Nothing to update; patchable fields: {', '.join(PATCHABLE_FIELDS)}")
+        unknown = sorted(field for field in changes if field not in PATCHABLE_FIELDS)
+        if unknown:
+            raise ValidationError(f"Fields cannot be updated: {', '.join(unknown)}")
+        if version is not None and (isinstance(version, bool) or not isinstance(version, int) or version < 0):
+            raise ValidationError("version must be a non-negative integer")
+        
+        changes = dict(changes)
+        if 'filename' in changes:
+            filename = changes['filename']
+            if not isinstance(filename, str) or not filename.strip():
+                raise ValidationError("filename must be a non-empty string")
+            changes['filename'] = filename.strip()
+        if 'description' in changes:
+            description = changes['description']
+            if description is not None and not isinstance(description, str):
+                raise ValidationError("description must be a string")
+            changes['description'] = description or None
+        if 'tags' in changes:
+            changes['tags'] = parse_tags(changes['tags']) or None
+        
+        metadata = self.metadata_repo.update_metadata(image_id, changes, version)
+        self.search.index_image(metadata)
+        
+        logger.info("Image updated", image_id=image_id, version=metadata.version)
+        return {'message': 'Image updated successfully', 'image_id': image_id, 'metadata': metadata.to_dict()}
+    
+    def update_tags(self, image_ids, add=None, remove=None, user_id=None):
+        """
+        Add and remove tags across many images.
+        
+        Images are read with batched gets and updated in parallel, each with
+        a version-conditional update that is retried on a concurrent change,
+        so tags edited meanwhile are not overwritten. With ``user_id`` only
+        that user's images are edited; others count as not found.
+        """
+        settings = Config.get_bulk_tag_settings()
+        if not isinstance(image_ids, list) or not image_ids or not all(isinstance(i, str) and i for i in image_ids):
+            raise ValidationError("image_ids must be a non-empty list of image IDs")
+        image_ids = list(dict.fromkeys(image_ids))
+        if len(image_ids) > settings['max_images']:
+            raise ValidationError(f"At most {settings['max_images']} images can be edited at once")
+        add, remove = parse_tags(add) or [], parse_tags(remove) or []
+        if not add and not remove:
+            raise ValidationError("add_tags or remove_tags is required")
+        if set(add) & set(remove):
+            raise ValidationError("A tag cannot be both added and removed")
+        logger.info("Editing tags", images=len(image_ids), add=add, remove=remove)
+        
+        found = self.metadata_repo.get_many(image_ids, TAG_EDIT_FIELDS)
+        images = [found[image_id] for image_id in image_ids
+                  if image_id in found and (not user_id or found[image_id].user_id == user_id)]
+        
+        def edit(metadata):
+            return self._edit_tags(metadata, add, remove)
+        
+        if len(images) <= 1 or settings['workers'] <= 1:
+            outcomes = [edit(metadata) for metadata in images]
+        else:
+            with ThreadPoolExecutor(max_workers=min(settings['workers'], len(images))) as executor:
+                outcomes = list(executor.map(resilience.bind_invocation(edit), images))
+        
+        result = {'updated': [], 'unchanged': [], 'not_found': [], 'failed': []}
+        edited = dict(zip((metadata.image_id for metadata in images), outcomes))
+        for image_id in image_ids:
+            result[edited.get(image_id, 'not_found')].append(image_id)
+        
+        logger.info("Tags edited", **{outcome: len(ids) for outcome, ids in result.items()})
+        return result
+    
+    def _edit_tags(self, metadata, add, remove):
+        """Apply one image's tag edit; returns its outcome in the ``update_tags`` result."""
+        for _ in range(TAG_EDIT_ATTEMPTS):
+            tags = edit_tags(metadata.tags, add, remove)
+            if tags == edit_tags(metadata.tags):
+                return 'unchanged'
+            try:
+                updated = self.metadata_repo.update_metadata(
+                    metadata.image_id, {'tags': tags or None}, metadata.version or 0
+                )
+            except ConflictError:
+                try:
+                    metadata = self.metadata_repo.get_metadata(metadata.image_id, fields=list(TAG_EDIT_FIELDS))
+                except NotFoundError:
+                    return 'not_found'
+                continue
+            except NotFoundError:
+                return 'not_found'
+            except ImageServiceError as e:
+                logger.error("Tag edit failed", image_id=metadata.image_id, error=str(e))
+                return 'failed'
+            self.search.index_image(updated)
+            return 'updated'
+        logger.error("Tag edit failed, image kept changing", image_id=metadata.image_id)
+        return 'failed'
+    
     def delete_image(self, image_id):
-        """Delete an image and its metadata."""
-        logger.info("Deleting image", image_id=image_id)
+        """
+        Soft-delete an image.
         
-        # Get metadata (to get S3 key)
-        metadata = self.metadata_repo.get_metadata(image_id)
+        One conditional update tombstones the metadata, hiding the image from
+        reads at once; the object and item are removed later by
+        ``purge_deleted``. The image can be restored until ``restorable_until``.
+        """
+        logger.info("Deleting image", image_id=image_id)
         
-        # Delete from S3 and DynamoDB
-        self.storage_repo.delete_image(metadata.s3_key)
-        self.metadata_repo.delete_metadata(image_id)
+        now = datetime.utcnow()
+        purge_after = (now + timedelta(seconds=Config.get_undelete_window_seconds())).isoformat()
+        metadata = self.metadata_repo.mark_deleted(image_id, now.isoformat(), purge_after)
+        self._release_usage(metadata.user_id, metadata.size)
+        self.search.remove_image(metadata.user_id, image_id)
         
         logger.info("Image deleted", image_id=image_id)
         
-        return {'message': 'Image deleted successfully', 'image_id': image_id}
+        return {'message': 'Image deleted successfully', 'image_id': image_id, 'restorable_until': purge_after}
+    
+    def restore_image(self, image_id):
+        """Undo a delete while the image is inside its undelete window."""
+        logger.info("Restoring image", image_id=image_id)
+        
+        now = get_current_timestamp()
+        metadata, purge_after = self.metadata_repo.get_deleted(image_id, now)
+        
+        # The image counts against the user's quotas again; it is not a new upload
+        self.usage_repo.reserve(
+            metadata.user_id, metadata.size or 0, None,
+            Config.get_max_images_per_user(), Config.get_max_bytes_per_user()
+        )
+        try:
+            self.metadata_repo.restore(metadata, purge_after, now)
+        except Exception:
+            self._release_usage(metadata.user_id, metadata.size or 0)
+            raise
+        self.search.index_image(metadata)
+        
+        logger.info("Image restored", image_id=image_id)
+        return {'message': 'Image restored successfully', 'image_id': image_id, 'metadata': metadata.to_dict()}
+    
+    def purge_deleted(self, now=None):
+        """
+        Permanently remove images whose undelete window has closed.
+        
+        Objects go first, in ``DeleteObjects`` batches; only items whose object
+        is gone are then removed with ``BatchWriteItem``, so a failure leaves a
+        tombstone to retry rather than metadata pointing at nothing. Expired
+        images the backend does not reap itself (SQLite) are removed the same
+        way, and their usage is released.
+        """
+        now = now or get_current_timestamp()
+        logger.info("Purging deleted images", now=now)
+        
+        purged = failed = 0
+        for page in self.metadata_repo.iter_purgeable(now):
+            removed = self._purge_page(page)
+            purged += len(removed)
+            failed += len(page) - len(removed)
+        for page in self.metadata_repo.iter_expired(now):
+            removed = self._purge_page(page)
+            for metadata in removed:
+                self._release_usage(metadata.user_id, metadata.size)
+            purged += len(removed)
+            failed += len(page) - len(removed)
+        
+        logger.info("Purge completed", purged=purged, failed=failed)
+        return {'purged': purged, 'failed': failed}
+    
+    def _purge_page(self, page):
+        """Delete the objects, derivatives and items of ``page``; returns the images fully removed."""
+        failed_keys = self.storage_repo.delete_images([metadata.s3_key for metadata in page])
+        image_ids = [metadata.image_id for metadata in page if metadata.s3_key not in failed_keys]
+        self._delete_derivatives(image_ids)
+        unprocessed = set(self.metadata_repo.delete_many(image_ids))
+        return [metadata for metadata in page
+                if metadata.s3_key not in failed_keys and metadata.image_id not in unprocessed]
+    
+    def release_expired(self, user_id, size):
+        """
+        Uncount an image removed by DynamoDB TTL.
+        
+        Unlike deletes, a failure raises, so the stream record is retried.
+        """
+        self.usage_repo.release(user_id, size)
+        logger.info("Expired image released", user_id=user_id, size=size)
+    
+    def get_user_stats(self, user_id):
+        """Get a user's image count, storage use and quotas."""
+        if not user_id:
+            raise ValidationError('user_id is required')
+        
+        usage = self.usage_repo.get_usage(user_id)
+        usage['quota'] = {
+            'max_images': Config.get_max_images_per_user() or None,
+            'max_bytes': Config.get_max_bytes_per_user() or None
+        }
+        return usage
+    
+    def recount_usage(self, user_id=None):
+        """
+        Rebuild usage counters from the metadata table to repair drift.
+        
+        Recounts every user (or only ``user_id``) and resets users whose
+        counters no longer match any stored image. Counters are read before
+        the scan and each correction is conditional on them being unchanged,
+        so uploads and deletes during the job are never overwritten; those
+        users are skipped until the next run.
+        """
+        logger.info("Recounting usage", user_id=user_id)
+        
+        current = {
+            usage['user_id']: usage for usage in self.usage_repo.list_usage()
+            if not user_id or usage['user_id'] == user_id
+        }
+        
+        totals = {}
+        for metadata in self.metadata_repo.iter_metadata(['user_id', 'size', 'upload_date']):
+            if user_id and metadata.user_id != user_id:
+                continue
+            count, size, last_upload = totals.get(metadata.user_id, (0, 0, None))
+            upload_date = metadata.upload_date
+            if last_upload is None or (upload_date and upload_date > last_upload):
+                last_upload = upload_date
+            totals[metadata.user_id] = (count + 1, size + (metadata.size or 0), last_upload)
+        
+        corrected = skipped = 0
+        for uid in set(totals) | set(current):
+            count, size, last_upload = totals.get(uid, (0, 0, None))
+            existing = current.get(uid) or {'image_count': 0, 'total_bytes': 0}
+            expected = (existing['image_count'], existing['total_bytes'])
+            if expected == (count, size):
+                continue
+            if self.usage_repo.set_usage(uid, count, size, last_upload, expected=expected):
+                corrected += 1
+            else:
+                skipped += 1
+        
+        logger.info("Usage recount completed", users=len(totals), corrected=corrected, skipped=skipped)
+        return {'users': len(totals), 'corrected': corrected, 'skipped': skipped}
+    
+    def compact_search_index(self, user_id=None):
+        """Fold pending search deltas into segments."""
+        if not self.search.enabled:
+            raise ImageServiceError('Search is not enabled', status_code=501)
+        return self.search.compact(user_id)
+    
+    def rebuild_search_index(self, user_id=None):
+        """Rebuild search segments from the metadata table."""
+        if not self.search.enabled:
+            raise ImageServiceError('Search is not enabled', status_code=501)
+        images = self.metadata_repo.iter_metadata(SEARCH_FIELDS)
+        return self.search.rebuild(images, user_id)
+    
+    def _delete_derivatives(self, image_ids, workers=8):
+        """Best-effort removal of generated derivatives; leftovers are only wasted bytes."""
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                listings = executor.map(resilience.bind_invocation(
+                    lambda image_id: self.storage_repo.list_keys(derivative_prefix(image_id))
+                ), image_ids)
+                keys = [key for listing in listings for key in listing]
+            if keys:
+                self.storage_repo.delete_images(keys)
+        except StorageError:
+            logger.error("Derivative cleanup failed", count=len(image_ids))
+    
+    def migrate_key_layout(self, layout=None, limit=None, workers=8, delete_source=True):
+        """
+        Move existing objects to the keys of ``layout`` (default: the configured layout).
+        
+        Each image is copied to its new key, its metadata is switched over with
+        a conditional update, and then the old object is deleted. Readers see
+        either key through ``s3_key`` throughout. Images deleted or changed
+        mid-way keep their old key and the copy is removed. ``limit`` bounds
+        how many images one run migrates, so the job can resume across
+        invocations.
+        """
+        layout = layout or Config.get_s3_key_layout()
+        if layout not in KEY_LAYOUTS:
+            raise ValidationError(f"layout must be one of: {', '.join(KEY_LAYOUTS)}")
+        logger.info("Migrating key layout", layout=layout, limit=limit)
+        
+        pending = []
+        for metadata in self.metadata_repo.iter_metadata(['image_id', 's3_key']):
+            # The stored extension can differ from the filename (optimized or renamed images)
+            new_key = relayout_s3_key(metadata.s3_key, layout) if metadata.s3_key else None
+            if new_key and metadata.s3_key != new_key:
+                pending.append((metadata, new_key))
+                if limit and len(pending) >= limit:
+                    break
+        
+        counts = {'migrated': 0, 'skipped': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for outcome in executor.map(
+                resilience.bind_invocation(lambda job: self._migrate_object(*job, delete_source)), pending
+            ):
+                counts[outcome] += 1
+        
+        logger.info("Key layout migration completed", layout=layout, **counts)
+        return counts
+    
+    def _migrate_object(self, metadata, new_key, delete_source):
+        old_key = metadata.s3_key
+        try:
+            self.storage_repo.copy_image(old_key, new_key)
+            if not self.metadata_repo.update_s3_key(metadata.image_id, old_key, new_key):
+                self.storage_repo.delete_image(new_key)
+                return 'skipped'
+        except (StorageError, DatabaseError):
+            logger.error("Key migration failed", image_id=metadata.image_id)
+            return 'failed'
+        
+        if delete_source:
+            try:
+                self.storage_repo.delete_image(old_key)
+            except StorageError:
+                # The image already reads from its new key; the old object is only garbage
+                logger.error("Old object cleanup failed", image_id=metadata.image_id, s3_key=old_key)
+        return 'migrated'
+    
+    def _release_usage(self, user_id, size):
+        """Uncount an image; a failure here is left for the recount job."""
+        try:
+            self.usage_repo.release(user_id, size)
+        except DatabaseError:
+            logger.error("Usage release failed", user_id=user_id, size=size)
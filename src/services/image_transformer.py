@@ -0,0 +1,179 @@
+"""
+On-demand image derivatives (resized / re-encoded copies of an original).
+
+Requested dimensions are rounded up to a small set of allowed sizes and the
+format and fit are normalized, so arbitrary query strings cannot multiply the
+number of stored derivatives. Each normalized spec maps to one deterministic
+S3 key, under a hash-prefixed ``derivatives/`` tree that is independent of the
+original's key layout. Requires Pillow.
+"""
+import hashlib
+import io
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = ImageOps = None
+
+from ..common.errors import ImageServiceError, ValidationError
+
+# Allowed edge lengths; requests are rounded up to the next one
+SIZE_BUCKETS = (32, 64, 128, 256, 320, 480, 640, 800, 1024, 1280, 1600, 2048)
+FITS = ('contain', 'cover')
+FORMATS = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+DERIVATIVE_QUALITY = 80
+
+
+class TransformSpec:
+    """A normalized transformation: bucketed ``width``/``height`` (0 = auto), ``fit`` and ``format``."""
+
+    __slots__ = ('width', 'height', 'fit', 'format')
+
+    def __init__(self, width, height, fit, format):
+        self.width = width
+        self.height = height
+        self.fit = fit
+        self.format = format
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format]
+
+    @property
+    def name(self):
+        return f'w{self.width}-h{self.height}-{self.fit}.{self.format}'
+
+    def to_dict(self):
+        return {'width': self.width, 'height': self.height, 'fit': self.fit, 'format': self.format}
+
+
+def _bucket(value, name):
+    if value in (None, ''):
+        return 0
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{name} must be a valid integer")
+    if size < 1:
+        raise ValidationError(f"{name} must be a positive integer")
+    for bucket in SIZE_BUCKETS:
+        if size <= bucket:
+            return bucket
+    return SIZE_BUCKETS[-1]
+
+
+def normalize_transform(params, source_content_type):
+    """
+    Build a ``TransformSpec`` from raw ``w``/``h``/``fit``/``format`` strings.
+
+    ``format`` defaults to the source's format; ``cover`` needs both sides.
+    """
+    width = _bucket(params.get('w'), 'w')
+    height = _bucket(params.get('h'), 'h')
+    if not width and not height:
+        raise ValidationError('w or h is required for a transformation')
+
+    fit = (params.get('fit') or 'contain').lower()
+    if fit not in FITS:
+        raise ValidationError(f"fit must be one of: {', '.join(FITS)}")
+    if fit == 'cover' and not (width and height):
+        raise ValidationError('fit=cover requires both w and h')
+
+    image_format = (params.get('format') or '').lower()
+    image_format = FORMAT_ALIASES.get(image_format, image_format)
+    if not image_format:
+        image_format = next(
+            (name for name, content_type in FORMATS.items() if content_type == source_content_type), 'jpeg'
+        )
+    if image_format not in FORMATS:
+        raise ValidationError(f"format must be one of: {', '.join(FORMATS)}")
+
+    return TransformSpec(width, height, fit, image_format)
+
+
+def derivative_prefix(image_id):
+    """S3 prefix holding every derivative of an image."""
+    shard = hashlib.sha256(image_id.encode('utf-8')).hexdigest()[:4]
+    return f'derivatives/{shard}/{image_id}/'
+
+
+def derivative_key(image_id, spec):
+    return derivative_prefix(image_id) + spec.name
+
+
+def transform_image(image_bytes, spec):
+    """Render ``spec`` from the original bytes; never upscales."""
+    if Image is None:
+        raise ImageServiceError('Image transformations are not available', status_code=501)
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except Exception:
+        raise ValidationError('Image cannot be transformed')
+
+    box = (spec.width or image.width, spec.height or image.height)
+    if spec.fit == 'cover':
+        box = (min(box[0], image.width), min(box[1], image.height))
+        image = ImageOps.fit(image, box, Image.Resampling.LANCZOS)
+    else:
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+
+    if spec.format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif spec.format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.mode in ('LA', 'PA', 'P') else 'RGB')
+
+    buffer = io.BytesIO()
+    options = {'optimize': True} if spec.format == 'png' else {'quality': DERIVATIVE_QUALITY}
+    image.save(buffer, spec.format.upper(), **options)
+    return buffer.getvalue()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution.
+
+    Callers arriving while a call for their key is running wait for it and
+    share its result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,237 @@
+"""
+In-memory inverted index over image filenames, descriptions and tags.
+
+One ``SearchIndex`` holds one user's images. Documents get consecutive
+ordinals. Each term maps a bit set of fields (filename / description /
+tags) to an ``array('I')`` of the ordinals whose term occurs in exactly
+those fields, so every posting list scores the same for all its documents
+and queries are evaluated with dict and set operations rather than a Python
+loop per posting. Removing a document only marks its ordinal dead;
+``encode`` (compaction) drops dead documents and renumbers the rest.
+
+Segments are the serialized form kept in S3: a magic header followed by a
+zlib-compressed JSON header line (document and term columns), the posting
+counts and the raw posting arrays in term order.
+"""
+import bisect
+import heapq
+import json
+import math
+import re
+import zlib
+from array import array
+
+# Field bits stored in each posting entry
+FILENAME = 1
+DESCRIPTION = 2
+TAGS = 4
+FIELD_WEIGHTS = {FILENAME: 2.0, DESCRIPTION: 1.0, TAGS: 3.0}
+
+# A prefix match scores lower than the exact term
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_TERMS = 64
+MAX_QUERY_TERMS = 8
+MAX_TOKEN_LENGTH = 32
+
+SEGMENT_MAGIC = b'ISX1'
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Lower-case word tokens; underscores, dashes and dots separate words."""
+    if not text:
+        return []
+    return [token[:MAX_TOKEN_LENGTH] for token in _TOKEN_RE.findall(str(text).lower())]
+
+
+def document_terms(filename=None, description=None, tags=None):
+    """Map each term of an image to the bit set of fields it occurs in."""
+    terms = {}
+    stem = filename.rsplit('.', 1)[0] if filename and '.' in filename else filename
+    for field, text in ((FILENAME, stem), (DESCRIPTION, description), (TAGS, tags)):
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0) | field
+    return terms
+
+
+def field_score(fields):
+    return sum(weight for bit, weight in FIELD_WEIGHTS.items() if fields & bit)
+
+
+class SearchIndex:
+    """Inverted index for one user's images."""
+
+    def __init__(self):
+        self.doc_ids = []
+        self.doc_dates = []
+        self.dead = set()
+        self.ordinals = {}
+        self.postings = {}
+        self.sorted_terms = []
+        self._new_terms = []
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def add(self, image_id, upload_date=None, filename=None, description=None, tags=None):
+        """Index an image, replacing any earlier version of it."""
+        self.remove(image_id)
+        ordinal = len(self.doc_ids)
+        self.doc_ids.append(image_id)
+        self.doc_dates.append(upload_date or '')
+        self.ordinals[image_id] = ordinal
+        for term, fields in document_terms(filename, description, tags).items():
+            groups = self.postings.get(term)
+            if groups is None:
+                groups = self.postings[term] = {}
+                self._new_terms.append(term)
+            entries = groups.get(fields)
+            if entries is None:
+                entries = groups[fields] = array('I')
+            entries.append(ordinal)
+
+    def remove(self, image_id):
+        ordinal = self.ordinals.pop(image_id, None)
+        if ordinal is not None:
+            self.dead.add(ordinal)
+
+    def _terms(self):
+        """The sorted term dictionary, merging terms added since the last lookup."""
+        if self._new_terms:
+            if len(self._new_terms) < 1000:
+                for term in self._new_terms:
+                    bisect.insort(self.sorted_terms, term)
+            else:
+                self.sorted_terms = sorted(self.postings)
+            self._new_terms = []
+        return self.sorted_terms
+
+    def _expand(self, token):
+        """Terms matching ``token``: the exact term first, then up to ``MAX_PREFIX_TERMS`` extensions."""
+        matches = [(token, 1.0)] if token in self.postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return matches
+        terms = self._terms()
+        start = bisect.bisect_right(terms, token)
+        for term in terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            matches.append((term, PREFIX_WEIGHT))
+        return matches
+
+    def _token_scores(self, matches, live):
+        """Best score per ordinal for one query token."""
+        groups = []
+        for term, weight in matches:
+            term_groups = self.postings[term]
+            idf = math.log(1 + live / sum(len(entries) for entries in term_groups.values())) * weight
+            groups.extend((idf * field_score(fields), entries) for fields, entries in term_groups.items())
+        # Ascending, so a later (higher) score overwrites a lower one
+        groups.sort(key=lambda group: group[0])
+        scores = {}
+        for score, entries in groups:
+            scores.update(dict.fromkeys(entries, score))
+        return scores
+
+    def search(self, query, limit=20):
+        """
+        Return up to ``limit`` ``(image_id, score)`` pairs, best first.
+
+        Every query token must match a term exactly or as a prefix. Scores
+        add up per token: field weight x idf, halved for prefix matches. Ties
+        go to the most recent upload.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        live = len(self.ordinals)
+        if not tokens or not live:
+            return []
+
+        scores = None
+        for token in tokens:
+            matches = self._expand(token)
+            if not matches:
+                return []
+            token_scores = self._token_scores(matches, live)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {ordinal: scores[ordinal] + token_scores[ordinal]
+                          for ordinal in scores.keys() & token_scores.keys()}
+            if not scores:
+                return []
+        for ordinal in self.dead & scores.keys():
+            del scores[ordinal]
+        if not scores:
+            return []
+
+        # Only documents scoring at least the limit-th best score can rank
+        threshold = min(heapq.nlargest(limit, scores.values()))
+        candidates = [ordinal for ordinal, score in scores.items() if score >= threshold]
+        dates = self.doc_dates
+        best = heapq.nlargest(limit, candidates, key=lambda ordinal: (scores[ordinal], dates[ordinal]))
+        return [(self.doc_ids[ordinal], round(scores[ordinal], 4)) for ordinal in best]
+
+    def encode(self, extra=None):
+        """Serialize live documents into a compact segment; ``extra`` is stored in the header."""
+        remap = {}
+        ids = []
+        dates = []
+        for ordinal, image_id in enumerate(self.doc_ids):
+            if ordinal not in self.dead:
+                remap[ordinal] = len(ids)
+                ids.append(image_id)
+                dates.append(self.doc_dates[ordinal])
+
+        terms = []
+        fields_column = []
+        counts = array('I')
+        blobs = []
+        for term in self._terms():
+            for fields, entries in sorted(self.postings[term].items()):
+                if self.dead:
+                    entries = array('I', (remap[o] for o in entries if o in remap))
+                if entries:
+                    terms.append(term)
+                    fields_column.append(fields)
+                    counts.append(len(entries))
+                    blobs.append(entries.tobytes())
+
+        # Column-wise, so decoding is mostly C-level list and array building
+        header = json.dumps({
+            'ids': ids, 'dates': dates, 'terms': terms, 'fields': fields_column, 'extra': extra or {}
+        }, separators=(',', ':'))
+        body = counts.tobytes() + b''.join(blobs)
+        return SEGMENT_MAGIC + zlib.compress(header.encode('utf-8') + b'\n' + body, 6)
+
+    @classmethod
+    def decode(cls, data):
+        """Load a segment written by ``encode``; returns ``(index, extra)``."""
+        if data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            raise ValueError('Not a search segment')
+        raw = zlib.decompress(data[len(SEGMENT_MAGIC):])
+        newline = raw.index(b'\n')
+        header = json.loads(raw[:newline])
+
+        index = cls()
+        index.doc_ids = header['ids']
+        index.doc_dates = header['dates']
+        index.ordinals = dict(zip(index.doc_ids, range(len(index.doc_ids))))
+
+        terms = header['terms']
+        counts = array('I')
+        counts.frombytes(raw[newline + 1:newline + 1 + len(terms) * counts.itemsize])
+        entries = array('I')
+        entries.frombytes(raw[newline + 1 + len(terms) * counts.itemsize:])
+
+        postings = index.postings
+        start = 0
+        for term, fields, count in zip(terms, header['fields'], counts):
+            groups = postings.get(term)
+            if groups is None:
+                groups = postings[term] = {}
+            groups[fields] = entries[start:start + count]
+            start += count
+        index.sorted_terms = list(postings)
+        return index, header['extra']
@@ -0,0 +1,200 @@
+"""
+Per-user full-text search over filenames, descriptions and tags.
+
+Writes append a small delta object per change (``SearchRepository``) and
+apply it to this process's cached index straight away. Searches load a
+user's segment lazily, cache it (LRU over users) and, at most every
+``SEARCH_REFRESH_SECONDS``, list the user's objects once to pick up a new
+segment or deltas written by other instances. The ``compact_search_index``
+job folds deltas into the segment; ``rebuild_search_index`` rebuilds it from
+the metadata table.
+
+The index is eventually consistent: a missing delta is repaired by the next
+rebuild, and callers check hits against the metadata table.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from ..common import resilience
+from ..common.config import Config
+from ..common.errors import StorageError
+from ..common.logger import get_logger
+from ..repositories.search_repository import SearchRepository
+from .search_index import SearchIndex
+
+logger = get_logger(__name__)
+
+PUT = 'put'
+DELETE = 'delete'
+
+
+def image_change(metadata):
+    """The delta recorded when an image is added, restored or edited."""
+    return {
+        'op': PUT,
+        'image_id': metadata.image_id,
+        'upload_date': metadata.upload_date,
+        'filename': metadata.filename,
+        'description': metadata.description,
+        'tags': metadata.tags
+    }
+
+
+def apply_change(index, change):
+    if change['op'] == DELETE:
+        index.remove(change['image_id'])
+    else:
+        index.add(
+            change['image_id'], change.get('upload_date'), change.get('filename'),
+            change.get('description'), change.get('tags')
+        )
+
+
+def load_index(data):
+    """Decode a segment; returns ``(index, folded delta keys)``."""
+    if data is None:
+        return SearchIndex(), set()
+    index, extra = SearchIndex.decode(data)
+    return index, set(extra.get('folded', ()))
+
+
+class _CachedIndex:
+    __slots__ = ('index', 'etag', 'applied', 'checked_at')
+
+    def __init__(self, index, etag, applied):
+        self.index = index
+        self.etag = etag
+        self.applied = applied
+        self.checked_at = None
+
+
+class SearchService:
+    """Maintain and query per-user search indexes."""
+
+    def __init__(self, search_repo=None, settings=None, clock=time.monotonic):
+        settings = settings or Config.get_search_settings()
+        self.enabled = settings['enabled']
+        self.cache_users = settings['cache_users']
+        self.refresh_seconds = settings['refresh_seconds']
+        self.search_repo = search_repo or (SearchRepository() if self.enabled else None)
+        self.clock = clock
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index_image(self, metadata):
+        """Record that an image was added or changed."""
+        self._record(metadata.user_id, image_change(metadata))
+
+    def remove_image(self, user_id, image_id):
+        """Record that an image was deleted."""
+        self._record(user_id, {'op': DELETE, 'image_id': image_id})
+
+    def _record(self, user_id, change):
+        """Best effort: a failed delta only delays the image until the next rebuild."""
+        if not self.enabled:
+            return
+        try:
+            key = self.search_repo.put_delta(user_id, change)
+        except StorageError:
+            logger.error("Search index update failed", user_id=user_id, image_id=change['image_id'])
+            return
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None:
+                apply_change(cached.index, change)
+                cached.applied.add(key)
+
+    def search(self, user_id, query, limit=20):
+        """Return ranked ``(image_id, score)`` pairs from the user's index."""
+        with self._lock:
+            cached = self._load(user_id)
+            return cached.index.search(query, limit)
+
+    def _load(self, user_id):
+        """Return the user's cached index, loading or refreshing it when due."""
+        cached = self._cache.get(user_id)
+        now = self.clock()
+        if cached is not None and now - cached.checked_at < self.refresh_seconds:
+            self._cache.move_to_end(user_id)
+            return cached
+
+        etag, deltas = self.search_repo.list_user(user_id)
+        if cached is None or cached.etag != etag:
+            data, etag = self.search_repo.get_segment(user_id) if etag else (None, None)
+            index, folded = load_index(data)
+            cached = _CachedIndex(index, etag, folded)
+
+        pending = [key for key in deltas if key not in cached.applied]
+        for key, change in zip(pending, self._get_deltas(pending)):
+            if change is not None:
+                apply_change(cached.index, change)
+        # Keys no longer listed were compacted away and cannot come back
+        cached.applied = set(deltas)
+        cached.checked_at = now
+
+        self._cache[user_id] = cached
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_users:
+            self._cache.popitem(last=False)
+        logger.info("Search index loaded", user_id=user_id, documents=len(cached.index), deltas=len(pending))
+        return cached
+
+    def _get_deltas(self, keys, workers=8):
+        if len(keys) <= 1:
+            return [self.search_repo.get_delta(key) for key in keys]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(resilience.bind_invocation(self.search_repo.get_delta), keys))
+
+    def compact(self, user_id=None):
+        """Fold pending deltas into each user's segment and delete them."""
+        users = [user_id] if user_id else list(self.search_repo.list_users())
+        compacted = folded_total = 0
+        for uid in users:
+            _, deltas = self.search_repo.list_user(uid)
+            if not deltas:
+                continue
+            data, _ = self.search_repo.get_segment(uid)
+            index, folded = load_index(data)
+            pending = [key for key in deltas if key not in folded]
+            for change in self._get_deltas(pending):
+                if change is not None:
+                    apply_change(index, change)
+            # Keys stay listed as folded until their delete succeeds
+            self.search_repo.put_segment(uid, index.encode({'folded': deltas}))
+            failed = self.search_repo.delete_deltas(deltas)
+            compacted += 1
+            folded_total += len(deltas) - len(failed)
+        logger.info("Search index compacted", users=compacted, deltas=folded_total)
+        return {'users': compacted, 'deltas': folded_total}
+
+    def rebuild(self, images, user_id=None):
+        """
+        Replace segments with indexes built from ``images`` (ImageMetadata).
+
+        Deltas listed before the scan are covered by it and are deleted;
+        later ones stay pending on top of the new segment.
+        """
+        users = [user_id] if user_id else list(self.search_repo.list_users())
+        pending = {uid: self.search_repo.list_user(uid)[1] for uid in users}
+
+        indexes = {}
+        for metadata in images:
+            if user_id and metadata.user_id != user_id:
+                continue
+            index = indexes.get(metadata.user_id)
+            if index is None:
+                index = indexes[metadata.user_id] = SearchIndex()
+            apply_change(index, image_change(metadata))
+
+        documents = 0
+        for uid in set(indexes) | set(pending):
+            index = indexes.get(uid) or SearchIndex()
+            deltas = pending.get(uid, [])
+            self.search_repo.put_segment(uid, index.encode({'folded': deltas}))
+            if deltas:
+                self.search_repo.delete_deltas(deltas)
+            documents += len(index)
+        logger.info("Search index rebuilt", users=len(indexes), documents=documents)
+        return {'users': len(indexes), 'documents': documents}
@@ -8,6 +8,14 @@ import unittest
 from unittest.mock import Mock
 from typing import Dict, Any
 
+import boto3
+from moto import mock_dynamodb, mock_s3
+
+from src.common import resilience
+from src.repositories.metadata_repository import table_definition
+from src.repositories.usage_repository import usage_table_definition
+from src.repositories.idempotency_repository import idempotency_table_definition
+
 
 class BaseTestCase(unittest.TestCase):
     """Base test class with common setup for all tests."""
@@ -76,3 +84,52 @@ class BaseTestCase(unittest.TestCase):
         self.assertEqual(status_code, expected_status)
         self.assertIn('error', body)
         return body
+
+
+
+class AWSTestCase(BaseTestCase):
+    """Base test class backed by moto S3 and DynamoDB with a live ImageService."""
+    
+    def setUp(self):
+        """Start AWS mocks, create resources and build the service."""
+        super().setUp()
+        os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+        os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+        
+        self.mocks = [mock_s3(), mock_dynamodb()]
+        for mock in self.mocks:
+            mock.start()
+        
+        self.s3_client = boto3.client('s3', region_name='us-east-1')
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.s3_client.create_bucket(Bucket=os.environ['BUCKET_NAME'])
+        self.dynamodb.create_table(**table_definition())
+        self.dynamodb.create_table(**usage_table_definition())
+        self.dynamodb.create_table(**idempotency_table_definition())
+        resilience.reset()
+        self.service = self.create_service()
+    
+    def tearDown(self):
+        """Stop AWS mocks."""
+        for mock in reversed(self.mocks):
+            mock.stop()
+        super().tearDown()
+    
+    def create_service(self):
+        """Build an ImageService wired to the mocked resources."""
+        from src.services.image_service import ImageService
+        from src.repositories.storage_repository import StorageRepository
+        from src.repositories.metadata_repository import MetadataRepository
+        from src.repositories.usage_repository import UsageRepository
+        from src.repositories.idempotency_repository import IdempotencyRepository
+        
+        return ImageService(
+            storage_repo=StorageRepository(self.s3_client),
+            metadata_repo=MetadataRepository(self.dynamodb),
+            usage_repo=UsageRepository(self.dynamodb),
+            idempotency_repo=IdempotencyRepository(self.dynamodb)
+        )
+    
+    def upload(self, user_id='user123', filename='test.png', **kwargs):
+        """Upload a test image and return the service result."""
+        return self.service.upload_image(user_id, filename, self.valid_image_data, **kwargs)
@@ -0,0 +1,157 @@
+"""Tests for admission control and load shedding."""
+import unittest
+from unittest.mock import patch
+
+from benchmarks.faults import FaultInjector
+from src.common.admission import READ, WRITE, AdmissionController
+from src.common.errors import ServiceUnavailableError, TooManyRequestsError
+from src.handlers.image_handler import lambda_handler
+from tests.base_test import AWSTestCase
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_settings(**overrides):
+    settings = {
+        'max_inflight_bytes': 0,
+        'window_seconds': 10,
+        'min_samples': 4,
+        'write_error_rate': 0.25,
+        'read_error_rate': 0.75,
+        'write_latency_ms': 0,
+        'read_latency_ms': 0,
+        'retry_after': 2
+    }
+    settings.update(overrides)
+    return settings
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for the admission controller."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def record(self, controller, failures, successes):
+        for failed in [True] * failures + [False] * successes:
+            controller.health.record(failed, 0.01)
+
+    def test_writes_are_shed_before_reads(self):
+        """Test that a moderate error rate sheds writes but not reads."""
+        controller = AdmissionController(make_settings(), self.clock)
+        self.record(controller, failures=2, successes=2)
+
+        with self.assertRaises(ServiceUnavailableError) as ctx:
+            controller.admit(WRITE)
+        self.assertGreaterEqual(ctx.exception.retry_after, 2)
+        controller.admit(READ)
+
+        self.record(controller, failures=8, successes=0)
+        with self.assertRaises(ServiceUnavailableError):
+            controller.admit(READ)
+
+    def test_recovers_when_window_expires(self):
+        """Test that shedding stops once bad samples age out."""
+        controller = AdmissionController(make_settings(), self.clock)
+        self.record(controller, failures=4, successes=0)
+        with self.assertRaises(ServiceUnavailableError):
+            controller.admit(WRITE)
+
+        self.clock.now += 11
+        controller.admit(WRITE)
+
+    def test_latency_threshold(self):
+        """Test shedding on p90 latency."""
+        controller = AdmissionController(make_settings(write_latency_ms=500), self.clock)
+        for _ in range(4):
+            ticket = controller.admit(READ)
+            self.clock.now += 1.0
+            controller.release(ticket)
+
+        with self.assertRaises(ServiceUnavailableError):
+            controller.admit(WRITE)
+        controller.admit(READ)
+
+    def test_slow_uploads_do_not_shed_reads(self):
+        """Test that only read latency counts towards the p90."""
+        controller = AdmissionController(make_settings(write_latency_ms=500, read_latency_ms=1000), self.clock)
+        for _ in range(6):
+            ticket = controller.admit(WRITE)
+            self.clock.now += 1.2
+            controller.release(ticket)
+        ticket = controller.admit(READ)
+        self.clock.now += 0.1
+        controller.release(ticket)
+
+        controller.admit(READ)
+        controller.admit(WRITE)
+
+    def test_inflight_bytes_budget(self):
+        """Test 429 when concurrent uploads exceed the byte budget."""
+        controller = AdmissionController(make_settings(max_inflight_bytes=100), self.clock)
+        first = controller.admit(WRITE, 80)
+        with self.assertRaises(TooManyRequestsError):
+            controller.admit(WRITE, 30)
+        controller.admit(READ)
+
+        controller.release(first)
+        self.assertEqual(controller.inflight_bytes, 0)
+        controller.admit(WRITE, 30)
+
+
+class TestHandlerLoadShedding(AWSTestCase):
+    """Test cases for shedding through the handler with injected DynamoDB faults."""
+
+    def test_upload_storm_with_failing_database_protects_reads(self):
+        """Test 503 + Retry-After for uploads while reads are still served."""
+        image_id = self.upload()['image_id']
+        controller = AdmissionController(make_settings(min_samples=5))
+        upload_event = self.create_api_event(method='POST', body={
+            'user_id': 'user123', 'filename': 'a.png', 'image_data': self.valid_image_data
+        })
+        get_event = self.create_api_event(path_params={'image_id': image_id})
+
+        injector = FaultInjector(error_rate=1.0, operations={'UpdateItem'})
+        injector.attach(self.dynamodb.meta.client)
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch('src.handlers.image_handler.admission', controller):
+            statuses = [lambda_handler(event, self.mock_context)['statusCode']
+                        for event in (upload_event, get_event, upload_event, get_event, get_event)]
+            shed = lambda_handler(upload_event, self.mock_context)
+            read = lambda_handler(get_event, self.mock_context)
+        injector.detach()
+
+        self.assertEqual(statuses, [503, 200, 503, 200, 200])
+        self.assertEqual(shed['statusCode'], 503)
+        self.assertIn('Retry-After', shed['headers'])
+        self.assertEqual(read['statusCode'], 200)
+
+    def test_not_implemented_routes_do_not_shed_traffic(self):
+        """Test that 501s from a disabled search index are not counted as failures."""
+        controller = AdmissionController(make_settings(min_samples=2))
+        search_event = self.create_api_event(query_params={'user_id': 'user123', 'q': 'cat'})
+        search_event['resource'] = '/images/search'
+        upload_event = self.create_api_event(method='POST', body={
+            'user_id': 'user123', 'filename': 'a.png', 'image_data': self.valid_image_data
+        })
+
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch('src.handlers.image_handler.admission', controller):
+            statuses = [lambda_handler(search_event, self.mock_context)['statusCode'] for _ in range(5)]
+            upload = lambda_handler(upload_event, self.mock_context)
+
+        self.assertEqual(statuses, [501] * 5)
+        self.assertEqual(controller.health.snapshot()[1], 0)
+        self.assertEqual(upload['statusCode'], 201)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+"""Tests for the repository interfaces and the local filesystem / SQLite backends."""
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from src.common.errors import NotFoundError, QuotaExceededError, StorageError
+from src.models.image_model import ImageMetadata
+from src.repositories.backends import (
+    create_idempotency_repository, create_metadata_repository, create_storage_repository, create_usage_repository
+)
+from src.repositories.base import BaseMetadataRepository, BaseStorageRepository
+from src.repositories.local_storage_repository import TEMP_PREFIX, LocalStorageRepository
+from src.repositories.metadata_repository import MetadataRepository
+from src.repositories.sqlite_repository import (
+    SqliteIdempotencyRepository, SqliteMetadataRepository, SqliteUsageRepository
+)
+from src.repositories.storage_repository import StorageRepository
+from tests.base_test import AWSTestCase, BaseTestCase
+from tests.test_projection import TestProjection
+from tests.test_recent_feed import TestRecentFeed
+from tests.test_usage_quota import TestUsageQuota
+
+
+class LocalBackendMixin:
+    """Build the service on a temporary directory and SQLite database instead of moto."""
+
+    def create_service(self):
+        from src.services.image_service import ImageService
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        database = os.path.join(data_dir.name, 'metadata.db')
+        return ImageService(
+            storage_repo=LocalStorageRepository(os.path.join(data_dir.name, 'objects')),
+            metadata_repo=SqliteMetadataRepository(database),
+            usage_repo=SqliteUsageRepository(database),
+            idempotency_repo=SqliteIdempotencyRepository(database)
+        )
+
+
+class TestLocalProjection(LocalBackendMixin, TestProjection):
+    """The projection tests against the local backends."""
+
+
+class TestLocalRecentFeed(LocalBackendMixin, TestRecentFeed):
+    """The recent-feed tests against the local backends."""
+
+
+class TestLocalUsageQuota(LocalBackendMixin, TestUsageQuota):
+    """The quota tests against the local backends."""
+
+
+class StorageContract:
+    """Behavior every ``BaseStorageRepository`` must have."""
+
+    def test_upload_read_and_ranged_read(self):
+        """Test that objects round-trip, ranged reads return a prefix and missing keys give None."""
+        self.storage.upload_image('images/u1/a.png', b'0123456789', 'image/png', {'user_id': 'u1'})
+        self.assertIsInstance(self.storage, BaseStorageRepository)
+        self.assertEqual(self.storage.get_image_bytes('images/u1/a.png'), b'0123456789')
+        self.assertEqual(self.storage.read_image('images/u1/a.png', 4), b'0123')
+        self.assertTrue(self.storage.check_image_exists('images/u1/a.png'))
+        self.assertFalse(self.storage.check_image_exists('images/u1/missing.png'))
+        self.assertIsNone(self.storage.read_image('images/u1/missing.png'))
+        with self.assertRaises(StorageError):
+            self.storage.get_image_bytes('images/u1/missing.png')
+
+    def test_list_copy_and_delete(self):
+        """Test listing by prefix, copying and single and batch deletes."""
+        for key in ('images/u1/a.png', 'images/u1/b.png', 'images/u2/c.png', 'ab12/images/u1/d.png'):
+            self.storage.upload_image(key, key.encode(), 'image/png', {})
+        self.assertEqual(self.storage.list_keys('images/u1/'), ['images/u1/a.png', 'images/u1/b.png'])
+        self.assertEqual(len(self.storage.list_keys('')), 4)
+
+        self.storage.copy_image('images/u1/a.png', 'cd34/images/u1/a.png')
+        self.assertEqual(self.storage.get_image_bytes('cd34/images/u1/a.png'), b'images/u1/a.png')
+
+        self.storage.delete_image('images/u1/a.png')
+        self.storage.delete_image('images/u1/a.png')
+        self.assertEqual(self.storage.delete_images(['images/u1/b.png', 'images/u2/c.png']), set())
+        self.assertEqual(sorted(self.storage.list_keys('')), ['ab12/images/u1/d.png', 'cd34/images/u1/a.png'])
+
+    def test_download_url(self):
+        """Test that download URLs name the key and ask for an attachment."""
+        url = self.storage.generate_presigned_url('images/u1/a.png', download=True, filename='a.png')
+        self.assertIn('response-content-disposition', url)
+
+
+class TestS3Storage(StorageContract, AWSTestCase):
+    """Storage contract against S3 (moto)."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = StorageRepository(self.s3_client)
+
+
+class TestLocalStorage(StorageContract, BaseTestCase):
+    """Storage contract against the local filesystem."""
+
+    def setUp(self):
+        super().setUp()
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        self.root = Path(data_dir.name)
+        self.storage = LocalStorageRepository(self.root, base_url='https://files.example.com/')
+
+    def test_keys_cannot_escape_the_root(self):
+        """Test that keys resolving outside the root are rejected."""
+        for key in ('../outside.png', 'images/../../outside.png', '/etc/passwd'):
+            with self.assertRaises(StorageError):
+                self.storage.upload_image(key, b'x', 'image/png', {})
+        self.assertFalse((self.root.parent / 'outside.png').exists())
+
+    def test_failed_write_leaves_no_partial_object(self):
+        """Test that a write failing before the rename leaves neither the object nor its temporary file."""
+        self.storage.upload_image('images/u1/a.png', b'old', 'image/png', {})
+        with patch('src.repositories.local_storage_repository.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(StorageError):
+                self.storage.upload_image('images/u1/a.png', b'new', 'image/png', {})
+        self.assertEqual(self.storage.get_image_bytes('images/u1/a.png'), b'old')
+        names = os.listdir(self.root / 'images' / 'u1')
+        self.assertEqual(names, ['a.png'])
+        self.assertFalse(any(name.startswith(TEMP_PREFIX) for name in names))
+
+    def test_empty_object_and_plain_urls(self):
+        """Test that empty objects read as empty bytes and URLs are the base URL plus the quoted key."""
+        self.storage.upload_image('images/u1/empty.png', b'', 'image/png', {})
+        self.assertEqual(self.storage.read_image('images/u1/empty.png'), b'')
+        self.assertEqual(self.storage.get_object_url('images/u1/a b.png'),
+                         'https://files.example.com/images/u1/a%20b.png')
+        self.assertFalse(self.storage.signed_cookies_enabled)
+        with self.assertRaises(NotImplementedError):
+            self.storage.generate_user_cookies('u1')
+
+
+def image(image_id, user_id='u1', upload_date='2024-05-01T10:00:00', tags=None):
+    return ImageMetadata(
+        image_id=image_id, user_id=user_id, filename=f'{image_id}.png', s3_key=f'images/{user_id}/{image_id}.png',
+        content_type='image/png', size=100, upload_date=upload_date, tags=tags, width=10, height=20
+    )
+
+
+class MetadataContract:
+    """Behavior every ``BaseMetadataRepository`` must have."""
+
+    def test_save_get_and_project(self):
+        """Test that metadata round-trips and projections return only the requested fields."""
+        self.metadata.save_metadata(image('a', tags=['cat', 'pet']))
+        self.assertIsInstance(self.metadata, BaseMetadataRepository)
+        stored = self.metadata.get_metadata('a')
+        self.assertEqual((stored.user_id, stored.size, stored.width, stored.tags), ('u1', 100, 10, ['cat', 'pet']))
+        projected = self.metadata.get_metadata('a', fields=['image_id', 'size'])
+        self.assertEqual((projected.image_id, projected.size, projected.filename), ('a', 100, None))
+        with self.assertRaises(NotFoundError):
+            self.metadata.get_metadata('missing')
+
+    def test_list_filters_and_pages(self):
+        """Test user and tag filters and resuming from the returned key."""
+        for index in range(5):
+            self.metadata.save_metadata(image(f'img{index}', tags=['even'] if index % 2 == 0 else ['odd']))
+        self.metadata.save_metadata(image('other', user_id='u2'))
+
+        seen, key = [], None
+        while True:
+            page, key = self.metadata.list_metadata(user_id='u1', limit=2, last_evaluated_key=key)
+            seen += [item.image_id for item in page]
+            if not key:
+                break
+        self.assertEqual(sorted(seen), [f'img{index}' for index in range(5)])
+
+        tagged, _ = self.metadata.list_metadata(tags=['even'], limit=50)
+        self.assertEqual(sorted(item.image_id for item in tagged), ['img0', 'img2', 'img4'])
+        self.assertEqual(len(list(self.metadata.iter_metadata())), 6)
+
+    def test_soft_delete_restore_and_purge(self):
+        """Test tombstones: hidden from reads, restorable in the window, purgeable after it."""
+        self.metadata.save_metadata(image('a'))
+        self.metadata.save_metadata(image('b'))
+        self.metadata.mark_deleted('a', '2024-05-01T10:00:00', '2024-05-08T10:00:00')
+        self.metadata.mark_deleted('b', '2024-05-01T10:00:00', '2024-05-08T10:00:00')
+        with self.assertRaises(NotFoundError):
+            self.metadata.get_metadata('a')
+        with self.assertRaises(NotFoundError):
+            self.metadata.mark_deleted('a', '2024-05-01T11:00:00', '2024-05-08T11:00:00')
+        self.assertEqual(self.metadata.list_metadata(limit=10)[0], [])
+
+        metadata, purge_after = self.metadata.get_deleted('a', '2024-05-02T00:00:00')
+        self.metadata.restore(metadata, purge_after, '2024-05-02T00:00:00')
+        self.assertEqual(self.metadata.get_metadata('a').image_id, 'a')
+        with self.assertRaises(NotFoundError):
+            self.metadata.get_deleted('b', '2024-05-09T00:00:00')
+
+        self.assertEqual(list(self.metadata.iter_purgeable('2024-05-02T00:00:00')), [])
+        purgeable = [item.image_id for page in self.metadata.iter_purgeable('2024-05-09T00:00:00') for item in page]
+        self.assertEqual(purgeable, ['b'])
+        self.assertEqual(self.metadata.delete_many(['b']), [])
+        self.assertEqual(list(self.metadata.iter_purgeable('2024-05-09T00:00:00')), [])
+
+    def test_get_many_and_list_recent(self):
+        """Test batch reads skip missing images and the feed pages newest first."""
+        for day in (1, 2, 3):
+            self.metadata.save_metadata(image(f'd{day}', upload_date=f'2024-05-0{day}T10:00:00'))
+        found = self.metadata.get_many(['d1', 'd3', 'missing'], fields=['image_id'])
+        self.assertEqual(sorted(found), ['d1', 'd3'])
+
+        now = datetime(2024, 5, 4, 9, 0)
+        first, cursor = self.metadata.list_recent(limit=2, now=now)
+        second, last = self.metadata.list_recent(limit=2, cursor=cursor, now=now)
+        self.assertEqual([item.image_id for item in first + second], ['d3', 'd2', 'd1'])
+        self.assertIn('feed_sk', cursor)
+        self.assertIsNone(last)
+
+    def test_conditional_updates(self):
+        """Test that key and enrichment updates only apply to a live image at the expected key."""
+        self.metadata.save_metadata(image('a'))
+        self.assertTrue(self.metadata.update_s3_key('a', 'images/u1/a.png', 'ab12/images/u1/a.png'))
+        self.assertFalse(self.metadata.update_s3_key('a', 'images/u1/a.png', 'cd34/images/u1/a.png'))
+        self.assertEqual(self.metadata.get_metadata('a').s3_key, 'ab12/images/u1/a.png')
+
+        self.assertTrue(self.metadata.update_enrichment('a', 'ab12/images/u1/a.png', {'checksum': 'abc', 'width': 64}))
+        self.assertFalse(self.metadata.update_enrichment('a', 'images/u1/a.png', {'checksum': 'stale'}))
+        stored = self.metadata.get_metadata('a')
+        self.assertEqual((stored.checksum, stored.width), ('abc', 64))
+        with self.assertRaises(NotFoundError):
+            self.metadata.update_enrichment('missing', 'images/u1/missing.png', {'checksum': 'x'})
+
+
+class TestDynamoDBMetadata(MetadataContract, AWSTestCase):
+    """Metadata contract against DynamoDB (moto)."""
+
+    def setUp(self):
+        super().setUp()
+        self.metadata = MetadataRepository(self.dynamodb)
+
+
+class TestSqliteMetadata(MetadataContract, BaseTestCase):
+    """Metadata contract against SQLite."""
+
+    def setUp(self):
+        super().setUp()
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        self.database = os.path.join(data_dir.name, 'db', 'metadata.db')
+        self.metadata = SqliteMetadataRepository(self.database)
+        self.addCleanup(self.metadata.close)
+
+    def test_usage_and_idempotency_share_the_database(self):
+        """Test quota reservations and idempotency claims on the same file."""
+        usage = SqliteUsageRepository(self.database)
+        idempotency = SqliteIdempotencyRepository(self.database)
+        self.addCleanup(usage.close)
+        self.addCleanup(idempotency.close)
+
+        usage.reserve('u1', 100, '2024-05-01T10:00:00', max_images=1)
+        with self.assertRaises(QuotaExceededError):
+            usage.reserve('u1', 100, '2024-05-01T11:00:00', max_images=1)
+        usage.release('u1', 100)
+        self.assertEqual(usage.get_usage('u1')['image_count'], 0)
+
+        self.assertIsNone(idempotency.claim('k1', 'fp', 60, 't1'))
+        self.assertEqual(idempotency.claim('k1', 'fp', 60, 't2')['fingerprint'], 'fp')
+        self.assertFalse(idempotency.complete('k1', 't2', {'image_id': 'b'}, 60))
+        self.assertTrue(idempotency.complete('k1', 't1', {'image_id': 'a'}, 60))
+        self.assertEqual(idempotency.get('k1')['response'], {'image_id': 'a'})
+
+    def test_claim_token_column_is_added_to_existing_databases(self):
+        """Test that a database created before claim tokens gains the column on open."""
+        database = os.path.join(os.path.dirname(self.database), 'old.db')
+        connection = sqlite3.connect(database)
+        connection.execute(
+            'CREATE TABLE idempotency (idempotency_key TEXT PRIMARY KEY, status TEXT NOT NULL, '
+            'fingerprint TEXT, response TEXT, expires_at INTEGER NOT NULL)'
+        )
+        connection.close()
+
+        idempotency = SqliteIdempotencyRepository(database)
+        self.addCleanup(idempotency.close)
+        self.assertIsNone(idempotency.claim('k1', 'fp', 60, 't1'))
+        self.assertTrue(idempotency.complete('k1', 't1', {'image_id': 'a'}, 60))
+
+
+class TestBackendSelection(BaseTestCase):
+    """Test cases for choosing backends by configuration."""
+
+    def test_local_backends_from_environment(self):
+        """Test that STORAGE_BACKEND and METADATA_BACKEND select the local implementations."""
+        with tempfile.TemporaryDirectory() as data_dir:
+            environment = {
+                'STORAGE_BACKEND': 'local', 'METADATA_BACKEND': 'sqlite',
+                'LOCAL_STORAGE_ROOT': os.path.join(data_dir, 'objects'),
+                'SQLITE_PATH': os.path.join(data_dir, 'metadata.db')
+            }
+            with patch.dict(os.environ, environment):
+                self.assertIsInstance(create_storage_repository(), LocalStorageRepository)
+                repositories = [create_metadata_repository(), create_usage_repository(), create_idempotency_repository()]
+                self.assertEqual([type(repo) for repo in repositories],
+                                 [SqliteMetadataRepository, SqliteUsageRepository, SqliteIdempotencyRepository])
+                for repo in repositories:
+                    repo.close()
+
+    def test_unknown_backend_is_rejected(self):
+        """Test that a misspelled backend fails loudly."""
+        with self.assertRaises(ValueError):
+            create_storage_repository('gcs')
+        with patch.dict(os.environ, {'METADATA_BACKEND': 'postgres'}):
+            with self.assertRaises(ValueError):
+                create_metadata_repository()
+
+
+if __name__ == '__main__':
+    unittest.main()
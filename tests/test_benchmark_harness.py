@@ -0,0 +1,41 @@
+"""Tests for the benchmark harness."""
+import unittest
+
+from benchmarks.harness import compare_reports, percentile, run_benchmark
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    """Test cases for benchmark statistics and baseline comparison."""
+
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_run_benchmark_collects_stats(self):
+        """Test that a benchmark run reports iterations and memory."""
+        result = run_benchmark('noop', lambda i: bytearray(1024), iterations=5, warmup=1)
+        report = result.to_dict()
+        self.assertEqual(report['iterations'], 5)
+        self.assertGreater(report['ops_per_sec'], 0)
+        self.assertGreaterEqual(report['peak_memory_bytes'], 1024)
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        """Test that only changes beyond the threshold are flagged."""
+        baseline = {'results': {'list': {'ops_per_sec': 100.0, 'p95_ms': 10.0}}}
+        current = {'results': {
+            'list': {'ops_per_sec': 95.0, 'p95_ms': 13.0},
+            'new_case': {'ops_per_sec': 1.0}
+        }}
+
+        regressions = compare_reports(baseline, current, threshold=0.10)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0]['metric'], 'p95_ms')
+        self.assertEqual(regressions[0]['change_pct'], 30.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""Tests for asynchronous metadata enrichment from S3 events."""
+import base64
+import hashlib
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from src.common.utils import parse_s3_key
+from src.handlers.enrichment_handler import lambda_handler
+from src.repositories.metadata_repository import MetadataRepository
+from src.repositories.storage_repository import StorageRepository
+from src.services.enrichment_service import EnrichmentService
+from src.services.image_enricher import Image, capture_date, enrich_image, image_dimensions
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+def make_image(size=(120, 80), image_format='PNG', color=(20, 90, 200), exif=None):
+    buffer = io.BytesIO()
+    options = {'exif': exif} if exif is not None else {}
+    Image.new('RGB', size, color).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def s3_record(key, bucket='test-bucket', event_name='ObjectCreated:Put'):
+    return {
+        'eventSource': 'aws:s3',
+        'eventName': event_name,
+        's3': {'bucket': {'name': bucket}, 'object': {'key': key}}
+    }
+
+
+def sqs_event(*bodies):
+    return {'Records': [
+        {
+            'eventSource': 'aws:sqs',
+            'messageId': f"m{index}",
+            'body': body if isinstance(body, str) else json.dumps({'Records': body})
+        }
+        for index, body in enumerate(bodies)
+    ]}
+
+
+class TestImageEnricher(BaseTestCase):
+    """Test cases for header parsing and computed attributes."""
+
+    def test_png_and_gif_dimensions_without_pillow(self):
+        """Test that PNG and GIF headers are parsed from their first bytes."""
+        png = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR' + (640).to_bytes(4, 'big') + (480).to_bytes(4, 'big')
+        self.assertEqual(image_dimensions(png), (640, 480))
+        self.assertEqual(image_dimensions(b'GIF89a' + b'\x20\x03\x58\x02'), (800, 600))
+        self.assertIsNone(image_dimensions(base64.b64decode(self.valid_image_data)))
+        self.assertIsNone(image_dimensions(b'not an image'))
+
+    @unittest.skipIf(Image is None, 'Pillow is not installed')
+    def test_jpeg_and_webp_dimensions(self):
+        """Test that SOF and VP8/VP8L/VP8X headers give the pixel size."""
+        self.assertEqual(image_dimensions(make_image((333, 111), 'JPEG')), (333, 111))
+        self.assertEqual(image_dimensions(make_image((51, 77), 'WEBP')), (51, 77))
+        buffer = io.BytesIO()
+        Image.new('RGBA', (90, 45), (0, 0, 0, 0)).save(buffer, 'WEBP', lossless=True)
+        self.assertEqual(image_dimensions(buffer.getvalue()), (90, 45))
+
+    @unittest.skipIf(Image is None, 'Pillow is not installed')
+    def test_capture_date_and_header_only_enrichment(self):
+        """Test that the EXIF date is read from the header and body enrichments need the full object."""
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = '2023:07:14 18:30:05'
+        data = make_image((64, 48), 'JPEG', exif=exif)
+        self.assertEqual(capture_date(data), '2023-07-14T18:30:05')
+        self.assertIsNone(capture_date(make_image()))
+
+        header = enrich_image(data[:4096], complete=False)
+        self.assertEqual(header, {'width': 64, 'height': 48, 'captured_at': '2023-07-14T18:30:05'})
+        full = enrich_image(make_image(color=(250, 10, 10)))
+        self.assertEqual(full['checksum'], hashlib.sha256(make_image(color=(250, 10, 10))).hexdigest())
+        self.assertEqual(full['dominant_color'], '#fa0a0a')
+
+    def test_parse_s3_key(self):
+        """Test that image keys of both layouts are recognized and other objects are not."""
+        self.assertEqual(parse_s3_key('images/u1/abc.png'), ('u1', 'abc'))
+        self.assertEqual(parse_s3_key('0f3a/images/u1/abc.png'), ('u1', 'abc'))
+        self.assertIsNone(parse_s3_key('derivatives/0f3a/abc/w256-h0-contain.png'))
+        self.assertIsNone(parse_s3_key('search/u1/segment'))
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestEnrichmentHandler(AWSTestCase):
+    """Test cases for the S3/SQS-driven enrichment Lambda against moto."""
+
+    def setUp(self):
+        super().setUp()
+        self.enricher = self.create_enricher()
+        self.patcher = patch('src.handlers.enrichment_handler.service', self.enricher)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super().tearDown()
+
+    def create_enricher(self, **settings):
+        settings = {'enrichments': ('dimensions', 'captured_at', 'checksum', 'dominant_color'),
+                    'header_bytes': 65536, 'workers': 4, **settings}
+        return EnrichmentService(
+            StorageRepository(self.s3_client),
+            MetadataRepository(self.dynamodb),
+            settings=settings
+        )
+
+    def upload_image(self, data, width=None, height=None):
+        image_data = base64.b64encode(data).decode('utf-8')
+        result = self.service.upload_image('user123', 'photo.png', image_data, width=width, height=height)
+        return {**result, 's3_key': self.stored(result['image_id'])['s3_key']}
+
+    def stored(self, image_id):
+        return self.dynamodb.Table('test-table').get_item(Key={'image_id': image_id})['Item']
+
+    def test_batch_enriches_images_and_reports_no_failures(self):
+        """Test that every object in a batch gets real dimensions, checksum and color."""
+        data = make_image((120, 80))
+        uploads = [self.upload_image(data, width=1, height=1) for _ in range(3)]
+        self.assertNotIn('checksum', self.stored(uploads[0]['image_id']))
+
+        event = sqs_event([s3_record(uploads[0]['s3_key']), s3_record(uploads[1]['s3_key'])],
+                          [s3_record(uploads[2]['s3_key'])])
+        self.assertEqual(lambda_handler(event, self.mock_context), {'batchItemFailures': []})
+
+        for upload in uploads:
+            item = self.stored(upload['image_id'])
+            self.assertEqual((item['width'], item['height']), (120, 80))
+            self.assertEqual(item['checksum'], hashlib.sha256(data).hexdigest())
+            self.assertEqual(item['dominant_color'], '#145ac8')
+            self.assertIn('enriched_at', item)
+        metadata = self.service.get_image(uploads[0]['image_id'])['metadata']
+        self.assertEqual(metadata['checksum'], hashlib.sha256(data).hexdigest())
+
+    def test_header_enrichments_use_a_ranged_get(self):
+        """Test that only the configured header bytes are fetched when no body enrichment is on."""
+        enricher = self.create_enricher(enrichments=('dimensions',), header_bytes=32)
+        upload = self.upload_image(make_image((30, 20)))
+        with patch.object(enricher.storage_repo, 'read_image', wraps=enricher.storage_repo.read_image) as read:
+            enricher.enrich(upload['s3_key'])
+        read.assert_called_once_with(upload['s3_key'], 32)
+        item = self.stored(upload['image_id'])
+        self.assertEqual((item['width'], item['height']), (30, 20))
+        self.assertNotIn('checksum', item)
+
+    def test_missing_metadata_fails_only_its_message(self):
+        """Test that an object whose metadata is not written yet is retried via batchItemFailures."""
+        upload = self.upload_image(make_image())
+        self.s3_client.put_object(Bucket='test-bucket', Key='images/user123/pending.png', Body=make_image())
+
+        event = sqs_event([s3_record(upload['s3_key'])], [s3_record('images/user123/pending.png')])
+        result = lambda_handler(event, self.mock_context)
+        self.assertEqual(result, {'batchItemFailures': [{'itemIdentifier': 'm1'}]})
+        self.assertIn('checksum', self.stored(upload['image_id']))
+
+    def test_unreadable_messages_are_acknowledged(self):
+        """Test that messages that can never be parsed are not redelivered."""
+        upload = self.upload_image(make_image())
+        missing_s3 = json.dumps({'Records': [{'eventName': 'ObjectCreated:Put'}]})
+        event = sqs_event('not json', [s3_record(upload['s3_key'])], missing_s3)
+        self.assertEqual(lambda_handler(event, self.mock_context), {'batchItemFailures': []})
+        self.assertIn('checksum', self.stored(upload['image_id']))
+
+    def test_irrelevant_and_stale_objects_are_skipped(self):
+        """Test that derivatives, other buckets, test events and deleted images are not failures."""
+        deleted = self.upload_image(make_image())
+        self.service.delete_image(deleted['image_id'])
+        event = sqs_event(
+            [s3_record(deleted['s3_key'])],
+            [s3_record('derivatives/abcd/x/w256-h0-contain.png'), s3_record('images/u/x.png', bucket='other')],
+            [s3_record('images/user123/gone.png')],
+            json.dumps({'Event': 's3:TestEvent'})
+        )
+        self.assertEqual(lambda_handler(event, self.mock_context), {'batchItemFailures': []})
+        self.assertNotIn('checksum', self.stored(deleted['image_id']))
+
+    def test_direct_s3_invocation_raises_on_failure(self):
+        """Test that without SQS a failed object fails the invocation so Lambda retries it."""
+        upload = self.upload_image(make_image())
+        self.assertEqual(lambda_handler({'Records': [s3_record(upload['s3_key'])]}, self.mock_context),
+                         {'batchItemFailures': []})
+        self.s3_client.put_object(Bucket='test-bucket', Key='images/user123/pending.png', Body=make_image())
+        with self.assertRaises(Exception):
+            lambda_handler({'Records': [s3_record('images/user123/pending.png')]}, self.mock_context)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+"""Tests for ephemeral images expiring through DynamoDB TTL and S3 lifecycle tags."""
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from boto3.dynamodb.types import TypeSerializer
+
+from src.common.errors import DatabaseError, NotFoundError, ValidationError
+from src.common.utils import get_expiry_tags, parse_expiry
+from src.handlers import expiry_handler
+from src.handlers.image_handler import lambda_handler
+from src.repositories.local_storage_repository import LocalStorageRepository
+from src.repositories.sqlite_repository import (
+    SqliteIdempotencyRepository, SqliteMetadataRepository, SqliteUsageRepository
+)
+from src.services.image_service import request_fingerprint
+from tests.base_test import AWSTestCase, BaseTestCase
+
+NOW = 1_700_000_000
+
+
+class TestExpiryParsing(BaseTestCase):
+    """Test cases for resolving upload expiry and choosing lifecycle classes."""
+
+    def test_ttl_and_expires_at_forms(self):
+        """Test that TTLs, epoch seconds and ISO timestamps all resolve to epoch seconds."""
+        self.assertIsNone(parse_expiry(now=NOW))
+        self.assertEqual(parse_expiry(ttl_seconds=3600, now=NOW), NOW + 3600)
+        self.assertEqual(parse_expiry(expires_at=NOW + 60, now=NOW), NOW + 60)
+        iso = datetime.utcfromtimestamp(NOW + 90).isoformat()
+        self.assertEqual(parse_expiry(expires_at=iso, now=NOW), NOW + 90)
+        self.assertEqual(parse_expiry(expires_at=iso + '+01:00', now=NOW - 3600), NOW - 3600 + 90)
+
+    def test_invalid_expiry_is_rejected(self):
+        """Test both-given, past, too distant and malformed expiries."""
+        invalid = [
+            {'ttl_seconds': 60, 'expires_at': NOW + 60},
+            {'ttl_seconds': 0},
+            {'ttl_seconds': '60'},
+            {'ttl_seconds': True},
+            {'expires_at': NOW - 1},
+            {'expires_at': 'tomorrow'},
+            {'expires_at': 12.5},
+            {'ttl_seconds': 86400 * 2}
+        ]
+        for kwargs in invalid:
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValidationError):
+                parse_expiry(max_seconds=86400, now=NOW, **kwargs)
+
+    def test_shortest_class_covering_the_ttl(self):
+        """Test that objects are tagged with the shortest lifecycle class that outlives the item."""
+        classes = (1, 7, 30)
+        self.assertIsNone(get_expiry_tags(None, classes, 'expiry-class', now=NOW))
+        self.assertEqual(get_expiry_tags(NOW + 3600, classes, 'expiry-class', now=NOW), {'expiry-class': '1d'})
+        self.assertEqual(get_expiry_tags(NOW + 86400, classes, 'expiry-class', now=NOW), {'expiry-class': '1d'})
+        self.assertEqual(get_expiry_tags(NOW + 86401, classes, 'expiry-class', now=NOW), {'expiry-class': '7d'})
+        self.assertIsNone(get_expiry_tags(NOW + 60, (), 'expiry-class', now=NOW))
+        with self.assertRaises(ValidationError):
+            get_expiry_tags(NOW + 31 * 86400, classes, 'expiry-class', now=NOW)
+
+    def test_fingerprint_covers_expiry(self):
+        """Test that reusing an Idempotency-Key with another TTL is a different request."""
+        parts = ('u1', 'a.png', 'data', None, None, None, None)
+        self.assertEqual(request_fingerprint(*parts), request_fingerprint(*parts, expiry=None))
+        self.assertNotEqual(request_fingerprint(*parts, expiry=(60, None)), request_fingerprint(*parts, expiry=(120, None)))
+
+
+class TestEphemeralImages(AWSTestCase):
+    """Test cases for uploading, hiding and cleaning up ephemeral images against moto."""
+
+    def expire(self, image_id):
+        """Move an image's expiry into the past, as if TTL had not reaped it yet."""
+        self.dynamodb.Table('test-table').update_item(
+            Key={'image_id': image_id}, UpdateExpression='SET expires_at = :past',
+            ExpressionAttributeValues={':past': int(time.time()) - 1}
+        )
+
+    def test_upload_writes_ttl_attribute_and_lifecycle_tag(self):
+        """Test that the item carries expires_at and the object the matching expiry class tag."""
+        before = int(time.time())
+        result = self.upload(ttl_seconds=3 * 86400)
+        item = self.dynamodb.Table('test-table').get_item(Key={'image_id': result['image_id']})['Item']
+        self.assertTrue(before + 3 * 86400 <= item['expires_at'] <= int(time.time()) + 3 * 86400)
+        self.assertEqual(result['metadata']['expires_at'], item['expires_at'])
+
+        tagging = self.s3_client.get_object_tagging(Bucket='test-bucket', Key=item['s3_key'])
+        self.assertEqual(tagging['TagSet'], [{'Key': 'expiry-class', 'Value': '7d'}])
+
+        permanent = self.upload()
+        self.assertIsNone(permanent['metadata']['expires_at'])
+        key = self.dynamodb.Table('test-table').get_item(Key={'image_id': permanent['image_id']})['Item']['s3_key']
+        self.assertEqual(self.s3_client.get_object_tagging(Bucket='test-bucket', Key=key)['TagSet'], [])
+
+    def test_expired_images_are_hidden_before_ttl_reaps_them(self):
+        """Test that get, list, recent, delete and recount skip expired items."""
+        kept = self.upload(ttl_seconds=3600)['image_id']
+        expired = self.upload(ttl_seconds=3600)['image_id']
+        self.expire(expired)
+
+        self.assertEqual(self.service.get_image(kept, include_urls=False)['image_id'], kept)
+        with self.assertRaises(NotFoundError):
+            self.service.get_image(expired)
+        with self.assertRaises(NotFoundError):
+            self.service.get_image(expired, fields='image_id,filename', include_urls=False)
+
+        listed = self.service.list_images(user_id='user123', include_urls=False)
+        self.assertEqual([image['image_id'] for image in listed['images']], [kept])
+        recent = self.service.list_images(sort='recent', fields='image_id', include_urls=False)
+        self.assertEqual([image['image_id'] for image in recent['images']], [kept])
+        self.assertEqual(list(self.service.metadata_repo.get_many([kept, expired])), [kept])
+
+        with self.assertRaises(NotFoundError):
+            self.service.delete_image(expired)
+        self.service.recount_usage('user123')
+        self.assertEqual(self.service.get_user_stats('user123')['image_count'], 1)
+
+    def test_deleted_ephemeral_image_cannot_be_restored_after_expiry(self):
+        """Test that the undelete window ends early when the image expires."""
+        image_id = self.upload(ttl_seconds=3600)['image_id']
+        self.service.delete_image(image_id)
+        self.expire(image_id)
+        with self.assertRaises(NotFoundError):
+            self.service.restore_image(image_id)
+
+    def test_handler_accepts_ttl_and_rejects_invalid_expiry(self):
+        """Test ttl_seconds / expires_at in the POST body."""
+        body = {'user_id': 'user123', 'filename': 'a.png', 'image_data': self.valid_image_data}
+        with patch('src.handlers.image_handler.service', self.service):
+            created = self.assertSuccess(lambda_handler(
+                self.create_api_event(method='POST', body={**body, 'ttl_seconds': 600}), self.mock_context
+            ), 201)
+            self.assertIsNotNone(created['metadata']['expires_at'])
+            self.assertError(lambda_handler(
+                self.create_api_event(method='POST', body={**body, 'ttl_seconds': 600, 'expires_at': 1}),
+                self.mock_context
+            ), 400)
+            self.assertError(lambda_handler(
+                self.create_api_event(method='POST', body={**body, 'ttl_seconds': 400 * 86400}), self.mock_context
+            ), 400)
+
+
+class TestExpiryStreamHandler(AWSTestCase):
+    """Test cases for releasing usage when DynamoDB TTL removes an image."""
+
+    def setUp(self):
+        super().setUp()
+        self.patcher = patch('src.handlers.expiry_handler.service', self.service)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        super().tearDown()
+
+    def stream_record(self, image_id, sequence_number, by_ttl=True):
+        """The stream record DynamoDB emits when the item of ``image_id`` is removed."""
+        table = self.dynamodb.Table('test-table')
+        item = table.get_item(Key={'image_id': image_id})['Item']
+        table.delete_item(Key={'image_id': image_id})
+        serializer = TypeSerializer()
+        record = {
+            'eventName': 'REMOVE',
+            'eventSource': 'aws:dynamodb',
+            'dynamodb': {
+                'Keys': {'image_id': {'S': image_id}},
+                'OldImage': {name: serializer.serialize(value) for name, value in item.items()},
+                'SequenceNumber': sequence_number
+            }
+        }
+        if by_ttl:
+            record['userIdentity'] = {'type': 'Service', 'principalId': 'dynamodb.amazonaws.com'}
+        return record
+
+    def usage(self):
+        usage = self.service.usage_repo.get_usage('user123')
+        return usage['image_count'], usage['total_bytes']
+
+    def test_ttl_removals_release_usage(self):
+        """Test that only TTL removals of live images are uncounted."""
+        expired = self.upload(ttl_seconds=3600)['image_id']
+        removed_by_api = self.upload(ttl_seconds=3600)['image_id']
+        deleted = self.upload(ttl_seconds=3600)['image_id']
+        self.service.delete_image(deleted)
+        kept = self.upload()['metadata']
+
+        event = {'Records': [
+            self.stream_record(expired, '1'),
+            self.stream_record(removed_by_api, '2', by_ttl=False),
+            self.stream_record(deleted, '3')
+        ]}
+        self.assertEqual(expiry_handler.lambda_handler(event, self.mock_context), {'batchItemFailures': []})
+        # The API-removed image is still counted here only because the test removed it behind the API's back
+        self.assertEqual(self.usage(), (2, 2 * kept['size']))
+
+    def test_failure_reports_the_record_and_leaves_the_rest(self):
+        """Test that a failed release is retried from its record without releasing later ones twice."""
+        first, second, third = (self.upload(ttl_seconds=3600)['image_id'] for _ in range(3))
+        event = {'Records': [self.stream_record(image_id, str(number))
+                             for number, image_id in enumerate((first, second, third), 1)]}
+        release = self.service.usage_repo.release
+        calls = []
+
+        def flaky_release(user_id, size):
+            calls.append(size)
+            if len(calls) == 2:
+                raise DatabaseError('throttled')
+            release(user_id, size)
+
+        with patch.object(self.service.usage_repo, 'release', side_effect=flaky_release):
+            result = expiry_handler.lambda_handler(event, self.mock_context)
+        self.assertEqual(result, {'batchItemFailures': [{'itemIdentifier': '2'}]})
+        self.assertEqual(self.usage()[0], 2)
+
+        expiry_handler.lambda_handler({'Records': event['Records'][1:]}, self.mock_context)
+        self.assertEqual(self.usage(), (0, 0))
+
+
+class TestLocalEphemeralImages(AWSTestCase):
+    """Test cases for expiry on the SQLite backend, which has no TTL reaper."""
+
+    def create_service(self):
+        from src.services.image_service import ImageService
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        database = os.path.join(data_dir.name, 'metadata.db')
+        self.storage = LocalStorageRepository(os.path.join(data_dir.name, 'objects'))
+        return ImageService(
+            storage_repo=self.storage,
+            metadata_repo=SqliteMetadataRepository(database),
+            usage_repo=SqliteUsageRepository(database),
+            idempotency_repo=SqliteIdempotencyRepository(database)
+        )
+
+    def test_expired_images_are_hidden_and_purged(self):
+        """Test that expired images disappear from reads and purge_deleted removes them."""
+        kept = self.upload(ttl_seconds=3600)
+        expired = self.upload(ttl_seconds=60)
+        later = time.time() + 120
+        with patch('src.repositories.sqlite_repository.time.time', return_value=later):
+            self.assertEqual([image['image_id'] for image in self.service.list_images(include_urls=False)['images']],
+                             [kept['image_id']])
+            with self.assertRaises(NotFoundError):
+                self.service.get_image(expired['image_id'])
+
+        now = (datetime.utcnow() + timedelta(seconds=120)).isoformat()
+        self.assertEqual(self.service.purge_deleted(now), {'purged': 1, 'failed': 0})
+        self.assertFalse(self.storage.check_image_exists(expired['metadata']['s3_key']))
+        self.assertTrue(self.storage.check_image_exists(kept['metadata']['s3_key']))
+        usage = self.service.usage_repo.get_usage('user123')
+        self.assertEqual((usage['image_count'], usage['total_bytes']), (1, kept['metadata']['size']))
+
+    def test_expired_tombstones_are_not_released_twice(self):
+        """Test that a deleted image that then expires waits for its undelete window and keeps usage intact."""
+        kept = self.upload()
+        deleted = self.upload(ttl_seconds=60)
+        self.service.delete_image(deleted['image_id'])
+
+        now = (datetime.utcnow() + timedelta(seconds=120)).isoformat()
+        self.assertEqual(self.service.purge_deleted(now), {'purged': 0, 'failed': 0})
+        usage = self.service.usage_repo.get_usage('user123')
+        self.assertEqual((usage['image_count'], usage['total_bytes']), (1, kept['metadata']['size']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+"""Tests for idempotent uploads."""
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import ConflictError, DatabaseError, StorageError
+from src.handlers.image_handler import lambda_handler
+from tests.base_test import AWSTestCase
+
+
+def serialize_dynamodb_writes(client):
+    """
+    Make moto's conditional writes atomic across threads.
+
+    DynamoDB evaluates a ConditionExpression and applies the write atomically;
+    moto does not lock between the two, so concurrent tests serialize the call.
+    """
+    lock = threading.Lock()
+
+    def before(model, **kwargs):
+        if model.name in ('PutItem', 'UpdateItem', 'DeleteItem'):
+            lock.acquire()
+
+    def after(model, **kwargs):
+        if model.name in ('PutItem', 'UpdateItem', 'DeleteItem'):
+            lock.release()
+
+    client.meta.events.register('before-call.dynamodb', before)
+    client.meta.events.register('after-call.dynamodb', after)
+    client.meta.events.register('after-call-error.dynamodb', after)
+
+
+class TestIdempotentUpload(AWSTestCase):
+    """Test cases for Idempotency-Key and content-hash deduplication."""
+
+    def tearDown(self):
+        os.environ.pop('IDEMPOTENCY_CONTENT_HASH', None)
+        os.environ.pop('IDEMPOTENCY_WAIT_SECONDS', None)
+        os.environ.pop('IDEMPOTENCY_LEASE_SECONDS', None)
+        super().tearDown()
+
+    def count_objects(self):
+        response = self.s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])
+        return response.get('KeyCount', 0)
+
+    def test_retry_returns_original_response_without_s3_write(self):
+        """Test that a retried key replays the first response."""
+        first = self.upload(idempotency_key='key-1')
+        with patch.object(self.service.storage_repo, 'upload_image') as s3_upload:
+            second = self.upload(idempotency_key='key-1')
+
+        s3_upload.assert_not_called()
+        self.assertEqual(second['image_id'], first['image_id'])
+        self.assertEqual(self.count_objects(), 1)
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 1)
+
+    def test_key_reused_with_different_payload_conflicts(self):
+        """Test that a key cannot be reused for a different request."""
+        self.upload(idempotency_key='key-1')
+        with self.assertRaises(ConflictError):
+            self.upload(filename='other.png', idempotency_key='key-1')
+
+    def test_failed_upload_releases_key(self):
+        """Test that a failed attempt can be retried with the same key."""
+        with patch.object(self.service.storage_repo, 'upload_image', side_effect=StorageError('boom')):
+            with self.assertRaises(StorageError):
+                self.upload(idempotency_key='key-1')
+
+        result = self.upload(idempotency_key='key-1')
+        self.assertEqual(self.count_objects(), 1)
+        self.assertEqual(self.service.get_image(result['image_id'])['image_id'], result['image_id'])
+
+    def test_content_hash_deduplication(self):
+        """Test deduplication without a header when content hashing is enabled."""
+        os.environ['IDEMPOTENCY_CONTENT_HASH'] = '1'
+        first = self.upload()
+        second = self.upload()
+        third = self.upload(filename='different.png')
+
+        self.assertEqual(first['image_id'], second['image_id'])
+        self.assertNotEqual(first['image_id'], third['image_id'])
+        self.assertEqual(self.count_objects(), 2)
+
+    def test_concurrent_duplicates_store_one_object(self):
+        """Test racing duplicates: one upload, the rest replay or get a 409."""
+        original_upload = self.service.storage_repo.upload_image
+        started = threading.Event()
+
+        def slow_upload(*args, **kwargs):
+            started.set()
+            threading.Event().wait(0.2)
+            return original_upload(*args, **kwargs)
+
+        results, conflicts = [], []
+        serialize_dynamodb_writes(self.dynamodb.meta.client)
+
+        def worker():
+            try:
+                results.append(self.upload(idempotency_key='race')['image_id'])
+            except ConflictError:
+                conflicts.append(True)
+
+        with patch.object(self.service.storage_repo, 'upload_image', side_effect=slow_upload):
+            threads = [threading.Thread(target=worker) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results) + len(conflicts), 5)
+        self.assertEqual(self.count_objects(), 1)
+
+    def test_in_flight_duplicate_gets_conflict_after_wait(self):
+        """Test 409 when the original is still running after the wait window."""
+        os.environ['IDEMPOTENCY_WAIT_SECONDS'] = '0.1'
+        fingerprint_key = 'user123#stuck'
+        self.service.idempotency_repo.claim(fingerprint_key, 'not-this-request', 60, 'other-token')
+        with self.assertRaises(ConflictError):
+            self.upload(idempotency_key='stuck')
+
+    def test_abandoned_claim_expires_after_lease(self):
+        """Test that a claim never released (crash, timeout) only blocks retries for the lease."""
+        os.environ['IDEMPOTENCY_WAIT_SECONDS'] = '0.1'
+        os.environ['IDEMPOTENCY_LEASE_SECONDS'] = '30'
+        with patch.object(self.service.idempotency_repo, 'release'), \
+                patch.object(self.service.storage_repo, 'upload_image', side_effect=StorageError('timeout')):
+            with self.assertRaises(StorageError):
+                self.upload(idempotency_key='crashed')
+
+        record = self.service.idempotency_repo.get('user123#crashed')
+        self.assertLessEqual(record['expires_at'], int(time.time()) + 31)
+        with self.assertRaises(ConflictError):
+            self.upload(idempotency_key='crashed')
+
+        later = time.time() + 60
+        with patch('src.repositories.idempotency_repository.time.time', return_value=later):
+            result = self.upload(idempotency_key='crashed')
+        self.assertEqual(self.count_objects(), 1)
+        record = self.service.idempotency_repo.get('user123#crashed')
+        self.assertEqual(record['response']['image_id'], result['image_id'])
+        self.assertGreater(record['expires_at'], later + 3600)
+
+    def test_failed_complete_still_returns_the_upload(self):
+        """Test that a completion failing after the upload is stored returns the upload and leaves only a lease."""
+        os.environ['IDEMPOTENCY_WAIT_SECONDS'] = '0.1'
+        with patch.object(self.service.idempotency_repo, 'complete', side_effect=DatabaseError('throttled')):
+            result = self.upload(idempotency_key='lost')
+        self.assertEqual(self.service.get_image(result['image_id'])['image_id'], result['image_id'])
+        record = self.service.idempotency_repo.get('user123#lost')
+        self.assertLess(record['expires_at'], int(time.time()) + 3600)
+
+    def test_upload_past_its_lease_does_not_overwrite_the_retry(self):
+        """Test that an upload whose claim was taken over by a retry leaves the retry's record alone."""
+        os.environ['IDEMPOTENCY_LEASE_SECONDS'] = '30'
+        later = time.time() + 60
+        original_upload = self.service.storage_repo.upload_image
+        retried = {}
+
+        def slow_upload(*args, **kwargs):
+            # The first upload outruns its lease; a retry claims the key and finishes meanwhile
+            if not retried:
+                retried['started'] = True
+                with patch('src.repositories.idempotency_repository.time.time', return_value=later):
+                    retried.update(self.upload(idempotency_key='slow'))
+            return original_upload(*args, **kwargs)
+
+        with patch.object(self.service.storage_repo, 'upload_image', side_effect=slow_upload):
+            first = self.upload(idempotency_key='slow')
+
+        self.assertNotEqual(first['image_id'], retried['image_id'])
+        with patch('src.repositories.idempotency_repository.time.time', return_value=later):
+            record = self.service.idempotency_repo.get('user123#slow')
+        self.assertEqual(record['response']['image_id'], retried['image_id'])
+
+    @patch('src.handlers.image_handler.service')
+    def test_handler_forwards_idempotency_header(self, mock_service):
+        """Test that the Idempotency-Key header reaches the service."""
+        mock_service.upload_image.return_value = {'image_id': 'img1'}
+        event = self.create_api_event(method='POST', body={
+            'user_id': 'user123', 'filename': 'a.png', 'image_data': self.valid_image_data
+        })
+        event['headers']['idempotency-key'] = 'abc'
+
+        self.assertSuccess(lambda_handler(event, self.mock_context), 201)
+        self.assertEqual(mock_service.upload_image.call_args.kwargs['idempotency_key'], 'abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Tests for time-ordered image IDs."""
+import os
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from src.common.errors import NotFoundError
+from src.common.utils import generate_image_id, uuid7
+from src.repositories.local_storage_repository import LocalStorageRepository
+from src.repositories.sqlite_repository import (
+    SqliteIdempotencyRepository, SqliteMetadataRepository, SqliteUsageRepository
+)
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+class TestUuid7(BaseTestCase):
+    """Test cases for UUIDv7 generation."""
+
+    def test_layout(self):
+        """Test version, variant and the millisecond timestamp prefix."""
+        before = int(time.time() * 1000)
+        value = uuid.UUID(generate_image_id('uuid7'))
+        after = int(time.time() * 1000)
+        self.assertEqual((value.version, value.variant), (7, uuid.RFC_4122))
+        self.assertTrue(before <= value.int >> 80 <= after + 1)
+
+    def test_schemes(self):
+        """Test that uuid4 stays the default and unknown schemes are rejected."""
+        self.assertEqual(uuid.UUID(generate_image_id()).version, 4)
+        with self.assertRaises(ValueError):
+            generate_image_id('ulid')
+
+    def test_monotonic_within_a_millisecond_and_when_the_clock_steps_back(self):
+        """Test that IDs keep increasing, as integers and as strings."""
+        now_ms = int(time.time() * 1000)
+        ids = [uuid7(now_ms=now_ms) for _ in range(1000)]
+        ids += [uuid7(now_ms=now_ms - 60000) for _ in range(10)]
+        self.assertEqual(ids, sorted(set(ids), key=lambda value: value.int))
+        self.assertEqual([str(value) for value in ids], sorted(str(value) for value in ids))
+        self.assertTrue(all(value.version == 7 for value in ids))
+
+    def test_concurrent_generation_is_unique_and_ordered(self):
+        """Test that threads sharing the generator never collide and each sees increasing IDs."""
+        results = [[] for _ in range(8)]
+        barrier = threading.Barrier(len(results))
+
+        def generate(ids):
+            barrier.wait()
+            ids.extend(generate_image_id('uuid7') for _ in range(2000))
+
+        threads = [threading.Thread(target=generate, args=(ids,)) for ids in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({image_id for ids in results for image_id in ids}), 8 * 2000)
+        for ids in results:
+            self.assertEqual(ids, sorted(ids))
+
+
+class TestTimeOrderedUploads(AWSTestCase):
+    """Test cases for uploads with ID_SCHEME=uuid7 alongside existing uuid4 images."""
+
+    def test_uuid4_and_uuid7_images_side_by_side(self):
+        """Test that switching schemes keeps older random IDs readable and deletable."""
+        old = self.upload()['image_id']
+        with patch.dict(os.environ, {'ID_SCHEME': 'uuid7'}):
+            new = self.upload()['image_id']
+        self.assertEqual((uuid.UUID(old).version, uuid.UUID(new).version), (4, 7))
+
+        for image_id in (old, new):
+            self.assertEqual(self.service.get_image(image_id)['image_id'], image_id)
+            self.service.delete_image(image_id)
+            with self.assertRaises(NotFoundError):
+                self.service.get_image(image_id)
+
+
+class TestLocalTimeOrderedUploads(AWSTestCase):
+    """Test cases for the SQLite backend, which lists images in ID order."""
+
+    def create_service(self):
+        from src.services.image_service import ImageService
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        database = os.path.join(data_dir.name, 'metadata.db')
+        return ImageService(
+            storage_repo=LocalStorageRepository(os.path.join(data_dir.name, 'objects')),
+            metadata_repo=SqliteMetadataRepository(database),
+            usage_repo=SqliteUsageRepository(database),
+            idempotency_repo=SqliteIdempotencyRepository(database)
+        )
+
+    def test_list_follows_upload_order(self):
+        """Test that time-ordered IDs make ID-ordered pages come out in upload order."""
+        with patch.dict(os.environ, {'ID_SCHEME': 'uuid7'}):
+            uploaded = [self.upload()['image_id'] for _ in range(5)]
+        first = self.service.list_images(limit=3, include_urls=False)
+        rest = self.service.list_images(limit=3, last_key=first['last_evaluated_key'], include_urls=False)
+        listed = [image['image_id'] for page in (first, rest) for image in page['images']]
+        self.assertEqual(listed, uploaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
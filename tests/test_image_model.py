@@ -0,0 +1,74 @@
+"""Tests for the image metadata model."""
+import json
+import unittest
+from decimal import Decimal
+
+from src.models.image_model import ImageMetadata, SCHEMA_VERSION
+
+
+class TestImageMetadata(unittest.TestCase):
+    """Test cases for ImageMetadata decoding and encoding."""
+
+    def setUp(self):
+        self.item = {
+            'image_id': 'img1',
+            'user_id': 'user123',
+            'filename': 'a.png',
+            's3_key': 'images/user123/img1.png',
+            'content_type': 'image/png',
+            'size': Decimal('2048'),
+            'upload_date': '2024-05-01T12:00:00',
+            'width': Decimal('640'),
+            'height': Decimal('480.5')
+        }
+
+    def test_uses_slots(self):
+        """Test that instances have no per-instance __dict__."""
+        metadata = ImageMetadata.from_dynamodb_item(self.item)
+        self.assertFalse(hasattr(metadata, '__dict__'))
+
+    def test_decimals_are_normalized(self):
+        """Test that integral Decimals become ints and others floats."""
+        metadata = ImageMetadata.from_dynamodb_item(self.item)
+        self.assertIs(type(metadata.size), int)
+        self.assertEqual(metadata.width, 640)
+        self.assertEqual(metadata.height, 480.5)
+
+    def test_unknown_attributes_from_current_schema_are_ignored(self):
+        """Test that stray attributes do not crash decoding."""
+        item = {**self.item, 'legacy_flag': True, 'schema_version': Decimal(SCHEMA_VERSION)}
+        metadata = ImageMetadata.from_dynamodb_item(item)
+        self.assertIsNone(metadata.extra)
+        self.assertNotIn('legacy_flag', metadata.to_dynamodb_item())
+
+    def test_unknown_attributes_from_newer_schema_are_kept(self):
+        """Test that attributes written by a newer schema survive a round trip."""
+        item = {**self.item, 'future_field': 'x', 'schema_version': Decimal(SCHEMA_VERSION + 1)}
+        metadata = ImageMetadata.from_dynamodb_item(item)
+
+        self.assertEqual(metadata.extra, {'future_field': 'x', 'schema_version': SCHEMA_VERSION + 1})
+        self.assertEqual(metadata.to_dynamodb_item()['future_field'], 'x')
+        self.assertNotIn('future_field', metadata.to_dict())
+
+    def test_newer_schema_survives_repeated_write_backs(self):
+        """Test that writing a newer item back keeps its version, so the next write keeps its attributes."""
+        item = {**self.item, 'future_field': 'x', 'schema_version': Decimal(SCHEMA_VERSION + 1)}
+        for _ in range(2):
+            item = ImageMetadata.from_dynamodb_item(item).to_dynamodb_item()
+            self.assertEqual((item['future_field'], item['schema_version']), ('x', SCHEMA_VERSION + 1))
+
+        current = ImageMetadata.from_dynamodb_item(self.item).to_dynamodb_item()
+        self.assertEqual(current['schema_version'], SCHEMA_VERSION)
+
+    def test_json_ready_paths(self):
+        """Test to_json and item_to_dict produce the same values."""
+        metadata = ImageMetadata.from_dynamodb_item(self.item)
+        self.assertEqual(json.loads(metadata.to_json()), metadata.to_dict())
+        self.assertEqual(
+            ImageMetadata.item_to_dict(self.item, ['image_id', 'size']),
+            {'image_id': 'img1', 'size': 2048}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
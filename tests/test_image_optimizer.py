@@ -0,0 +1,215 @@
+"""Tests for the image optimization stage."""
+import base64
+import io
+import os
+import struct
+import time
+import unittest
+import zlib
+from unittest.mock import patch
+
+from src.services.image_optimizer import ImageOptimizer, Image, optimize_image, strip_jpeg_metadata
+from tests.base_test import AWSTestCase
+
+
+def make_photo(size=(64, 48)):
+    image = Image.new('RGB', size)
+    image.putdata([((x * 4) % 256, (y * 5) % 256, (x * y) % 256) for y in range(size[1]) for x in range(size[0])])
+    return image
+
+
+def jpeg_with_metadata(orientation=None):
+    exif = Image.Exif()
+    exif[0x010E] = 'x' * 20000  # ImageDescription
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    make_photo().save(buffer, 'JPEG', quality=90, exif=exif.tobytes(), comment=b'c' * 2000)
+    return buffer.getvalue()
+
+
+def uncompressed_png():
+    from PIL import PngImagePlugin
+    info = PngImagePlugin.PngInfo()
+    info.add_text('Comment', 'x' * 5000)
+    buffer = io.BytesIO()
+    make_photo().save(buffer, 'PNG', compress_level=0, pnginfo=info)
+    return buffer.getvalue()
+
+
+def png_16_bit(size=(64, 48)):
+    """An uncompressed RGB PNG with 16 bits per channel, which Pillow cannot write."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    width, height = size
+    rows = b''.join(
+        b'\x00' + b''.join(struct.pack('>3H', x * 1000, y * 1300, x * y * 7) for x in range(width))
+        for y in range(height)
+    )
+    header = struct.pack('>2I5B', width, height, 16, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(rows, 0)) + chunk(b'IEND', b''))
+
+
+def slow_optimize(image_bytes, mode, quality):
+    """Stand-in for ``optimize_image`` that overruns any test time budget."""
+    time.sleep(5)
+
+
+def settings(**overrides):
+    values = {'mode': 'lossless', 'webp_quality': 80, 'timeout_ms': 5000, 'workers': 0}
+    values.update(overrides)
+    return values
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestOptimizeImage(unittest.TestCase):
+    """Test cases for the optimization functions."""
+
+    def test_jpeg_metadata_is_stripped_losslessly(self):
+        """Test that EXIF and comments go while scan data is untouched."""
+        original = jpeg_with_metadata()
+        stripped = strip_jpeg_metadata(original)
+
+        self.assertLess(len(stripped), len(original) - 20000)
+        with Image.open(io.BytesIO(original)) as before, Image.open(io.BytesIO(stripped)) as after:
+            self.assertEqual(before.tobytes(), after.tobytes())
+            self.assertNotIn('comment', after.info)
+            self.assertEqual(dict(after.getexif()), {})
+
+    def test_jpeg_orientation_is_kept(self):
+        """Test that a rotated photo keeps only its orientation tag."""
+        stripped = strip_jpeg_metadata(jpeg_with_metadata(orientation=6))
+        with Image.open(io.BytesIO(stripped)) as image:
+            self.assertEqual(dict(image.getexif()), {0x0112: 6})
+
+    def test_png_recompressed_losslessly(self):
+        """Test that PNGs shrink with identical pixels and no text chunks."""
+        original = uncompressed_png()
+        data, content_type = optimize_image(original, 'lossless')
+
+        self.assertEqual(content_type, 'image/png')
+        self.assertLess(len(data), len(original))
+        with Image.open(io.BytesIO(original)) as before, Image.open(io.BytesIO(data)) as after:
+            self.assertEqual(before.tobytes(), after.tobytes())
+            self.assertNotIn('Comment', after.info)
+
+    def test_16_bit_png_is_kept(self):
+        """Test that 16-bit PNGs are stored as sent instead of being reduced to 8 bits."""
+        original = png_16_bit()
+        for mode in ('lossless', 'webp'):
+            with self.subTest(mode=mode):
+                self.assertIsNone(optimize_image(original, mode))
+                self.assertEqual(ImageOptimizer(settings(mode=mode)).optimize(original, 'image/png'),
+                                 (original, 'image/png'))
+
+    def test_webp_transcode(self):
+        """Test lossy WebP output."""
+        data, content_type = optimize_image(uncompressed_png(), 'webp', quality=75)
+        self.assertEqual(content_type, 'image/webp')
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (64, 48)))
+
+    def test_undecodable_bytes_are_kept(self):
+        """Test that non-images and results that are not smaller fall back to the input."""
+        optimizer = ImageOptimizer(settings())
+        self.assertEqual(optimizer.optimize(b'not an image', 'image/png'), (b'not an image', 'image/png'))
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, 'GIF')
+        self.assertEqual(optimizer.optimize(buffer.getvalue(), 'image/gif')[0], buffer.getvalue())
+
+    def test_time_budget_in_worker_pool(self):
+        """Test that an image over the time budget is stored as sent."""
+        optimizer = ImageOptimizer(settings(workers=1, timeout_ms=0.001))
+        self.addCleanup(optimizer.shutdown)
+        original = uncompressed_png()
+        self.assertEqual(optimizer.optimize(original, 'image/png'), (original, 'image/png'))
+
+        optimizer.timeout = 30
+        data, _ = optimizer.optimize(original, 'image/png')
+        self.assertLess(len(data), len(original))
+
+    def test_worker_over_budget_is_terminated(self):
+        """Test that a job over budget does not keep its worker process busy."""
+        optimizer = ImageOptimizer(settings(workers=1, timeout_ms=200))
+        self.addCleanup(optimizer.shutdown)
+        original = uncompressed_png()
+        with patch('src.services.image_optimizer.optimize_image', slow_optimize):
+            pool = optimizer._get_pool()
+            self.assertEqual(optimizer.optimize(original, 'image/png'), (original, 'image/png'))
+        self.assertIsNone(optimizer._pool)
+        self.assertFalse(any(process.is_alive() for process in pool._processes or {}))
+
+        optimizer.timeout = 30
+        self.assertLess(len(optimizer.optimize(original, 'image/png')[0]), len(original))
+
+    def test_time_budget_inline(self):
+        """Test that inline jobs have a time budget and an abandoned job is not joined by more."""
+        optimizer = ImageOptimizer(settings(timeout_ms=100))
+        self.addCleanup(optimizer.shutdown)
+        original = uncompressed_png()
+        with patch('src.services.image_optimizer.optimize_image', side_effect=lambda *_: time.sleep(0.5)) as job:
+            started = time.monotonic()
+            self.assertEqual(optimizer.optimize(original, 'image/png'), (original, 'image/png'))
+            self.assertEqual(optimizer.optimize(original, 'image/png'), (original, 'image/png'))
+            self.assertLess(time.monotonic() - started, 0.4)
+            self.assertEqual(job.call_count, 1)
+            optimizer._inline_job.result()
+
+        self.assertLess(len(optimizer.optimize(original, 'image/png')[0]), len(original))
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestOptimizedUpload(AWSTestCase):
+    """Test cases for optimization inside upload_image."""
+
+    def tearDown(self):
+        for name in ('IMAGE_OPTIMIZATION', 'OPTIMIZE_WORKERS'):
+            os.environ.pop(name, None)
+        super().tearDown()
+
+    def upload_png(self, mode):
+        os.environ['IMAGE_OPTIMIZATION'] = mode
+        os.environ['OPTIMIZE_WORKERS'] = '0'
+        self.service = self.create_service()
+        image_data = base64.b64encode(uncompressed_png()).decode('utf-8')
+        return self.service.upload_image('user123', 'photo.png', image_data)
+
+    def test_sizes_recorded(self):
+        """Test that original and stored sizes are both recorded."""
+        result = self.upload_png('lossless')
+        metadata = result['metadata']
+        stored = self.s3_client.get_object(Bucket=os.environ['BUCKET_NAME'], Key=metadata['s3_key'])
+
+        self.assertEqual(metadata['original_size'], len(uncompressed_png()))
+        self.assertLess(metadata['size'], metadata['original_size'])
+        self.assertEqual(stored['ContentLength'], metadata['size'])
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['total_bytes'], metadata['size'])
+
+    def test_webp_changes_key_and_content_type(self):
+        """Test that a transcoded upload is stored as .webp."""
+        metadata = self.upload_png('webp')['metadata']
+        stored = self.s3_client.get_object(Bucket=os.environ['BUCKET_NAME'], Key=metadata['s3_key'])
+
+        self.assertTrue(metadata['s3_key'].endswith('.webp'))
+        self.assertEqual(metadata['filename'], 'photo.png')
+        self.assertEqual((metadata['content_type'], stored['ContentType']), ('image/webp', 'image/webp'))
+
+    def test_webp_object_keeps_its_extension_when_migrated(self):
+        """Test that the layout migration keys the object by what is stored, not by the .png filename."""
+        result = self.upload_png('webp')
+        original_key = result['metadata']['s3_key']
+
+        self.assertEqual(self.service.migrate_key_layout(layout='legacy')['migrated'], 0)
+        self.assertEqual(self.service.migrate_key_layout(layout='hashed')['migrated'], 1)
+
+        metadata = self.service.get_image(result['image_id'])['metadata']
+        self.assertRegex(metadata['s3_key'], r'^[0-9a-f]{4}/' + original_key.replace('.', r'\.') + '$')
+        stored = self.s3_client.get_object(Bucket=os.environ['BUCKET_NAME'], Key=metadata['s3_key'])
+        self.assertEqual((metadata['content_type'], stored['ContentType']), ('image/webp', 'image/webp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
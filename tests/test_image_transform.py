@@ -0,0 +1,193 @@
+"""Tests for on-demand derivatives and their cache."""
+import base64
+import io
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import ValidationError
+from src.handlers.image_handler import lambda_handler
+from src.services import image_service as image_service_module
+from src.services.image_transformer import (
+    Image,
+    SingleFlight,
+    derivative_key,
+    derivative_prefix,
+    normalize_transform
+)
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+def make_png(size=(300, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+class TestNormalizeTransform(BaseTestCase):
+    """Test cases for parameter normalization."""
+
+    def test_sizes_round_up_to_buckets(self):
+        """Test that near-identical requests share one spec."""
+        first = normalize_transform({'w': '250'}, 'image/png')
+        second = normalize_transform({'w': '256', 'fit': 'CONTAIN'}, 'image/png')
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(first.to_dict(), {'width': 256, 'height': 0, 'fit': 'contain', 'format': 'png'})
+        self.assertEqual(normalize_transform({'h': '99999'}, 'image/png').height, 2048)
+
+    def test_format_defaults_to_source_and_accepts_aliases(self):
+        """Test format defaulting and the jpg alias."""
+        self.assertEqual(normalize_transform({'w': '64'}, 'image/webp').format, 'webp')
+        self.assertEqual(normalize_transform({'w': '64'}, 'image/gif').format, 'jpeg')
+        spec = normalize_transform({'w': '64', 'format': 'jpg'}, 'image/png')
+        self.assertEqual(spec.content_type, 'image/jpeg')
+
+    def test_invalid_parameters(self):
+        """Test that bad values are rejected."""
+        for params in ({}, {'w': 'abc'}, {'w': '0'}, {'w': '10', 'fit': 'stretch'},
+                       {'w': '10', 'fit': 'cover'}, {'w': '10', 'format': 'tiff'}):
+            with self.assertRaises(ValidationError, msg=params):
+                normalize_transform(params, 'image/png')
+
+    def test_derivative_key_is_deterministic(self):
+        """Test that the key depends only on the image and normalized spec."""
+        spec = normalize_transform({'w': '100', 'h': '100', 'fit': 'cover'}, 'image/png')
+        key = derivative_key('abc', spec)
+        self.assertEqual(key, derivative_key('abc', normalize_transform(
+            {'w': '128', 'h': '120', 'fit': 'cover', 'format': 'png'}, 'image/png')))
+        self.assertTrue(key.startswith(derivative_prefix('abc')))
+        self.assertTrue(key.endswith('w128-h128-cover.png'))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for call coalescing."""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that waiters get the leader's result."""
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return 'done'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('k', work))) for _ in range(8)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['done'] * 8)
+        self.assertEqual(flights.do('k', lambda: 'again'), 'again')
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+class TestDerivatives(AWSTestCase):
+    """Test cases for generating and serving derivatives."""
+
+    def setUp(self):
+        super().setUp()
+        self.valid_image_data = make_png()
+
+    def object_keys(self):
+        response = self.s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])
+        return [obj['Key'] for obj in response.get('Contents', [])]
+
+    def test_first_request_generates_then_cache_is_reused(self):
+        """Test that the second request only checks the stored derivative."""
+        image_id = self.upload()['image_id']
+
+        with patch.object(image_service_module, 'transform_image',
+                          wraps=image_service_module.transform_image) as transform:
+            first = self.service.get_image(image_id, transform={'w': '100'})
+            second = self.service.get_image(image_id, transform={'w': '128'})
+
+        self.assertEqual(transform.call_count, 1)
+        self.assertEqual(first['transform'], {'width': 128, 'height': 0, 'fit': 'contain', 'format': 'png'})
+        self.assertEqual(first['download_url'].split('?')[0], second['download_url'].split('?')[0])
+
+        key = [key for key in self.object_keys() if key.startswith('derivatives/')][0]
+        body = self.s3_client.get_object(Bucket=os.environ['BUCKET_NAME'], Key=key)
+        with Image.open(body['Body']) as derivative:
+            self.assertEqual(derivative.size, (128, 85))
+
+    def test_cover_and_format_conversion(self):
+        """Test cropping to the box and re-encoding."""
+        image_id = self.upload()['image_id']
+        result = self.service.get_image(image_id, transform={'w': '64', 'h': '64', 'fit': 'cover',
+                                                             'format': 'webp'})
+
+        key = derivative_key(image_id, normalize_transform({'w': '64', 'h': '64', 'fit': 'cover',
+                                                            'format': 'webp'}, 'image/png'))
+        head = self.s3_client.head_object(Bucket=os.environ['BUCKET_NAME'], Key=key)
+        self.assertEqual(head['ContentType'], 'image/webp')
+        self.assertEqual(result['transform']['format'], 'webp')
+
+    def test_concurrent_requests_generate_once(self):
+        """Test that identical concurrent requests are coalesced."""
+        image_id = self.upload()['image_id']
+        transform = image_service_module.transform_image
+        calls = []
+
+        def slow_transform(data, spec):
+            calls.append(spec.name)
+            time.sleep(0.1)
+            return transform(data, spec)
+
+        errors = []
+
+        def request():
+            try:
+                self.service.get_image(image_id, transform={'w': '200'})
+            except Exception as e:
+                errors.append(e)
+
+        with patch.object(image_service_module, 'transform_image', side_effect=slow_transform):
+            threads = [threading.Thread(target=request) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(calls, ['w256-h0-contain.png'])
+
+    def test_purge_removes_derivatives(self):
+        """Test that purging an image also removes its derivatives."""
+        os.environ['UNDELETE_WINDOW_SECONDS'] = '0'
+        try:
+            image_id = self.upload()['image_id']
+            self.service.get_image(image_id, transform={'w': '32'})
+            self.service.get_image(image_id, transform={'w': '64'})
+            self.service.delete_image(image_id)
+            self.assertEqual(self.service.purge_deleted(), {'purged': 1, 'failed': 0})
+        finally:
+            os.environ.pop('UNDELETE_WINDOW_SECONDS', None)
+        self.assertEqual(self.object_keys(), [])
+
+    def test_get_route_with_transform_parameters(self):
+        """Test GET /images/{id}?w=&format= through the handler."""
+        image_id = self.upload()['image_id']
+        ok = self.create_api_event(path_params={'image_id': image_id},
+                                   query_params={'w': '50', 'format': 'jpg'})
+        bad = self.create_api_event(path_params={'image_id': image_id}, query_params={'fit': 'cover'})
+
+        with patch('src.handlers.image_handler.service', self.service):
+            body = self.assertSuccess(lambda_handler(ok, self.mock_context))
+            self.assertError(lambda_handler(bad, self.mock_context), 400)
+
+        self.assertEqual(body['transform'], {'width': 64, 'height': 0, 'fit': 'contain', 'format': 'jpeg'})
+        self.assertIn('derivatives/', body['download_url'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""Tests for S3 key layouts and the key layout migration job."""
+import os
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import ValidationError
+from src.common.utils import get_s3_key, relayout_s3_key
+from src.handlers.maintenance_handler import lambda_handler as maintenance_handler
+from tests.base_test import AWSTestCase
+
+
+class TestKeyLayout(unittest.TestCase):
+    """Test cases for key generation."""
+
+    def test_legacy_layout_is_unchanged(self):
+        """Test the default per-user layout."""
+        self.assertEqual(get_s3_key('user1', 'img1', 'a.png'), 'images/user1/img1.png')
+
+    def test_hashed_layout_spreads_prefixes(self):
+        """Test that hashed keys lead with a stable 4-hex prefix that varies per image."""
+        key = get_s3_key('user1', 'img1', 'a.png', 'hashed')
+        self.assertRegex(key, r'^[0-9a-f]{4}/images/user1/img1\.png$')
+        self.assertEqual(key[:4], get_s3_key('user2', 'img1', 'b.jpg', 'hashed')[:4])
+
+        prefixes = {get_s3_key('user1', f'img{i}', 'a.png', 'hashed')[:4] for i in range(200)}
+        self.assertGreater(len(prefixes), 150)
+
+    def test_relayout_keeps_the_stored_basename(self):
+        """Test that moving between layouts only adds or drops the hash prefix."""
+        hashed = relayout_s3_key('images/user1/img1.webp', 'hashed')
+        self.assertEqual(hashed, get_s3_key('user1', 'img1', 'a.webp', 'hashed'))
+        self.assertEqual(relayout_s3_key(hashed, 'legacy'), 'images/user1/img1.webp')
+        self.assertEqual(relayout_s3_key('images/user1/img1.webp'), 'images/user1/img1.webp')
+        self.assertIsNone(relayout_s3_key('derivatives/ab12/img1/w64-h64-contain.png', 'hashed'))
+
+    def test_unknown_layout(self):
+        """Test that an unknown layout is rejected."""
+        with self.assertRaises(ValueError):
+            get_s3_key('user1', 'img1', 'a.png', 'flat')
+
+
+class TestKeyLayoutMigration(AWSTestCase):
+    """Test cases for uploads under the hashed layout and migrating old objects."""
+
+    def tearDown(self):
+        os.environ.pop('S3_KEY_LAYOUT', None)
+        super().tearDown()
+
+    def object_keys(self):
+        response = self.s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])
+        return sorted(obj['Key'] for obj in response.get('Contents', []))
+
+    def test_hashed_uploads_stay_listable_per_user(self):
+        """Test that per-user listing goes through metadata, not the key prefix."""
+        os.environ['S3_KEY_LAYOUT'] = 'hashed'
+        result = self.upload()
+        self.upload(user_id='other')
+
+        self.assertRegex(result['metadata']['s3_key'], r'^[0-9a-f]{4}/images/user123/')
+        listed = self.service.list_images(user_id='user123')
+        self.assertEqual([image['image_id'] for image in listed['images']], [result['image_id']])
+        self.assertIn('download_url', self.service.get_image(result['image_id']))
+
+    def test_migration_moves_objects_and_is_resumable(self):
+        """Test copy, key switch and cleanup in limited batches."""
+        uploads = [self.upload() for _ in range(3)]
+        os.environ['S3_KEY_LAYOUT'] = 'hashed'
+
+        first = self.service.migrate_key_layout(limit=2, workers=2)
+        second = self.service.migrate_key_layout()
+        third = self.service.migrate_key_layout()
+
+        self.assertEqual(first, {'migrated': 2, 'skipped': 0, 'failed': 0})
+        self.assertEqual(second['migrated'], 1)
+        self.assertEqual(third['migrated'], 0)
+        expected = sorted(
+            get_s3_key('user123', upload['image_id'], 'test.png', 'hashed') for upload in uploads
+        )
+        self.assertEqual(self.object_keys(), expected)
+        for upload in uploads:
+            image = self.service.get_image(upload['image_id'])
+            self.assertEqual(image['metadata']['s3_key'],
+                             get_s3_key('user123', upload['image_id'], 'test.png', 'hashed'))
+
+    def test_changed_image_is_skipped_and_copy_removed(self):
+        """Test that a failed conditional switch leaves the original key in place."""
+        upload = self.upload()
+        with patch.object(self.service.metadata_repo, 'update_s3_key', return_value=False):
+            result = self.service.migrate_key_layout(layout='hashed')
+
+        self.assertEqual(result, {'migrated': 0, 'skipped': 1, 'failed': 0})
+        self.assertEqual(self.object_keys(), [upload['metadata']['s3_key']])
+
+    def test_deleted_images_are_not_migrated(self):
+        """Test that tombstoned images keep their key for the purge job."""
+        upload = self.upload()
+        self.service.delete_image(upload['image_id'])
+
+        self.assertEqual(self.service.migrate_key_layout(layout='hashed')['migrated'], 0)
+        self.assertEqual(self.object_keys(), [upload['metadata']['s3_key']])
+
+    def test_renamed_image_keeps_its_object_key(self):
+        """Test that renaming to another extension does not move or re-extension the unchanged bytes."""
+        upload = self.upload()
+        self.service.update_image(upload['image_id'], {'filename': 'renamed.jpg'})
+
+        self.assertEqual(self.service.migrate_key_layout(layout='legacy')['migrated'], 0)
+        self.assertEqual(self.object_keys(), [upload['metadata']['s3_key']])
+        self.assertEqual(self.service.migrate_key_layout(layout='hashed')['migrated'], 1)
+        self.assertEqual(self.object_keys(), [relayout_s3_key(upload['metadata']['s3_key'], 'hashed')])
+        self.assertTrue(self.object_keys()[0].endswith('.png'))
+
+    def test_maintenance_job(self):
+        """Test the migrate_key_layout job and layout validation."""
+        self.upload()
+        with patch('src.handlers.maintenance_handler.service', self.service):
+            result = maintenance_handler({'job': 'migrate_key_layout', 'layout': 'hashed'}, None)
+            invalid = maintenance_handler({'job': 'migrate_key_layout', 'layout': 'flat'}, None)
+
+        self.assertEqual(result['result']['migrated'], 1)
+        self.assertEqual(invalid['status'], 'failed')
+        with self.assertRaises(ValidationError):
+            self.service.migrate_key_layout(layout='flat')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for the load generator."""
+import unittest
+from collections import Counter
+
+from benchmarks.loadgen import (
+    EventGenerator,
+    LoadStats,
+    WorkloadSpec,
+    ZipfSampler,
+    classify_event,
+    latency_histogram,
+    run_load
+)
+
+
+class TestLoadGenerator(unittest.TestCase):
+    """Test cases for workload generation and replay."""
+
+    def test_zipf_sampler_skews_towards_hot_keys(self):
+        """Test that low ranks dominate a Zipfian sample."""
+        sampler = ZipfSampler(100, s=1.2)
+        counts = Counter(sampler.sample() for _ in range(5000))
+        self.assertGreater(counts[0], counts[10])
+        self.assertGreater(counts[0], 5000 * 0.1)
+
+    def test_generator_is_reproducible_and_follows_mix(self):
+        """Test that a seeded generator yields the same classified stream."""
+        spec = WorkloadSpec(mix={'list': 0.8, 'upload': 0.2}, payloads={1024: 1.0}, hot_images=10, seed=7)
+        first = EventGenerator(spec).take(200)
+        second = EventGenerator(spec).take(200)
+
+        self.assertEqual([op for op, _ in first], [op for op, _ in second])
+        self.assertEqual({classify_event(event) for _, event in first}, {'list', 'upload'})
+        self.assertGreater(Counter(op for op, _ in first)['list'], 120)
+
+    def test_histogram_and_summary(self):
+        """Test latency bucketing and per-operation error breakdown."""
+        stats = LoadStats()
+        stats.record('get', 0.003, 200)
+        stats.record('get', 0.150, 404, 'Image not found: x')
+        summary = stats.summary(elapsed=1.0)
+
+        self.assertEqual(summary['operations']['get']['statuses'], {'200': 1, '404': 1})
+        self.assertEqual(summary['errors'], {'get 404: Image not found: x': 1})
+        self.assertEqual(latency_histogram([0.003, 0.150]), {'<=5': 1, '<=200': 1})
+
+    def test_run_load_against_handler(self):
+        """Test a short threaded run against the in-process handler."""
+        spec = WorkloadSpec(payloads={1024: 1.0}, hot_images=5, users=2, seed=3)
+        raw, _ = run_load(spec, threads=2, requests=20)
+
+        stats = LoadStats()
+        stats.merge(raw)
+        summary = stats.summary(elapsed=1.0)
+        self.assertEqual(summary['total']['requests'], 20)
+        self.assertEqual(summary['errors'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
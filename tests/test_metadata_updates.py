@@ -0,0 +1,246 @@
+"""Tests for partial metadata updates and bulk tag edits."""
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import ConflictError, NotFoundError, ValidationError
+from src.handlers.image_handler import lambda_handler
+from src.repositories.local_storage_repository import LocalStorageRepository
+from src.repositories.search_repository import SearchRepository
+from src.repositories.sqlite_repository import (
+    SqliteIdempotencyRepository, SqliteMetadataRepository, SqliteUsageRepository
+)
+from src.services.image_service import edit_tags, parse_tags
+from src.services.search_service import SearchService
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+class TestTagEditing(BaseTestCase):
+    """Test cases for parsing and editing tag lists."""
+
+    def test_parse_tags(self):
+        """Test that strings are split and order is kept without duplicates."""
+        self.assertIsNone(parse_tags(None))
+        self.assertEqual(parse_tags('b, a,b,,'), ['b', 'a'])
+        self.assertEqual(parse_tags(['x', ' y ', 'x']), ['x', 'y'])
+        with self.assertRaises(ValidationError):
+            parse_tags(['x', 1])
+
+    def test_edit_tags(self):
+        """Test that removed tags go, added tags are appended once and stored strings are understood."""
+        self.assertEqual(edit_tags('nature,landscape', add=['sky'], remove=['nature']), ['landscape', 'sky'])
+        self.assertEqual(edit_tags(None, add=['a', 'a']), ['a'])
+        self.assertEqual(edit_tags(['a', 'b'], add=['b']), ['a', 'b'])
+
+
+class TestMetadataUpdates(AWSTestCase):
+    """Test cases for PATCH-style updates and bulk tag edits against moto."""
+
+    def item(self, image_id):
+        return self.dynamodb.Table('test-table').get_item(Key={'image_id': image_id})['Item']
+
+    def test_update_changes_only_given_fields_and_bumps_version(self):
+        """Test that a patch sets and removes fields, keeps the rest and increments the version."""
+        uploaded = self.upload(tags='nature,landscape', description='old')
+        image_id = uploaded['image_id']
+        self.assertEqual(uploaded['metadata']['version'], 1)
+
+        result = self.service.update_image(image_id, {'description': None, 'tags': ['sky', 'sky', 'sea']}, version=1)
+        self.assertEqual(result['metadata']['version'], 2)
+        self.assertEqual(result['metadata']['tags'], ['sky', 'sea'])
+        self.assertIsNone(result['metadata']['description'])
+        self.assertEqual(result['metadata']['filename'], 'test.png')
+
+        item = self.item(image_id)
+        self.assertNotIn('description', item)
+        self.assertEqual((item['version'], item['tags'], item['s3_key']),
+                         (2, ['sky', 'sea'], uploaded['metadata']['s3_key']))
+
+    def test_stale_version_conflicts(self):
+        """Test optimistic concurrency: the second writer holding version 1 gets a conflict."""
+        image_id = self.upload()['image_id']
+        self.service.update_image(image_id, {'filename': 'renamed.png'}, version=1)
+        with self.assertRaises(ConflictError):
+            self.service.update_image(image_id, {'filename': 'other.png'}, version=1)
+        self.assertEqual(self.item(image_id)['filename'], 'renamed.png')
+
+    def test_items_without_version_count_as_version_zero(self):
+        """Test that images stored before versioning can be updated conditionally."""
+        image_id = self.upload()['image_id']
+        self.dynamodb.Table('test-table').update_item(Key={'image_id': image_id}, UpdateExpression='REMOVE version')
+        with self.assertRaises(ConflictError):
+            self.service.update_image(image_id, {'description': 'x'}, version=1)
+        self.assertEqual(self.service.update_image(image_id, {'description': 'x'}, version=0)['metadata']['version'], 1)
+
+    def test_missing_deleted_and_expired_images_are_not_found(self):
+        """Test that only live images can be updated, and the update does not create items."""
+        deleted = self.upload()['image_id']
+        self.service.delete_image(deleted)
+        expired = self.upload(ttl_seconds=3600)['image_id']
+        self.dynamodb.Table('test-table').update_item(
+            Key={'image_id': expired}, UpdateExpression='SET expires_at = :past',
+            ExpressionAttributeValues={':past': int(time.time()) - 1}
+        )
+        for image_id in ('missing', deleted, expired):
+            with self.subTest(image_id=image_id), self.assertRaises(NotFoundError):
+                self.service.update_image(image_id, {'description': 'x'}, version=1)
+        self.assertNotIn('Item', self.dynamodb.Table('test-table').get_item(Key={'image_id': 'missing'}))
+
+    def test_invalid_updates_are_rejected(self):
+        """Test unknown fields, empty patches and bad values."""
+        image_id = self.upload()['image_id']
+        for changes, version in [({}, None), ({'s3_key': 'x'}, None), ({'filename': ''}, None),
+                                 ({'description': 5}, None), ({'tags': 'a'}, -1), ({'tags': 'a'}, '1')]:
+            with self.subTest(changes=changes, version=version), self.assertRaises(ValidationError):
+                self.service.update_image(image_id, changes, version)
+
+    def test_update_reindexes_search_and_tag_filters(self):
+        """Test that search and tag filters see the new values."""
+        self.service.search = SearchService(
+            SearchRepository(self.s3_client), {'enabled': True, 'cache_users': 4, 'refresh_seconds': 0}
+        )
+        image_id = self.upload(description='a red barn', tags='farm')['image_id']
+        self.service.update_image(image_id, {'description': 'a blue lake', 'tags': ['water']})
+
+        found = self.service.search_images('user123', 'lake', include_urls=False)
+        self.assertEqual([image['image_id'] for image in found['images']], [image_id])
+        self.assertEqual(self.service.search_images('user123', 'barn', include_urls=False)['images'], [])
+        listed = self.service.list_images(tags='water', include_urls=False)
+        self.assertEqual([image['image_id'] for image in listed['images']], [image_id])
+
+    def test_bulk_tag_edit(self):
+        """Test that tags are added and removed across images, reporting each image's outcome."""
+        first = self.upload(tags='nature,landscape')['image_id']
+        second = self.upload(tags=['sky'])['image_id']
+        done = self.upload(tags=['landscape', 'sunset'])['image_id']
+        other = self.upload(user_id='user456', tags='nature')['image_id']
+
+        result = self.service.update_tags(
+            [first, second, done, other, 'missing', first], add=['sunset'], remove=['nature'], user_id='user123'
+        )
+        self.assertEqual(result, {'updated': [first, second], 'unchanged': [done],
+                                  'not_found': [other, 'missing'], 'failed': []})
+        self.assertEqual(self.item(first)['tags'], ['landscape', 'sunset'])
+        self.assertEqual((self.item(first)['version'], self.item(done)['version']), (2, 1))
+        self.assertEqual(self.item(second)['tags'], ['sky', 'sunset'])
+        self.assertEqual(self.item(other)['tags'], 'nature')
+
+        result = self.service.update_tags([second], remove=['sky', 'sunset'])
+        self.assertEqual(result['updated'], [second])
+        self.assertNotIn('tags', self.item(second))
+
+    def test_bulk_tag_edit_retries_concurrent_changes(self):
+        """Test that an image updated between the read and the write is re-read, not overwritten."""
+        image_id = self.upload(tags=['a'])['image_id']
+        repo = self.service.metadata_repo
+        original = repo.get_many
+
+        def racing_get_many(image_ids, fields=None):
+            found = original(image_ids, fields)
+            self.service.update_image(image_id, {'tags': ['a', 'b']})
+            return found
+
+        with patch.object(repo, 'get_many', racing_get_many):
+            result = self.service.update_tags([image_id], add=['c'])
+        self.assertEqual(result['updated'], [image_id])
+        self.assertEqual((self.item(image_id)['tags'], self.item(image_id)['version']), (['a', 'b', 'c'], 3))
+
+    def test_bulk_tag_edit_validation(self):
+        """Test limits and required arguments."""
+        with patch.dict(os.environ, {'BULK_TAG_MAX_IMAGES': '2'}):
+            with self.assertRaises(ValidationError):
+                self.service.update_tags(['a', 'b', 'c'], add=['x'])
+        for kwargs in [{'image_ids': []}, {'image_ids': 'a'}, {'image_ids': ['a']},
+                       {'image_ids': ['a'], 'add': ['x'], 'remove': ['x']}]:
+            with self.subTest(kwargs=kwargs), self.assertRaises(ValidationError):
+                self.service.update_tags(**{'add': None, **kwargs})
+
+    def test_patch_routes(self):
+        """Test PATCH /images/{image_id} with body and If-Match versions, and PATCH /images."""
+        image_id = self.upload()['image_id']
+        with patch('src.handlers.image_handler.service', self.service):
+            event = self.create_api_event(method='PATCH', path_params={'image_id': image_id},
+                                          body={'description': 'new', 'version': 1})
+            updated = self.assertSuccess(lambda_handler(event, self.mock_context))
+            self.assertEqual(updated['metadata']['version'], 2)
+
+            event = self.create_api_event(method='PATCH', path_params={'image_id': image_id}, body={'tags': 'x'})
+            event['headers']['If-Match'] = 'W/"1"'
+            response = lambda_handler(event, self.mock_context)
+            self.assertError(response, 409)
+            self.assertIn('If-Match', response['headers']['Access-Control-Allow-Headers'])
+            self.assertIn('PATCH', response['headers']['Access-Control-Allow-Methods'])
+
+            event['headers']['If-Match'] = '"2"'
+            self.assertSuccess(lambda_handler(event, self.mock_context))
+            event['headers']['If-Match'] = 'latest'
+            self.assertError(lambda_handler(event, self.mock_context), 400)
+
+            bulk = self.create_api_event(method='PATCH', body={'image_ids': [image_id], 'add_tags': ['y']})
+            self.assertEqual(self.assertSuccess(lambda_handler(bulk, self.mock_context))['updated'], [image_id])
+        self.assertEqual(self.item(image_id)['tags'], ['x', 'y'])
+
+    def test_patch_rejects_non_object_bodies(self):
+        """Test that JSON arrays, strings and null are a 400, not a 500."""
+        image_id = self.upload()['image_id']
+        with patch('src.handlers.image_handler.service', self.service):
+            for path_params in ({'image_id': image_id}, None):
+                for body in ('[]', '"x"', 'null'):
+                    with self.subTest(path_params=path_params, body=body):
+                        event = self.create_api_event(method='PATCH', path_params=path_params)
+                        event['body'] = body
+                        self.assertError(lambda_handler(event, self.mock_context), 400)
+
+
+class TestLocalMetadataUpdates(TestMetadataUpdates):
+    """The same updates against the SQLite backend."""
+
+    def create_service(self):
+        from src.services.image_service import ImageService
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        database = os.path.join(data_dir.name, 'metadata.db')
+        return ImageService(
+            storage_repo=LocalStorageRepository(os.path.join(data_dir.name, 'objects')),
+            metadata_repo=SqliteMetadataRepository(database),
+            usage_repo=SqliteUsageRepository(database),
+            idempotency_repo=SqliteIdempotencyRepository(database)
+        )
+
+    def item(self, image_id):
+        return self.service.metadata_repo.get_metadata(image_id).to_dynamodb_item()
+
+    def test_items_without_version_count_as_version_zero(self):
+        """Test that images stored before versioning can be updated conditionally."""
+        image_id = self.upload()['image_id']
+        repo = self.service.metadata_repo
+        repo.connection.execute(
+            "UPDATE images SET item = json_remove(item, '$.version') WHERE image_id = ?", (image_id,)
+        )
+        with self.assertRaises(ConflictError):
+            self.service.update_image(image_id, {'description': 'x'}, version=1)
+        self.assertEqual(self.service.update_image(image_id, {'description': 'x'}, version=0)['metadata']['version'], 1)
+
+    def test_missing_deleted_and_expired_images_are_not_found(self):
+        """Test that only live images can be updated."""
+        deleted = self.upload()['image_id']
+        self.service.delete_image(deleted)
+        expired = self.upload(ttl_seconds=60)['image_id']
+        with patch('src.repositories.sqlite_repository.time.time', return_value=time.time() + 120):
+            for image_id in ('missing', deleted, expired):
+                with self.subTest(image_id=image_id), self.assertRaises(NotFoundError):
+                    self.service.update_image(image_id, {'description': 'x'}, version=1)
+
+    def test_update_reindexes_search_and_tag_filters(self):
+        """Test that the tag table follows tag changes (search needs S3, covered above)."""
+        image_id = self.upload(tags='farm')['image_id']
+        self.service.update_image(image_id, {'tags': ['water']})
+        self.assertEqual(self.service.list_images(tags='farm', include_urls=False)['images'], [])
+        listed = self.service.list_images(tags='water', include_urls=False)
+        self.assertEqual([image['image_id'] for image in listed['images']], [image_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""Tests for on-demand request profiling."""
+import base64
+import json
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from src.common import utils
+from src.common.profiling import (
+    PROFILE_HEADER, PROFILE_ID_HEADER, allocation_site, profiled, sign_profile_header, verify_profile_header
+)
+from src.handlers.image_handler import lambda_handler
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+def profile_settings(**overrides):
+    return {'mode': 'all', 'sample_rate': 0.0, 'secret': None, 'output': '/tmp/profiles',
+            'top': 10, 'trace_frames': 16, **overrides}
+
+
+class TestProfileHeader(BaseTestCase):
+    """Test cases for signed debug headers and the disabled fast path."""
+
+    def test_disabled_profiling_returns_the_function_itself(self):
+        """Test that with no sample rate and no secret nothing is wrapped."""
+        settings = profile_settings()
+        self.assertIs(profiled(lambda_handler, settings), lambda_handler)
+        self.assertIs(allocation_site(utils.get_header, settings), utils.get_header)
+
+    def test_signed_header_is_verified(self):
+        """Test that only unexpired headers signed with the secret select a mode."""
+        now = time.time()
+        header = sign_profile_header('s3cret', 'memory', expires_in=60, now=now)
+        self.assertEqual(verify_profile_header(header, 's3cret', now=now), 'memory')
+        self.assertIsNone(verify_profile_header(header, 'other', now=now))
+        self.assertIsNone(verify_profile_header(header, 's3cret', now=now + 120))
+        self.assertIsNone(verify_profile_header(header.replace('memory', 'cpu'), 's3cret', now=now))
+        self.assertIsNone(verify_profile_header('garbage', 's3cret', now=now))
+        self.assertIsNone(verify_profile_header(header, None, now=now))
+
+    def test_unknown_mode_is_rejected(self):
+        """Test that a misspelled PROFILE_MODE fails at import rather than per request."""
+        with self.assertRaises(ValueError):
+            profiled(lambda_handler, profile_settings(sample_rate=1.0, mode='heap'))
+
+    def test_allocation_sites_count_each_call_once(self):
+        """Test that results kept from earlier calls are not attributed to later ones again."""
+        decode = allocation_site(utils.parse_base64_image, profile_settings(secret='s3cret'))
+        size = 64 * 1024
+        data = base64.b64encode(os.urandom(size)).decode('ascii')
+        sites = {}
+        tracemalloc.start(16)
+        try:
+            with patch('src.common.profiling._sites', sites):
+                kept = [decode(data) for _ in range(4)]
+        finally:
+            tracemalloc.stop()
+
+        entry = sites['parse_base64_image']
+        self.assertEqual((entry['calls'], len(kept)), (4, 4))
+        self.assertGreaterEqual(sum(entry['sites'].values()), 4 * size)
+        self.assertLess(sum(entry['sites'].values()), 5 * size)
+
+
+class TestRequestProfiling(AWSTestCase):
+    """Test cases for profiling real handler invocations against moto."""
+
+    def setUp(self):
+        super().setUp()
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        self.output = output.name
+        self.settings = profile_settings(output=self.output, secret='s3cret')
+        patchers = [
+            patch('src.handlers.image_handler.service', self.service),
+            patch('src.handlers.image_handler.parse_json_body',
+                  allocation_site(utils.parse_json_body, self.settings)),
+            patch('src.services.image_service.parse_base64_image',
+                  allocation_site(utils.parse_base64_image, self.settings))
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.handler = profiled(lambda_handler, self.settings)
+
+    def upload_event(self, size=256 * 1024, header=None):
+        image_data = base64.b64encode(b'\x89PNG\r\n\x1a\n' + os.urandom(size)).decode('ascii')
+        event = self.create_api_event(method='POST', body={
+            'user_id': 'user123', 'filename': 'big.png', 'image_data': image_data
+        })
+        if header:
+            event['headers'][PROFILE_HEADER] = header
+        return event
+
+    def report(self, response):
+        profile_id = response['headers'][PROFILE_ID_HEADER]
+        with open(os.path.join(self.output, f'{profile_id}.json')) as f:
+            return profile_id, json.load(f)
+
+    def test_unsigned_request_is_not_profiled(self):
+        """Test that without a header or sampling the request runs as usual."""
+        response = self.handler(self.upload_event(1024), self.mock_context)
+        self.assertSuccess(response, 201)
+        self.assertNotIn(PROFILE_ID_HEADER, response['headers'])
+        self.assertEqual(os.listdir(self.output), [])
+
+    def test_signed_upload_reports_cpu_and_parsing_allocations(self):
+        """Test that a signed upload writes top functions, peak memory and the parsing allocation sites."""
+        response = self.handler(self.upload_event(header=sign_profile_header('s3cret')), self.mock_context)
+        self.assertSuccess(response, 201)
+        profile_id, report = self.report(response)
+
+        self.assertEqual((report['mode'], report['method'], report['status']), ('all', 'POST', 201))
+        functions = [row['function'] for row in report['cpu']['functions']]
+        self.assertTrue(any('upload_image' in name for name in functions))
+        self.assertGreater(report['memory']['peak_bytes'], 256 * 1024)
+
+        decoded = report['memory']['functions']['parse_base64_image']
+        self.assertEqual(decoded['calls'], 1)
+        self.assertGreaterEqual(decoded['retained_bytes'], 256 * 1024)
+        self.assertTrue(all(site.startswith('common/utils.py:') for site in decoded['sites']))
+        self.assertEqual(report['memory']['functions']['parse_json_body']['calls'], 1)
+
+        stats = pstats.Stats(os.path.join(self.output, f'{profile_id}.pstats'))
+        self.assertGreater(stats.total_calls, 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_sampled_cpu_mode_skips_tracemalloc(self):
+        """Test that sampling uses PROFILE_MODE and cpu mode writes no memory section."""
+        handler = profiled(lambda_handler, {**self.settings, 'sample_rate': 1.0, 'mode': 'cpu'})
+        response = handler(self.create_api_event(query_params={'user_id': 'user123'}), self.mock_context)
+        self.assertSuccess(response)
+        _, report = self.report(response)
+        self.assertEqual(report['mode'], 'cpu')
+        self.assertIn('cpu', report)
+        self.assertNotIn('memory', report)
+
+    def test_reports_can_go_to_s3(self):
+        """Test that an s3:// output writes the report and stats under the debug prefix."""
+        handler = profiled(lambda_handler, {**self.settings, 'output': 's3://test-bucket/debug/profiles/'})
+        response = handler(self.upload_event(1024, header=sign_profile_header('s3cret', 'memory')), self.mock_context)
+        profile_id = response['headers'][PROFILE_ID_HEADER]
+        listed = self.s3_client.list_objects_v2(Bucket='test-bucket', Prefix='debug/profiles/')
+        self.assertEqual([item['Key'] for item in listed['Contents']], [f'debug/profiles/{profile_id}.json'])
+
+    def test_failed_write_does_not_fail_the_request(self):
+        """Test that an unwritable output only loses the report."""
+        handler = profiled(lambda_handler, {**self.settings, 'output': '/dev/null/profiles'})
+        response = handler(self.upload_event(1024, header=sign_profile_header('s3cret')), self.mock_context)
+        self.assertSuccess(response, 201)
+        self.assertNotIn(PROFILE_ID_HEADER, response['headers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for field projection and optional URL signing."""
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import ValidationError
+from src.handlers.image_handler import lambda_handler
+from src.models.image_model import ImageMetadata
+from tests.base_test import AWSTestCase
+
+
+class TestProjection(AWSTestCase):
+    """Test cases for fields= and include_urls= on list and get."""
+
+    def setUp(self):
+        super().setUp()
+        self.image_id = self.upload(tags='nature', description='x' * 500)['image_id']
+
+    def test_list_with_fields_returns_only_selected_attributes(self):
+        """Test that projected listings only carry the requested fields."""
+        result = self.service.list_images(fields='upload_date', include_urls=False)
+
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(set(result['images'][0]), {'image_id', 'upload_date'})
+
+    def test_list_with_fields_keeps_signed_urls(self):
+        """Test that projection still reads s3_key when URLs are requested."""
+        result = self.service.list_images(fields='filename')
+
+        image = result['images'][0]
+        self.assertEqual(set(image), {'image_id', 'filename', 'image_url'})
+        self.assertIn('images/user123/', image['image_url'])
+
+    def test_include_urls_false_skips_signing(self):
+        """Test that no URL is generated when include_urls is False."""
+        with patch.object(self.service.storage_repo, 'generate_presigned_url') as presign:
+            listing = self.service.list_images(include_urls=False)
+            image = self.service.get_image(self.image_id, include_urls=False)
+
+        presign.assert_not_called()
+        self.assertNotIn('image_url', listing['images'][0])
+        self.assertNotIn('download_url', image)
+        self.assertEqual(image['metadata']['description'], 'x' * 500)
+
+    def test_get_with_fields_and_download(self):
+        """Test projected get with a download disposition."""
+        result = self.service.get_image(self.image_id, download=True, fields='size')
+
+        self.assertEqual(result['metadata'], {'image_id': self.image_id, 'size': 18})
+        self.assertIn('attachment', result['download_url'])
+
+    def test_unknown_field_is_rejected(self):
+        """Test that unknown fields fail validation."""
+        with self.assertRaises(ValidationError):
+            self.service.list_images(fields='image_id,secret')
+
+    def test_from_dynamodb_item_tolerates_partial_items(self):
+        """Test decoding a projected item."""
+        metadata = ImageMetadata.from_dynamodb_item({'image_id': 'img1'})
+        self.assertEqual(metadata.image_id, 'img1')
+        self.assertIsNone(metadata.s3_key)
+
+    @patch('src.handlers.image_handler.service')
+    def test_handler_passes_projection_parameters(self, mock_service):
+        """Test that the handler forwards fields and include_urls."""
+        mock_service.list_images.return_value = {'images': [], 'count': 0}
+        event = self.create_api_event(query_params={'fields': 'upload_date', 'include_urls': 'false'})
+
+        self.assertSuccess(lambda_handler(event, self.mock_context))
+        kwargs = mock_service.list_images.call_args.kwargs
+        self.assertEqual(kwargs['fields'], 'upload_date')
+        self.assertFalse(kwargs['include_urls'])
+
+        event = self.create_api_event(query_params={'include_urls': 'maybe'})
+        self.assertError(lambda_handler(event, self.mock_context), 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Tests for the sharded recent-uploads feed."""
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from src.common.errors import ValidationError
+from src.models.image_model import ImageMetadata
+from src.repositories.metadata_repository import feed_attributes
+from tests.base_test import AWSTestCase
+
+
+class TestRecentFeed(AWSTestCase):
+    """Test cases for sort=recent listing."""
+
+    def save(self, image_id, upload_date, user_id='user123'):
+        self.service.metadata_repo.save_metadata(ImageMetadata(
+            image_id=image_id, user_id=user_id, filename='a.png', s3_key=f'images/{user_id}/{image_id}.png',
+            content_type='image/png', size=10, upload_date=upload_date
+        ))
+
+    def test_feed_keys_are_sharded_by_day(self):
+        """Test feed partition and sort keys."""
+        keys = feed_attributes('img1', '2024-05-01T10:00:00', shard_count=4)
+        self.assertRegex(keys['feed_pk'], r'^2024-05-01#[0-3]$')
+        self.assertEqual(keys['feed_sk'], '2024-05-01T10:00:00#img1')
+
+        shards = {feed_attributes(f'img{i}', '2024-05-01T10:00:00', 4)['feed_pk'] for i in range(50)}
+        self.assertEqual(len(shards), 4)
+
+    def test_recent_pages_newest_first_across_days(self):
+        """Test merged newest-first paging with a resumable cursor."""
+        for day in (1, 2, 3):
+            for hour in (8, 12, 16):
+                self.save(f'img-{day}-{hour}', f'2024-05-0{day}T{hour:02d}:00:00')
+        repo = self.service.metadata_repo
+        now = datetime(2024, 5, 4, 9, 0)
+
+        first, cursor = repo.list_recent(limit=4, now=now)
+        second, cursor2 = repo.list_recent(limit=4, cursor=cursor, now=now)
+        third, cursor3 = repo.list_recent(limit=4, cursor=cursor2, now=now)
+
+        ordered = [m.image_id for m in first + second + third]
+        self.assertEqual(ordered, [f'img-{d}-{h}' for d in (3, 2, 1) for h in (16, 12, 8)])
+        self.assertIsNone(cursor3)
+
+    def test_feed_continues_past_the_lookback_window(self):
+        """Test that sort=recent pages reach images far older than FEED_LOOKBACK_DAYS."""
+        today = datetime.utcnow()
+        for index in range(6):
+            self.save(f'img-{index}', (today - timedelta(days=20 * index)).isoformat())
+
+        listed, last_key = [], None
+        with patch.dict(os.environ, {'FEED_LOOKBACK_DAYS': '30'}):
+            for _ in range(10):
+                page = self.service.list_images(user_id='user123', limit=2, sort='recent',
+                                                last_key=last_key, include_urls=False)
+                listed += [image['image_id'] for image in page['images']]
+                last_key = page.get('last_evaluated_key')
+                if not last_key:
+                    break
+        self.assertEqual(listed, [f'img-{index}' for index in range(6)])
+        self.assertIsNone(last_key)
+
+    def test_page_day_budget_returns_a_resumable_cursor(self):
+        """Test that a page that runs out of daily buckets hands back a cursor instead of ending the feed."""
+        today = datetime.utcnow()
+        self.save('new', today.isoformat())
+        self.save('old', (today - timedelta(days=120)).isoformat())
+
+        listed, last_key, pages = [], None, 0
+        with patch.dict(os.environ, {'FEED_LOOKBACK_DAYS': '200'}), \
+                patch('src.repositories.metadata_repository.MAX_FEED_DAYS_PER_PAGE', 50):
+            while pages < 20:
+                page = self.service.list_images(limit=5, sort='recent', last_key=last_key, include_urls=False)
+                listed += [image['image_id'] for image in page['images']]
+                last_key, pages = page.get('last_evaluated_key'), pages + 1
+                if not last_key:
+                    break
+        self.assertEqual(listed, ['new', 'old'])
+        self.assertIsNone(last_key)
+
+    def test_recent_with_user_filter(self):
+        """Test that feed queries honor the user filter."""
+        self.save('a', '2024-05-01T08:00:00', user_id='alice')
+        self.save('b', '2024-05-01T09:00:00', user_id='bob')
+        self.save('c', '2024-05-01T10:00:00', user_id='alice')
+
+        images, _ = self.service.metadata_repo.list_recent(
+            user_id='alice', limit=10, now=datetime(2024, 5, 1, 12)
+        )
+        self.assertEqual([m.image_id for m in images], ['c', 'a'])
+
+    def test_service_sort_recent(self):
+        """Test list_images(sort='recent') end to end with a JSON cursor."""
+        ids = [self.upload(filename=f'{i}.png')['image_id'] for i in range(3)]
+
+        page = self.service.list_images(limit=2, sort='recent', fields='upload_date', include_urls=False)
+        rest = self.service.list_images(limit=2, sort='recent', last_key=page['last_evaluated_key'])
+
+        self.assertEqual([img['image_id'] for img in page['images']], ids[::-1][:2])
+        self.assertEqual([img['image_id'] for img in rest['images']], ids[:1])
+        self.assertIn('feed_sk', json.loads(page['last_evaluated_key']))
+
+    def test_invalid_sort_is_rejected(self):
+        """Test that unknown sort modes fail validation."""
+        with self.assertRaises(ValidationError):
+            self.service.list_images(sort='oldest')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+"""Tests for retries, retry budgets and circuit breaking of AWS calls."""
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from src.common import resilience
+from src.common.errors import QuotaExceededError, StorageError
+from src.common.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy
+from src.handlers.image_handler import lambda_handler
+from src.repositories.storage_repository import StorageRepository
+from tests.base_test import AWSTestCase, BaseTestCase
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail_first_calls(client, operation, count, code='ProvisionedThroughputExceededException'):
+    """Fail the first ``count`` calls of ``operation`` on ``client``, then pass through."""
+    remaining = [count]
+
+    def before_call(model, **kwargs):
+        if model.name != operation or not remaining[0]:
+            return None
+        remaining[0] -= 1
+        return FakeResponse(400), {'Error': {'Code': code, 'Message': 'Injected'},
+                                   'ResponseMetadata': {'HTTPStatusCode': 400}}
+
+    client.meta.events.register('before-call.*', before_call)
+    return before_call
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.raw = None
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test cases for the circuit breaker state machine."""
+
+    def test_opens_after_threshold_and_probes_after_reset(self):
+        """Test closed -> open -> half-open -> closed."""
+        clock = FakeClock()
+        breaker = CircuitBreaker('s3', failure_threshold=2, reset_seconds=10, clock=clock)
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+
+        with self.assertRaises(CircuitOpenError) as ctx:
+            breaker.before_call()
+        self.assertEqual(ctx.exception.retry_after, 10)
+
+        clock.now = 10
+        breaker.before_call()  # the single probe
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        breaker.before_call()
+        self.assertEqual(breaker.state, resilience.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        """Test that a failing half-open probe opens the circuit again."""
+        clock = FakeClock()
+        breaker = CircuitBreaker('dynamodb', failure_threshold=1, reset_seconds=5, clock=clock)
+        breaker.record_failure()
+        clock.now = 5
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+
+    def test_one_failed_call_counts_once(self):
+        """Test that retries of one call add a single failure, and a failing probe is not retried."""
+        clock = FakeClock()
+        breaker = CircuitBreaker('s3', failure_threshold=2, reset_seconds=5, clock=clock)
+        attempts = []
+
+        def failing():
+            attempts.append(1)
+            raise ClientError({'Error': {'Code': 'SlowDown'}}, 'GetObject')
+
+        with self.assertRaises(ClientError):
+            resilience.call('s3', failing, budget=RetryBudget(10), breaker=breaker, sleep=lambda _: None)
+        self.assertEqual((len(attempts), breaker.failures, breaker.state), (3, 1, resilience.CLOSED))
+
+        with self.assertRaises(ClientError):
+            resilience.call('s3', failing, budget=RetryBudget(10), breaker=breaker, sleep=lambda _: None)
+        self.assertEqual(breaker.state, resilience.OPEN)
+
+        clock.now = 5
+        with self.assertRaises(ClientError):
+            resilience.call('s3', failing, budget=RetryBudget(10), breaker=breaker, sleep=lambda _: None)
+        self.assertEqual((len(attempts), breaker.state), (7, resilience.OPEN))
+
+    def test_non_retryable_error_leaves_breaker_state(self):
+        """Test that a conditional check failure neither closes a half-open breaker nor clears failures."""
+        clock = FakeClock()
+        breaker = CircuitBreaker('dynamodb', failure_threshold=3, reset_seconds=5, clock=clock)
+
+        def rejected():
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+
+        breaker.record_failure()
+        with self.assertRaises(ClientError):
+            resilience.call('dynamodb', rejected, budget=RetryBudget(10), breaker=breaker)
+        self.assertEqual((breaker.failures, breaker.state), (1, resilience.CLOSED))
+
+        breaker.record_failure()
+        breaker.record_failure()
+        clock.now = 5
+        with self.assertRaises(ClientError):
+            resilience.call('dynamodb', rejected, budget=RetryBudget(10), breaker=breaker)
+        self.assertEqual(breaker.state, resilience.HALF_OPEN)
+        breaker.before_call()  # the probe was released for the next call
+
+
+class TestRetries(BaseTestCase):
+    """Test cases for retry classification, backoff and budgets with stubbed clients."""
+
+    def setUp(self):
+        super().setUp()
+        resilience.reset()
+        self.s3 = boto3.client('s3', region_name='us-east-1',
+                               aws_access_key_id='testing', aws_secret_access_key='testing')
+        self.stubber = Stubber(self.s3)
+        self.stubber.activate()
+        self.repo = StorageRepository(self.s3)
+        self.sleep = patch('src.common.resilience.time.sleep').start()
+        self.addCleanup(patch.stopall)
+
+    def tearDown(self):
+        self.stubber.deactivate()
+        super().tearDown()
+
+    def test_throttled_call_is_retried(self):
+        """Test that SlowDown is retried and the upload succeeds."""
+        self.stubber.add_client_error('put_object', 'SlowDown', http_status_code=503)
+        self.stubber.add_response('put_object', {})
+
+        self.repo.upload_image('k', b'data', 'image/png', {})
+        self.stubber.assert_no_pending_responses()
+
+    def test_non_retryable_error_fails_fast(self):
+        """Test that client errors are not retried and map to 500."""
+        self.stubber.add_client_error('put_object', 'AccessDenied', http_status_code=403)
+
+        with self.assertRaises(StorageError) as ctx:
+            self.repo.upload_image('k', b'data', 'image/png', {})
+        self.assertFalse(ctx.exception.retryable)
+        self.assertEqual(ctx.exception.status_code, 500)
+        self.assertEqual(resilience.get_circuit_breaker('s3').failures, 0)
+
+    def test_exhausted_retries_are_retryable_503(self):
+        """Test that a persistent transient failure surfaces as a retryable 503."""
+        for _ in range(3):
+            self.stubber.add_client_error('delete_object', 'InternalError', http_status_code=500)
+
+        with self.assertRaises(StorageError) as ctx:
+            self.repo.delete_image('k')
+        self.stubber.assert_no_pending_responses()
+        self.assertTrue(ctx.exception.retryable)
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def test_retry_budget_limits_retries_per_invocation(self):
+        """Test that retries stop once the invocation's budget is spent."""
+        budget = RetryBudget(max_retries=1)
+        calls = []
+
+        def failing():
+            calls.append(1)
+            raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'Query')
+
+        breaker = CircuitBreaker('x', failure_threshold=100)
+        for _ in range(2):
+            with self.assertRaises(ClientError):
+                resilience.call('x', failing, budget=budget, breaker=breaker, sleep=lambda _: None)
+        self.assertEqual(len(calls), 3)  # 2 attempts, then 1 attempt without budget
+
+        budget.reset()
+        with self.assertRaises(ClientError):
+            resilience.call('x', failing, budget=budget, breaker=breaker, sleep=lambda _: None)
+        self.assertEqual(len(calls), 5)
+
+    def test_retry_budget_is_kept_per_invocation(self):
+        """Test that another invocation does not refill this one's budget, and worker threads share it."""
+        resilience.start_invocation()
+        budget = resilience.current_budget()
+        while budget.try_acquire():
+            pass
+
+        other = threading.Thread(target=resilience.start_invocation)
+        other.start()
+        other.join()
+        self.assertIs(resilience.current_budget(), budget)
+        self.assertFalse(budget.try_acquire())
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            worker_budget = executor.submit(resilience.bind_invocation(resilience.current_budget)).result()
+        self.assertIs(worker_budget, budget)
+
+    def test_backoff_is_capped_full_jitter(self):
+        """Test that delays stay within [0, min(max, base * 2^n)]."""
+        policy = RetryPolicy(base_delay=0.1, max_delay=0.3)
+        for attempt, cap in ((1, 0.1), (2, 0.2), (3, 0.3), (6, 0.3)):
+            for _ in range(20):
+                self.assertLessEqual(policy.delay(attempt), cap)
+
+    def test_open_circuit_fails_fast_without_calling(self):
+        """Test that an open breaker rejects calls with Retry-After."""
+        os.environ['BREAKER_FAILURE_THRESHOLD'] = '2'
+        self.addCleanup(os.environ.pop, 'BREAKER_FAILURE_THRESHOLD')
+        resilience.reset()
+        for calls in (1, 2):
+            for _ in range(3):
+                self.stubber.add_client_error('head_object', 'ServiceUnavailable', http_status_code=503)
+            with self.assertRaises(StorageError):
+                self.repo.check_image_exists('k')
+            # Three failed attempts are one failed call
+            self.assertEqual(resilience.get_circuit_breaker('s3').failures, calls)
+
+        with self.assertRaises(StorageError) as ctx:
+            self.repo.check_image_exists('k')
+        self.stubber.assert_no_pending_responses()
+        self.assertTrue(ctx.exception.retryable)
+        self.assertEqual(ctx.exception.retry_after, 30)
+
+
+class TestResilientService(AWSTestCase):
+    """Test cases for transient DynamoDB faults against the live service."""
+
+    def test_transient_metadata_failure_does_not_roll_back_upload(self):
+        """Test that a throttled PutItem is retried instead of rolling back S3."""
+        fail_first_calls(self.dynamodb.meta.client, 'PutItem', 1)
+        result = self.upload()
+
+        self.assertEqual(self.service.get_image(result['image_id'])['image_id'], result['image_id'])
+        objects = self.s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])
+        self.assertEqual(objects['KeyCount'], 1)
+
+    def test_handler_returns_retry_after_when_dynamodb_is_down(self):
+        """Test 503 + Retry-After once retries are exhausted."""
+        fail_first_calls(self.dynamodb.meta.client, 'GetItem', 100, code='InternalServerError')
+        event = self.create_api_event(path_params={'image_id': 'img1'})
+
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch('src.common.resilience.time.sleep'):
+            response = lambda_handler(event, self.mock_context)
+
+        self.assertError(response, 503)
+        self.assertIn('Retry-After', response['headers'])
+
+    def test_conditional_failures_do_not_trip_breaker(self):
+        """Test that quota rejections are not counted as dependency failures."""
+        os.environ['MAX_IMAGES_PER_USER'] = '1'
+        self.addCleanup(os.environ.pop, 'MAX_IMAGES_PER_USER')
+        self.upload()
+        for _ in range(6):
+            with self.assertRaises(QuotaExceededError):
+                self.upload()
+
+        self.assertEqual(resilience.get_circuit_breaker('dynamodb').state, resilience.CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+"""Tests for the search index, its S3 segments and the search endpoint."""
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import StorageError, ValidationError
+from src.handlers.image_handler import lambda_handler
+from src.handlers.maintenance_handler import lambda_handler as maintenance_handler
+from src.repositories.search_repository import SearchRepository
+from src.services.search_index import SearchIndex, tokenize
+from src.services.search_service import SearchService
+from tests.base_test import AWSTestCase
+
+
+def build_index():
+    index = SearchIndex()
+    index.add('a', '2024-01-01', 'beach_2024.jpg', 'Sunset in Nice', 'holiday,sea')
+    index.add('b', '2024-02-01', 'IMG_0001.png', 'beach volleyball match', None)
+    index.add('c', '2024-03-01', 'city.png', 'Night skyline', 'beach')
+    index.add('d', '2024-04-01', 'beachhouse.png', None, None)
+    return index
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for tokenizing, ranking and segments."""
+
+    def test_tokenize(self):
+        """Test that separators split words and case is folded."""
+        self.assertEqual(tokenize('IMG_2024-Beach.trip'), ['img', '2024', 'beach', 'trip'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_ranking_by_field(self):
+        """Test that tags outrank filenames, which outrank descriptions."""
+        ids = [image_id for image_id, _ in build_index().search('beach')]
+        self.assertEqual(ids[:2], ['c', 'a'])
+        self.assertEqual(set(ids), {'a', 'b', 'c', 'd'})
+
+    def test_exact_match_outranks_prefix(self):
+        """Test that a whole-word match beats a longer word with the same prefix."""
+        index = SearchIndex()
+        index.add('prefix', '2024-02-01', 'beachhouse.png')
+        index.add('exact', '2024-01-01', 'beach.png')
+        self.assertEqual([i for i, _ in index.search('beach')], ['exact', 'prefix'])
+
+    def test_all_tokens_must_match(self):
+        """Test AND semantics with prefix matching on every token."""
+        index = build_index()
+        self.assertEqual([i for i, _ in index.search('beach 2024')], ['a'])
+        self.assertEqual([i for i, _ in index.search('sun bea')], ['a'])
+        self.assertEqual(index.search('beach tokyo'), [])
+        self.assertEqual(index.search('  '), [])
+
+    def test_recency_breaks_ties(self):
+        """Test that equal scores return the newest image first."""
+        index = SearchIndex()
+        for image_id, date in (('old', '2023-01-01'), ('new', '2024-01-01'), ('mid', '2023-06-01')):
+            index.add(image_id, date, 'cat.png')
+        self.assertEqual([i for i, _ in index.search('cat', limit=2)], ['new', 'mid'])
+
+    def test_remove_and_replace(self):
+        """Test that removed and re-added documents are searched by their latest version."""
+        index = build_index()
+        index.remove('a')
+        index.add('c', '2024-03-01', 'city.png', 'Night skyline', None)
+        self.assertEqual(sorted(i for i, _ in index.search('beach')), ['b', 'd'])
+        self.assertEqual(len(index), 3)
+        self.assertEqual([i for i, _ in index.search('night')], ['c'])
+
+    def test_segment_round_trip_drops_removed_documents(self):
+        """Test that a decoded segment returns the same images as the original."""
+        index = build_index()
+        index.remove('b')
+        decoded, extra = SearchIndex.decode(index.encode({'folded': ['k1']}))
+
+        self.assertEqual(extra, {'folded': ['k1']})
+        self.assertEqual(decoded.doc_ids, ['a', 'c', 'd'])
+        for query in ('beach', 'sun', 'night sky', 'volleyball'):
+            # Scores can shift slightly: removed documents still count towards idf until compaction
+            self.assertEqual(sorted(i for i, _ in decoded.search(query)), sorted(i for i, _ in index.search(query)))
+        with self.assertRaises(ValueError):
+            SearchIndex.decode(b'garbage')
+
+
+class TestSearchService(AWSTestCase):
+    """Test cases for incremental indexing, segments in S3 and the endpoint."""
+
+    def create_service(self):
+        service = super().create_service()
+        service.search = self.make_search()
+        return service
+
+    def make_search(self, refresh_seconds=0):
+        settings = {'enabled': True, 'cache_users': 4, 'refresh_seconds': refresh_seconds}
+        return SearchService(SearchRepository(self.s3_client), settings)
+
+    def search_ids(self, query, search=None, user_id='user123'):
+        if search is not None:
+            return [image_id for image_id, _ in search.search(user_id, query)]
+        result = self.service.search_images(user_id, query)
+        return [image['image_id'] for image in result['images']]
+
+    def test_uploads_and_deletes_are_searchable(self):
+        """Test that writes update the index incrementally."""
+        beach = self.upload(filename='beach.png', description='sunny day', tags='holiday')['image_id']
+        city = self.upload(filename='city.png', description='beach front towers')['image_id']
+        self.upload(user_id='other', filename='beach.png')
+
+        result = self.service.search_images('user123', 'beach', fields='filename')
+        self.assertEqual([image['image_id'] for image in result['images']], [beach, city])
+        self.assertEqual(set(result['images'][0]), {'image_id', 'filename', 'image_url', 'score'})
+
+        self.service.delete_image(beach)
+        self.assertEqual(self.search_ids('beach'), [city])
+        self.service.restore_image(beach)
+        self.assertEqual(self.search_ids('holi'), [beach])
+
+    def test_other_instances_pick_up_deltas_and_segments(self):
+        """Test that a cold instance loads deltas, then the compacted segment."""
+        first = self.upload(filename='dog.png')['image_id']
+        self.assertEqual(self.search_ids('dog', self.make_search()), [first])
+
+        warm = self.make_search()
+        self.search_ids('dog', warm)
+        self.assertEqual(self.service.compact_search_index(), {'users': 1, 'deltas': 1})
+        _, deltas = self.service.search.search_repo.list_user('user123')
+        self.assertEqual(deltas, [])
+
+        second = self.upload(filename='dog_park.png')['image_id']
+        self.assertEqual(set(self.search_ids('dog', self.make_search())), {first, second})
+        self.assertEqual(set(self.search_ids('dog', warm)), {first, second})
+
+    def test_refresh_interval_limits_listing(self):
+        """Test that a cached index is only re-checked after the refresh interval."""
+        search = self.make_search(refresh_seconds=60)
+        search.clock = lambda: now
+        now = 0
+        self.assertEqual(self.search_ids('cat', search), [])
+        image_id = self.upload(filename='cat.png')['image_id']
+
+        self.assertEqual(self.search_ids('cat', search), [])
+        now = 61
+        self.assertEqual(self.search_ids('cat', search), [image_id])
+
+    def test_rebuild_from_metadata(self):
+        """Test that a rebuild indexes images whose deltas were lost."""
+        with patch.object(self.service.search.search_repo, 'put_delta', side_effect=StorageError('unavailable', operation='search_delta')):
+            image_id = self.upload(filename='lost.png')['image_id']
+        self.assertEqual(self.search_ids('lost'), [])
+
+        self.assertEqual(self.service.rebuild_search_index(), {'users': 1, 'documents': 1})
+        self.assertEqual(self.search_ids('lost', self.make_search()), [image_id])
+
+    def test_stale_hits_are_dropped(self):
+        """Test that hits missing from the metadata table are not returned."""
+        image_id = self.upload(filename='gone.png')['image_id']
+        self.service.metadata_repo.delete_metadata(image_id)
+        self.assertEqual(self.service.search_images('user123', 'gone')['count'], 0)
+
+    def test_validation(self):
+        """Test required parameters and limits."""
+        for args in (('', 'x'), ('user123', ' '), ('user123', None)):
+            with self.assertRaises(ValidationError):
+                self.service.search_images(*args)
+        with self.assertRaises(ValidationError):
+            self.service.search_images('user123', 'x', limit=0)
+
+    def test_search_route_and_jobs(self):
+        """Test GET /images/search and the search maintenance jobs."""
+        image_id = self.upload(filename='tree.png')['image_id']
+        event = self.create_api_event(query_params={'user_id': 'user123', 'q': 'tree'})
+        event['resource'] = '/images/search'
+        missing_q = self.create_api_event(query_params={'user_id': 'user123'})
+        missing_q['resource'] = '/images/search'
+
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch('src.handlers.maintenance_handler.service', self.service):
+            body = self.assertSuccess(lambda_handler(event, self.mock_context))
+            self.assertError(lambda_handler(missing_q, self.mock_context), 400)
+            compacted = maintenance_handler({'job': 'compact_search_index'}, None)
+            rebuilt = maintenance_handler({'job': 'rebuild_search_index', 'user_id': 'user123'}, None)
+
+        self.assertEqual([image['image_id'] for image in body['images']], [image_id])
+        self.assertEqual(compacted['result'], {'users': 1, 'deltas': 1})
+        self.assertEqual(rebuilt['result'], {'users': 1, 'documents': 1})
+
+    def test_disabled_search_returns_501(self):
+        """Test that the endpoint reports search as unavailable when it is off."""
+        self.service.search = SearchService(settings={'enabled': False, 'cache_users': 1, 'refresh_seconds': 0})
+        event = self.create_api_event(query_params={'user_id': 'user123', 'q': 'x'})
+        event['resource'] = '/images/search'
+        with patch('src.handlers.image_handler.service', self.service):
+            self.assertError(lambda_handler(event, self.mock_context), 501)
+        self.upload()
+        self.assertEqual(self.s3_client.list_objects_v2(Bucket='test-bucket', Prefix='search/')['KeyCount'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
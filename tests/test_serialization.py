@@ -0,0 +1,76 @@
+"""Tests for response serialization and compression."""
+import base64
+import gzip
+import json
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from src.common.serialization import dumps, negotiate_encoding
+from src.handlers.image_handler import lambda_handler
+from src.models.image_model import ImageMetadata
+from tests.base_test import BaseTestCase
+
+
+class TestSerialization(BaseTestCase):
+    """Test cases for the serialization layer."""
+
+    def setUp(self):
+        super().setUp()
+        self.large_listing = {
+            'images': [
+                {'image_id': f'img{i}', 'image_url': 'https://example.com/' + 'x' * 200, 'size': 1024}
+                for i in range(50)
+            ],
+            'count': 50
+        }
+
+    def test_negotiate_encoding(self):
+        """Test Accept-Encoding parsing with quality values."""
+        self.assertEqual(negotiate_encoding('gzip'), 'gzip')
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding('gzip;q=0'))
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertIn(negotiate_encoding('gzip;q=0.5, br'), ('br', 'gzip'))
+
+    def test_metadata_numbers_are_pre_converted(self):
+        """Test that DynamoDB Decimals become ints when the model is decoded."""
+        metadata = ImageMetadata.from_dynamodb_item({
+            'image_id': 'img1', 'user_id': 'u', 'filename': 'a.png', 's3_key': 'k',
+            'content_type': 'image/png', 'size': Decimal('2048'), 'upload_date': 'now',
+            'width': Decimal('640')
+        })
+        self.assertIs(type(metadata.size), int)
+        self.assertEqual(json.loads(dumps(metadata.to_dict()))['width'], 640)
+
+    @patch('src.handlers.image_handler.service')
+    def test_large_response_is_gzip_compressed(self, mock_service):
+        """Test that large bodies are compressed when the client accepts gzip."""
+        mock_service.list_images.return_value = self.large_listing
+        event = self.create_api_event()
+        event['headers']['accept-encoding'] = 'gzip'
+
+        response = lambda_handler(event, self.mock_context)
+
+        self.assertTrue(response['isBase64Encoded'])
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        body = json.loads(gzip.decompress(base64.b64decode(response['body'])))
+        self.assertEqual(body['count'], 50)
+
+    @patch('src.handlers.image_handler.service')
+    def test_small_or_unaccepted_response_is_plain(self, mock_service):
+        """Test that small bodies and clients without Accept-Encoding get plain JSON."""
+        mock_service.list_images.return_value = self.large_listing
+        response = lambda_handler(self.create_api_event(), self.mock_context)
+        self.assertFalse(response['isBase64Encoded'])
+        self.assertNotIn('Content-Encoding', response['headers'])
+
+        mock_service.list_images.return_value = {'images': [], 'count': 0}
+        event = self.create_api_event()
+        event['headers']['Accept-Encoding'] = 'gzip'
+        body = self.assertSuccess(lambda_handler(event, self.mock_context))
+        self.assertEqual(body['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+"""Tests for soft delete, undelete and the batched purge job."""
+import os
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import NotFoundError
+from src.handlers.image_handler import lambda_handler
+from src.handlers.maintenance_handler import lambda_handler as maintenance_handler
+from src.repositories.sqlite_repository import SqliteUsageRepository
+from tests.base_test import AWSTestCase
+
+
+class TestSoftDelete(AWSTestCase):
+    """Test cases for tombstones, restore and purge."""
+
+    def tearDown(self):
+        os.environ.pop('UNDELETE_WINDOW_SECONDS', None)
+        super().tearDown()
+
+    def object_keys(self):
+        response = self.s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])
+        return [obj['Key'] for obj in response.get('Contents', [])]
+
+    def test_delete_hides_image_but_keeps_object(self):
+        """Test that a deleted image disappears from reads before it is purged."""
+        kept = self.upload()
+        deleted = self.upload()
+
+        result = self.service.delete_image(deleted['image_id'])
+
+        self.assertIn('restorable_until', result)
+        with self.assertRaises(NotFoundError):
+            self.service.get_image(deleted['image_id'])
+        with self.assertRaises(NotFoundError):
+            self.service.get_image(deleted['image_id'], fields='filename')
+        for sort in (None, 'recent'):
+            listed = self.service.list_images(sort=sort)
+            self.assertEqual([image['image_id'] for image in listed['images']], [kept['image_id']])
+        self.assertEqual(len(self.object_keys()), 2)
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 1)
+
+    def test_delete_twice_is_not_found(self):
+        """Test that the conditional update rejects a second delete."""
+        image_id = self.upload()['image_id']
+        self.service.delete_image(image_id)
+        with self.assertRaises(NotFoundError):
+            self.service.delete_image(image_id)
+        with self.assertRaises(NotFoundError):
+            self.service.delete_image('missing')
+
+    def test_restore_within_window(self):
+        """Test that restore brings an image back into reads, the feed and usage."""
+        image_id = self.upload()['image_id']
+        self.service.delete_image(image_id)
+
+        result = self.service.restore_image(image_id)
+
+        self.assertEqual(result['image_id'], image_id)
+        self.assertEqual(self.service.get_image(image_id)['image_id'], image_id)
+        recent = self.service.list_images(sort='recent')
+        self.assertEqual([image['image_id'] for image in recent['images']], [image_id])
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 1)
+        with self.assertRaises(NotFoundError):
+            self.service.restore_image(image_id)
+
+    def test_restore_keeps_last_upload(self):
+        """Test that restoring an older image does not move the user's last upload back in time."""
+        old = self.upload()['image_id']
+        latest = self.upload()['metadata']['upload_date']
+        self.service.delete_image(old)
+        self.service.restore_image(old)
+
+        usage = self.service.usage_repo.get_usage('user123')
+        self.assertEqual((usage['image_count'], usage['last_upload']), (2, latest))
+
+        local = SqliteUsageRepository(':memory:')
+        local.reserve('user123', 10, '2024-05-01T12:00:00')
+        local.reserve('user123', 10, None)
+        self.assertEqual(local.get_usage('user123')['last_upload'], '2024-05-01T12:00:00')
+
+    def test_restore_after_window_closes_fails(self):
+        """Test that an expired tombstone cannot be restored."""
+        os.environ['UNDELETE_WINDOW_SECONDS'] = '0'
+        image_id = self.upload()['image_id']
+        self.service.delete_image(image_id)
+
+        with self.assertRaises(NotFoundError):
+            self.service.restore_image(image_id)
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 0)
+
+    def test_purge_removes_expired_tombstones_only(self):
+        """Test that purge deletes objects and items past their window."""
+        kept = self.upload()
+        restorable = self.upload()
+        self.service.delete_image(restorable['image_id'])
+        os.environ['UNDELETE_WINDOW_SECONDS'] = '0'
+        expired = [self.upload()['image_id'] for _ in range(3)]
+        for image_id in expired:
+            self.service.delete_image(image_id)
+
+        result = self.service.purge_deleted()
+
+        self.assertEqual(result, {'purged': 3, 'failed': 0})
+        self.assertEqual(sorted(self.object_keys()), sorted([
+            kept['metadata']['s3_key'], restorable['metadata']['s3_key']
+        ]))
+        for image_id in expired:
+            response = self.service.metadata_repo.table.get_item(Key={'image_id': image_id})
+            self.assertNotIn('Item', response)
+        self.service.restore_image(restorable['image_id'])
+
+    def test_purge_keeps_tombstone_when_object_delete_fails(self):
+        """Test that metadata is only removed once its object is gone."""
+        os.environ['UNDELETE_WINDOW_SECONDS'] = '0'
+        first = self.upload()
+        second = self.upload()
+        self.service.delete_image(first['image_id'])
+        self.service.delete_image(second['image_id'])
+
+        with patch.object(self.service.storage_repo, 'delete_images',
+                          return_value={first['metadata']['s3_key']}):
+            result = self.service.purge_deleted()
+
+        self.assertEqual(result, {'purged': 1, 'failed': 1})
+        self.assertEqual(self.service.purge_deleted(), {'purged': 1, 'failed': 0})
+
+    def test_batch_delete_retries_unprocessed_items(self):
+        """Test that BatchWriteItem UnprocessedItems are resubmitted."""
+        repo = self.service.metadata_repo
+        batch_write = repo.dynamodb.batch_write_item
+        calls = []
+
+        def flaky_batch_write(RequestItems):
+            calls.append(len(RequestItems[repo.table_name]))
+            if len(calls) == 1:
+                requests = RequestItems[repo.table_name]
+                batch_write(RequestItems={repo.table_name: requests[:1]})
+                return {'UnprocessedItems': {repo.table_name: requests[1:]}}
+            return batch_write(RequestItems=RequestItems)
+
+        ids = [self.upload()['image_id'] for _ in range(3)]
+        with patch.object(repo.dynamodb, 'batch_write_item', side_effect=flaky_batch_write), \
+                patch('src.repositories.metadata_repository.time.sleep'):
+            unprocessed = repo.delete_many(ids)
+
+        self.assertEqual(unprocessed, [])
+        self.assertEqual(calls, [3, 2])
+        self.assertEqual(repo.table.scan()['Count'], 0)
+
+    def test_restore_route_and_purge_job(self):
+        """Test POST /images/{id}/restore and the purge_deleted maintenance job."""
+        image_id = self.upload()['image_id']
+        self.service.delete_image(image_id)
+        event = self.create_api_event(method='POST', path_params={'image_id': image_id})
+        event['resource'] = '/images/{image_id}/restore'
+
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch('src.handlers.maintenance_handler.service', self.service):
+            body = self.assertSuccess(lambda_handler(event, self.mock_context), 200)
+            result = maintenance_handler({'job': 'purge_deleted'}, None)
+
+        self.assertEqual(body['image_id'], image_id)
+        self.assertEqual(result['result'], {'purged': 0, 'failed': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,294 @@
+"""Tests for S3 and CloudFront URL signers and signed cookies."""
+import base64
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import boto3
+from botocore.config import Config as BotoConfig
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except ImportError:
+    rsa = None
+
+from src.common.config import Config
+from src.common.errors import ValidationError
+from src.handlers.image_handler import lambda_handler
+from src.repositories.storage_repository import StorageRepository
+from src.repositories.url_signers import (
+    CloudFrontUrlSigner,
+    MAX_PRESIGN_SECONDS,
+    S3UrlSigner,
+    WindowedUrlSigner,
+    build_url_signer
+)
+from tests.base_test import AWSTestCase
+
+NOW = 1700000000
+
+
+def generate_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode('utf-8')
+    return key.public_key(), pem
+
+
+def b64decode(value):
+    return base64.b64decode(value.replace('-', '+').replace('_', '=').replace('~', '/'))
+
+
+def canned_policy(url, expires):
+    return json.dumps(
+        {'Statement': [{'Resource': url, 'Condition': {'DateLessThan': {'AWS:EpochTime': expires}}}]},
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+@unittest.skipIf(rsa is None, 'cryptography is not installed')
+class TestCloudFrontUrlSigner(unittest.TestCase):
+    """Test cases for CloudFront signatures, verified offline with the public key."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.public_key, cls.private_pem = generate_key()
+
+    def make_signer(self, **kwargs):
+        return CloudFrontUrlSigner('cdn.example.com', 'K2EXAMPLE', self.private_pem, clock=lambda: NOW, **kwargs)
+
+    def verify(self, signature, message):
+        self.public_key.verify(b64decode(signature), message, padding.PKCS1v15(), hashes.SHA1())
+
+    def test_canned_policy_url(self):
+        """Test that a canned URL carries Expires and a valid signature."""
+        url = self.make_signer().sign('images/user123/a b.png', 600)
+
+        parts = urlsplit(url)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        self.assertEqual(f'{parts.scheme}://{parts.netloc}{parts.path}',
+                         'https://cdn.example.com/images/user123/a%20b.png')
+        self.assertEqual(query['Expires'], str(NOW + 600))
+        self.assertEqual(query['Key-Pair-Id'], 'K2EXAMPLE')
+        self.verify(query['Signature'], canned_policy(url.split('?')[0], NOW + 600))
+
+    def test_canned_url_is_stable_for_the_same_expiry(self):
+        """Test that signatures are deterministic, so equal expiries give equal URLs."""
+        signer = self.make_signer()
+        self.assertEqual(signer.sign('images/u/1.png', 60), signer.sign('images/u/1.png', 60))
+
+    def test_custom_policy_url_with_download(self):
+        """Test a custom policy URL that also covers the content disposition parameter."""
+        url = self.make_signer(policy='custom').sign('images/u/1.png', 60, download=True, filename='cat.png')
+
+        query = {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+        self.assertNotIn('Expires', query)
+        self.assertEqual(query['response-content-disposition'], 'attachment; filename="cat.png"')
+        policy = b64decode(query['Policy'])
+        statement = json.loads(policy)['Statement'][0]
+        self.assertTrue(statement['Resource'].endswith('1.png?response-content-disposition=attachment%3B+'
+                                                       'filename%3D%22cat.png%22'))
+        self.assertEqual(statement['Condition']['DateLessThan']['AWS:EpochTime'], NOW + 60)
+        self.verify(query['Signature'], policy)
+
+    def test_signed_cookies_cover_a_prefix(self):
+        """Test that cookie policies use a wildcard resource and verify."""
+        cookies = self.make_signer(signed_cookies=True).signed_cookies('*images/user123/*', 300)
+
+        policy = b64decode(cookies['CloudFront-Policy'])
+        self.assertEqual(json.loads(policy)['Statement'][0]['Resource'], 'https://cdn.example.com/*images/user123/*')
+        self.assertEqual(cookies['CloudFront-Key-Pair-Id'], 'K2EXAMPLE')
+        self.verify(cookies['CloudFront-Signature'], policy)
+
+        _, other_pem = generate_key()
+        forged = CloudFrontUrlSigner('cdn.example.com', 'K2EXAMPLE', other_pem, clock=lambda: NOW)
+        with self.assertRaises(InvalidSignature):
+            self.verify(forged.signed_cookies('*images/user123/*', 300)['CloudFront-Signature'], policy)
+
+    def test_build_url_signer_validates_settings(self):
+        """Test signer selection and configuration errors."""
+        settings = {'signer': 's3', 'domain': None, 'key_pair_id': None, 'private_key': None,
+                    'policy': 'canned', 'signed_cookies': False}
+        self.assertIsInstance(build_url_signer(None, 'bucket', settings), S3UrlSigner)
+        with self.assertRaises(ValueError):
+            build_url_signer(None, 'bucket', dict(settings, signer='cloudfront'))
+        with self.assertRaises(ValueError):
+            build_url_signer(None, 'bucket', dict(settings, signer='akamai'))
+        with self.assertRaises(ValueError):
+            self.make_signer(policy='open')
+
+    def test_private_key_from_file(self):
+        """Test that CLOUDFRONT_PRIVATE_KEY_FILE is read when the key is not inline."""
+        with tempfile.NamedTemporaryFile('w', suffix='.pem', delete=False) as f:
+            f.write(self.private_pem)
+        env = {'URL_SIGNER': 'cloudfront', 'CLOUDFRONT_DOMAIN': 'cdn.example.com',
+               'CLOUDFRONT_KEY_PAIR_ID': 'K2EXAMPLE', 'CLOUDFRONT_PRIVATE_KEY_FILE': f.name}
+        try:
+            with patch.dict(os.environ, env):
+                signer = build_url_signer(None, 'bucket')
+        finally:
+            os.unlink(f.name)
+        self.assertIsInstance(signer, CloudFrontUrlSigner)
+        self.assertFalse(signer.cookies_enabled)
+
+
+@unittest.skipIf(rsa is None, 'cryptography is not installed')
+class TestSignedCookieListing(AWSTestCase):
+    """Test cases for per-user listings served with signed cookies."""
+
+    def create_service(self):
+        _, pem = generate_key()
+        service = super().create_service()
+        service.storage_repo = StorageRepository(
+            self.s3_client, CloudFrontUrlSigner('cdn.example.com', 'K2EXAMPLE', pem, signed_cookies=True)
+        )
+        return service
+
+    def test_user_listing_uses_cookies_instead_of_signatures(self):
+        """Test that a per-user list has plain URLs plus one set of cookies."""
+        keys = sorted(self.upload()['metadata']['s3_key'] for _ in range(3))
+
+        with patch.object(self.service.storage_repo.url_signer, 'sign') as sign:
+            result = self.service.list_images(user_id='user123')
+
+        sign.assert_not_called()
+        self.assertEqual(sorted(image['image_url'] for image in result['images']),
+                         [f'https://cdn.example.com/{key}' for key in keys])
+        self.assertEqual(set(result['signed_cookies']),
+                         {'CloudFront-Policy', 'CloudFront-Signature', 'CloudFront-Key-Pair-Id'})
+
+    def test_unscoped_listing_signs_each_url(self):
+        """Test that a listing without user_id falls back to signed URLs."""
+        self.upload()
+        result = self.service.list_images()
+        self.assertNotIn('signed_cookies', result)
+        self.assertIn('Signature=', result['images'][0]['image_url'])
+
+    def test_handler_sets_cookies(self):
+        """Test that cookies leave the body and become Set-Cookie headers."""
+        self.upload()
+        event = self.create_api_event(query_params={'user_id': 'user123'})
+
+        with patch('src.handlers.image_handler.service', self.service), \
+                patch.object(Config, 'get_cookie_domain', return_value='.example.com'):
+            response = lambda_handler(event, self.mock_context)
+
+        body = self.assertSuccess(response)
+        self.assertNotIn('signed_cookies', body)
+        cookies = response['multiValueHeaders']['Set-Cookie']
+        self.assertEqual(len(cookies), 3)
+        for cookie in cookies:
+            self.assertTrue(cookie.startswith('CloudFront-'))
+            self.assertIn('; Domain=.example.com', cookie)
+            self.assertIn('; Secure; HttpOnly', cookie)
+
+    def test_wildcards_in_user_id_are_rejected(self):
+        """Test that a user ID cannot widen the cookie policy to other users' objects."""
+        for user_id in ('*', 'user?23', 'user123/../user456'):
+            with self.subTest(user_id=user_id), self.assertRaises(ValidationError):
+                self.service.list_images(user_id=user_id)
+
+        event = self.create_api_event(query_params={'user_id': 'u*'})
+        with patch('src.handlers.image_handler.service', self.service):
+            self.assertError(lambda_handler(event, self.mock_context), 400)
+
+
+class TestWindowedUrlSigner(AWSTestCase):
+    """Test cases for window-aligned, memoized URLs."""
+
+    def setUp(self):
+        super().setUp()
+        self.now = (int(time.time()) // 900) * 900 + 10
+        self.signer = WindowedUrlSigner(S3UrlSigner(self.s3_client, 'test-bucket'), 900, clock=lambda: self.now)
+
+    def expires(self, url):
+        return int(parse_qs(urlsplit(url).query)['Expires'][0])
+
+    def test_urls_are_stable_within_a_window(self):
+        """Test that the same object gets the same URL for the whole window."""
+        first = self.signer.sign('images/u/1.png', 3600)
+        self.now += 880
+        self.assertEqual(self.signer.sign('images/u/1.png', 3600), first)
+        self.assertEqual(self.expires(first), self.now - 890 + 900 + 3600)
+        self.assertGreaterEqual(self.expires(first) - self.now, 3600)
+
+    def test_urls_rotate_across_windows(self):
+        """Test that a new window signs a new URL with a later expiry."""
+        first = self.signer.sign('images/u/1.png', 3600)
+        self.now += 900
+        second = self.signer.sign('images/u/1.png', 3600)
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.expires(second) - self.expires(first), 900)
+
+    def test_disposition_is_part_of_the_cache_key(self):
+        """Test that download URLs do not collide with view URLs."""
+        view = self.signer.sign('images/u/1.png', 3600)
+        download = self.signer.sign('images/u/1.png', 3600, download=True, filename='a.png')
+        other = self.signer.sign('images/u/1.png', 3600, download=True, filename='b.png')
+        self.assertEqual(len({view, download, other}), 3)
+        self.assertIn('response-content-disposition', download)
+
+    @unittest.skipIf(rsa is None, 'cryptography is not installed')
+    def test_cloudfront_urls_match_across_instances(self):
+        """Test that separate processes sign identical CloudFront URLs in a window."""
+        _, pem = generate_key()
+        signers = [
+            WindowedUrlSigner(CloudFrontUrlSigner('cdn.example.com', 'K2EXAMPLE', pem), 900,
+                              clock=lambda offset=offset: self.now + offset)
+            for offset in (0, 500)
+        ]
+        self.assertEqual(signers[0].sign('images/u/1.png', 60), signers[1].sign('images/u/1.png', 60))
+
+    def test_cache_hit_rate_on_repeated_lists(self):
+        """Test that repeated list pages are served from the memo."""
+        for _ in range(20):
+            self.upload()
+        self.service.storage_repo = StorageRepository(self.s3_client, self.signer)
+
+        with patch.object(S3UrlSigner, 'sign', autospec=True, side_effect=S3UrlSigner.sign) as sign:
+            pages = [self.service.list_images(user_id='user123') for _ in range(10)]
+
+        self.assertEqual(sign.call_count, 20)
+        self.assertEqual(self.signer.cache.hits, 180)
+        self.assertEqual(len(self.signer.cache), 20)
+        self.assertTrue(all(page['images'] == pages[0]['images'] for page in pages))
+
+    def test_sigv4_urls_stay_within_seven_days(self):
+        """Test that window alignment never pushes X-Amz-Expires past the 604800 seconds S3 accepts."""
+        client = boto3.client('s3', region_name='us-east-1', config=BotoConfig(signature_version='s3v4'))
+        s3_signer = S3UrlSigner(client, 'test-bucket')
+        signer = WindowedUrlSigner(s3_signer, 900)
+
+        def amz_expires(url):
+            return int(parse_qs(urlsplit(url).query)['X-Amz-Expires'][0])
+
+        self.assertEqual(amz_expires(s3_signer.sign_until('images/u/1.png', int(time.time()) + 604882)),
+                         MAX_PRESIGN_SECONDS)
+        for expires_in in (MAX_PRESIGN_SECONDS, MAX_PRESIGN_SECONDS - 1, MAX_PRESIGN_SECONDS - 300,
+                           MAX_PRESIGN_SECONDS - 900, 3600):
+            with self.subTest(expires_in=expires_in):
+                url = signer.sign('images/u/1.png', expires_in)
+                self.assertTrue(expires_in <= amz_expires(url) <= MAX_PRESIGN_SECONDS)
+        self.assertEqual(signer.sign('images/u/2.png', MAX_PRESIGN_SECONDS - 300),
+                         signer.sign('images/u/2.png', MAX_PRESIGN_SECONDS - 300))
+
+    def test_cache_is_bounded(self):
+        """Test that the memo evicts least recently used URLs."""
+        signer = WindowedUrlSigner(S3UrlSigner(self.s3_client, 'test-bucket'), 900, max_entries=2,
+                                   clock=lambda: self.now)
+        for name in ('a', 'b', 'a', 'c'):
+            signer.sign(name, 60)
+        self.assertEqual(len(signer.cache), 2)
+        signer.sign('a', 60)
+        self.assertEqual((signer.cache.hits, signer.cache.misses), (2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Tests for per-user usage counters and quotas."""
+import os
+import unittest
+from unittest.mock import patch
+
+from src.common.errors import QuotaExceededError, StorageError
+from src.handlers.maintenance_handler import lambda_handler as maintenance_handler
+from src.handlers.image_handler import lambda_handler
+from tests.base_test import AWSTestCase
+
+
+class TestUsageQuota(AWSTestCase):
+    """Test cases for usage counters, quota enforcement and recount."""
+
+    def tearDown(self):
+        os.environ.pop('MAX_IMAGES_PER_USER', None)
+        os.environ.pop('MAX_BYTES_PER_USER', None)
+        super().tearDown()
+
+    def test_upload_and_delete_maintain_counters(self):
+        """Test that counters follow uploads and deletes."""
+        first = self.upload()
+        self.upload()
+        usage = self.service.usage_repo.get_usage('user123')
+        self.assertEqual(usage['image_count'], 2)
+        self.assertEqual(usage['total_bytes'], 36)
+        self.assertIsNotNone(usage['last_upload'])
+
+        self.service.delete_image(first['image_id'])
+        usage = self.service.get_user_stats('user123')
+        self.assertEqual((usage['image_count'], usage['total_bytes']), (1, 18))
+        self.assertEqual(usage['quota'], {'max_images': None, 'max_bytes': None})
+
+    def test_image_quota_rejects_before_s3_write(self):
+        """Test that an over-quota upload never reaches S3."""
+        os.environ['MAX_IMAGES_PER_USER'] = '1'
+        self.upload()
+
+        with patch.object(self.service.storage_repo, 'upload_image') as s3_upload:
+            with self.assertRaises(QuotaExceededError):
+                self.upload()
+        s3_upload.assert_not_called()
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 1)
+
+    def test_byte_quota(self):
+        """Test the storage quota, including a single oversized image."""
+        os.environ['MAX_BYTES_PER_USER'] = '40'
+        self.upload()
+        self.upload()
+        with self.assertRaises(QuotaExceededError):
+            self.upload()
+
+        os.environ['MAX_BYTES_PER_USER'] = '10'
+        with self.assertRaises(QuotaExceededError):
+            self.upload(user_id='new-user')
+
+    def test_failed_s3_upload_releases_reservation(self):
+        """Test that a storage failure does not leave the image counted."""
+        with patch.object(self.service.storage_repo, 'upload_image', side_effect=StorageError('boom')):
+            with self.assertRaises(StorageError):
+                self.upload()
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 0)
+
+    def test_recount_repairs_drift(self):
+        """Test that the recount job rewrites drifted counters."""
+        self.upload()
+        self.upload(user_id='other')
+        self.service.usage_repo.set_usage('user123', 7, 999)
+        self.service.usage_repo.set_usage('ghost', 3, 30)
+
+        with patch('src.handlers.maintenance_handler.service', self.service):
+            result = maintenance_handler({'job': 'recount_usage'}, self.mock_context)
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(result['result'], {'users': 2, 'corrected': 2, 'skipped': 0})
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 1)
+        self.assertEqual(self.service.usage_repo.get_usage('ghost')['image_count'], 0)
+
+    def test_recount_does_not_overwrite_concurrent_uploads(self):
+        """Test that uploads landing while the table is scanned keep their counts."""
+        self.upload()
+        self.upload(user_id='other')
+        self.service.usage_repo.set_usage('other', 7, 999)
+        size = self.service.usage_repo.get_usage('user123')['total_bytes']
+        scan = self.service.metadata_repo.iter_metadata
+
+        def scan_with_uploads(fields=None):
+            # Uploads reserve usage after the counters were read and after the scan passed them
+            images = list(scan(fields))
+            self.upload()
+            self.upload(user_id='other')
+            return iter(images)
+
+        with patch.object(self.service.metadata_repo, 'iter_metadata', side_effect=scan_with_uploads):
+            result = self.service.recount_usage()
+
+        self.assertEqual(result, {'users': 2, 'corrected': 0, 'skipped': 1})
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['image_count'], 2)
+        self.assertEqual(self.service.usage_repo.get_usage('user123')['total_bytes'], 2 * size)
+        self.assertEqual(self.service.usage_repo.get_usage('other')['image_count'], 8)
+
+    @patch('src.handlers.image_handler.service')
+    def test_stats_endpoint(self, mock_service):
+        """Test routing of GET /users/{user_id}/stats."""
+        mock_service.get_user_stats.return_value = {'user_id': 'user123', 'image_count': 3}
+        event = self.create_api_event(path_params={'user_id': 'user123'})
+        event['resource'] = '/users/{user_id}/stats'
+
+        body = self.assertSuccess(lambda_handler(event, self.mock_context))
+        self.assertEqual(body['image_count'], 3)
+        mock_service.get_user_stats.assert_called_once_with('user123')
+
+
+if __name__ == '__main__':
+    unittest.main()